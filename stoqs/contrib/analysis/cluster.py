@@ -29,6 +29,8 @@ import matplotlib as mpl
 
 mpl.use('Agg')  # Force matplotlib to not use any Xwindows backend
 import argparse
+import hashlib
+import json
 import matplotlib.pyplot as plt
 import numpy as np
 import warnings
@@ -55,6 +57,10 @@ from sklearn.mixture import GaussianMixture
 import pickle
 
 CLUSTERED = 'Clustered'
+PARAMETERS = 'Clustering parameters'
+
+# Number of MeasuredParameter ids per Activity query and MeasuredParameterResource rows per INSERT when saving labels
+LABEL_BATCH = 10000
 
 
 class DefaultsRawTextHelpFormatter(argparse.ArgumentDefaultsHelpFormatter, argparse.RawTextHelpFormatter):
@@ -93,85 +99,123 @@ class Clusterer(BiPlot):
 
         return r
 
-    def saveClusters(self, clusteredGroupName):
+    def saveParameters(self, seq=False):
         '''
-        Save the set of labels in MeasuredParameterResource. Accepts 2 input vectors. (TODO: generalize to N input vectors);
-        description is used to describe the criteria for assigning this label. The clusteredGroupName may be used to
-        refer to the grouping, and the clusters are each clustered with a letter from A-Z.
+        Save the runParameters() to a Resource and return it for association with the label Resources of the run
         '''
-        X, y_clusters, X_ids = c.createClusters()
-        clResource = c.saveCommand()
+        rt, _ = ResourceType.objects.using(self.args.database).get_or_create(name=LABEL, description='metadata')
+        r, _ = Resource.objects.using(self.args.database).get_or_create(name=PARAMETERS, value=self.runParameters(seq),
+                                                                        resourcetype=rt)
 
-        # assign each cluster a letter
-        for i in range(-1, max(y_clusters) + 1):
-            letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-            if i == -1:
-                label = 'OUTLIER'
-            else:
-                label = letters[i]
+        return r
+
+    def runParameters(self, seq=False):
+        '''
+        Return JSON string of the parameters that determine the cluster labels of a run: the algorithm and its
+        settings, the input Parameters, Platform, time period and normalization, and for saveClustersSeq()
+        the interval and step
+        '''
+        params = {'algorithm': self.args.algorithm,
+                  'settings': self.algorithms[self.args.algorithm].get_params(),
+                  'inputs': self.args.inputs,
+                  'platform': self.args.platform,
+                  'start': self.args.start,
+                  'end': self.args.end,
+                  'normalize': not self.args.do_not_normalize}
+        if seq:
+            params['interval'] = self.args.interval
+            params['step'] = self.args.step
+
+        return json.dumps(params, sort_keys=True, default=str)
+
+    def runGroupName(self, seq=False):
+        '''
+        Return the ResourceType name of the labels of a run: the --clusteredGroupName tagged with the algorithm
+        and a digest of runParameters() so that runs with different parameters are saved side by side and a
+        rerun with the same parameters writes to the same labels
+        '''
+        digest = hashlib.sha1(self.runParameters(seq).encode('utf-8')).hexdigest()[:8]
 
-            cluster = X[y_clusters == i]
-            cluster_ids = X_ids[y_clusters == i]
+        return ' '.join((CLUSTERED, self.args.clusteredGroupName, f'{self.args.algorithm}-{digest}'))
 
+    def _labelResources(self, clusteredGroupName, y_clusters, clResource, paramResource):
+        '''
+        Get or create the label Resource of each cluster number in y_clusters, associated with the command line
+        and run parameter Resources, and return them in a dictionary keyed by cluster number
+        '''
+        letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        rt, _ = ResourceType.objects.using(self.args.database).get_or_create(name=clusteredGroupName,
+                                                                        description='unsupervised classification')
+        labelResources = {}
+        for i in range(-1, max(y_clusters) + 1):
+            label = 'OUTLIER' if i == -1 else letters[i]
             try:
-                # Label
-                rt, _ = ResourceType.objects.using(self.args.database).get_or_create(name=clusteredGroupName,
-                                                                                description='unsupervised classification')
                 r, _ = Resource.objects.using(self.args.database).get_or_create(name=LABEL, value=label, resourcetype=rt)
-
                 ResourceResource.objects.using(self.args.database).get_or_create(fromresource=r, toresource=clResource)
-
+                ResourceResource.objects.using(self.args.database).get_or_create(fromresource=r, toresource=paramResource)
             except IntegrityError as e:
                 print(str(e))
                 print("Ignoring")
+                continue
 
-            # Associate MeasuredParameters with Resource
-            if self.args.verbose:
-                print("  Saving %d values in cluster '%s'" % (len(cluster), label))
-            for x_id, y_id in cluster_ids:
-                act = self.getActivity(x_id, y_id)
-                if self.args.verbose > 1:
-                    print(f'  Activity: {act}')
-
-                mp_x = MeasuredParameter.objects.using(self.args.database).get(id=x_id)
-                mp_y = MeasuredParameter.objects.using(self.args.database).get(id=y_id)
-                MeasuredParameterResource.objects.using(self.args.database).get_or_create(
-                    activity=act, measuredparameter=mp_x, resource=r)
-                MeasuredParameterResource.objects.using(self.args.database).get_or_create(
-                    activity=act, measuredparameter=mp_y, resource=r)
+            labelResources[i] = r
 
-    def _parseTimeDelta(self, arg):
-        # Help documentation implies that multiple comma-separated time intervals may be in 'arg'
-        # but only one is parsed.
-        kwargs = {}
-        kwargs[arg.split('=')[0]] = int(arg.split('=')[1])
-
-        return timedelta(**kwargs)
+        return labelResources
 
-    def _saveMPRassociations(self, cluster_ids, label, r_cluster):
+    def _saveLabels(self, X_ids, y_clusters, labelResources):
+        '''
+        Save MeasuredParameterResources associating the MeasuredParameter id pairs in X_ids with the label
+        Resources of their clusters in y_clusters.  The Activities are looked up LABEL_BATCH ids per query and
+        the rows are inserted with bulk_create(), skipping rows that already exist so that saving a run again
+        leaves the database unchanged.
+        '''
+        X_ids = np.asarray(X_ids, dtype=np.int64).reshape(-1, 2)
+        y_clusters = np.asarray(y_clusters)
 
         if self.args.verbose:
-            print("  Saving %d values in cluster '%s'" % (len(cluster_ids), label))
+            for i, r in labelResources.items():
+                print("  Saving %d values in cluster '%s'" % (np.count_nonzero(y_clusters == i), r.value))
+
+        # The x and y MeasuredParameters of a pair are from the same Measurement and therefore Activity
+        activities = {}
+        x_ids = X_ids[:, 0].tolist()
+        for start in range(0, len(x_ids), LABEL_BATCH):
+            activities.update(MeasuredParameter.objects.using(self.args.database)
+                                .filter(id__in=x_ids[start:start + LABEL_BATCH])
+                                .values_list('id', 'measurement__instantpoint__activity_id'))
+
+        mprs = []
+        for (x_id, y_id), i in zip(X_ids.tolist(), y_clusters.tolist()):
+            if i not in labelResources:
+                continue
+            for mp_id in (x_id, y_id):
+                mprs.append(MeasuredParameterResource(measuredparameter_id=mp_id, resource=labelResources[i],
+                                                      activity_id=activities[x_id]))
 
-        try:
-            # See https://docs.djangoproject.com/en/dev/topics/db/transactions/#django.db.transaction.atomic
-            with transaction.atomic():
-                for x_id, y_id in cluster_ids:
-                    act = self.getActivity(x_id, y_id)
+        with transaction.atomic(using=self.args.database):
+            MeasuredParameterResource.objects.using(self.args.database).bulk_create(
+                    mprs, batch_size=LABEL_BATCH, ignore_conflicts=True)
 
-                    mp_x = MeasuredParameter.objects.using(self.args.database).get(id=x_id)
-                    mp_y = MeasuredParameter.objects.using(self.args.database).get(id=y_id)
+    def saveClusters(self, clusteredGroupName):
+        '''
+        Save the set of labels in MeasuredParameterResource. Accepts 2 input vectors. (TODO: generalize to N input vectors);
+        description is used to describe the criteria for assigning this label. The clusteredGroupName may be used to
+        refer to the grouping, and the clusters are each clustered with a letter from A-Z.
+        '''
+        X, y_clusters, X_ids = self.createClusters()
+        clResource = self.saveCommand()
+        paramResource = self.saveParameters()
 
-                    mprx = MeasuredParameterResource(activity=act, measuredparameter=mp_x, resource=r_cluster)
-                    mpry = MeasuredParameterResource(activity=act, measuredparameter=mp_y, resource=r_cluster)
+        labelResources = self._labelResources(clusteredGroupName, y_clusters, clResource, paramResource)
+        self._saveLabels(X_ids, y_clusters, labelResources)
 
-                    mprx.save(self.args.database)
-                    mpry.save(self.args.database)
+    def _parseTimeDelta(self, arg):
+        # Help documentation implies that multiple comma-separated time intervals may be in 'arg'
+        # but only one is parsed.
+        kwargs = {}
+        kwargs[arg.split('=')[0]] = int(arg.split('=')[1])
 
-        except IntegrityError as e:
-            # Likely duplicate key value violates unique constraint...
-            if self.args.verbose > 2:
-                print(str(e))
+        return timedelta(**kwargs)
 
     def saveClustersSeq(self, clusteredGroupName):
         '''
@@ -180,7 +224,8 @@ class Clusterer(BiPlot):
         and is given a number (appended to the clusteredGroupName for each time interval step. Within each grouping, each cluster is named with a
         letter from A-Z.
         '''
-        clResource = c.saveCommand()
+        clResource = self.saveCommand()
+        paramResource = self.saveParameters(seq=True)
         clf = self.algorithms[self.args.algorithm]
 
         start = datetime.strptime(self.args.start, '%Y%m%dT%H%M%S')
@@ -223,31 +268,8 @@ class Clusterer(BiPlot):
 
             y_clusters = clf.labels_
 
-            # assign each cluster a letter
-            for i in range(-1, max(y_clusters) + 1):
-                letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-                if i == -1:
-                    label = 'OUTLIER'
-                else:
-                    label = letters[i]
-
-                cluster = X[y_clusters == i]
-                cluster_ids = X_ids[y_clusters == i]
-
-                try:
-                    # Label
-                    rt, _ = ResourceType.objects.using(self.args.database).get_or_create(
-                                name=clusteredGroupName, description='unsupervised classification')
-                    r_cluster, _ = Resource.objects.using(self.args.database).get_or_create(name=LABEL, value=label, resourcetype=rt)
-                    # Associate with commandlineResource
-                    ResourceResource.objects.using(self.args.database).get_or_create(fromresource=r_cluster, toresource=clResource)
-
-                except IntegrityError as e:
-                    print(str(e))
-                    print("Ignoring")
-
-                # Associate MeasuredParameters with Resource
-                self._saveMPRassociations(cluster_ids, label, r_cluster)
+            labelResources = self._labelResources(clusteredGroupName, y_clusters, clResource, paramResource)
+            self._saveLabels(X_ids, y_clusters, labelResources)
 
             sdt = sdt + step
             edt = edt + step
@@ -276,8 +298,7 @@ class Clusterer(BiPlot):
 
             rdt, _ = ResourceType.objects.using(self.args.database).get_or_create(name=LABEL, description='metadata')
             rd, _ = Resource.objects.using(self.args.database).get_or_create(name=DESCRIPTION, value=description, resourcetype=rdt)
-            rr = ResourceResource(fromresource=r, toresource=rd)
-            rr.save(using=self.args.database)
+            ResourceResource.objects.using(self.args.database).get_or_create(fromresource=r, toresource=rd)
 
     def removeLabels(self, clusteredGroupName):  # pragma: no cover
         '''
@@ -435,6 +456,8 @@ class Clusterer(BiPlot):
         parser.add_argument('--saveClustersSeq', action='store_true', help='Step through data at specified interval, identify data clusters,'
                                                                           'and save labels to database with --clusteredGroupName option')
         parser.add_argument('--removeLabels', action='store_true', help='Remove Labels created by --saveClusters with --clusteredGroupName option')
+        parser.add_argument('--seq', action='store_true', help='With --removeLabels remove Labels created by --saveClustersSeq; '
+                                                               'the other options must be the same as when they were saved')
         parser.add_argument('--inputs', action='store',
                             help='List of STOQS Parameter names to use as features, separated by spaces', nargs='*')
         parser.add_argument('--start', action='store', help='Start time in YYYYMMDDTHHMMSS format',
@@ -451,7 +474,8 @@ class Clusterer(BiPlot):
                             help='Specify clustering algorithm to use with --createClusters, --clusterSeq, --saveClusters, '
                                                                 'or --saveClusterSeq option')
         parser.add_argument('--clusteredGroupName', action='store', help='Name used to refer to the grouping, such as '
-                                                                '"Cluster label" or "DBSCAN labels"')
+                                                                '"Cluster label" or "DBSCAN labels", it is tagged with the '
+                                                                'algorithm and a digest of the clustering parameters')
         parser.add_argument('--do_not_normalize', action='store_true', help='Pass non-normalized data to the fitting algorithm')
         parser.add_argument('-v', '--verbose', nargs='?', choices=[1, 2, 3], type=int,
                             help='Turn on verbose output. Higher number = more output.', const=1, default=0)
@@ -472,15 +496,15 @@ if __name__ == '__main__':
         c.clusterSeq()
 
     elif c.args.saveClusters:
-        c.saveClusters(' '.join((CLUSTERED, c.args.clusteredGroupName)))
-        c.describeClusterLabels(' '.join((CLUSTERED, c.args.clusteredGroupName)))
+        c.saveClusters(c.runGroupName())
+        c.describeClusterLabels(c.runGroupName())
 
     elif c.args.saveClustersSeq:
-        c.saveClustersSeq(' '.join((CLUSTERED, c.args.clusteredGroupName)))
-        c.describeClusterLabels(' '.join((CLUSTERED, c.args.clusteredGroupName)))
+        c.saveClustersSeq(c.runGroupName(seq=True))
+        c.describeClusterLabels(c.runGroupName(seq=True))
 
     elif c.args.removeLabels:
-        c.removeLabels(' '.join((CLUSTERED, c.args.clusteredGroupName)))
+        c.removeLabels(c.runGroupName(seq=c.args.seq))
 
     else:
         print("fix your inputs")
@@ -72,6 +72,8 @@ class CANONLoader(LoadScript):
     '''
     Common routines for loading all CANON data
     '''
+    # Loads that fail with these are reported but not retried when executed with --workers
+    no_retry_exceptions = (DAPloaders.NoValidData, DAPloaders.DuplicateData, DAPloaders.OpendapError)
 
     brownish = {'dorado':       '8c510a',
                 'tethys':       'bf812d',
@@ -159,7 +161,6 @@ class CANONLoader(LoadScript):
         Support legacy use of loadDorad() and permit wider use by specifying startdate and endate
         '''
         pname = 'dorado'
-        psl = ParentSamplesLoader('', '', dbAlias=self.dbAlias)
         if build_attrs:
             self.logger.info(f'Building load parameter attributes from crawling TDS')
             self.build_dorado_attrs(pname, startdate, enddate, parameters, file_patterns)
@@ -176,23 +177,54 @@ class CANONLoader(LoadScript):
         for url in urls:
             dfile = url.split('/')[-1]
             aname = dfile + getStrideText(stride)
-            try:
-                mps_loaded = DAPloaders.runDoradoLoader(url, self.campaignName, self.campaignDescription, aname, 
-                                           pname, self.colors[pname], 'auv', 'AUV mission', 
-                                           self.dorado_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain,
-                                           plotTimeSeriesDepth=0.0, plankton_proxies=plankton_proxies)
-                if mps_loaded:
-                    psl.load_gulps(aname, dfile, self.dbAlias)
-            except DAPloaders.DuplicateData as e:
-                self.logger.warn(str(e))
-                self.logger.info(f"Skipping load of {url}")
+            self.schedule_load(url, aname, self._load_dorado_url, url, aname, dfile, pname, stride, plankton_proxies)
 
         self.addPlatformResources('https://stoqs.mbari.org/x3d/dorado/simpleDorado389.x3d', pname,
                                   scalefactor=2)
 
-    def _execute_load(self, pname, parameters, stride, critSimpleDepthTime):
+    def _load_dorado_url(self, url, aname, dfile, pname, stride, plankton_proxies):
+        '''Load one Dorado mission and its Gulper samples, may be executed by a scheduler worker
+        '''
+        psl = ParentSamplesLoader('', '', dbAlias=self.dbAlias)
+        try:
+            mps_loaded = DAPloaders.runDoradoLoader(url, self.campaignName, self.campaignDescription, aname, 
+                                       pname, self.colors[pname], 'auv', 'AUV mission', 
+                                       self.dorado_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain,
+                                       plotTimeSeriesDepth=0.0, plankton_proxies=plankton_proxies,
+                                       command_line_args=self.args)
+            if mps_loaded:
+                psl.load_gulps(aname, dfile, self.dbAlias)
+        except DAPloaders.DuplicateData as e:
+            self.logger.warn(str(e))
+            self.logger.info(f"Skipping load of {url}")
+
+    def _load_lrauv_url(self, url, aname, pname, parameters, stride, aux_coords, critSimpleDepthTime):
+        '''Load one LRAUV log file with its samples and missions, may be executed by a scheduler worker
+        '''
         psl = ParentSamplesLoader('', '', dbAlias=self.dbAlias)
         lrauv_ml = MissionLoader('', '', dbAlias=self.dbAlias)
+        try:
+            # Early LRAUV data had time coord of 'Time', override with auxCoords setting from load script
+            DAPloaders.runLrauvLoader(url, self.campaignName, self.campaignDescription, aname, 
+                                      pname, self.colors[pname], 'auv', 'LRAUV log',
+                                      parameters, self.dbAlias, stride, 
+                                      grdTerrain=self.grdTerrain, command_line_args=self.args,
+                                      plotTimeSeriesDepth=0, auxCoords=aux_coords,
+                                      critSimpleDepthTime=critSimpleDepthTime)
+            psl.load_lrauv_samples(pname, aname, url, self.dbAlias)
+            lrauv_ml.load_missions(pname, aname, url, self.dbAlias)
+        except DAPloaders.NoValidData:
+            self.logger.info("No valid data in %s" % url)
+        except (webob.exc.HTTPError, UnboundLocalError) as e:
+            self.logger.warn(f"{e}")
+        except Exception as e:
+            if 'shore_i.nc' in url:
+                self.logger.warn(f"{e}")
+                self.logger.info(f"Being tolerant of shore_i.nc files and ignoring this warning")
+            else:
+                raise
+
+    def _execute_load(self, pname, parameters, stride, critSimpleDepthTime):
         stride = stride or self.stride
         files = getattr(self, f'{pname}_files')
         base = getattr(self, f'{pname}_base')
@@ -208,26 +240,8 @@ class CANONLoader(LoadScript):
             else:
                 setattr(self, f'{pname}s_aux_coords', None)
                 aux_coords = None
-            try:
-                # Early LRAUV data had time coord of 'Time', override with auxCoords setting from load script
-                DAPloaders.runLrauvLoader(url, self.campaignName, self.campaignDescription, aname, 
-                                          pname, self.colors[pname], 'auv', 'LRAUV log',
-                                          parameters, self.dbAlias, stride, 
-                                          grdTerrain=self.grdTerrain, command_line_args=self.args,
-                                          plotTimeSeriesDepth=0, auxCoords=aux_coords,
-                                          critSimpleDepthTime=critSimpleDepthTime)
-                psl.load_lrauv_samples(pname, aname, url, self.dbAlias)
-                lrauv_ml.load_missions(pname, aname, url, self.dbAlias)
-            except DAPloaders.NoValidData:
-                self.logger.info("No valid data in %s" % url)
-            except (webob.exc.HTTPError, UnboundLocalError) as e:
-                self.logger.warn(f"{e}")
-            except Exception as e:
-                if 'shore_i.nc' in url:
-                    self.logger.warn(f"{e}")
-                    self.logger.info(f"Being tolerant of shore_i.nc files and ignoring this warning")
-                else:
-                    raise
+            self.schedule_load(url, aname, self._load_lrauv_url, url, aname, pname, parameters, stride,
+                               aux_coords, critSimpleDepthTime)
 
         self.addPlatformResources(f'https://stoqs.mbari.org/x3d/lrauv/lrauv_{pname}.x3d', pname,
                                   scalefactor=2)
@@ -281,7 +295,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.martin_files], self.martin_files):
             url = self.martin_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            'Martin', self.colors['martin'], 'ship', 'cruise', 
                                            self.martin_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -292,7 +306,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.JMuctd_files], self.JMuctd_files):
             url = self.JMuctd_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            'John_Martin_UCTD', self.colors['martin'], 'ship', 'cruise', 
                                            self.JMuctd_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -303,10 +317,11 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.JMpctd_files], self.JMpctd_files):
             url = self.JMpctd_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            platformName, self.colors['martin'], 'ship', activitytypeName,
                                            self.JMpctd_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
         # load all the bottles           
+        self.run_scheduled_loads()
         sl = SeabirdLoader(aName[:5], platformName, dbAlias=self.dbAlias, campaignName=self.campaignName, 
                            platformColor=self.colors['martin'], platformTypeName='ship', dodsBase=self.JMpctd_base)
         if self.args.verbose:
@@ -321,7 +336,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.fulmar_files], self.fulmar_files):
             url = self.fulmar_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            'fulmar', self.colors['fulmar'], 'ship', 'cruise', 
                                            self.fulmar_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -332,7 +347,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.nps_g29_files], self.nps_g29_files):
             url = self.nps_g29_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'nps_g29', self.colors['nps_g29'], 'glider', 'Glider Mission', 
                                        self.nps_g29_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain,
                                        command_line_args=self.args)
@@ -344,7 +359,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.l_662_files], self.l_662_files):
             url = self.l_662_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'SPRAY_L66_Glider', self.colors['l_662'], 'glider', 'Glider Mission', 
                                        self.l_662_parms, self.dbAlias, stride, self.l_662_startDatetime, 
                                        self.l_662_endDatetime, grdTerrain=self.grdTerrain,
@@ -357,7 +372,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.l_662a_files], self.l_662a_files):
             url = self.l_662a_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName,
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName,
                                        'SPRAY_L66a_Glider', self.colors['l_662a'], 'glider', 'Glider Mission',
                                        self.l_662a_parms, self.dbAlias, stride, self.l_662a_startDatetime,
                                        self.l_662a_endDatetime, grdTerrain=self.grdTerrain,
@@ -370,7 +385,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.nps29_files], self.nps29_files):
             url = self.nps29_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'NPS_Glider_29', self.colors['nps29'], 'glider', 'Glider Mission', 
                                         self.nps29_parms, self.dbAlias, stride, self.nps29_startDatetime, 
                                         self.nps29_endDatetime, grdTerrain=self.grdTerrain, 
@@ -384,7 +399,7 @@ class CANONLoader(LoadScript):
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.sg539_files], self.sg539_files):
             url = self.sg539_base + f
             try:
-                DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName,
+                self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName,
                                        'SG_Glider_539', self.colors['sg539'], 'glider', 'Glider Mission',
                                         self.sg539_parms, self.dbAlias, stride, self.sg539_startDatetime,
                                         self.sg539_endDatetime, grdTerrain=self.grdTerrain,
@@ -400,7 +415,7 @@ class CANONLoader(LoadScript):
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.sg621_files], self.sg621_files):
             url = self.sg621_base + f
             try:
-                DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName,
+                self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName,
                                        'SG_Glider_621', self.colors['sg621'], 'glider', 'Glider Mission',
                                         self.sg621_parms, self.dbAlias, stride, self.sg621_startDatetime,
                                         self.sg621_endDatetime, grdTerrain=self.grdTerrain,
@@ -415,7 +430,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.nps34_files], self.nps34_files):
             url = self.nps34_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'NPS_Glider_34', self.colors['nps34'], 'glider', 'Glider Mission', 
                                         self.nps34_parms, self.dbAlias, stride, self.nps34_startDatetime, 
                                         self.nps34_endDatetime, grdTerrain=self.grdTerrain,
@@ -429,7 +444,7 @@ class CANONLoader(LoadScript):
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.nps34a_files], self.nps34a_files):
             url = self.nps34a_base + f
             try:
-                DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName,
+                self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName,
                                        'NPS_Glider_34', self.colors['nps34a'], 'glider', 'Glider Mission',
                                         self.nps34a_parms, self.dbAlias, stride, self.nps34a_startDatetime,
                                         self.nps34a_endDatetime, grdTerrain=self.grdTerrain,
@@ -449,7 +464,7 @@ class CANONLoader(LoadScript):
             url = self.glider_ctd_base + f
             gplatform=aName.split('_')[0].upper() + '_Glider'
             gname=aName.split('_')[0].lower()
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        gplatform, self.colors[gname], 'glider', 'Glider Mission', 
                                        self.glider_ctd_parms, self.dbAlias, stride, self.glider_ctd_startDatetime, 
                                        self.glider_ctd_endDatetime, grdTerrain=self.grdTerrain)
@@ -465,7 +480,7 @@ class CANONLoader(LoadScript):
             url = self.glider_met_base + f
             gplatform=aName.split('_')[0].upper() + '_Glider'
             gname=aName.split('_')[0].lower()
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        gplatform, self.colors[gname], 'glider', 'Glider Mission', 
                                        self.glider_met_parms, self.dbAlias, stride, self.glider_met_startDatetime, 
                                        self.glider_met_endDatetime, grdTerrain=self.grdTerrain)
@@ -478,7 +493,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.slocum_260_files], self.slocum_260_files):
             url = self.slocum_260_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'Slocum_260', self.colors['slocum_260'], 'glider', 'Glider Mission', 
                                        self.slocum_260_parms, self.dbAlias, stride, self.slocum_260_startDatetime, 
                                        self.slocum_260_endDatetime, grdTerrain=self.grdTerrain)
@@ -490,7 +505,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.slocum_294_files], self.slocum_294_files):
             url = self.slocum_294_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'Slocum_294', self.colors['slocum_294'], 'glider', 'Glider Mission', 
                                        self.slocum_294_parms, self.dbAlias, stride, 
                                        self.slocum_294_startDatetime, self.slocum_294_endDatetime,
@@ -504,7 +519,7 @@ class CANONLoader(LoadScript):
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.slocum_nemesis_files], self.slocum_nemesis_files):
             url = self.slocum_nemesis_base + f
             try:
-                DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+                self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'Slocum_nemesis', self.colors['slocum_nemesis'], 'glider', 'Glider Mission', 
                                         self.slocum_nemesis_parms, self.dbAlias, stride, 
                                         self.slocum_nemesis_startDatetime, self.slocum_nemesis_endDatetime,
@@ -521,7 +536,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_oa_files], self.wg_oa_files):
             url = self.wg_oa_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_OA_Glider', self.colors['wg_oa'], 'waveglider', 'Glider Mission',
                                        self.wg_oa_parms, self.dbAlias, stride, self.wg_oa_startDatetime, 
                                        self.wg_oa_endDatetime, grdTerrain=self.grdTerrain)
@@ -533,7 +548,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_oa_pco2_files], self.wg_oa_pco2_files):
             url = self.wg_oa_pco2_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_OA_Glider', self.colors['wg_oa'], 'waveglider', 'Glider Mission', 
                                        self.wg_oa_pco2_parms, self.dbAlias, stride, 
                                        self.wg_oa_pco2_startDatetime, self.wg_oa_pco2_endDatetime,
@@ -546,7 +561,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_oa_ctd_files], self.wg_oa_ctd_files):
             url = self.wg_oa_ctd_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_OA_Glider', self.colors['wg_oa'], 'waveglider', 'Glider Mission', 
                                        self.wg_oa_ctd_parms, self.dbAlias, stride, self.wg_oa_ctd_startDatetime, 
                                        self.wg_oa_ctd_endDatetime, grdTerrain=self.grdTerrain)
@@ -558,7 +573,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_tex_ctd_files], self.wg_tex_ctd_files):
             url = self.wg_tex_ctd_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_Tex_Glider', self.colors['wg_tex'], 'waveglider', 'Glider Mission', 
                                        self.wg_tex_ctd_parms, self.dbAlias, stride, self.wg_tex_ctd_startDatetime, 
                                        self.wg_tex_ctd_endDatetime, grdTerrain=self.grdTerrain)
@@ -570,7 +585,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_oa_met_files], self.wg_oa_met_files):
             url = self.wg_oa_met_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_OA_Glider', self.colors['wg_oa'], 'waveglider', 'Glider Mission', 
                                        self.wg_oa_met_parms, self.dbAlias, stride, self.wg_oa_met_startDatetime, 
                                        self.wg_oa_met_endDatetime, grdTerrain=self.grdTerrain)
@@ -582,7 +597,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_tex_met_files], self.wg_tex_met_files):
             url = self.wg_tex_met_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_Tex_Glider', self.colors['wg_tex'], 'waveglider', 'Glider Mission', 
                                        self.wg_tex_met_parms, self.dbAlias, stride, self.wg_tex_met_startDatetime, 
                                        self.wg_tex_met_endDatetime, grdTerrain=self.grdTerrain)
@@ -594,7 +609,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_tex_files], self.wg_tex_files):
             url = self.wg_tex_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_Tex_Glider', self.colors['wg_tex'], 'waveglider', 'Glider Mission', 
                                        self.wg_tex_parms, self.dbAlias, stride, self.wg_tex_startDatetime, 
                                        self.wg_tex_endDatetime, grdTerrain=self.grdTerrain)
@@ -606,7 +621,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_Tiny_files], self.wg_Tiny_files):
             url = self.wg_Tiny_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_Tiny_Glider', self.colors['wg_Tiny'], 'waveglider', 'Glider Mission',
                                        self.wg_Tiny_parms, self.dbAlias, stride, self.wg_Tiny_startDatetime, 
                                        self.wg_Tiny_endDatetime, grdTerrain=self.grdTerrain, plotTimeSeriesDepth=0,
@@ -619,7 +634,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_Sparky_files], self.wg_Sparky_files):
             url = self.wg_Sparky_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName,
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName,
                                        'wg_Sparky_Glider', self.colors['wg_Sparky'], 'waveglider', 'Glider Mission',
                                        self.wg_Sparky_parms, self.dbAlias, stride, self.wg_Sparky_startDatetime,
                                        self.wg_Sparky_endDatetime, grdTerrain=self.grdTerrain, plotTimeSeriesDepth=0)
@@ -631,7 +646,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_272_files], self.wg_272_files):
             url = self.wg_272_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName,
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName,
                                        'wg_272_Glider', self.colors['wg_272'], 'waveglider', 'Glider Mission',
                                        self.wg_272_parms, self.dbAlias, stride, self.wg_272_startDatetime,
                                        self.wg_272_endDatetime, grdTerrain=self.grdTerrain, plotTimeSeriesDepth=0)
@@ -643,7 +658,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_Hansen_files], self.wg_Hansen_files):
             url = self.wg_Hansen_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName,
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName,
                                        'wg_Hansen_Glider', self.colors['wg_Hansen'], 'waveglider', 'Glider Mission',
                                        self.wg_Hansen_parms, self.dbAlias, stride, self.wg_Hansen_startDatetime,
                                        self.wg_Hansen_endDatetime, grdTerrain=self.grdTerrain, plotTimeSeriesDepth=0,
@@ -657,7 +672,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wg_oa_files], self.wg_oa_files):
             url = self.wg_oa_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'wg_OA_Glider', self.colors['wg_oa'], 'waveglider', 'Glider Mission', 
                                        self.wg_oa_parms, self.dbAlias, stride, self.wg_oa_startDatetime, 
                                        self.wg_oa_endDatetime, grdTerrain=self.grdTerrain)
@@ -669,7 +684,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.oa1_files], self.oa1_files):
             url = os.path.join(self.oa1_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA1_Mooring', self.colors['oa'], 'mooring', 'Mooring Deployment',
                                         self.oa1_parms, self.dbAlias, stride, self.oa1_startDatetime, self.oa1_endDatetime,
                                         command_line_args=self.args)
@@ -681,7 +696,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.oa2_files], self.oa2_files):
             url = os.path.join(self.oa2_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA2_Mooring', self.colors['oa2'], 'mooring', 'Mooring Deployment',
                                         self.oa2_parms, self.dbAlias, stride, self.oa2_startDatetime, self.oa2_endDatetime,
                                         command_line_args=self.args)
@@ -694,7 +709,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA1pco2_files], self.OA1pco2_files):
             url = os.path.join(self.OA1pco2_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA1_Mooring', self.colors['oa'], 'mooring', 'Mooring Deployment', 
                                         self.OA1pco2_parms, self.dbAlias, stride, self.OA1pco2_startDatetime, self.OA1pco2_endDatetime)
 
@@ -706,7 +721,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA1fl_files], self.OA1fl_files):
             url = os.path.join(self.OA1fl_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA1_Mooring', self.colors['oa'], 'mooring', 'Mooring Deployment', 
                                         self.OA1fl_parms, self.dbAlias, stride, self.OA1fl_startDatetime, self.OA1fl_endDatetime)
 
@@ -718,7 +733,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA1o2_files], self.OA1o2_files):
             url = os.path.join(self.OA1o2_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA1_Mooring', self.colors['oa'], 'mooring', 'Mooring Deployment', 
                                         self.OA1o2_parms, self.dbAlias, stride, self.OA1o2_startDatetime, self.OA1o2_endDatetime)
 
@@ -729,7 +744,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA1ctd_files], self.OA1ctd_files):
             url = os.path.join(self.OA1ctd_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA1_Mooring', self.colors['oa'], 'mooring', 'Mooring Deployment', 
                                         self.OA1ctd_parms, self.dbAlias, stride, self.OA1ctd_startDatetime, self.OA1ctd_endDatetime)
 
@@ -741,7 +756,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA1pH_files], self.OA1pH_files):
             url = os.path.join(self.OA1pH_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA1_Mooring', self.colors['oa'], 'mooring', 'Mooring Deployment', 
                                         self.OA1pH_parms, self.dbAlias, stride, self.OA1pH_startDatetime, self.OA1pH_endDatetime)
 
@@ -753,7 +768,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA1met_files], self.OA1met_files):
             url = os.path.join(self.OA1met_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA1_Mooring', self.colors['oa'], 'mooring', 'Mooring Deployment', 
                                         self.OA1met_parms, self.dbAlias, stride, self.OA1met_startDatetime, self.OA1met_endDatetime)
 
@@ -765,7 +780,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA2pco2_files], self.OA2pco2_files):
             url = os.path.join(self.OA2pco2_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA2_Mooring', self.colors['oa2'], 'mooring', 'Mooring Deployment', 
                                         self.OA2pco2_parms, self.dbAlias, stride, self.OA2pco2_startDatetime, self.OA2pco2_endDatetime)
 
@@ -777,7 +792,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA2fl_files], self.OA2fl_files):
             url = os.path.join(self.OA2fl_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA2_Mooring', self.colors['oa2'], 'mooring', 'Mooring Deployment', 
                                         self.OA2fl_parms, self.dbAlias, stride, self.OA2fl_startDatetime, self.OA2fl_endDatetime)
 
@@ -789,7 +804,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA2o2_files], self.OA2o2_files):
             url = os.path.join(self.OA2o2_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA2_Mooring', self.colors['oa2'], 'mooring', 'Mooring Deployment', 
                                         self.OA2o2_parms, self.dbAlias, stride, self.OA2o2_startDatetime, self.OA2o2_endDatetime)
 
@@ -800,7 +815,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA2ctd_files], self.OA2ctd_files):
             url = os.path.join(self.OA2ctd_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA2_Mooring', self.colors['oa2'], 'mooring', 'Mooring Deployment', 
                                         self.OA2ctd_parms, self.dbAlias, stride, self.OA2ctd_startDatetime, self.OA2ctd_endDatetime)
 
@@ -812,7 +827,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA2pH_files], self.OA2pH_files):
             url = os.path.join(self.OA2pH_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA2_Mooring', self.colors['oa2'], 'mooring', 'Mooring Deployment', 
                                         self.OA2pH_parms, self.dbAlias, stride, self.OA2pH_startDatetime, self.OA2pH_endDatetime)
 
@@ -824,7 +839,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.OA2met_files], self.OA2met_files):
             url = os.path.join(self.OA2met_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'OA2_Mooring', self.colors['oa2'], 'mooring', 'Mooring Deployment', 
                                         self.OA2met_parms, self.dbAlias, stride, self.OA2met_startDatetime, self.OA2met_endDatetime)
 
@@ -836,7 +851,7 @@ class CANONLoader(LoadScript):
         pName = 'ESP_Bruce_Mooring'
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.bruce_moor_files], self.bruce_moor_files):
             url = os.path.join(self.bruce_moor_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         pName, self.colors['espbruce'], 'mooring', 
                                         'Mooring Deployment', self.bruce_moor_parms, self.dbAlias, stride, 
                                         self.bruce_moor_startDatetime, self.bruce_moor_endDatetime)
@@ -852,7 +867,7 @@ class CANONLoader(LoadScript):
         pName = 'ESP_Mack_Mooring'
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.mack_moor_files], self.mack_moor_files):
             url = os.path.join(self.mack_moor_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         pName, self.colors['espmack'], 'mooring', 'Mooring Deployment',
                                         self.mack_moor_parms, self.dbAlias, stride, 
                                         self.mack_moor_startDatetime, self.mack_moor_endDatetime)
@@ -870,7 +885,7 @@ class CANONLoader(LoadScript):
         end_datetime = getattr(self, 'm1_endDatetime', None)
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.m1_files], self.m1_files):
             url = os.path.join(self.m1_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         platformName, self.colors['m1'], 'mooring', 'Mooring Deployment', 
                                         self.m1_parms, self.dbAlias, stride, start_datetime, 
                                         end_datetime, command_line_args=self.args) 
@@ -892,7 +907,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.m2_files], self.m2_files):
             url = os.path.join(self.m2_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         platformName, self.colors['m2'], 'mooring', 'Mooring Deployment', 
                                         self.m2_parms, self.dbAlias, stride, self.m2_startDatetime, 
                                         self.m2_endDatetime, command_line_args=self.args)
@@ -913,7 +928,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.m1ts_files], self.m1ts_files):
             url = self.m1ts_base + f
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'M1_Mooring', self.colors['m1'], 'mooring', 'Mooring Deployment', 
                                         self.m1ts_parms, self.dbAlias, stride, 
                                         self.m1ts_startDatetime, self.m1ts_endDatetime)
@@ -925,7 +940,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.m1met_files], self.m1met_files):
             url = self.m1met_base + f
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         'M1_Mooring', self.colors['m1'], 'mooring', 'Mooring Deployment', 
                                         self.m1met_parms, self.dbAlias, stride, 
                                         self.m1met_startDatetime, self.m1met_endDatetime)
@@ -938,7 +953,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.deimos_files], self.deimos_files):
             url = os.path.join(self.deimos_base, f)
-            DAPloaders.runMooringLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runMooringLoader, url, self.campaignName, self.campaignDescription, aName, 
                                         platformName, self.colors['deimos'], 'mooring', 'Mooring Deployment', 
                                         self.deimos_parms, self.dbAlias, stride, startdate,
                                         enddate, command_line_args=self.args) 
@@ -950,7 +965,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.hehape_files], self.hehape_files):
             url = self.hehape_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'hehape', self.colors['hehape'], 'glider', 'Glider Mission', 
                                        self.hehape_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -961,7 +976,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.rusalka_files], self.rusalka_files):
             url = self.rusalka_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'rusalka', self.colors['rusalka'], 'glider', 'Glider Mission', 
                                        self.rusalka_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -972,7 +987,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.carmen_files], self.carmen_files):
             url = self.carmen_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'carmen', self.colors['carmen'], 'glider', 'Glider Mission', 
                                        self.carmen_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -983,7 +998,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.waveglider_files], self.waveglider_files):
             url = self.waveglider_base + f
-            DAPloaders.runGliderLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runGliderLoader, url, self.campaignName, self.campaignDescription, aName, 
                                        'waveglider', self.colors['waveglider'], 'glider', 'Glider Mission', 
                                        self.waveglider_parms, self.dbAlias, stride, self.waveglider_startDatetime, 
                                        self.waveglider_endDatetime, grdTerrain=self.grdTerrain)
@@ -996,7 +1011,7 @@ class CANONLoader(LoadScript):
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.stella_files], self.stella_files):
             url = self.stella_base + f
             dname='Stella' + aName[6:9]
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            dname, self.colors[dname], 'drifter', 'Stella drifter Mission', 
                                            self.stella_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -1007,7 +1022,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.espdrift_files], self.espdrift_files):
             url = self.espdrift_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            'espdrift', self.colors['espdrift'], 'drifter', 'ESP drift Mission', 
                                            self.espdrift_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -1018,7 +1033,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.espmack_files], self.espmack_files):
             url = self.espmack_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            'ESP_Mack_Drifter', self.colors['espmack'], 'espmack', 'ESP mack Mission', 
                                            self.espmack_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -1029,7 +1044,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.espbruce_files], self.espbruce_files):
             url = self.espbruce_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            'espbruce', self.colors['espbruce'], 'espbruce', 'ESP bruce Mission', 
                                            self.espbruce_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -1042,7 +1057,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.wfuctd_files], self.wfuctd_files):
             url = self.wfuctd_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            platformName, self.colors['flyer'], 'ship', activitytypeName,
                                            self.wfuctd_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -1057,10 +1072,11 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a.split('.')[0] + getStrideText(stride) for a in self.wfpctd_files], self.wfpctd_files):
             url = self.wfpctd_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            platformName, self.colors['flyer'], 'ship', activitytypeName, 
                                            self.wfpctd_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
         # Now load all the bottles           
+        self.run_scheduled_loads()
         sl = SeabirdLoader('activity name', platformName, dbAlias=self.dbAlias, campaignName=self.campaignName, 
                            platformColor=self.colors['flyer'], dodsBase=self.wfpctd_base)
         if self.args.verbose:
@@ -1075,7 +1091,7 @@ class CANONLoader(LoadScript):
         stride = stride or self.stride
         for (aName, f) in zip([ a + getStrideText(stride) for a in self.rcuctd_files], self.rcuctd_files):
             url = self.rcuctd_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            platformName, self.colors['carson'], 'ship', activitytypeName, 
                                            self.rcuctd_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
 
@@ -1087,11 +1103,11 @@ class CANONLoader(LoadScript):
         #platformName = 'rc_pctd'
         for (aName, f) in zip([ a.split('.')[0] + getStrideText(stride) for a in self.rcpctd_files], self.rcpctd_files):
             url = self.rcpctd_base + f
-            DAPloaders.runTrajectoryLoader(url, self.campaignName, self.campaignDescription, aName, 
+            self.schedule_load(url, aName, DAPloaders.runTrajectoryLoader, url, self.campaignName, self.campaignDescription, aName, 
                                            platformName, self.colors['carson'], 'ship', activitytypeName, 
                                            self.rcpctd_parms, self.dbAlias, stride, grdTerrain=self.grdTerrain)
         # load all the bottles           
-
+        self.run_scheduled_loads()
         sl = SeabirdLoader(aName[:5], platformName, dbAlias=self.dbAlias, campaignName=self.campaignName, 
                            platformColor=self.colors['carson'], platformTypeName='ship', dodsBase=self.rcpctd_base)
         if self.args.verbose:
@@ -1243,6 +1259,7 @@ class CANONLoader(LoadScript):
         Load water sample analysis Sampled data values from spreadsheets (.csv files).  Expects to have the subsample_csv_base and
         subsample_csv_files set by the load script.
         '''
+        self.run_scheduled_loads()
         ssl = SubSamplesLoader('', '', dbAlias=self.dbAlias)
         if self.args.verbose:
             ssl.logger.setLevel(logging.DEBUG)
@@ -1257,6 +1274,7 @@ class CANONLoader(LoadScript):
         '''
         Load Parent NetTow Samples. This must be done after CTD cast data are loaded and before subsamples are loaded.
         '''
+        self.run_scheduled_loads()
         nt = NetTow()
         ns = Namespace()
 
@@ -1280,6 +1298,7 @@ class CANONLoader(LoadScript):
         Load Parent PlanktonPump Samples. This must be done after CTD cast data are loaded and before subsamples are loaded.
         duration is pumping time in minutes.
         '''
+        self.run_scheduled_loads()
         pp = PlanktonPump()
         ns = Namespace()
 
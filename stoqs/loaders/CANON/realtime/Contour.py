@@ -33,16 +33,14 @@ import tempfile
 import shutil
 
 from django.contrib.gis.geos import MultiPoint
+from django.db import connections
 from django.db.models import Max, Min
 from django.conf import settings
-from collections import defaultdict
 from datetime import datetime, timedelta, tzinfo
 from matplotlib.ticker import FormatStrFormatter
-#from matplotlib.mlab import griddata
-from scipy.interpolate import griddata
+from utils.gridding import grid, NEAREST
 from mpl_toolkits.basemap import Basemap
 from stoqs.models import Activity, ActivityParameter, ParameterResource, Platform, MeasuredParameter, Measurement, Parameter
-from utils.utils import percentile
 from matplotlib.transforms import Bbox, TransformedBbox
 from matplotlib import dates
 from mpl_toolkits.axes_grid1.inset_locator import BboxPatch, BboxConnectorPatch
@@ -79,6 +77,8 @@ class Contour(object):
         self.zoom = zoom
         self.overlap = overlap
         self.dirpath = []
+        self.data = None
+        self.maptracks = {}
 
     def getActivityExtent(self,start_datetime, end_datetime):
         '''
@@ -111,11 +111,69 @@ class Contour(object):
 
         return pmin, pmax, units
 
+    def getPlatformData(self, platform, parameters, start_datetime, end_datetime):
+        '''
+        Return dictionary keyed by parameter name of numpy arrays of the MeasuredParameters of a list of Parameters
+        from a Platform, read with one query and sorted newest first
+        '''
+        sql = '''SELECT stoqs_parameter.name, stoqs_instantpoint.timevalue, stoqs_measurement.depth,
+                        ST_X(stoqs_measurement.geom), ST_Y(stoqs_measurement.geom), stoqs_measuredparameter.datavalue,
+                        stoqs_instantpoint.activity_id
+                 FROM stoqs_measuredparameter
+                 INNER JOIN stoqs_parameter ON stoqs_measuredparameter.parameter_id = stoqs_parameter.id
+                 INNER JOIN stoqs_measurement ON stoqs_measuredparameter.measurement_id = stoqs_measurement.id
+                 INNER JOIN stoqs_instantpoint ON stoqs_measurement.instantpoint_id = stoqs_instantpoint.id
+                 INNER JOIN stoqs_activity ON stoqs_instantpoint.activity_id = stoqs_activity.id
+                 INNER JOIN stoqs_platform ON stoqs_activity.platform_id = stoqs_platform.id
+                 WHERE stoqs_platform.name = %s AND stoqs_parameter.name = ANY(%s)
+                   AND stoqs_instantpoint.timevalue BETWEEN %s AND %s'''
+        with connections[self.database].cursor() as cursor:
+            cursor.execute(sql, [platform, list(parameters), self.naiveUTC(start_datetime), self.naiveUTC(end_datetime)])
+            rows = cursor.fetchall()
+
+        if not rows:
+            return {}
+
+        names, timevalues, depths, lons, lats, datavalues, activities = list(zip(*rows))
+        names, indices = np.unique(names, return_inverse=True)
+        times = np.array(timevalues, dtype='datetime64[us]')
+
+        # Group by Parameter, newest first within each group
+        order = np.lexsort((-times.astype(np.int64), indices))
+        starts = np.searchsorted(indices[order], np.arange(len(names) + 1))
+        columns = {'time': times, 'depth': np.array(depths, dtype=np.float64), 'lon': np.array(lons, dtype=np.float64),
+                   'lat': np.array(lats, dtype=np.float64), 'datavalue': np.array(datavalues, dtype=np.float64),
+                   'activity': np.array(activities, dtype=np.int64)}
+
+        data = {}
+        for i, name in enumerate(names):
+            group = order[starts[i]:starts[i + 1]]
+            data[name] = {key: values[group] for key, values in columns.items()}
+
+        return data
+
+    def naiveUTC(self, dt):
+        '''
+        Return datetime dt in UTC without tzinfo, as the timevalues are stored in the database
+        '''
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(pytz.utc).replace(tzinfo=None)
+        return dt
+
+    def getMaptracks(self, activity_ids):
+        '''
+        Return list of the maptracks of the Activities with activity_ids, each read from the database only once
+        '''
+        missing = set(activity_ids) - set(self.maptracks)
+        if missing:
+            self.maptracks.update(Activity.objects.using(self.database).filter(id__in=missing).values_list('id', 'maptrack'))
+        return [self.maptracks[a] for a in activity_ids]
+
     def getTimeSeriesData(self, start_datetime, end_datetime):
         '''
         Return time series of a list of Parameters from a Platform
         '''
-        data_dict = defaultdict(lambda: {'datetime': [], 'lon': [], 'lat': [], 'depth': [], 'datavalue':[], 'units':'', 'p010':'', 'p990':''})
+        data_dict = {}
 
         start_dt= []
         end_dt = []
@@ -124,63 +182,47 @@ class Contour(object):
             raise Exception('Must specify list plotGroup')
 
         for pln in self.platformName:
-            for g in self.plotGroup:
-                parameters = [x.strip() for x in g.split(',')]
+            groups = [[x.strip() for x in g.split(',')] for g in self.plotGroup]
+            pnames = set(pname for parameters in groups for pname in parameters)
+
+            # Percentiles and units from the ActivityParameters of the Platform's Activities
+            apQS = ActivityParameter.objects.using(self.database)
+            apQS = apQS.filter(activity__platform__name=pln, parameter__name__in=pnames)
+            apQS = apQS.values('parameter__name', 'parameter__units').annotate(Min('p010'), Max('p990'))
+            aps = {ap['parameter__name']: ap for ap in apQS}
+
+            platform_data = self.getPlatformData(pln, pnames, start_datetime, end_datetime)
+
+            for parameters in groups:
                 parameters_valid = []
-                try:
-                    for pname in parameters:
-
-                        apQS = ActivityParameter.objects.using(self.database)
-                        apQS = apQS.filter(activity__platform__name=pln)
-                        apQS = apQS.filter(parameter__name=pname)
-                        pQS = apQS.aggregate(Min('p010'), Max('p990'))
-                        data_dict[pln+pname]['p010'] = pQS['p010__min']
-                        data_dict[pln+pname]['p990'] = pQS['p990__max']
-                        units=apQS.values('parameter__units')
-                        data_dict[pln+pname]['units'] = units[0]['parameter__units']
-
-                        qs = MeasuredParameter.objects.using(self.database)
-                        qs = qs.filter(measurement__instantpoint__timevalue__gte=start_datetime)
-                        qs = qs.filter(measurement__instantpoint__timevalue__lte=end_datetime)
-                        qs = qs.filter(parameter__name=pname)
-                        qs = qs.filter(measurement__instantpoint__activity__platform__name=pln)
-                        sdt_count = qs.values_list('measurement__instantpoint__simpledepthtime__depth').count()
-                        qs = qs.values('measurement__instantpoint__timevalue', 'measurement__depth', 'measurement__geom', 'datavalue'
-                                       ).order_by('measurement__instantpoint__timevalue')
-                        data_dict[pln+pname]['sdt_count'] = sdt_count
-
-                        # only plot data with more than one point
-                        if len(qs) > 0:
-                            for rs in qs:
-                                geom = rs['measurement__geom']
-                                lat = geom.y
-                                lon = geom.x
-                                data_dict[pln+pname]['lat'].insert(0, lat)
-                                data_dict[pln+pname]['lon'].insert(0, lon)
-                                data_dict[pln+pname]['datetime'].insert(0, rs['measurement__instantpoint__timevalue'])
-                                data_dict[pln+pname]['depth'].insert(0, rs['measurement__depth'])
-                                data_dict[pln+pname]['datavalue'].insert(0, rs['datavalue'])
-
-                            # for salinity, throw out anything less than 20 and do the percentiles manually
-                            if pname.find('salinity') != -1 :
-                                numpvar = np.array(data_dict[pln+pname]['datavalue'])
-                                numpvar_filtered = numpvar[numpvar>20.0]
-                                numpvar_filtered.sort()
-                                listvar = list(numpvar_filtered)
-                                p010 = percentile(listvar, 0.010)
-                                p990 = percentile(listvar, 0.990)
-                                data_dict[pln+pname]['p010'] = p010
-                                data_dict[pln+pname]['p990'] = p990
-
-                            # dates are in reverse order - newest first
-                            start_dt.append(data_dict[pln+pname]['datetime'][-1])
-                            end_dt.append(data_dict[pln+pname]['datetime'][0])
-                            logger.debug('Loaded data for parameter {}'.format(pname))
-                            parameters_valid.append(pname)
-
-                except Exception:
-                    logger.error('{} not available in database for the dates {} {}'.format(pname, start_datetime, end_datetime))
-                    continue
+                for pname in parameters:
+                    if pname not in aps or pname not in platform_data:
+                        logger.error('{} not available in database for the dates {} {}'.format(pname, start_datetime, end_datetime))
+                        continue
+
+                    d = platform_data[pname]
+                    d['datetime'] = d['time'].tolist()
+                    d['units'] = aps[pname]['parameter__units']
+                    d['p010'] = aps[pname]['p010__min']
+                    d['p990'] = aps[pname]['p990__max']
+                    # Each InstantPoint has at most one SimpleDepthTime point
+                    d['sdt_count'] = len(d['datavalue'])
+
+                    # for salinity, throw out anything less than 20 and do the percentiles manually
+                    if pname.find('salinity') != -1 :
+                        numpvar_filtered = d['datavalue'][d['datavalue'] > 20.0]
+                        if numpvar_filtered.size:
+                            d['p010'], d['p990'] = np.percentile(numpvar_filtered, [1.0, 99.0])
+                        else:
+                            d['p010'], d['p990'] = None, None
+
+                    data_dict[pln+pname] = d
+
+                    # dates are in reverse order - newest first
+                    start_dt.append(d['datetime'][-1])
+                    end_dt.append(d['datetime'][0])
+                    logger.debug('Loaded data for parameter {}'.format(pname))
+                    parameters_valid.append(pname)
 
                 if len(parameters_valid) > 0:
                     self.plotGroupValid.append(','.join(parameters_valid))
@@ -206,38 +248,29 @@ class Contour(object):
         return data_dict, data_start_dt, data_end_dt
 
     def getMeasuredPPData(self, start_datetime, end_datetime, platform, parm):
-        points = []
-        data = []
-        activity_names = []
-        maptracks = []
-
+        '''
+        Return datavalues, (lon, lat) points and the maptracks of the Activities of a Parameter from a Platform
+        in time order, from the data read by getTimeSeriesData() when the Parameter is in the plotGroup
+        '''
         try:
-            qs = MeasuredParameter.objects.using(self.database)
-            qs = qs.filter(measurement__instantpoint__timevalue__gte=start_datetime)
-            qs = qs.filter(measurement__instantpoint__timevalue__lte=end_datetime)
-            qs = qs.filter(parameter__name=parm)
-            qs = qs.filter(measurement__instantpoint__activity__platform__name=platform)
-            qs = qs.values('measurement__instantpoint__timevalue', 'measurement__geom', 'parameter', 'datavalue', 
-                           'measurement__instantpoint__activity__maptrack',  'measurement__instantpoint__activity__name'
-                           ).order_by('measurement__instantpoint__timevalue')
-
-            for rs in qs:
-                geom = rs['measurement__geom']
-                lon = geom.x
-                lat = geom.y
-                pt = Point(float(lon),float(lat))
-                points.append(pt)
-                value = rs['datavalue']
-                data.append(float(value))
-                geom = rs['measurement__instantpoint__activity__maptrack']
-                activity_name = rs['measurement__instantpoint__activity__name']
-                # only keep  maptracks from new activities
-                if not any(activity_name in s for s in activity_names):
-                    activity_names.append(activity_name)
-                    maptracks.append(geom)
+            d = self.data.get(platform+parm) if self.data else None
+            if d is None:
+                d = self.getPlatformData(platform, [parm], start_datetime, end_datetime)[parm]
+
+            # Oldest first
+            times = d['time'][::-1]
+            in_range = (times >= np.datetime64(self.naiveUTC(start_datetime))) & (times <= np.datetime64(self.naiveUTC(end_datetime)))
+            data = d['datavalue'][::-1][in_range]
+            points = np.column_stack((d['lon'][::-1][in_range], d['lat'][::-1][in_range]))
+
+            # only keep  maptracks from new activities
+            activities = d['activity'][::-1][in_range]
+            _, firsts = np.unique(activities, return_index=True)
+            maptracks = self.getMaptracks(activities[np.sort(firsts)].tolist())
 
         except Exception:
-            logger.error('{} not available in database for the dates {} {}', parm, start_datetime, end_datetime)
+            logger.error('{} not available in database for the dates {} {}'.format(parm, start_datetime, end_datetime))
+            return [], np.empty((0, 2)), []
 
         return data, points, maptracks
 
@@ -344,7 +377,7 @@ class Contour(object):
         for group in self.plotGroupValid:
             parm = [x.strip() for x in group.split(',')]
             for name in parm:
-                y = max(self.data[pn+name]['depth'])
+                y = np.nanmax(self.data[pn+name]['depth'])
                 sz = len(self.data[pn+name]['datavalue'])
                 if y > maxy:
                     maxy = y
@@ -428,12 +461,7 @@ class Contour(object):
                 if not x:
                     tmin = time.mktime(start_datetime.timetuple())
                     tmax = time.mktime(end_datetime.timetuple())
-                    x.append(tmin)
-                    x.append(tmax)
-                    y.append(np.NaN)
-                    y.append(np.NaN)
-                    z.append(np.NaN)
-                    z.append(np.NaN)
+                    x, y, z = [tmin, tmax], [np.NaN, np.NaN], [np.NaN, np.NaN]
 
                 if plot_scatter_contour:
                     cs0, _, scale_factor = self.createContourPlot(title + pn,ax0_plot,x,y,z,rangey,rangez,start_datetime,end_datetime,sdt_count)
@@ -641,7 +669,7 @@ class Contour(object):
             if (len(z) == 0):
                 raise('No data returned to grid')
             logger.debug('Gridding')
-            zi = griddata((x, y), np.array(z), (xi[None,:], yi[:,None]), method='nearest')
+            zi = grid(x, y, z, xi, yi, method=NEAREST, rescale=False)
             logger.debug('Done gridding')
         except KeyError as e:
             logger.warning('Got KeyError. Could not grid the data')
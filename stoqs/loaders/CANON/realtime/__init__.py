@@ -9,8 +9,10 @@ MBARI 22 May 2012
 '''
 
 import os
+import socket
 import sys
 import datetime
+import time
 import amqplib.client_0_8 as amqp
 from optparse import OptionParser
 import signal
@@ -25,16 +27,26 @@ project_dir = os.path.dirname(__file__)
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../../"))  # settings.py is three dirs up
 from django.conf import settings
 from stoqs import models as m
-from django.db.utils import IntegrityError
+from django.db import transaction
+from django.db.utils import IntegrityError, DatabaseError
 from django.contrib.gis.geos import LineString, Point
 from coards import to_udunits
 import numpy
-from utils.utils import percentile, median, mode
+from loaders import STOQS_Loader, partitions
+from utils.optionscache import bump_load_generation
 
 logger = logging.getLogger('__main__')
 logger.setLevel(logging.DEBUG)
 
 
+# Defaults for the number of measured values and the time in milliseconds to buffer before writing to the database
+BATCH_ROWS = 500
+BATCH_MS = 2000
+
+# Consecutive failures of flush() to write the same buffered measurements before giving up
+FLUSH_ATTEMPTS = 5
+
+
 class InterruptedBySignal(Exception):
     pass
 
@@ -46,13 +58,28 @@ class Consumer(object):
     Credentials are read in from privateSettings
     '''
 
-    def __init__(self, vhost = 'trackingvhost', exchange_name = '', exchange_type = '', queue_name = '', routing_key = '', dbAlias = ''):
+    def __init__(self, vhost = 'trackingvhost', exchange_name = '', exchange_type = '', queue_name = '', routing_key = '', dbAlias = '',
+                 batch_rows = BATCH_ROWS, batch_ms = BATCH_MS):
         self.vhost = vhost
         self.exchange_name = exchange_name
         self.exchange_type = exchange_type
         self.queue_name = queue_name
         self.routing_key = routing_key
         self.dbAlias = dbAlias
+        self.batch_rows = batch_rows
+        self.batch_ms = batch_ms
+
+        # Measurements waiting for flush(), the time.time() the first was buffered and the number
+        # of consecutive failures to write them
+        self.pending = []
+        self.pending_since = None
+        self.failed_flushes = 0
+
+        # Parameters by name, and the Activity's simplified maptrack coordinates and depth range
+        # as of the last flush() - set by loadActivityState()
+        self.parameters = {}
+        self.track = None
+        self.depth_range = None
 
         (self.connection, self.channel) = self.create_connection_and_channel(vhost)
 
@@ -85,52 +112,28 @@ class Consumer(object):
 
 
     def persistMessage(self, message):
-        '''Callback function for AMQP message.  Assume that we are processing Frederic's trex sensor messages.'''
+        '''Callback function for AMQP message.  Assume that we are processing Frederic's trex sensor messages.
+        The measured values are buffered and written by flush() once there are batch_rows of them or
+        the oldest has waited batch_ms milliseconds.'''
         logger.info('persistMessage(): Received SensorMessage object: ')
         sm = trex_sensor_pb2.SensorMessage()
         logger.info("persistMessage(): Length of message.body = %i", len(message.body))
         sm.ParseFromString(message.body)
-        parameterCount = {}
-        i = 0
         measVars = ['temperature', 'salinity', 'nitrate', 'gulper_id']
         for s in sm.sample:
-            i += 1
-            print((20*'-'))
-            print(("%d. %s" % (i, s)))
             # Assume that every sample has utime, easting, northing, and depth (not every sample has all of the state variables)
+            dt = datetime.datetime.fromtimestamp(s.utime)
+            (lon, lat) = self.utmProj(s.easting, s.northing, inverse = True)
+            logger.debug("utime = %d, lat = %f, lon = %f, depth = %f", s.utime, lat, lon, s.depth)
             for mv in measVars:
-                if s.HasField(mv):
-                    logger.debug("utime = %d", s.utime)
-                    dt = datetime.datetime.fromtimestamp(s.utime)
-                    print(("dt = %s" % dt))
-                    logger.debug("easting = %f", s.easting)
-                    logger.debug("northing = %f", s.northing)
-                    (lon, lat) = self.utmProj(s.easting, s.northing, inverse = True)
-                    print(("lat = %f" % lat))
-                    print(("lon = %f" % lon))
-
-                    print(("depth = %f" % s.depth))
-                    value = s.__getattribute__(mv)
-                    print(("%s = %f" % (mv, value)))
-        
-                    if mv == 'gulper_id':
-                        logger.info('>>> gulper_id = %s', value)
-                        self.persistSample(dt, s.depth, lat, lon, mv, value)
-                    else:
-                        try:
-                            self.persistMeasurement(dt, s.depth, lat, lon, mv, value)
-                        except Exception as e:
-                            logger.error("ERROR: *** Could not persist this measurement.  Is something wrong with PostgreSQL?  See details below. ***\n")
-                            logger.error(e)
-                            traceback.print_exc(file = sys.stdout)
-                            ##sys.exit(-1)
-                            print("Continuing on with processing messages...")
-                        else:
-                            if mv in parameterCount:
-                                parameterCount[mv] += 1
-                            else:
-                                parameterCount[mv] = 0
-                            logger.debug('parameterCount = %s', parameterCount)
+                if not s.HasField(mv):
+                    continue
+                value = s.__getattribute__(mv)
+                if mv == 'gulper_id':
+                    logger.info('>>> gulper_id = %s', value)
+                    self.persistSample(dt, s.depth, lat, lon, mv, value)
+                else:
+                    self.persistMeasurement(dt, s.depth, lat, lon, mv, value)
 
             # As a test email extrapolated position to driftertrack - this will obscure sensortrack data visualization
             ##(lon, lat) = self.utmProj(s.easting, s.northing, inverse = True)
@@ -139,47 +142,114 @@ class Consumer(object):
             ##print "Mailing message to driftertrack with command:\n%s" % cmd
             ##os.system(cmd);
 
-        # Update Activity attributes with info that stoqs/query needs
-        try:
-            pass
-        except Exception as e:
-            logger.error("ERROR: *** Could not update MapTrack or SimpleDepthTime.  Is something wrong with PostgreSQL?  See details below. ***\n")
-            logger.error(e)
-            traceback.print_exc(file = sys.stdout)
-            sys.exit(-1)
-        
-        self.updateMaptrack()
-        self.updateSimpleDepthTime()
-        self.updateActivityParameterStats(parameterCount)
-
-        logger.debug("EXITING for debug")
-        sys.exit(-1)
+        if self.batchDue():
+            self.flush()
 
     def persistMeasurement(self, dt, depth, lat, lon, var, value):
-        '''Call all of the create_ methods to properly persist this measurement in STOQS'''
-
-        try:
-            parm, _ = m.Parameter.objects.using(self.dbAlias).get_or_create(name = var)
-        except Exception as e:
-            print(("ERROR: *** Could not get_or_create name = '%s'.  See details below. ***\n" % var))
-            print(e)
-            traceback.print_exc(file = sys.stdout)
-            print("Continuing on with processing messages...")
-            ##sys.exit(-1)
+        '''Buffer this measurement to be persisted in STOQS by the next flush()'''
+        if not self.pending:
+            self.pending_since = time.time()
+        self.pending.append((dt, float(depth), lat, lon, var, float(value)))
+
+    def batchDue(self):
+        '''Return True if the buffered measurements should be flushed to the database'''
+        if not self.pending:
+            return False
+        return len(self.pending) >= self.batch_rows or (time.time() - self.pending_since) * 1000 >= self.batch_ms
+
+    def flush(self):
+        '''Persist the buffered measurements in one transaction with bulk inserts and update the Activity's
+        maptrack, SimpleDepthTime, and statistics from just the new rows.  The in-memory state used for
+        the updates is kept only if the transaction commits.  If it doesn't the measurements are kept
+        buffered for the next flush(), and dropped after FLUSH_ATTEMPTS failures in a row so that the
+        Consumer keeps consuming.'''
+        if not self.pending:
+            return
 
-        meas = self.createMeasurement(dt, depth, lat, lon)
-        mp = m.MeasuredParameter(measurement = meas,
-                    parameter = parm,
-                    datavalue = str(value))
+        rows = self.pending
+        if self.track is None:
+            self.loadActivityState()
         try:
-            mp.save(using=self.dbAlias)
-        except IntegrityError as e:
-            logger.error("WARNING: Probably a duplicate measurement that could not be added to the DB.  Skipping it.\n")
+            with transaction.atomic(using=self.dbAlias):
+                measurements, mps = self.bulkCreateMeasurements(rows)
+                track, depth_range = self.updateMaptrack(measurements)
+                self.updateSimpleDepthTime(measurements)
+                self.updateActivityParameterStats(mps)
+        except DatabaseError as e:
+            self.failed_flushes += 1
+            logger.error("ERROR: *** Could not persist %d measurements (attempt %d of %d).  Is something wrong with PostgreSQL?  See details below. ***\n",
+                         len(rows), self.failed_flushes, FLUSH_ATTEMPTS)
             logger.error(e)
-        else:
-            print(("saved %s = %f at %s, %f, %f, %f" % (parm, value, dt, depth, lat, lon)))
+            traceback.print_exc(file = sys.stdout)
+            # Parameters created in the rolled back transaction don't exist
+            self.parameters = {}
+            if self.failed_flushes >= FLUSH_ATTEMPTS:
+                logger.error("ERROR: *** Dropping %d measurements from %s to %s that could not be persisted in %d attempts ***",
+                             len(rows), min(r[0] for r in rows), max(r[0] for r in rows), FLUSH_ATTEMPTS)
+                self.pending, self.pending_since, self.failed_flushes = [], None, 0
+                return
+            # Retry with these and any newer measurements after another batch_ms
+            self.pending_since = time.time()
+            logger.info("Continuing on with processing messages...")
+            return
 
-        return 
+        self.pending, self.pending_since, self.failed_flushes = [], None, 0
+        self.track, self.depth_range = track, depth_range
+        bump_load_generation(self.dbAlias)
+        logger.info('Persisted %d MeasuredParameters in %d Measurements', len(mps), len(measurements))
+
+    def loadActivityState(self):
+        '''Read the maptrack and depth range of the Activity so that flush() can update them with just the new rows'''
+        qs = list(m.Measurement.objects.using(self.dbAlias).filter(instantpoint__activity = self.activity)
+                .order_by('instantpoint__timevalue').values_list('geom', 'depth'))
+        self.track = [geom.coords for geom, _ in qs]
+        depths = [depth for _, depth in qs]
+        self.depth_range = (min(depths), max(depths)) if depths else None
+
+    def bulkCreateMeasurements(self, rows):
+        '''Insert the InstantPoints, Measurements, and MeasuredParameters of the (dt, depth, lat, lon, var, value)
+        tuples in rows that are not already in the database.  Foreign keys are resolved from the Parameter cache
+        and from one query each for the existing InstantPoints and Measurements of the rows.  Return the new
+        Measurements and MeasuredParameters.
+        '''
+        for name in set(r[4] for r in rows) - set(self.parameters):
+            self.parameters[name], _ = m.Parameter.objects.using(self.dbAlias).get_or_create(name = name)
+
+        times = set(r[0] for r in rows)
+        ips = {ip.timevalue: ip for ip in m.InstantPoint.objects.using(self.dbAlias).filter(
+                                            activity = self.activity, timevalue__in = times)}
+        new_ips = [m.InstantPoint(activity = self.activity, timevalue = t) for t in sorted(times - set(ips))]
+        m.InstantPoint.objects.using(self.dbAlias).bulk_create(new_ips)
+        ips.update((ip.timevalue, ip) for ip in new_ips)
+
+        # Only InstantPoints that were already in the database can have Measurements and MeasuredParameters
+        old_ip_ids = [ip.id for ip in ips.values() if ip not in new_ips]
+        measurements = {(ms.instantpoint_id, ms.depth, ms.geom.x, ms.geom.y): ms for ms in
+                            m.Measurement.objects.using(self.dbAlias).filter(instantpoint__id__in = old_ip_ids)}
+        keys = {ms.id: key for key, ms in measurements.items()}
+        existing_mps = set((keys[ms_id], p_id) for ms_id, p_id in m.MeasuredParameter.objects.using(self.dbAlias).filter(
+                            measurement__id__in = list(keys)).values_list('measurement_id', 'parameter_id'))
+
+        new_measurements = []
+        mps = []
+        for dt, depth, lat, lon, var, value in rows:
+            key = (ips[dt].id, depth, lon, lat)
+            if key not in measurements:
+                measurements[key] = m.Measurement(instantpoint = ips[dt], depth = depth, geom = Point(lon, lat))
+                new_measurements.append(measurements[key])
+            if (key, self.parameters[var].id) in existing_mps:
+                logger.warning("Skipping duplicate measurement of %s at %s, %f, %f, %f", var, dt, depth, lat, lon)
+                continue
+            existing_mps.add((key, self.parameters[var].id))
+            mps.append(m.MeasuredParameter(measurement = measurements[key], parameter = self.parameters[var], datavalue = value))
+
+        m.Measurement.objects.using(self.dbAlias).bulk_create(new_measurements)
+        for mp in mps:
+            # Assign the ids that bulk_create() set on the new Measurements
+            mp.measurement_id = mp.measurement.id
+        m.MeasuredParameter.objects.using(self.dbAlias).bulk_create(mps, ignore_conflicts=True)
+
+        return new_measurements, mps
 
     def persistSample(self, dt, depth, lat, lon, var, value):
         '''Call all of the create_ methods to properly persist this sample in STOQS'''
@@ -255,111 +325,64 @@ class Consumer(object):
 
         return sample
 
-    def updateMaptrack(self):
+    def updateMaptrack(self, measurements):
         '''
-        Read measurement geometry accumulated so far for this activity and compute a maptrack for the path
+        Extend the simplified maptrack of the activity with the new measurements and update the Activity's
+        maptrack and depth range.  Return the track coordinates and depth range for the next update.
         '''
-        qs = m.Measurement.objects.using(self.dbAlias).filter(instantpoint__activity = self.activity)
-        linestringPoints = [q.geom for q in qs]
-        if len(linestringPoints) < 2:
-            return
-        print(("linestringPoints = %s" % linestringPoints))
-        path = LineString(linestringPoints).simplify(tolerance=.001)
+        track = self.track + [ms.geom.coords for ms in sorted(measurements, key=lambda ms: ms.instantpoint.timevalue)]
+        depths = [ms.depth for ms in measurements] + (list(self.depth_range) if self.depth_range else [])
+        depth_range = (min(depths), max(depths)) if depths else None
+        if len(track) < 2:
+            return track, depth_range
 
+        path = LineString(track).simplify(tolerance=.001)
         num_updated = m.Activity.objects.using(self.dbAlias).filter(id = self.activity.id).update(
                         maptrack = path,
-                        mindepth = 0,
-                        maxdepth = 100,
+                        mindepth = depth_range[0],
+                        maxdepth = depth_range[1],
                         loaded_date = datetime.datetime.utcnow())
+        logger.debug("Updated %d Activity", num_updated)
 
-        print(("Updated %d Activity" % num_updated))
+        return list(path.coords), depth_range
 
-    def updateSimpleDepthTime(self):
+    def updateSimpleDepthTime(self, measurements):
         '''
-        Read the time series of depth values for this activity, simplify it and insert the values in the
-        SimpleDepthTime table that is related to the Activity.
+        Insert the depth time values of the new measurements in the SimpleDepthTime table that is related to the Activity.
         '''
-        measurements = m.Measurement.objects.using(self.dbAlias).select_related(depth=2).filter(instantpoint__activity=self.activity)
-        for meas in measurements:
-            logger.debug("meas %s, id = %d", meas, meas.id)
-            logger.debug("meas.instantpoint %s", meas.instantpoint)
-            ems = 1000 * to_udunits(meas.instantpoint.timevalue, 'seconds since 1970-01-01')
-            logger.debug(ems)
-            d = float(meas.depth)
-            m.SimpleDepthTime.objects.using(self.dbAlias).create(activity = self.activity, instantpoint = meas.instantpoint, 
-                    depth = d, epochmilliseconds = ems)
-
-        logger.info('Inserted %d values into SimpleDepthTime', len(measurements))
+        sdts = [m.SimpleDepthTime(activity = self.activity, instantpoint = meas.instantpoint, depth = meas.depth,
+                        epochmilliseconds = 1000 * to_udunits(meas.instantpoint.timevalue, 'seconds since 1970-01-01'))
+                for meas in measurements]
+        m.SimpleDepthTime.objects.using(self.dbAlias).bulk_create(sdts)
 
+        logger.info('Inserted %d values into SimpleDepthTime', len(sdts))
 
-    def updateActivityParameterStats(self, parameterCounts):
+    def updateActivityParameterStats(self, mps):
         '''
-        Examine the data for the Activity, compute and update some statistics on the measuredparameters
-        for this activity.  Store the historgram in the associated table.
+        Merge the datavalues of the new MeasuredParameters mps into the statistics, histogram and quantile
+        sketch saved in the ActivityParameters of the Activity, so that no values need be kept in memory
+        or read back.  Statistics of Parameters without a saved sketch are computed from all their values.
         '''
         a = self.activity
-        for pname in parameterCounts:
-            logger.debug(pname)
-            p = m.Parameter.objects.using(self.dbAlias).get(name=pname)
-            data = m.MeasuredParameter.objects.using(self.dbAlias).filter(parameter=p)
-            numpvar = numpy.array([float(v.datavalue) for v in data])
-            numpvar.sort()
-            listvar = list(numpvar)
-            logger.debug('parameter: %s, min = %f, max = %f, mean = %f, median = %f, mode = %f, p025 = %f, p975 = %f',
-                            p, numpvar.min(), numpvar.max(), numpvar.mean(), median(listvar), mode(numpvar),
-                            percentile(listvar, 0.025), percentile(listvar, 0.975))
-
-
-            # Save statistics
-            try:
-                ap, created = m.ActivityParameter.objects.using(self.dbAlias).get_or_create(
-                                        activity = a,
-                                        parameter = p,
-                                        number = len(listvar),
-                                        min = numpvar.min(),
-                                        max = numpvar.max(),
-                                        mean = numpvar.mean(),
-                                        median = median(listvar),
-                                        mode = mode(numpvar),
-                                        p025 = percentile(listvar, 0.025),
-                                        p975 = percentile(listvar, 0.975)
-                                        )
-
-                if created:
-                    logger.info('Created ActivityParameter for parameter.name = %s', p.name)
-                else:
-                    m.ActivityParameter.objects.using(self.dbAlias).update(
-                                        activity = a,
-                                        parameter = p,
-                                        number = len(listvar),
-                                        min = numpvar.min(),
-                                        max = numpvar.max(),
-                                        mean = numpvar.mean(),
-                                        median = median(listvar),
-                                        mode = mode(numpvar),
-                                        p025 = percentile(listvar, 0.025),
-                                        p975= percentile(listvar, 0.975)
-                                        )
-                    logger.info('Update ActivityParameter for parameter.name = %s', p.name)
-
-            except IntegrityError:
-                logger.warn('IntegrityError: Cannot create ActivityParameter for parameter.name = %s. Skipping.', p.name)
-
-            # Compute and save histogram
-            (counts, bins) = numpy.histogram(numpvar,100)
-            logger.info(counts)
-            logger.info(bins)
-            i = 0
-            for count in counts:
-                try:
-                    ##logger.info('Creating ActivityParameterHistogram...')
-                    logger.info('count = %d, binlo = %f, binhi = %f', count, bins[i], bins[i+1])
-                    m.ActivityParameterHistogram.objects.using(self.dbAlias).get_or_create(
-                                                    activityparameter=ap, bincount=count, binlo=bins[i], binhi=bins[i+1])
-                    i = i + 1
-                except IntegrityError:
-                    logger.warn('IntegrityError: Cannot create ActivityParameter for parameter.name = %s. Skipping.', p.name)
-
+        new_values = {}
+        for mp in mps:
+            new_values.setdefault(mp.parameter.name, []).append(mp.datavalue)
+
+        for pname, new in new_values.items():
+            p = self.parameters[pname]
+            values = numpy.array(new, dtype=numpy.float64)
+            values = values[numpy.isfinite(values)]
+            if not values.size:
+                continue
+
+            ap = (m.ActivityParameter.objects.using(self.dbAlias)
+                        .filter(activity = a, parameter = p, number__isnull = False, sketch__isnull = False).first())
+            if ap:
+                STOQS_Loader.merge_ap_stats(self.dbAlias, ap, values)
+                logger.info('Updated ActivityParameter for parameter.name = %s', p.name)
+            else:
+                STOQS_Loader.update_ap_stats(self.dbAlias, a, {p: None})
+                logger.info('Created ActivityParameter for parameter.name = %s', p.name)
 
         logger.info('Updated statistics for activity.name = %s', a.name)
 
@@ -417,7 +440,13 @@ class Consumer(object):
         print("Waiting for messages (Ctrl-C or send SIGTERM to cancel)...")
         try:
             while True:
-                self.channel.wait()            
+                # Wake up at least every batch_ms to flush buffered measurements when messages are infrequent
+                try:
+                    self.connection.drain_events(timeout = self.batch_ms / 1000.0)
+                except socket.timeout:
+                    pass
+                if self.batchDue():
+                    self.flush()
 
         except KeyboardInterrupt:
             print("Received KeyboardInterrupt Exception")
@@ -427,6 +456,12 @@ class Consumer(object):
             print("Received InterruptedBySignal Exception")
             self.channel.basic_cancel(consumer_tag)
            
+        # flush() drops the measurements if they still can't be persisted after FLUSH_ATTEMPTS
+        while self.pending:
+            self.flush()
+            if self.pending:
+                time.sleep(self.batch_ms / 1000.0)
+
         # Close the channel
         self.channel.close()
 
@@ -447,7 +482,11 @@ def deleteTestMessages(activityName, activityType, dbAlias):
         ans = eval(input("Going to delete Activity %s and all %i measurements from it, O.K.? [N/y] " % (activity, qs.count())))
 
         if ans.upper() == 'Y':
-            activity.delete()
+            if partitions.is_partitioned(dbAlias):
+                for act in activity:
+                    partitions.drop_activity(dbAlias, act)
+            else:
+                activity.delete()
             print("Activity deleted.")
 
 
@@ -492,6 +531,12 @@ Examples:
     parser.add_option('', '--persist',
         type='string', action='store',
         help="Specify dbAlias from the settings file where the data need to be persisted")
+    parser.add_option('', '--batchRows',
+        type='int', action='store', default=BATCH_ROWS,
+        help="Number of measured values to buffer before writing them to the database, default %d" % BATCH_ROWS)
+    parser.add_option('', '--batchMs',
+        type='int', action='store', default=BATCH_MS,
+        help="Milliseconds to buffer measured values before writing them to the database, default %d" % BATCH_MS)
     parser.add_option('', '--testPersist',
         type='string', action='store',
         help="Run a test to persist a saved message to dbAlias rather than connect to a queue.")
@@ -513,9 +558,10 @@ Examples:
         test_file = 'test_gulper_msg_300025010809770_002324.sbd'
         fh = open(test_file)
         deleteTestMessages('test_unassigned', 'test_AUV_mission', opts.testPersist)
-        c = Consumer(dbAlias = opts.testPersist)
+        c = Consumer(dbAlias = opts.testPersist, batch_rows = opts.batchRows, batch_ms = opts.batchMs)
         c.createActivity('trex', 'auv', 'ffff00', 'test_unassigned', 'test_AUV_mission')
         c.persistMessage(Message(fh.read()))
+        c.flush()
         fh.close()
         sys.exit()
 
@@ -525,7 +571,7 @@ Examples:
 
     # Create Consumer object
     c = Consumer(vhost = opts.vh, exchange_name = opts.en, exchange_type = opts.et, queue_name = opts.qn, 
-        routing_key = opts.rk, dbAlias = opts.persist)
+        routing_key = opts.rk, dbAlias = opts.persist, batch_rows = opts.batchRows, batch_ms = opts.batchMs)
 
     # Create a dummy activity for this realtime data (paramaters set inside the method)
     c.createActivity('trex', 'auv', 'ffff00', 'unassigned', 'AUV_mission')
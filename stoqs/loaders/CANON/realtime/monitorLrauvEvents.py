@@ -5,6 +5,18 @@ Monitors messages from the Pusher API  for new realtime cell or sbdlog data from
 Use DAPloaders.py to load new data into the stoqs database and posts messages to Slack
 when new data is available.
 
+Each new log file is a Job that goes through three stages: convert (interpolate the .nc4
+file with lrauvNc4ToNetcdf), load (DAPloaders.runLrauvLoader) and render (the Contour
+plots).  The JobScheduler executes the stages of the Jobs of all the vehicles in one pool
+of --workers processes so that they overlap: a Job is converted while the previous one
+is loaded and the plots of another vehicle are rendered.  The loads of a vehicle are
+executed one at a time, in the order that the log files arrived - each Job is numbered
+on arrival and a vehicle's Jobs are loaded in that sequence whatever order their
+conversions finish in - and only the plots of the last Job loaded for a vehicle are
+rendered.  If a worker process dies the pool is restarted and the Jobs that were in it
+are queued again, once.  The number of Jobs waiting for each
+stage and the time that they wait and take are logged every METRICS_INTERVAL seconds.
+
 Danelle Cline
 MBARI 5 September 2018
 '''
@@ -28,15 +40,18 @@ import pydap
 import pysher
 import pytz
 import json
+import multiprocessing
 import time
-import queue
-from threading import Thread
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-##from Contour import Contour
 from coards import from_udunits
 from stoqs.models import InstantPoint
 from slacker import Slacker
 
+from django.db import connections
 from django.db.models import Max
 
 # Set up global variables for logging output to STDOUT
@@ -59,34 +74,291 @@ class NcFileMissing(Exception):
 class ServerError(Exception):
     pass
 
-class IterableQueue():
-    def __init__(self,source_queue):
-            self.source_queue = source_queue
-    def __iter__(self):
-        while True:
-            try:
-               yield self.source_queue.get_nowait()
-            except queue.Empty:
-               return
+CONVERT = 'convert'
+LOAD = 'load'
+RENDER = 'render'
+STAGES = (CONVERT, LOAD, RENDER)
+
+# Seconds between logging of the queue depths and latencies of the stages
+METRICS_INTERVAL = 300
+
+# Number of the most recent Jobs of each stage that latencies are reported for
+METRICS_WINDOW = 100
 
 class Job: 
-    def __init__(self, full_path, url_src):
+    def __init__(self, vehicle, full_path, url_src):
+        self.vehicle = vehicle
         self.full_path = full_path
         self.url_src = url_src
         self.activity_name = url_src.split('/')[-2] + '_' + url_src.split('/')[-1].split('.')[0]
+        self.arrived = time.time()
+        self.queued = self.arrived
+        self.started = None
+        self.url_dest, self.start, self.end = None, None, None
+        self.seq = None                 # Order of arrival among the Jobs of the vehicle, set by JobScheduler.put()
+        self.executor = None            # Pool that the Job's current stage was submitted to
+        self.requeued = False           # Set when queued again after the pool broke
         print('New job: {} {}'.format(full_path, url_src))
         return
-  
-class Loader(Thread):
+
+class StageMetrics():
     '''
-    Manages converting and loading nc files into STOQS. Create one of these per each vehicle.
+    Counts and latencies, in seconds, of the Jobs executed by a stage
     '''
-    def __init__(self, vehicle, slack, args):
-        Thread.__init__(self)
-        self.q = queue.Queue(maxsize=0)
-        self.vehicle = vehicle
+    def __init__(self, name):
+        self.name = name
+        self.done = 0
+        self.failed = 0
+        self.waits = deque(maxlen=METRICS_WINDOW)
+        self.durations = deque(maxlen=METRICS_WINDOW)
+
+    def started(self, job):
+        job.started = time.time()
+        self.waits.append(job.started - job.queued)
+
+    def finished(self, job, failed=False):
+        now = time.time()
+        self.durations.append(now - job.started)
+        job.queued = now
+        if failed:
+            self.failed += 1
+        else:
+            self.done += 1
+
+    def summary(self, depth, running):
+        def mean_max(values):
+            if not values:
+                return '-'
+            return '{:.1f}/{:.1f}'.format(sum(values) / len(values), max(values))
+
+        return '{}: queued {} running {} done {} failed {} wait mean/max {} s duration mean/max {} s'.format(
+                    self.name, depth, running, self.done, self.failed, mean_max(self.waits), mean_max(self.durations))
+
+# Loaders of the worker process, one per vehicle
+_loaders = {}
+
+def _worker_loader(vehicle, args):
+    if vehicle not in _loaders:
+        _loaders[vehicle] = Loader(vehicle, args)
+    return _loaders[vehicle]
+
+def _convert(job, args):
+    print('====>Processing decimated nc file {}'.format(job.activity_name))
+    return _worker_loader(job.vehicle, args).process_decimated(job)
+
+def _load(job, args):
+    _worker_loader(job.vehicle, args).load(job)
+
+def _render(job, args):
+    return _worker_loader(job.vehicle, args).update(job.start, job.end, job.url_dest)
+
+class JobScheduler(threading.Thread):
+    '''
+    Executes the convert, load and render stages of the Jobs of all the vehicles in a shared pool of worker
+    processes.  Jobs are added with put() and the stages are dispatched when a Job is added or a stage finishes.
+    '''
+    def __init__(self, vehicles, slack, args):
+        threading.Thread.__init__(self)
+        self.daemon = True
         self.slack = slack
         self.args = args
+        self.workers = int(args.workers)
+        self.cv = threading.Condition(threading.RLock())
+        self.converts = deque()                         # Jobs waiting to be converted, in order of arrival
+        self.queued = set()                             # url_src of the Jobs in converts
+        self.arrivals = {v: 0 for v in vehicles}        # Number of Jobs put for each vehicle, the next seq
+        self.loads = {v: {} for v in vehicles}          # seq: converted Job waiting to be loaded, None if there's nothing to load
+        self.next_load = {v: 0 for v in vehicles}       # seq of the next Job of each vehicle to load
+        self.loading = set()                            # Vehicles with a Job being loaded
+        self.renders = {}                               # Vehicle: last loaded Job, waiting to be rendered
+        self.rendering = set()                          # Vehicles with a Job being rendered
+        self.running = {stage: 0 for stage in STAGES}
+        self.completed = deque()
+        self.metrics = {stage: StageMetrics(stage) for stage in STAGES}
+        self.lags = deque(maxlen=METRICS_WINDOW)
+        self.executor = self._executor()
+
+    def _executor(self):
+        # Forked workers must not share the database connections of this process
+        connections.close_all()
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+
+    def put(self, job):
+        with self.cv:
+            # only queue jobs with unique URLs
+            if job.url_src in self.queued:
+                logger.debug('Already queued: {}'.format(job.url_src))
+                return
+            self.queued.add(job.url_src)
+            job.seq = self.arrivals[job.vehicle]
+            self.arrivals[job.vehicle] += 1
+            self.converts.append(job)
+            self.cv.notify()
+
+    def _next_load(self, vehicle):
+        '''
+        Return the converted Job of vehicle that is next in order of arrival, None if it's not converted yet
+        '''
+        jobs = self.loads[vehicle]
+        # Skip Jobs that failed to convert or had no data to load
+        while self.next_load[vehicle] in jobs and jobs[self.next_load[vehicle]] is None:
+            del jobs[self.next_load[vehicle]]
+            self.next_load[vehicle] += 1
+
+        return jobs.get(self.next_load[vehicle])
+
+    def _next(self):
+        '''
+        Return (stage, Job) to execute next: loads first, so that converted data are available in STOQS
+        as soon as possible, then renders of vehicles that have nothing more to load, then conversions
+        '''
+        for vehicle, jobs in self.loads.items():
+            job = self._next_load(vehicle)
+            if job and vehicle not in self.loading:
+                self.loading.add(vehicle)
+                del jobs[job.seq]
+                self.next_load[vehicle] += 1
+                return LOAD, job
+        for vehicle in list(self.renders):
+            if vehicle not in self.rendering and vehicle not in self.loading and not any(self.loads[vehicle].values()):
+                self.rendering.add(vehicle)
+                return RENDER, self.renders.pop(vehicle)
+        if self.converts:
+            job = self.converts.popleft()
+            self.queued.discard(job.url_src)
+            return CONVERT, job
+
+        return None, None
+
+    def _dispatch(self):
+        while sum(self.running.values()) < self.workers:
+            stage, job = self._next()
+            if not job:
+                return
+            func = {CONVERT: _convert, LOAD: _load, RENDER: _render}[stage]
+            self.metrics[stage].started(job)
+            self.running[stage] += 1
+            job.executor = self.executor
+            try:
+                future = self.executor.submit(func, job, self.args)
+            except BrokenProcessPool:
+                future = None
+            if future is None:
+                self._finish(stage, job, None)
+                continue
+            future.add_done_callback(lambda f, stage=stage, job=job: self._done(stage, job, f))
+
+    def _done(self, stage, job, future):
+        with self.cv:
+            self.completed.append((stage, job, future))
+            self.cv.notify()
+
+    def _finish(self, stage, job, future):
+        self.running[stage] -= 1
+        if stage == LOAD:
+            self.loading.discard(job.vehicle)
+        elif stage == RENDER:
+            self.rendering.discard(job.vehicle)
+
+        try:
+            if future is None:
+                raise BrokenProcessPool('Worker process pool is not usable')
+            result = future.result()
+        except BrokenProcessPool as e:
+            self.metrics[stage].finished(job, failed=True)
+            if job.executor is self.executor:
+                # The first of the Jobs that were in the broken pool to finish restarts it
+                logger.warning('{} of {} failed: {}, restarting worker processes'.format(stage, job.url_src, e))
+                self.executor.shutdown(wait=False)
+                self.executor = self._executor()
+            if job.requeued:
+                logger.warning('{} of {} failed again in a restarted pool, giving up on it'.format(stage, job.url_src))
+                if stage == CONVERT:
+                    self.loads[job.vehicle][job.seq] = None
+            else:
+                job.requeued = True
+                self._requeue(stage, job)
+            return
+        except Exception as e:
+            logger.warning('{} of {} failed: {}'.format(stage, job.url_src, e))
+            self.metrics[stage].finished(job, failed=True)
+            if stage == CONVERT:
+                self.loads[job.vehicle][job.seq] = None
+            return
+
+        self.metrics[stage].finished(job)
+        if stage == CONVERT:
+            job.url_dest, job.start, job.end = result
+            if job.url_dest:
+                self.loads[job.vehicle][job.seq] = job
+            else:
+                logger.info('No interpolated data to load from {}'.format(job.url_src))
+                self.loads[job.vehicle][job.seq] = None
+        elif stage == LOAD:
+            lag = time.time() - job.arrived
+            self.lags.append(lag)
+            logger.info('Loaded {} {:.1f} s after it arrived'.format(job.activity_name, lag))
+            # Plots of a previous Job of the vehicle that have not been rendered are replaced by these
+            self.renders[job.vehicle] = job
+        elif stage == RENDER:
+            self.post(job, result)
+
+    def _requeue(self, stage, job):
+        '''
+        Queue job again for stage after the pool that it was executing in broke
+        '''
+        logger.info('Queuing {} of {} again'.format(stage, job.url_src))
+        if stage == CONVERT:
+            self.queued.add(job.url_src)
+            self.converts.appendleft(job)
+        elif stage == LOAD:
+            self.loads[job.vehicle][job.seq] = job
+            self.next_load[job.vehicle] = min(self.next_load[job.vehicle], job.seq)
+        elif stage == RENDER:
+            # Unless a later Job of the vehicle has been loaded since
+            self.renders.setdefault(job.vehicle, job)
+
+    def post(self, job, rendered):
+        log_url = re.sub(r'\.nc$', '.png', job.url_dest)
+        print('==========================> posting to slack')
+        if rendered:
+            message = 'LRAUV log data loaded into STOQS <{} plot|{}> '.format(log_url, job.activity_name)
+        else:
+            message = 'LRAUV log data loaded into STOQS <{}> '.format(job.activity_name)
+        print(message)
+        # if self.slack:
+        #     self.slack.chat.post_message("#lrauvs", message)
+
+    def log_metrics(self):
+        depths = {CONVERT: len(self.converts), LOAD: sum(job is not None for jobs in self.loads.values() for job in jobs.values()),
+                  RENDER: len(self.renders)}
+        for stage in STAGES:
+            logger.info(self.metrics[stage].summary(depths[stage], self.running[stage]))
+        if self.lags:
+            logger.info('Arrival to load lag mean/max: {:.1f}/{:.1f} s'.format(
+                            sum(self.lags) / len(self.lags), max(self.lags)))
+
+    def run(self):
+        next_report = time.time() + METRICS_INTERVAL
+        with self.cv:
+            while True:
+                self.cv.wait_for(lambda: self.completed or (self.converts and sum(self.running.values()) < self.workers),
+                                 timeout=max(next_report - time.time(), 0))
+                while self.completed:
+                    self._finish(*self.completed.popleft())
+                self._dispatch()
+                if time.time() >= next_report:
+                    self.log_metrics()
+                    next_report = time.time() + METRICS_INTERVAL
+
+class Loader():
+    '''
+    Converts, loads and plots nc files of a vehicle into STOQS. The JobScheduler's worker processes create one of
+    these per each vehicle.
+    '''
+    def __init__(self, vehicle, args):
+        self.vehicle = vehicle
+        self.args = args
         self.pw = lrauvNc4ToNetcdf.InterpolatorWriter()
         # Assume that the database has already been created with description and terrain information, 
         # so use minimal arguments in constructor
@@ -94,51 +366,9 @@ class Loader(Thread):
         self.cl.dbAlias = args.database
         self.cl.campaignName = args.campaign
 
-    def put(self, job):
-        found = False
-        # only place jobs in the queue with unique URLs
-        for j in IterableQueue(self.q):
-            if job.url_src in j.url_src:
-                found = True
-        if not found:
-            self.q.put(job)
-
-    def run(self):
-        while True:
-            if not self.q.empty():
-                job = self.q.get()
-                self.q.task_done()
-                print('===>loading {}'.format(job.full_path))
-                try:
-                    url_dest, start_date, end_date = self.load(job)
-                    # if last item in the queue, update animations 
-                    if self.q.empty():
-                        print('===> update animations {}'.format(url_dest))
-                        log_url = re.sub('\.nc$', '.png', url_dest)
-
-                        try:
-                          if self.update(start_date, end_date, url_dest) and self.slack:
-                            print('==========================> posting to slack')
-                            message = 'LRAUV log data loaded into STOQS <{} plot|{}> '.format(log_url, job.activity_name)
-                            print(message)
-                            # self.slack.chat.post_message("#lrauvs", message)
-                        except Exception as e:
-                            logger.warning(e)
-                            print('==========================> posting to slack')
-                            message = 'LRAUV log data loaded into STOQS <{}> '.format(job.activity_name)
-                            print(message)
-                            # self.slack.chat.post_message("#lrauvs", message)
-                          # self.slack.chat.post_message("#lrauvs", message)
-                except ServerError as e:
-                    logger.warning(e)
-                    continue
-                except Exception as e:
-                    logger.warning(e)
-                    continue
-            else:
-                time.sleep(1)
-
     def update(self, start_date, end_date, url_dest):
+        # Imported here so that matplotlib is loaded only by the worker processes that render
+        from Contour import Contour
         try:
 
           endDatetimeUTC = pytz.utc.localize(end_date)
@@ -281,9 +511,11 @@ class Loader(Thread):
         return url_i, start, end
 
     def load(self, job):
+        '''
+        Load the file of job converted by process_decimated()
+        '''
         data_start = None
-        print('====>Processing decimated nc file {}'.format(job.activity_name))
-        (url_dest, start, end) = self.process_decimated(job)
+        (url_dest, start, end) = (job.url_dest, job.start, job.end)
 
         print('====>Loading {}'.format(job.activity_name))
         if self.args.append:
@@ -380,6 +612,8 @@ def process_command_line():
                                 ['front', 'VTHI', 'temperature', 'salinity', 'chlorophyll'])
     parser.add_argument('--parms', action='store', help='List of space separated (non group) parameters to load', nargs='*',
                         default= ['front', 'VTHI', 'temperature', 'salinity'])
+    parser.add_argument('--workers', action='store', help='Number of processes that convert, load and plot the data of all the vehicles',
+                        default=os.cpu_count(), required=False)
     parser.add_argument('--vehicles', action='store', help='List of vehicles to monitor', nargs='*',
                         default= ['daphne', 'makai', 'ahi', 'opah', 'tethys', 'aku'])
     parser.add_argument('--groupparms', action='store',
@@ -443,12 +677,9 @@ def run():
     vehicles = args.vehicles
     print('Monitoring {} vehicles'.format(vehicles))
 
-    l = {}
-    # create a loader thread per each vehicle
-    for v in vehicles:
-        l[v] = Loader(v, slack, args)
-        l[v].setDaemon(True)
-        l[v].start()
+    # one scheduler converts, loads and renders the data of all the vehicles
+    scheduler = JobScheduler(vehicles, slack, args)
+    scheduler.start()
       
     # add a logging handler to see the raw communication data
     root = logging.getLogger()
@@ -470,20 +701,20 @@ def run():
                         url_src = args.inUrl +  full_path.split(args.inDir)[-1]
                         print('Checking if {} exists'.format(full_path))
                         if os.path.exists(full_path):
-                            l[vehicle].put(Job(full_path, url_src))
+                            scheduler.put(Job(vehicle, full_path, url_src))
                             
                     else: # from cell
                         full_path = os.path.join(args.inDir, vehicle, 'realtime', 'cell-logs', path, 'cell-Priority.nc')
                         print('Checking if {} exists'.format(full_path)) 
                         url_src = args.inUrl +  full_path.split(args.inDir)[-1]
                         if os.path.exists(full_path):
-                            l[vehicle].put(Job(full_path, url_src))
+                            scheduler.put(Job(vehicle, full_path, url_src))
                             
                         full_path = os.path.join(args.inDir, vehicle, 'realtime', 'cell-logs', path, 'cell-Normal.nc')
                         print('Checking if {} exists'.format(full_path)) 
                         url_src = args.inUrl +  full_path.split(args.inDir)[-1]
                         if os.path.exists(full_path):
-                            l[vehicle].put(Job(full_path, url_src))
+                            scheduler.put(Job(vehicle, full_path, url_src))
 
     def connect_handler(data):
         print("connect_handler: {}".format(data))
@@ -38,7 +38,7 @@ from django.conf import settings
 
 from django.db.models import Max
 from django.db.utils import IntegrityError, DatabaseError
-from django.db import transaction
+from django.db import transaction, connections
 from jdcal import gcal2jd, jd2gcal
 from stoqs.models import (Activity, InstantPoint, Measurement, MeasuredParameter,
                           NominalLocation, Resource, ResourceType, ActivityResource,
@@ -54,9 +54,13 @@ import logging
 import socket
 import seawater.eos80 as sw
 from utils.utils import mode, simplify_points
+from utils.optionscache import bump_load_generation
 from loaders import (STOQS_Loader, SkipRecord, HasMeasurement, MEASUREDINSITU, FileNotFound,
                      SIGMAT, SPICE, SPICINESS, ALTITUDE)
-from loaders.SampleLoaders import get_closest_instantpoint, ClosestTimeNotFoundException
+from loaders.instantpoints import InstantPointIndex
+from loaders import bulk_copy, partitions
+from loaders.dapreader import DAPReader
+from loaders.scheduler import empty_parameter, in_worker, shared_step
 import numpy as np
 import psycopg2
 from collections import defaultdict
@@ -93,6 +97,10 @@ LONGITUDE = 'longitude'
 #   TODO: Load these data as trajectoryProfile with point simplification (removal of redundant data points).
 BATCH_SIZE=10000
 
+# The --copy option of LoadScript bypasses bulk_create() and streams rows with PostgreSQL's COPY FROM STDIN,
+# see loaders/bulk_copy.py.  No Django model objects are constructed for InstantPoint, Measurement and
+# MeasuredParameter so memory use is bounded by bulk_copy.COPY_CHUNK_SIZE rather than by BATCH_SIZE.
+
 if settings.DEBUG:
     BaseDatabaseWrapper.make_debug_cursor = lambda self, cursor: CursorWrapper(cursor, self)
 
@@ -187,6 +195,9 @@ class Base_Loader(STOQS_Loader):
                           pointing to exact names of those coordinates. Used for variables missing the 
                           coordinates attribute.
         @param stride: The stride/step size used to retrieve data from the url.
+        @param command_line_args.copy: If true then load InstantPoints, Measurements and MeasuredParameters
+                           with PostgreSQL COPY rather than with Django's bulk_create().
+        @param command_line_args.dapcache: Directory for caching the data read from url, see loaders/dapreader.py
         '''
         self.campaignName = campaignName
         self.campaignDescription = campaignDescription
@@ -205,6 +216,7 @@ class Base_Loader(STOQS_Loader):
         self.stride = stride
         self.grdTerrain = grdTerrain
         self.command_line_args = command_line_args
+        self.use_copy = bool(getattr(command_line_args, 'copy', False))
         self.coord_dicts = {}
 
         self.url = url
@@ -222,6 +234,7 @@ class Base_Loader(STOQS_Loader):
             self.logger.warn(f"Failed in attempt to open_url('{url}'): {message}")
             raise
 
+        self.reader = DAPReader(self.ds, url, cache_dir=getattr(command_line_args, 'dapcache', None))
         self.ignored_names = list(self.global_ignored_names)    # Start with copy of list of global ignored names
         self.build_standard_names()
 
@@ -950,7 +963,7 @@ class Base_Loader(STOQS_Loader):
             # TODO: Deal with (as yet unseen) case where multiple trajectories exist in a netCDF file
             times = self.ds[ac[TIME]][0][0][tindx[0]:tindx[-1]:self.stride]
         else:
-            times = self.ds[ac[TIME]][tindx[0]:tindx[-1]:self.stride]
+            times = self._read_slice(ac[TIME], tindx)
         time_units = self.ds[ac[TIME]].units.lower().replace('utc', 'UTC')
         if self.ds[ac[TIME]].units == 'seconds since 1970-01-01T00:00:00Z':
             time_units = 'seconds since 1970-01-01 00:00:00'          # coards doesn't like ISO format
@@ -959,13 +972,10 @@ class Base_Loader(STOQS_Loader):
                 mtimes = (from_udunits(mt, time_units) for mt in times)
         except IndexError:
             # Trap case where times.shape = () giving opportunity to turn a single value into a list
-            mtimes = [from_udunits(float(times.data), time_units)]
+            mtimes = [from_udunits(float(times), time_units)]
 
         try:
-            if isinstance(self.ds[ac[DEPTH]], pydap.model.GridType):
-                depths = self.ds[ac[DEPTH]][ac[DEPTH]][tindx[0]:tindx[-1]:self.stride]
-            else:
-                depths = self.ds[ac[DEPTH]][tindx[0]:tindx[-1]:self.stride]
+            depths = self._read_slice(ac[DEPTH], tindx)
         except KeyError:
             # Allow for variables with no depth coordinate to be loaded at the depth specified in auxCoords
             if ac[DEPTH] in self.ds:
@@ -981,33 +991,29 @@ class Base_Loader(STOQS_Loader):
                         self.logger.info('Overridden in auxCoords: ac[DEPTH] = {ac[DEPTH]}, setting depths to [{ac[DEPTH]}]')
                         depths = [ac[DEPTH]]
 
-        if isinstance(self.ds[ac[LATITUDE]], pydap.model.GridType):
-            latitudes = self.ds[ac[LATITUDE]][ac[LATITUDE]][tindx[0]:tindx[-1]:self.stride]
-        elif multidim_trajectory:
+        if multidim_trajectory and not isinstance(self.ds[ac[LATITUDE]], pydap.model.GridType):
             # TODO: Deal with (as yet unseen) case where multiple trajectories exist in a netCDF file
             latitudes = self.ds[ac[LATITUDE]][0][0][tindx[0]:tindx[-1]:self.stride]
         else:
-            latitudes = self.ds[ac[LATITUDE]][tindx[0]:tindx[-1]:self.stride]
+            latitudes = self._read_slice(ac[LATITUDE], tindx)
         try:
             if latitudes.shape[0] > 0:
                 pass
         except IndexError:
             # Trap case where latitudes.shape = () giving opportunity to turn a single value into a list
-            latitudes = [float(latitudes.data)]
+            latitudes = [float(latitudes)]
 
-        if isinstance(self.ds[ac[LONGITUDE]], pydap.model.GridType):
-            longitudes = self.ds[ac[LONGITUDE]][ac[LONGITUDE]][tindx[0]:tindx[-1]:self.stride]
-        elif multidim_trajectory:
+        if multidim_trajectory and not isinstance(self.ds[ac[LONGITUDE]], pydap.model.GridType):
             # TODO: Deal with (as yet unseen) case where multiple trajectories exist in a netCDF file
             longitudes = self.ds[ac[LONGITUDE]][0][0][tindx[0]:tindx[-1]:self.stride]
         else:
-            longitudes = self.ds[ac[LONGITUDE]][tindx[0]:tindx[-1]:self.stride]
+            longitudes = self._read_slice(ac[LONGITUDE], tindx)
         try:
             if longitudes.shape[0] > 0:
                 pass
         except IndexError:
             # Trap case where longitudes.shape = () giving opportunity to turn a single value into a list
-            longitudes = [float(longitudes.data)]
+            longitudes = [float(longitudes)]
 
         return mtimes, depths, latitudes, longitudes
 
@@ -1021,11 +1027,9 @@ class Base_Loader(STOQS_Loader):
         mtimes, depths, latitudes, longitudes, dup_times = zip(*self.good_coords(
                                         pnames, mtimes, depths, latitudes, longitudes, coords_equal))
 
-        # Reassign meass with Measurement objects that have their id set
+        # Reassign meass with Measurement objects that have their id set (or with just the ids if use_copy)
         try:
-            meass, mask = self._bulk_load_coordinates(self._ips(mtimes), self._meass(
-                                                      depths, longitudes, latitudes), 
-                                                      dup_times, ac, axes)
+            meass, mask = self._load_coordinates(mtimes, depths, latitudes, longitudes, dup_times, ac, axes)
         except (UniqueViolation, IntegrityError) as e:
             # Likely a realtime LRAUV load with a coord already loaded - add the dup to coords_equal
             self.logger.info(f"{e}: Trying _bulk_load_coordinates() again after _find_dup_coords()")
@@ -1034,9 +1038,7 @@ class Base_Loader(STOQS_Loader):
                                                  coords_equal)
             mtimes, depths, latitudes, longitudes, dup_times = zip(*self.good_coords(
                                         pnames, mtimes, depths, latitudes, longitudes, coords_equal))
-            meass, mask = self._bulk_load_coordinates(self._ips(mtimes), self._meass(
-                                                      depths, longitudes, latitudes), 
-                                                      dup_times, ac, axes)
+            meass, mask = self._load_coordinates(mtimes, depths, latitudes, longitudes, dup_times, ac, axes)
 
         return meass, dup_times, mask
 
@@ -1056,31 +1058,36 @@ class Base_Loader(STOQS_Loader):
         time_units = self.ds[ac[TIME]].units.lower().replace('utc', 'UTC')
         if self.ds[ac[TIME]].units == 'seconds since 1970-01-01T00:00:00Z':
             timeUnits = 'seconds since 1970-01-01 00:00:00'          # coards doesn't like ISO format
-        mtimes = (from_udunits(mt, time_units) for mt in times)
+        mtimes = [from_udunits(mt, time_units) for mt in times]
+
+        # Match all the times against the sorted InstantPoint times of the associated Activity at once
+        ip_index = InstantPointIndex(self.associatedActivityName, self.dbAlias)
+        ip_ids, secs_diffs, _ = ip_index.match_ids(mtimes)
+        meas_by_ip = {meas.instantpoint_id: meas for meas in Measurement.objects.using(self.dbAlias)
+                        .filter(instantpoint_id__in=ip_ids[ip_ids >= 0].tolist()).select_related('instantpoint')}
 
         warn_secs_diff = 2
         noload_secs_diff = 60
-        ips = []
         meass = []
         warn_count = 0
         noload_count = 0
-        for mt in mtimes:
-            try:
-                ip, secs_diff = get_closest_instantpoint(self.associatedActivityName, mt, self.dbAlias)
-            except ClosestTimeNotFoundException as e:
+        for mt, ip_id, secs_diff in zip(mtimes, ip_ids.tolist(), secs_diffs.tolist()):
+            if ip_id < 0:
                 self.logger.error('Could not find corresponding measurment for LOPC data measured at %s', mt)
-            else:
-                if secs_diff > noload_secs_diff:
-                    noload_count += 1
-                    self.logger.debug(f"{noload_count:3d}. LOPC data at {mt.strftime('%Y-%m-%d %H:%M:%S')} not loaded - more than "
-                                      f"{noload_secs_diff} secs away from existing measurement: {secs_diff}")
-                    continue
-                if secs_diff > warn_secs_diff:
-                    warn_count += 1
-                    self.logger.debug(f"{warn_count:3d}. LOPC data at {mt.strftime('%Y-%m-%d %H:%M:%S')} more than "
-                                     f"{warn_secs_diff} secs away from existing measurement: {secs_diff}")
+                continue
 
-                meass.append(Measurement.objects.using(self.dbAlias).get(instantpoint=ip))
+            secs_diff = int(secs_diff)
+            if secs_diff > noload_secs_diff:
+                noload_count += 1
+                self.logger.debug(f"{noload_count:3d}. LOPC data at {mt.strftime('%Y-%m-%d %H:%M:%S')} not loaded - more than "
+                                  f"{noload_secs_diff} secs away from existing measurement: {secs_diff}")
+                continue
+            if secs_diff > warn_secs_diff:
+                warn_count += 1
+                self.logger.debug(f"{warn_count:3d}. LOPC data at {mt.strftime('%Y-%m-%d %H:%M:%S')} more than "
+                                 f"{warn_secs_diff} secs away from existing measurement: {secs_diff}")
+
+            meass.append(meas_by_ip[ip_id])
 
         self.logger.warn(f"{noload_count} of {len(times)} original LOPC measurements not loaded because they "
                          f"were more than {noload_secs_diff} seconds away from an existing measurement")
@@ -1181,6 +1188,9 @@ class Base_Loader(STOQS_Loader):
                 self.logger.warn(f'Failed to getTimeBegEndIndices() for axes {k} from {self.url}')
                 continue
 
+            if not multidim_trajectory:
+                self._prefetch(pnames + [ac.get(TIME), ac.get(DEPTH), ac.get(LATITUDE), ac.get(LONGITUDE)], tindx)
+
             for i, pname in enumerate(pnames):
                 self.logger.debug(f'{i}, {pname}')
                 if i == 0:
@@ -1235,7 +1245,7 @@ class Base_Loader(STOQS_Loader):
                 try:
                     if isinstance(self.ds[pname], pydap.model.GridType):
                         constraint_string = f"using python slice: ds['{pname}']['{pname}'][{tindx[0]}:{tindx[-1]}:{self.stride}]"
-                        values = self.ds[pname][pname].data[tindx[0]:tindx[-1]:self.stride]
+                        values = self._read_slice(pname, tindx)
                     elif multidim_trajectory:
                         self.logger.info(f"Loading {pname} from multidimensional trajectory file")
                         constraint_string = f"using python slice: ds['{pname}'][0][0][{tindx[0]}:{tindx[-1]}:{self.stride}]"
@@ -1243,7 +1253,7 @@ class Base_Loader(STOQS_Loader):
                         values = self.ds[pname].data[0][0][tindx[0]:tindx[-1]:self.stride]
                     else:
                         constraint_string = f"using python slice: ds['{pname}'][{tindx[0]}:{tindx[-1]}:{self.stride}]"
-                        values = self.ds[pname].data[tindx[0]:tindx[-1]:self.stride]
+                        values = self._read_slice(pname, tindx)
                 except ValueError:
                     self.logger.warn(f'Stride of {self.stride} likely greater than range of data: {tindx[0]}:{tindx[-1]}')
                     self.logger.warn(f'Skipping load of {self.url}')
@@ -1261,9 +1271,19 @@ class Base_Loader(STOQS_Loader):
                     # For data like LOPC data - expect all values to be non-nan, load array and the sum of it
                     self.param_by_key[pname].description = 'Sum of counts saved in datavalue, spectrum of counts saves in dataarray'
                     self.param_by_key[pname].save(using=self.dbAlias)
-                    mps = (MeasuredParameter(measurement=me, parameter=self.param_by_key[pname], 
-                                                dataarray=list(va), datavalue=sum(va)) 
-                                                for me, va in zip(meass, values))
+                    if self.use_copy:
+                        num_mps = self._copy_measuredparameters(meass, self.param_by_key[pname],
+                                                                (sum(va) for va in values), (list(va) for va in values))
+                    else:
+                        mps = (MeasuredParameter(measurement=me, parameter=self.param_by_key[pname], 
+                                                    dataarray=list(va), datavalue=sum(va)) 
+                                                    for me, va in zip(meass, values))
+                elif self.use_copy:
+                    # Like bulk_create() below, bad values are loaded as None and removed after the load
+                    values = self._good_value_generator(pname, values)
+                    num_mps = self._copy_measuredparameters(meass, self.param_by_key[pname], 
+                                                            (va for va, dt, mk in zip(values, dup_times, mask) 
+                                                                if not dt and not mk))
                 else:
                     # Need to bulk_create() all values, set bad ones to None and remove them after insert
                     values = self._good_value_generator(pname, values)
@@ -1271,15 +1291,33 @@ class Base_Loader(STOQS_Loader):
                                                 datavalue=va) for me, va, dt, mk in zip(
                                                 meass, values, dup_times, mask) if not dt and not mk)
 
-                # All items but meass are generators, so we can call len() on it
-                self.logger.info(f'Bulk loading {len(meass)} {self.param_by_key[pname]} datavalues into MeasuredParameter {constraint_string} with batch_size = {BATCH_SIZE}')
-                mps = self._measuredparameter_with_measurement(meass, mps)
-                mps = MeasuredParameter.objects.using(self.dbAlias).bulk_create(mps, batch_size=BATCH_SIZE)
-                self.parameter_counts[self.param_by_key[pname]] = len(mps)
-                total_loaded += len(mps)
+                if not self.use_copy:
+                    # All items but meass are generators, so we can call len() on it
+                    self.logger.info(f'Bulk loading {len(meass)} {self.param_by_key[pname]} datavalues into MeasuredParameter {constraint_string} with batch_size = {BATCH_SIZE}')
+                    mps = self._measuredparameter_with_measurement(meass, mps)
+                    mps = MeasuredParameter.objects.using(self.dbAlias).bulk_create(mps, batch_size=BATCH_SIZE)
+                    num_mps = len(mps)
+                else:
+                    self.logger.info(f'Copied {num_mps} {self.param_by_key[pname]} datavalues into MeasuredParameter {constraint_string}')
+                self.parameter_counts[self.param_by_key[pname]] = num_mps
+                total_loaded += num_mps
 
         return total_loaded
 
+    def _read_slice(self, name, tindx):
+        '''Return numpy array of ds[name][tindx[0]:tindx[-1]:self.stride], from the inner array
+        of GridTypes, read through self.reader
+        '''
+        return self.reader.read(name, tindx[0], tindx[-1], self.stride,
+                                grid=isinstance(self.ds[name], pydap.model.GridType))
+
+    def _prefetch(self, names, tindx):
+        '''Read the variables in names that are in the dataset concurrently into the reader's cache
+        '''
+        names = [n for n in dict.fromkeys(names) if isinstance(n, str) and n in self.ds]
+        self.reader.prefetch([(n, tindx[0], tindx[-1], self.stride, isinstance(self.ds[n], pydap.model.GridType))
+                              for n in names])
+
     def _convert_EPIC_times(self, times, tindx):
         # Create COARDS time from EPIC data
         time2s = self.ds['time2']['time2'].data[tindx[0]:tindx[-1]:self.stride]
@@ -1322,8 +1360,9 @@ class Base_Loader(STOQS_Loader):
                     # CF (nee COARDS) has tzyx coordinate ordering, time is at index [1] and depth is at [2]
                     # - times: Assume CF/COARDS, override if EPIC data detected
                     tindx = self.getTimeBegEndIndices(self.ds[list(self.ds[firstp].keys())[1]])
+                    self._prefetch(pnames, tindx)
                     try:
-                        times = self.ds[list(self.ds[firstp].maps.keys())[0]].data[tindx[0]:tindx[-1]:self.stride]
+                        times = self._read_slice(list(self.ds[firstp].maps.keys())[0], tindx)
                     except ValueError as e:
                         # Likely 'not enough values to unpack' because of self.stride exceeding range
                         self.logger.warn(f"{e}. Stride value of {self.stride} is likely too high.")
@@ -1463,30 +1502,33 @@ class Base_Loader(STOQS_Loader):
                     # Need a set of points for all the timeseriesprofile depths
                     points = points * len(list(depths))
 
-                    ips = (InstantPoint(activity=self.activity, timevalue=mt) for mt in mtimes)
-                    try:
-                        self.logger.info(f'Calling bulk_create() for InstantPoints in ips generator for firstp = {firstp} with batch_size = {BATCH_SIZE}')
-                        ips = InstantPoint.objects.using(self.dbAlias).bulk_create(ips, batch_size=BATCH_SIZE)
-                    except (IntegrityError, psycopg2.IntegrityError) as e:
-                        self.logger.info(f"Time axis '{ac[TIME]}' likely has timevalues already loaded from an axis in {time_axes_loaded}")
-                        self.logger.info(f'Getting matching InstantPoints from the database, creating new ones not yet there.')
-                        ips_new = []
-                        num_created = 0
-                        for ip in (InstantPoint(activity=self.activity, timevalue=mt) for mt in mtimes):
-                            ip_db, created = InstantPoint.objects.using(self.dbAlias).get_or_create(
-                                            activity=self.activity, timevalue=ip.timevalue)
-                            if created:
-                                num_created += 1
-
-                            ips_new.append(ip_db) 
-
-                        ips = ips_new 
-                        self.logger.info(f'Got {len(ips) - num_created} InstantPoints from the database, created {num_created} new ones')
+                    if self.use_copy:
+                        ips = self._copy_instantpoints(mtimes)
+                    else:
+                        ips = (InstantPoint(activity=self.activity, timevalue=mt) for mt in mtimes)
+                        try:
+                            self.logger.info(f'Calling bulk_create() for InstantPoints in ips generator for firstp = {firstp} with batch_size = {BATCH_SIZE}')
+                            ips = InstantPoint.objects.using(self.dbAlias).bulk_create(ips, batch_size=BATCH_SIZE)
+                        except (IntegrityError, psycopg2.IntegrityError) as e:
+                            self.logger.info(f"Time axis '{ac[TIME]}' likely has timevalues already loaded from an axis in {time_axes_loaded}")
+                            self.logger.info(f'Getting matching InstantPoints from the database, creating new ones not yet there.')
+                            ips_new = []
+                            num_created = 0
+                            for ip in (InstantPoint(activity=self.activity, timevalue=mt) for mt in mtimes):
+                                ip_db, created = InstantPoint.objects.using(self.dbAlias).get_or_create(
+                                                activity=self.activity, timevalue=ip.timevalue)
+                                if created:
+                                    num_created += 1
+
+                                ips_new.append(ip_db) 
+
+                            ips = ips_new 
+                            self.logger.info(f'Got {len(ips) - num_created} InstantPoints from the database, created {num_created} new ones')
                        
-                        if not ips: 
-                            self.logger.error(f'Unable to load load InstantPoints for axis {ac[TIME]}. Exiting.')
-                            self.logger.exception(f"Maybe you should delete Activity '{self.activity.name}' first?")
-                            sys.exit(-1)
+                            if not ips: 
+                                self.logger.error(f'Unable to load load InstantPoints for axis {ac[TIME]}. Exiting.')
+                                self.logger.exception(f"Maybe you should delete Activity '{self.activity.name}' first?")
+                                sys.exit(-1)
 
                     # TIME axes are commonly shared amongst variables on different grids in timeseriesprofile data
                     # Keep track of axis names for use in logger info messages
@@ -1505,37 +1547,40 @@ class Base_Loader(STOQS_Loader):
                     else:
                         nls = [None] * len(list(depths))
 
-                    meass = []
-                    for ip in ips:
-                        for de, po, nl in zip(depths, points, nls):
-                            if self.is_coordinate_bad(firstp, ip.timevalue, de):
-                                self.logger.warn(f'Bad coordinate: {ip}, {de}')
-                            meass.append(Measurement(depth=repr(de), geom=po, instantpoint=ip, nominallocation=nl))
+                    if self.use_copy:
+                        meass = self._copy_timeseriesprofile_measurements(firstp, ips, mtimes, depths, points, nls)
+                    else:
+                        meass = []
+                        for ip in ips:
+                            for de, po, nl in zip(depths, points, nls):
+                                if self.is_coordinate_bad(firstp, ip.timevalue, de):
+                                    self.logger.warn(f'Bad coordinate: {ip}, {de}')
+                                meass.append(Measurement(depth=repr(de), geom=po, instantpoint=ip, nominallocation=nl))
 
-                    try:
-                        self.logger.info(f'Calling bulk_create() for {len(meass)} Measurements with batch_size = {BATCH_SIZE}')
-                        meass = Measurement.objects.using(self.dbAlias).bulk_create(meass, batch_size=BATCH_SIZE)
-                    except (IntegrityError, psycopg2.IntegrityError) as e:
-                        self.logger.info(f"Depth axis '{ac[DEPTH]}' likely has depths already loaded from an axis in {depth_axes_loaded}")
-                        self.logger.info(f'Getting matching Measurements from the database, creating new ones not yet there.')
-                        meass_new = []
-                        num_created = 0
-                        for meas in meass:
-                            meas_db, created = Measurement.objects.using(self.dbAlias).get_or_create(
-                                            instantpoint=meas.instantpoint, depth=meas.depth, 
-                                            geom=meas.geom, nominallocation=meas.nominallocation) 
-                            if created:
-                                num_created += 1
-
-                            meass_new.append(meas_db) 
-
-                        meass = meass_new
-                        self.logger.info(f'Got {len(meass) - num_created} Measurements from the database, created {num_created} new ones')
-
-                        if not meass:
-                            self.logger.error(f'Unable to load load Measurements for axis {ac[DEPTH]}. Exiting.')
-                            self.logger.exception(f"Maybe you should delete Activity '{self.activity.name}' first?")
-                            sys.exit(-1)
+                        try:
+                            self.logger.info(f'Calling bulk_create() for {len(meass)} Measurements with batch_size = {BATCH_SIZE}')
+                            meass = Measurement.objects.using(self.dbAlias).bulk_create(meass, batch_size=BATCH_SIZE)
+                        except (IntegrityError, psycopg2.IntegrityError) as e:
+                            self.logger.info(f"Depth axis '{ac[DEPTH]}' likely has depths already loaded from an axis in {depth_axes_loaded}")
+                            self.logger.info(f'Getting matching Measurements from the database, creating new ones not yet there.')
+                            meass_new = []
+                            num_created = 0
+                            for meas in meass:
+                                meas_db, created = Measurement.objects.using(self.dbAlias).get_or_create(
+                                                instantpoint=meas.instantpoint, depth=meas.depth, 
+                                                geom=meas.geom, nominallocation=meas.nominallocation) 
+                                if created:
+                                    num_created += 1
+
+                                meass_new.append(meas_db) 
+
+                            meass = meass_new
+                            self.logger.info(f'Got {len(meass) - num_created} Measurements from the database, created {num_created} new ones')
+
+                            if not meass:
+                                self.logger.error(f'Unable to load load Measurements for axis {ac[DEPTH]}. Exiting.')
+                                self.logger.exception(f"Maybe you should delete Activity '{self.activity.name}' first?")
+                                sys.exit(-1)
 
                     # DEPTH axes are commonly shared amongst variables on different grids in timeseriesprofile data
                     # Keep track of axis names for use in logger info messages
@@ -1546,7 +1591,7 @@ class Base_Loader(STOQS_Loader):
  
                 constraint_string = f"using python slice: ds['{pname}']['{pname}'][{tindx[0]}:{tindx[-1]}:{self.stride}]"
                 try:
-                    values = self.ds[pname][pname].data[tindx[0]:tindx[-1]:self.stride]
+                    values = self._read_slice(pname, tindx)
                 except ValueError as e:
                     # Likely 'not enough values to unpack' because of self.stride exceeding range
                     self.logger.warn(f"{e}. Stride value of {self.stride} is likely too high.")
@@ -1558,6 +1603,13 @@ class Base_Loader(STOQS_Loader):
 
                 # Need to bulk_create() all values, set bad ones to None and remove them after insert
                 values = self._good_value_generator(pname, values.flatten())
+                if self.use_copy:
+                    num_mps = self._copy_measuredparameters(meass, self.param_by_key[pname], values)
+                    self.logger.info(f'Copied {num_mps} {self.param_by_key[pname]} datavalues into MeasuredParameter {constraint_string}')
+                    self.logger.info(f"Time data: {self.url}.ascii?{ac[TIME]}[{tindx[0]}:{self.stride}:{tindx[-1] - 1}]")
+                    total_loaded += num_mps
+                    continue
+
                 mps = (MeasuredParameter(measurement=me, parameter=self.param_by_key[pname], 
                                                 datavalue=va) for me, va in zip(meass, values))
 
@@ -1613,12 +1665,201 @@ class Base_Loader(STOQS_Loader):
             mp.measurement = meas
             yield mp
 
-    def _delete_bad_datavalues(self, pname):
-        num, _ = (MeasuredParameter.objects.using(self.dbAlias)
+    def _load_coordinates(self, mtimes, depths, latitudes, longitudes, dup_times, ac, axes):
+        '''Load InstantPoints and Measurements with either COPY or bulk_create(). Returns the
+        loaded Measurements (just their ids when using COPY) and the mask of coordinates not loaded.
+        '''
+        if self.use_copy:
+            return self._copy_load_coordinates(mtimes, depths, latitudes, longitudes, dup_times)
+
+        return self._bulk_load_coordinates(self._ips(mtimes), self._meass(depths, longitudes, latitudes),
+                                           dup_times, ac, axes)
+
+    def _copy_instantpoints(self, mtimes, reuse_existing=True):
+        '''COPY InstantPoints for mtimes into the database and return a numpy array of their 
+        ids in the order of mtimes.  Repeated timevalues in mtimes share one InstantPoint.  If some
+        of the timevalues are already in the database for this Activity (e.g. a time axis shared with
+        a previously loaded axis) then their ids are looked up in one query, reported, and only the
+        missing InstantPoints are copied.  With reuse_existing False repeated or existing timevalues
+        raise DuplicateData, as the bulk_create() code does.
+        '''
+        times = list(dict.fromkeys(mtimes))
+        if len(times) != len(mtimes):
+            if not reuse_existing:
+                self.logger.error(f"The time variable in {self.url} has {len(mtimes) - len(times)} duplicate values")
+                raise DuplicateData(f"Duplicate data from {self.url} in {self.dbAlias}")
+            self.logger.info(f'{len(mtimes) - len(times)} repeated time values share InstantPoints')
+
+        with connections[self.dbAlias].cursor() as cursor:
+            ip_ids = bulk_copy.reserve_ids(cursor, InstantPoint, len(times))
+            try:
+                with transaction.atomic(using=self.dbAlias):
+                    bulk_copy.copy_rows(cursor, InstantPoint, ('id', 'activity', 'timevalue'),
+                                        ((ip_id, self.activity.id, mt) for ip_id, mt in zip(ip_ids, times)))
+                self.logger.info(f'Copied {len(ip_ids)} InstantPoints')
+                ip_id_by_time = dict(zip(times, ip_ids.tolist()))
+                return np.array([ip_id_by_time[mt] for mt in mtimes], dtype=np.int64)
+            except (IntegrityError, psycopg2.IntegrityError) as e:
+                self.logger.info(f'{e}'.split('\n')[0])
+                if not reuse_existing:
+                    self.logger.error(f"It's likely that the time variable in {self.url} has values already loaded")
+                    raise DuplicateData(f"Duplicate data from {self.url} in {self.dbAlias}")
+
+            self.logger.info(f'Getting matching InstantPoints from the database, copying new ones not yet there.')
+            ip_id_by_time = dict(InstantPoint.objects.using(self.dbAlias)
+                                    .filter(activity=self.activity, timevalue__gte=min(times), timevalue__lte=max(times))
+                                    .values_list('timevalue', 'id'))
+            new_times = [mt for mt in times if mt not in ip_id_by_time]
+            new_ids = bulk_copy.reserve_ids(cursor, InstantPoint, len(new_times))
+            with transaction.atomic(using=self.dbAlias):
+                bulk_copy.copy_rows(cursor, InstantPoint, ('id', 'activity', 'timevalue'),
+                                    ((ip_id, self.activity.id, mt) for ip_id, mt in zip(new_ids, new_times)))
+            ip_id_by_time.update(zip(new_times, new_ids.tolist()))
+            self.logger.warning(f'Reusing {len(times) - len(new_times)} InstantPoints already loaded for Activity'
+                                f' {self.activity.name}, copied {len(new_times)} new ones')
+
+        return np.array([ip_id_by_time[mt] for mt in mtimes], dtype=np.int64)
+
+    def _copy_measurements(self, ip_ids, depths, geoms, nl_ids=None, reuse_existing=True):
+        '''COPY Measurements into the database and return a numpy array of their ids in the order
+        given.  geoms are EWKT strings as made by bulk_copy.ewkt_point().  Rows are keyed on the
+        (instantpoint, depth, geom) unique constraint: repeated keys share one Measurement and, like
+        the get_or_create() fallback used with bulk_create(), Measurements already in the database are
+        reported and reused.  With reuse_existing False repeated or existing keys raise DuplicateData.
+        '''
+        if nl_ids is None:
+            nl_ids = [None] * len(ip_ids)
+
+        keys = [(int(ip_id), float(de), geom) for ip_id, de, geom in zip(ip_ids, depths, geoms)]
+        row_by_key = {}
+        for key, nl_id in zip(keys, nl_ids):
+            row_by_key.setdefault(key, (key[0], nl_id, key[1], key[2]))
+        if len(row_by_key) != len(keys):
+            if not reuse_existing:
+                self.logger.error(f'{self.url} has {len(keys) - len(row_by_key)} duplicate coordinates')
+                raise DuplicateData(f"Duplicate data from {self.url} in {self.dbAlias}")
+            self.logger.info(f'{len(keys) - len(row_by_key)} repeated coordinates share Measurements')
+
+        fields = ('id', 'instantpoint', 'nominallocation', 'depth', 'geom')
+        with connections[self.dbAlias].cursor() as cursor:
+            meas_ids = bulk_copy.reserve_ids(cursor, Measurement, len(row_by_key))
+            try:
+                with transaction.atomic(using=self.dbAlias):
+                    bulk_copy.copy_rows(cursor, Measurement, fields,
+                                        ((meas_id, ) + row for meas_id, row in zip(meas_ids, row_by_key.values())))
+                self.logger.info(f'Copied {len(meas_ids)} Measurements')
+                meas_id_by_key = dict(zip(row_by_key, meas_ids.tolist()))
+                return np.array([meas_id_by_key[key] for key in keys], dtype=np.int64)
+            except (IntegrityError, psycopg2.IntegrityError) as e:
+                self.logger.info(f'{e}'.split('\n')[0])
+                if not reuse_existing:
+                    self.logger.error(f"It's likely that coordinates in {self.url} have already been loaded")
+                    raise DuplicateData(f"Duplicate data from {self.url} in {self.dbAlias}")
+
+            self.logger.info(f'Getting matching Measurements from the database, copying new ones not yet there.')
+            meas_id_by_key = {(ip_id, depth, bulk_copy.ewkt_point(geom.x, geom.y, geom.srid)): meas_id
+                                for ip_id, depth, geom, meas_id in Measurement.objects.using(self.dbAlias)
+                                    .filter(instantpoint__activity=self.activity)
+                                    .values_list('instantpoint_id', 'depth', 'geom', 'id')}
+            new_keys = [key for key in row_by_key if key not in meas_id_by_key]
+            new_ids = bulk_copy.reserve_ids(cursor, Measurement, len(new_keys))
+            with transaction.atomic(using=self.dbAlias):
+                bulk_copy.copy_rows(cursor, Measurement, fields, 
+                                    ((meas_id, ) + row_by_key[key] for meas_id, key in zip(new_ids, new_keys)))
+            meas_id_by_key.update(zip(new_keys, new_ids.tolist()))
+            self.logger.warning(f'Reusing {len(row_by_key) - len(new_keys)} Measurements already loaded for Activity'
+                                f' {self.activity.name}, copied {len(new_keys)} new ones')
+
+        return np.array([meas_id_by_key[key] for key in keys], dtype=np.int64)
+
+    def _copy_load_coordinates(self, mtimes, depths, latitudes, longitudes, dup_times):
+        '''COPY counterpart of _bulk_load_coordinates(). Coordinates are accepted or masked with the
+        same rules as in _ips() and _meass().  Returns numpy array of Measurement ids and the mask.
+        '''
+        mask = []
+        times = []
+        good_depths = []
+        geoms = []
+        for mt, de, la, lo, dt in zip(mtimes, depths, latitudes, longitudes, dup_times):
+            # Accept depths that are 0.0, but not latitudes and longitudes that are zero
+            if not mt or de is None or not lo or not la or dt:
+                mask.append(True)
+            else:
+                mask.append(False)
+                times.append(mt)
+                good_depths.append(float(de))
+                geoms.append(bulk_copy.ewkt_point(lo, la))
+
+        if not times:
+            return np.array([], dtype=np.int64), mask
+
+        # Like _bulk_load_coordinates() reuse time values only if they were loaded for a previous axis
+        ip_ids = self._copy_instantpoints(times, reuse_existing=hasattr(self, 'ips'))
+        self.ips = ip_ids
+
+        return self._copy_measurements(ip_ids, good_depths, geoms, reuse_existing=False), mask
+
+    def _copy_timeseriesprofile_measurements(self, firstp, ip_ids, mtimes, depths, points, nls):
+        '''COPY the Measurements for each time and depth of timeseriesprofile data, pairing
+        depths, points and NominalLocations the same way as the bulk_create() code does.
+        '''
+        meas_ip_ids = []
+        meas_depths = []
+        geoms = []
+        nl_ids = []
+        for ip_id, mt in zip(ip_ids, mtimes):
+            for de, po, nl in zip(depths, points, nls):
+                if self.is_coordinate_bad(firstp, mt, de):
+                    self.logger.warn(f'Bad coordinate: {mt}, {de}')
+                meas_ip_ids.append(ip_id)
+                meas_depths.append(float(de))
+                geoms.append(bulk_copy.ewkt_point(po.x, po.y))
+                nl_ids.append(nl.id if nl else None)
+
+        return self._copy_measurements(meas_ip_ids, meas_depths, geoms, nl_ids)
+
+    def _copy_measuredparameters(self, meass, parameter, datavalues, dataarrays=None):
+        '''COPY MeasuredParameters for parameter into the database.  meass may be Measurement ids 
+        (as returned by the _copy_*() methods) or Measurement objects, as from _meass_from_activity(). 
+        Returns the number of MeasuredParameters copied.
+        '''
+        meas_ids = (getattr(me, 'id', me) for me in meass)
+        if dataarrays is None:
+            fields = ('measurement', 'parameter', 'datavalue')
+            rows = ((me, parameter.id, va) for me, va in zip(meas_ids, datavalues))
+        else:
+            fields = ('measurement', 'parameter', 'datavalue', 'dataarray')
+            rows = ((me, parameter.id, va, da) for me, va, da in zip(meas_ids, datavalues, dataarrays))
+
+        try:
+            with connections[self.dbAlias].cursor() as cursor, transaction.atomic(using=self.dbAlias):
+                return bulk_copy.copy_rows(cursor, MeasuredParameter, fields, rows)
+        except (IntegrityError, psycopg2.IntegrityError) as e:
+            self.logger.error(f'{e}'.split('\n')[0])
+            raise DuplicateData(f"Duplicate data from {self.url} in {self.dbAlias}")
+
+    def _loaded_mps(self, since=None):
+        '''Return QuerySet of the MeasuredParameters of the Activity being loaded, those after since if given
+        '''
+        mps = MeasuredParameter.objects.using(self.dbAlias).filter(measurement__instantpoint__activity=self.activity)
+        if since:
+            mps = mps.filter(measurement__instantpoint__timevalue__gt=since)
+        return mps
+
+    def _append_since(self, add_to_activity=None):
+        '''Return the time after which data were appended to an existing Activity, None if the Activity's
+        derived data (maptrack, statistics, SimpleDepthTime, ...) need to be computed from all of its data
+        '''
+        if add_to_activity or hasattr(self, 'add_to_activity') or hasattr(self, 'associatedActivityName'):
+            return None
+        return getattr(self, 'dataStartDatetime', None)
+
+    def _delete_bad_datavalues(self, pname, since=None):
+        num, _ = (self._loaded_mps(since)
                     .filter(parameter__name=pname, datavalue=np.nan).delete())
         if num:
             self.logger.info(f'Deleted {num} nan {pname} MeasuredParameters')
-        num, _ = (MeasuredParameter.objects.using(self.dbAlias)
+        num, _ = (self._loaded_mps(since)
                     .filter(parameter__name=pname, datavalue=np.inf).delete())
         if num:
             self.logger.info(f'Deleted {num} inf {pname} MeasuredParameters')
@@ -1630,13 +1871,21 @@ class Base_Loader(STOQS_Loader):
         #
         stationPoint = None
         path = None
+        since = self._append_since(add_to_activity)
         if add_to_activity:
             self.activity = add_to_activity
 
+        # When appending, extend the simplified maptrack of the Activity with just the new points
+        track = []
         linestringPoints = Measurement.objects.using(self.dbAlias).filter(instantpoint__activity=self.activity
                                                        ).order_by('instantpoint__timevalue').values_list('geom')
+        if since:
+            maptrack = Activity.objects.using(self.dbAlias).get(id=self.activity.id).maptrack
+            if maptrack:
+                track = list(maptrack.coords)
+                linestringPoints = linestringPoints.filter(instantpoint__timevalue__gt=since)
         try:
-            path = LineString([p[0] for p in linestringPoints]).simplify(tolerance=.001)
+            path = LineString(track + [p[0].coords for p in linestringPoints]).simplify(tolerance=.001)
         except (TypeError, ValueError) as e:
             # Likely "LineString requires at least 2 points, got 1."
             self.logger.warn('%s', e)
@@ -1676,7 +1925,7 @@ class Base_Loader(STOQS_Loader):
 
         # Bulk loading of stoqs calculated values may introduce NaNs, remove them
         for pname in (SIGMAT, SPICE, ALTITUDE):
-            self._delete_bad_datavalues(pname)
+            self._delete_bad_datavalues(pname, since)
 
         # Update the Activity with information we now have following the load
         try:
@@ -1714,8 +1963,7 @@ class Base_Loader(STOQS_Loader):
                             comment=load_comment,
                             maptrack=path,
                             mappoint=stationPoint,
-                            num_measuredparameters=mps_loaded,
-                            loaded_date=datetime.utcnow())
+                            num_measuredparameters=mps_loaded)
         self.logger.debug("%d activitie(s) updated with new attributes.", num_updated)
 
         #
@@ -1729,22 +1977,35 @@ class Base_Loader(STOQS_Loader):
         # 
         # Update the stats and store simple line values
         #
-        self.updateActivityMinMaxDepth(act_to_update)
-        self.updateActivityParameterStats(act_to_update)
+        self.updateActivityMinMaxDepth(act_to_update, since=since)
+        self.updateActivityParameterStats(act_to_update, since=since)
+        self.insertActivityParameterTimeBins(act_to_update, since=since)
         self.updateCampaignStartEnd()
         self.assignParameterGroup(groupName=MEASUREDINSITU)
         if featureType == TRAJECTORY:
             if hasattr(self, 'critSimpleDepthTime'):
                 # Loader may have this attribute set, e.g. for BED that need less simplification
-                self.insertSimpleDepthTimeSeries(critSimpleDepthTime=self.critSimpleDepthTime)
+                self.insertSimpleDepthTimeSeries(critSimpleDepthTime=self.critSimpleDepthTime, since=since)
             else: 
-                self.insertSimpleDepthTimeSeries()
-            self.saveBottomDepth()
-            self.insertSimpleBottomDepthTimeSeries()
+                self.insertSimpleDepthTimeSeries(since=since)
+            self.saveBottomDepth(since=since)
+            self.insertSimpleBottomDepthTimeSeries(since=since)
         elif featureType == TIMESERIES or featureType == TIMESERIESPROFILE:
             self.insertSimpleDepthTimeSeriesByNominalDepth()
         elif featureType == TRAJECTORYPROFILE:
             self.insertSimpleDepthTimeSeriesByNominalDepth(trajectoryProfileDepths=self.timeDepthProfiles)
+
+        if partitions.is_partitioned(self.dbAlias):
+            # Move the Activity's rows from the DEFAULT partitions so that it can be dropped as a whole
+            partitions.seal_activity(self.dbAlias, act_to_update)
+
+        if not (hasattr(self, 'add_to_activity') or hasattr(self, 'associatedActivityName')):
+            # Set last so that an Activity without loaded_date is known to be incompletely loaded
+            Activity.objects.using(self.dbAlias).filter(id=act_to_update.id).update(loaded_date=datetime.utcnow())
+
+        # Invalidate the UI's cached query results that don't include this Activity
+        with shared_step(self.dbAlias, 'bump_load_generation'):
+            bump_load_generation(self.dbAlias)
         self.logger.info("Data load complete, %d records loaded.", mps_loaded)
 
         return path
@@ -1875,14 +2136,24 @@ class Base_Loader(STOQS_Loader):
             return mps_loaded, path, parmCount
 
         if mps_loaded:
-            # Bulk loading may introduce None values, remove them
-            MeasuredParameter.objects.using(self.dbAlias).filter(datavalue=None, dataarray=None).delete()
+            # Bulk loading may introduce None values, remove them - from just the appended data when appending
+            since = self._append_since(add_to_activity)
+            if since:
+                self._loaded_mps(since).filter(datavalue=None, dataarray=None).delete()
+            else:
+                MeasuredParameter.objects.using(self.dbAlias).filter(datavalue=None, dataarray=None).delete()
 
             # Removing Nones above may leave a Parameter without any MeasuredParameters, remove them
             for parameter in self.parameter_counts.copy().keys():
-                mp_count = MeasuredParameter.objects.using(self.dbAlias).filter(parameter=parameter).count()
+                if since:
+                    # Count the appended values, the Parameter has values from before if the Activity does
+                    mp_count = self._loaded_mps(since).filter(parameter=parameter).count()
+                    has_values = mp_count or MeasuredParameter.objects.using(self.dbAlias).filter(parameter=parameter).exists()
+                else:
+                    mp_count = MeasuredParameter.objects.using(self.dbAlias).filter(parameter=parameter).count()
+                    has_values = mp_count
                 self.logger.info(f"{parameter.name:40} count: {mp_count:6}")
-                if mp_count == 0:
+                if not has_values:
                     self.logger.info(f"Deleting Parameter because it has no valid data: {parameter}")
                     try:
                         del parmCount[parameter.name.split(' ')[0]]
@@ -1890,7 +2161,11 @@ class Base_Loader(STOQS_Loader):
                         del self.parameter_dict[parameter.name]
                     except KeyError as e:
                         self.logger.warning(f"{e} not from Activity {self.activity}")
-                    parameter.delete(using=self.dbAlias)
+                    if in_worker():
+                        # Other scheduled loads may be loading data for parameter, LoadScheduler deletes it if not
+                        empty_parameter(parameter)
+                    else:
+                        parameter.delete(using=self.dbAlias)
                 else:
                     parmCount[parameter.name.split(' ')[0]] = mp_count
             path = self._post_process_updates(mps_loaded, featureType, add_to_activity=add_to_activity)
@@ -2320,7 +2595,8 @@ def _load_plankton_proxies(url, stride, loader, cName, cDesc, dbAlias, aTypeName
         loader.logger.debug("Loaded Activity with name = %s", pp_loader.activityName)
 
 def runDoradoLoader(url, cName, cDesc, aName, pName, pColor, pTypeName, aTypeName, parmList, 
-                    dbAlias, stride, grdTerrain=None, plotTimeSeriesDepth=None, plankton_proxies=False):
+                    dbAlias, stride, grdTerrain=None, plotTimeSeriesDepth=None, plankton_proxies=False,
+                    command_line_args=None):
     '''
     Run the DAPloader for Dorado AUVCTD trajectory data and update the Activity with 
     attributes resulting from the load into dbAlias. Designed to be called from script
@@ -2337,7 +2613,8 @@ def runDoradoLoader(url, cName, cDesc, aName, pName, pColor, pTypeName, aTypeNam
             platformColor = pColor,
             platformTypeName = pTypeName,
             stride = stride,
-            grdTerrain = grdTerrain)
+            grdTerrain = grdTerrain,
+            command_line_args = command_line_args)
 
     if parmList:
         loader.include_names = parmList
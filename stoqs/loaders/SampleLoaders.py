@@ -27,6 +27,7 @@ from stoqs.models import (Activity, InstantPoint, Sample, SampleType, Resource,
                           SampleResource, ResourceType, ParameterResource)
 from loaders.seabird import get_year_lat_lon
 from loaders import STOQS_Loader, SkipRecord
+from loaders.instantpoints import closest_instantpoint, ClosestTimeNotFoundException
 from collections import defaultdict, namedtuple
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -94,9 +95,6 @@ lsr_esp_error_msg_re    = r'(?P<esp_error_message>.+Error in PROCESSING.+)'
 iso_time = r'\d\d\d\d-\d\d-\d\dT\d\d:\d\d:\d\d\.\d*Z'
 beg_syslog_re = iso_time + r',(?P<log_esec>\d*\.\d+)\s\[(?P<log_component>[^\]]+)\]\((?P<log_level>[^\)]+)\):\s(?P<log_message>[^\n]+)'
 
-class ClosestTimeNotFoundException(Exception):
-    pass
-
 class SingleActivityNotFound(Exception):
     pass
 
@@ -108,42 +106,13 @@ def removeNonAscii(s):
 
 def get_closest_instantpoint(aName, tv, dbAlias):
     '''
-    Start with a tolerance of 1 second and double it until we get a non-zero count,
-    get the values and find the closest one by finding the one with minimum absolute difference.
+    Return the InstantPoint of the Activity with name containing aName closest to tv and its distance
+    in whole seconds.  Raises ClosestTimeNotFoundException if there is none within 24 hours.
     '''
-    tol = 1
-    num_timevalues = 0
-    logger.debug('Looking for tv = %s', tv)
-    while tol < 86400:                                      # Fail if not found within 24 hours
-        qs = InstantPoint.objects.using(dbAlias).filter(  activity__name__contains = aName,
-                                                            timevalue__gte = (tv-timedelta(seconds=tol)),
-                                                            timevalue__lte = (tv+timedelta(seconds=tol))
-                                                         ).order_by('timevalue')
-        if qs.count():
-            num_timevalues = qs.count()
-            break
-        tol = tol * 2
-
-    if not num_timevalues:
-        raise ClosestTimeNotFoundException
-
-    logger.debug('Found %d time values with tol = %d', num_timevalues, tol)
-    timevalues = [q.timevalue for q in qs]
-    logger.debug('timevalues = %s', timevalues)
-    i = 0
-    i_min = 0
-    secdiff = []
-    minsecdiff = tol
-    for t in timevalues:
-        secdiff.append(abs(t - tv).seconds)
-        if secdiff[i] < minsecdiff:
-            minsecdiff = secdiff[i]
-            i_min = i
-        logger.debug('i = %d, secdiff = %d', i, secdiff[i])
-        i = i + 1
-
-    logger.debug('i_min = %d', i_min)
-    return qs[i_min], secdiff[i_min]
+    ip, seconds, _ = closest_instantpoint(aName, tv, dbAlias)
+    logger.debug('Found InstantPoint at %s, %s seconds from tv = %s', ip.timevalue, seconds, tv)
+
+    return ip, int(seconds)
 
 
 class ParentSamplesLoader(STOQS_Loader):
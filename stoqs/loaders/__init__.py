@@ -6,6 +6,7 @@ Base module for STOQS loaders
 @license: __license__
 '''
 
+import atexit
 import os
 import sys
 
@@ -18,16 +19,16 @@ django.setup()
 
 from collections import defaultdict
 from django.conf import settings
-from django.contrib.gis.geos import Polygon, Point
+from django.contrib.gis.geos import Point
 from django.db.utils import IntegrityError
-from django.db import transaction, DatabaseError
-from django.db.models import Max, Min
+from django.db import transaction, DatabaseError, connections
+from django.db.models import Count, Max, Min
 from stoqs import models as m
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-import time
 import re
+import itertools
 import subprocess
 import math
 import numpy as np
@@ -37,10 +38,13 @@ import csv
 import requests
 from contextlib import closing
 import logging
-from utils.utils import percentile, median, mode, simplify_points, spiciness
-from tempfile import NamedTemporaryFile
+from utils.utils import simplify_line, spiciness
+from utils.terrain import open_grid
+from utils.stats import StreamingStats, QuantileSketch, array_stats, merge_stats
+from utils.optionscache import bump_load_generation
+from loaders import bulk_copy
+from loaders.scheduler import LoadScheduler, created_activity, shared_step
 import pprint
-from netCDF4 import Dataset
 from argparse import ArgumentParser, RawTextHelpFormatter
 
 
@@ -65,6 +69,17 @@ SPICE = 'spice'
 SPICINESS = 'Spiciness'
 ALTITUDE = 'altitude'
 
+# ActivityParameter statistics for Activities with more values than this are computed
+# in a streaming pass of STATS_CHUNK_SIZE values at a time with approximate percentiles
+STATS_IN_MEMORY_LIMIT = 5000000
+STATS_CHUNK_SIZE = 100000
+
+# Number of rows read and written at a time when building the SimpleDepthTime series
+DEPTH_TIME_CHUNK_SIZE = 100000
+
+# Highest level of the ActivityParameterTimeBin pyramid, its bins are 60 * 4**10 seconds (about 2 years) wide
+TIME_BIN_MAX_LEVEL = 10
+
 if settings.DEBUG:
     BaseDatabaseWrapper.make_debug_cursor = lambda self, cursor: CursorWrapper(cursor, self)
 
@@ -99,6 +114,9 @@ class LoadScript(object):
 
     logger = logging.getLogger(__name__)
 
+    # Exceptions from a scheduled load that are reported, but for which the load is not retried
+    no_retry_exceptions = ()
+
     def __init__(self, base_dbAlias, base_campaignName, description=None, stride=1, x3dTerrains=None, grdTerrain=None):
         self.base_dbAlias = base_dbAlias
         self.base_campaignName = base_campaignName
@@ -106,6 +124,7 @@ class LoadScript(object):
         self.stride = stride
         self.x3dTerrains = x3dTerrains
         self.grdTerrain = grdTerrain
+        self.scheduler = None
 
         exampleString = ''
         for dbType in ('', '_t', '_o', '_s10'):
@@ -171,6 +190,16 @@ class LoadScript(object):
                             help='Stride value (default=1)')
         self.parser.add_argument('-a', '--append', action='store_true', 
                             help='Append data to existing activity - for use in repetative runs')
+        self.parser.add_argument('--copy', action='store_true', 
+                            help='Load data with PostgreSQL COPY rather than Django bulk_create() - for large loads')
+        self.parser.add_argument('--workers', action='store', type=int, default=1,
+                            help='Number of processes for loading Activities in parallel (default=1)')
+        self.parser.add_argument('--retries', action='store', type=int, default=2,
+                            help='Number of times to retry a failed load when --workers > 1 (default=2)')
+        self.parser.add_argument('--journal', action='store',
+                            help='File recording completed loads when --workers > 1, loads in it are skipped on rerun')
+        self.parser.add_argument('--dapcache', action='store',
+                            help='Directory for caching data read from OPeNDAP URLs, makes reloads and restrides faster')
         self.parser.add_argument('--startdate', action='store', 
                             help='For loaders that use it set startdate, in format YYYYMMDD')
         self.parser.add_argument('--enddate', action='store', 
@@ -231,13 +260,37 @@ class LoadScript(object):
             self.args.startdate = curr_mon_st_dt.strftime('%Y%m%d')
             self.args.enddate = curr_mon_en_dt.strftime('%Y%m%d')
 
+        if self.args.workers > 1:
+            self.scheduler = LoadScheduler(self.dbAlias, self.args.workers, self.args.retries,
+                                           self.args.journal, self.no_retry_exceptions)
+            # For load scripts that don't end with addTerrainResources()
+            atexit.register(self.run_scheduled_loads)
+
         self.commandline = ' '.join(sys.argv)
         self.logger.info('Executing command: %s', self.commandline)
 
+    def schedule_load(self, url, aName, func, *args, **kwargs):
+        '''Execute func(*args, **kwargs), the load of url into Activity aName, now or, if 
+        the load script was executed with --workers > 1, in parallel with the other loads
+        when run_scheduled_loads() is called.
+        '''
+        if self.scheduler:
+            self.scheduler.submit(url, aName, func, *args, **kwargs)
+        else:
+            return func(*args, **kwargs)
+
+    def run_scheduled_loads(self):
+        '''Execute the loads queued by schedule_load(). To be called before anything that
+        needs the loaded Activities; addTerrainResources() calls it.
+        '''
+        if self.scheduler and self.scheduler.pending:
+            return self.scheduler.run()
+
     def addTerrainResources(self):
         '''
         If X3D Terrain information is specified then add as Resources to Campaign.  To be called after process_command_line().
         '''
+        self.run_scheduled_loads()
         if not self.x3dTerrains:
             return
 
@@ -309,6 +362,10 @@ class LoadScript(object):
         Can put additional descriptive information in value option, e.g.: "X3D model 
         derived from SolidWorks model of ESP and processed through aopt"
         '''
+        if self.scheduler and self.scheduler.pending:
+            # The Platform is created by a scheduled load
+            self.scheduler.defer(self.addPlatformResources, x3dmodelurl, pName, value, nominaldepth, scalefactor)
+            return
 
         resourceType, _ = m.ResourceType.objects.using(self.dbAlias).get_or_create(
                 name=X3DPLATFORMMODEL, description='X3D scene for model of a platform')
@@ -496,38 +553,39 @@ class STOQS_Loader(object):
         # Initialize cache for each url/ds/activity
         self.parameter_dict = {} 
 
-        # Go through the keys of the OPeNDAP URL for the dataset and add the parameters as needed to the database
-        for variable in (set(self.include_names) & set(self.ds.keys())):
-            if (variable in self.ignored_names):
-                self.logger.debug(f"variable {variable} is in ignored_names")
-                continue
+        with shared_step(self.dbAlias, 'parameters'):
+            # Go through the keys of the OPeNDAP URL for the dataset and add the parameters as needed to the database
+            for variable in (set(self.include_names) & set(self.ds.keys())):
+                if (variable in self.ignored_names):
+                    self.logger.debug(f"variable {variable} is in ignored_names")
+                    continue
 
-            parameter_name, parameter_units = self.parameter_name(variable)
+                parameter_name, parameter_units = self.parameter_name(variable)
 
-            self.logger.info(f"variable: {variable}, parameter_name: {parameter_name}")
-            try:
-                parm = self.getParameterByName(parameter_name)
-            except ParameterNotFound as e:
-                self.logger.debug("Parameter not found in local cache. Getting from database.")
-                vattr = ds[variable].attributes
-                self.parameter_dict[parameter_name], created = (m.Parameter.objects
-                             .using(self.dbAlias).get_or_create(
-                                        name = parameter_name,
-                                        units = parameter_units,
-                                        standard_name = vattr.get('standard_name'),
-                                        long_name = vattr.get('long_name'),
-                                        type = vattr.get('type'),
-                                        description =  vattr.get('description'),
-                                        origin = self.activityName 
-                                    )) 
-                parm = self.parameter_dict[parameter_name]
-                if created:
-                    self.logger.debug(f"Added parameter {parameter_name} from {self.url} to database {self.dbAlias}")
-
-            if not parm.standard_name and ds[variable].attributes.get('standard_name'):
-                # Add standard_name if found in a later Activity (dataset)
-                parm.standard_name = ds[variable].attributes.get('standard_name')
-                parm.save(using=self.dbAlias)
+                self.logger.info(f"variable: {variable}, parameter_name: {parameter_name}")
+                try:
+                    parm = self.getParameterByName(parameter_name)
+                except ParameterNotFound as e:
+                    self.logger.debug("Parameter not found in local cache. Getting from database.")
+                    vattr = ds[variable].attributes
+                    self.parameter_dict[parameter_name], created = (m.Parameter.objects
+                                 .using(self.dbAlias).get_or_create(
+                                            name = parameter_name,
+                                            units = parameter_units,
+                                            standard_name = vattr.get('standard_name'),
+                                            long_name = vattr.get('long_name'),
+                                            type = vattr.get('type'),
+                                            description =  vattr.get('description'),
+                                            origin = self.activityName 
+                                        )) 
+                    parm = self.parameter_dict[parameter_name]
+                    if created:
+                        self.logger.debug(f"Added parameter {parameter_name} from {self.url} to database {self.dbAlias}")
+
+                if not parm.standard_name and ds[variable].attributes.get('standard_name'):
+                    # Add standard_name if found in a later Activity (dataset)
+                    parm.standard_name = ds[variable].attributes.get('standard_name')
+                    parm.save(using=self.dbAlias)
 
     def createCampaign(self):
         '''Create Campaign in the database ensuring that there is only one Campaign
@@ -535,19 +593,20 @@ class STOQS_Loader(object):
         campaign is used and supplied Campaign description is ignored.
         '''
 
-        try:
-            self.campaign = m.Campaign.objects.using(self.dbAlias).get(id=1)
-            self.logger.info('Retrieved Campaign = %s', self.campaign)
-            if self.campaign.name != self.campaignName:
-                self.logger.warn('Supplied Campaign name of %s does not match name = %s '
-                    'in database %s', self.campaignName, self.campaign.name, self.dbAlias)
-                self.logger.warn('Using Campaign already existing in the database')
-        except ObjectDoesNotExist:
-            self.campaign = m.Campaign(name = self.campaignName,
-                                       description = self.campaignDescription)
-            self.campaign.save(using=self.dbAlias)
-            self.logger.info('Created campaign = %s', self.campaign)
- 
+        with shared_step(self.dbAlias, 'campaign'):
+            try:
+                self.campaign = m.Campaign.objects.using(self.dbAlias).get(id=1)
+                self.logger.info('Retrieved Campaign = %s', self.campaign)
+                if self.campaign.name != self.campaignName:
+                    self.logger.warn('Supplied Campaign name of %s does not match name = %s '
+                        'in database %s', self.campaignName, self.campaign.name, self.dbAlias)
+                    self.logger.warn('Using Campaign already existing in the database')
+            except ObjectDoesNotExist:
+                self.campaign = m.Campaign(name = self.campaignName,
+                                           description = self.campaignDescription)
+                self.campaign.save(using=self.dbAlias)
+                self.logger.info('Created campaign = %s', self.campaign)
+
     def createActivity(self):
         '''
         Use provided activity information to add the activity to the database.
@@ -588,6 +647,7 @@ class STOQS_Loader(object):
             self.activity.name = self.activityName
             self.activity.startdate = self.startDatetime
             self.activity.save(using=self.dbAlias)
+            created_activity(self.activity)
             self.logger.info("Created activity %s in database %s with startDate=%s, endDate = %s",
                     self.activity.name, self.dbAlias, self.activity.startdate, self.activity.enddate)
         else:
@@ -1061,85 +1121,131 @@ class STOQS_Loader(object):
     @staticmethod
     def update_ap_stats(dbAlias, activity, parameters, sampledFlag=False):
         '''Update the database with descriptive statistics for parameters
-        belonging to the activity.
+        belonging to the activity.  Statistics are computed exactly with numpy
+        in one pass over the values, unless there are more than STATS_IN_MEMORY_LIMIT
+        of them in which case they are streamed from a server-side cursor and the
+        percentiles are approximated with utils.stats.QuantileSketch.
         '''
+        # Use smaller number of histogram bins for Sampled Parameters
+        numbins = 10 if sampledFlag else 100
         for p in list(parameters.keys()):
             if sampledFlag:
                 data = m.SampledParameter.objects.using(dbAlias).filter(
-                                parameter=p, sample__instantpoint__activity=activity
-                                ).values_list('datavalue', flat=True)
+                                parameter=p, sample__instantpoint__activity=activity,
+                                datavalue__isnull=False)
             else:
                 data = m.MeasuredParameter.objects.using(dbAlias).filter(
-                                parameter=p, measurement__instantpoint__activity=activity
-                                ).values_list('datavalue', flat=True)
-
-            # Just don't create an ActivityParameter for data that don't exist
-            if len(data) == 0:
-                # Assume data is like LOPC - get dataarray values
-                data_array = m.MeasuredParameter.objects.using(dbAlias).filter(parameter=p, 
-                                measurement__instantpoint__activity__name=activity
-                                ).values_list('dataarray', flat=True)
-                try:
-                    data = [item for sublist in data_array for item in sublist]
-                except TypeError:
-                    # Likely 'NoneType' object is not iterable because p is altitude of LOPC data
-                    data = []
-
-            np_data = np.array([float(d) for d in data if d is not None])
-            if not np_data.any():
-                # Quietly skip over 'no valid data' - can't log because of @static method
-                continue
+                                parameter=p, measurement__instantpoint__activity=activity,
+                                datavalue__isnull=False)
+
+            agg = data.aggregate(Count('datavalue'), Min('datavalue'), Max('datavalue'))
+            number = agg['datavalue__count']
+            if number > STATS_IN_MEMORY_LIMIT:
+                streaming_stats = StreamingStats(float(agg['datavalue__min']), float(agg['datavalue__max']), numbins)
+                values = (float(d) for d in data.values_list('datavalue', flat=True).iterator(chunk_size=STATS_CHUNK_SIZE))
+                while True:
+                    chunk = np.fromiter(itertools.islice(values, STATS_CHUNK_SIZE), dtype=np.float64)
+                    if not chunk.size:
+                        break
+                    streaming_stats.update(chunk)
+                stats, (counts, bins) = streaming_stats.result()
+                sketch = streaming_stats.sketch
+            else:
+                if number:
+                    np_data = np.fromiter((float(d) for d in data.values_list('datavalue', flat=True).iterator()),
+                                          dtype=np.float64, count=number)
+                else:
+                    # Assume data is like LOPC - get dataarray values
+                    data_array = m.MeasuredParameter.objects.using(dbAlias).filter(parameter=p, 
+                                    measurement__instantpoint__activity__name=activity
+                                    ).values_list('dataarray', flat=True)
+                    try:
+                        np_data = np.array([float(item) for sublist in data_array for item in sublist
+                                            if item is not None])
+                    except TypeError:
+                        # Likely 'NoneType' object is not iterable because p is altitude of LOPC data
+                        np_data = np.array([])
+
+                if not np_data.size:
+                    # Just don't create an ActivityParameter for data that don't exist
+                    # Quietly skip over 'no valid data' - can't log because of @static method
+                    continue
+
+                stats, (counts, bins) = array_stats(np_data, numbins)
+                sketch = QuantileSketch()
+                sketch.update(np_data)
 
             ap, _ = m.ActivityParameter.objects.using(dbAlias).get_or_create(
                             parameter=p, activity=activity)
-            np_data.sort()
-            ap.number = len(np_data)
-            try:
-                ap.min = np_data.min()
-                ap.max = np_data.max()
-            except ValueError as err:
-                # At least update ap with number, likely 0
-                ap.save(using=dbAlias)
-                if not err.args:
-                    err.args=('',)
-
-                err.args += (f'Parameter: {p}',)
-                raise
-
-            ap.mean = np_data.mean()
-            ap.median = median(list(np_data))
-            ap.mode = mode(np_data)
-            ap.p025 = percentile(list(np_data), 0.025)
-            ap.p975 = percentile(list(np_data), 0.975)
-            ap.p010 = percentile(list(np_data), 0.010)
-            ap.p990 = percentile(list(np_data), 0.990)
+            for field, value in stats.items():
+                setattr(ap, field, value)
+            ap.sketch = sketch.to_bytes()
             ap.save(using=dbAlias)
 
-            # Compute and save histogram, use smaller number of bins 
-            # for Sampled Parameters
-            if sampledFlag:
-                (counts, bins) = np.histogram(np_data,10)
-            else:
-                try:
-                    (counts, bins) = np.histogram(np_data,100)
-                except (IndexError, ValueError):
-                    # Likely something like 'index -9223372036854775808 is out of bounds for axis 1 with size 101' 
-                    # from numpy/lib/function_base.py.  Encoutered in really wild LRAUV data, e.g.:
-                    # http://dods.mbari.org/opendap/data/lrauv/tethys/missionlogs/2015/20150824_20150825/20150825T055243/201508250552_201508250553_2S_eng.nc.ascii?control_inputs_mass_position[0:1:13]
-                    # These kind of messages will appear in the log:
-                    # /vagrant/dev/stoqsgit/venv-stoqs/lib64/python3.6/site-packages/numpy/lib/function_base.py:766: RuntimeWarning: overflow encountered in double_scalars
-                    #  norm = n_equal_bins / (last_edge - first_edge)
-                    #/vagrant/dev/stoqsgit/venv-stoqs/lib64/python3.6/site-packages/numpy/lib/function_base.py:788: RuntimeWarning: invalid value encountered in multiply
-                    # tmp_a *= norm
-                    # ValueError: autodetected range of [-inf, inf] is not finite encountered in:
-                    # http://dods.mbari.org/opendap/data/lrauv/tethys/missionlogs/2016/20160801_20160809/20160807T120403/201608071204_201608091210_2S_scieng.nc
-                    # Contunue silently (as this is a static method), with the above errors given as a warning.
-                    continue
+            STOQS_Loader._save_ap_histogram(dbAlias, ap, counts, bins)
 
-            for i,count in enumerate(counts):
-                m.ActivityParameterHistogram.objects.using(dbAlias).get_or_create(
-                        activityparameter=ap, bincount=count, 
-                        binlo=bins[i], binhi=bins[i+1])
+    @staticmethod
+    def _save_ap_histogram(dbAlias, ap, counts, bins):
+        '''Replace any histogram from a previous load of the ActivityParameter ap with one bulk INSERT
+        '''
+        if counts is None:
+            # Likely 'ValueError: autodetected range of [-inf, inf] is not finite' encountered in really wild LRAUV data, e.g.:
+            # http://dods.mbari.org/opendap/data/lrauv/tethys/missionlogs/2016/20160801_20160809/20160807T120403/201608071204_201608091210_2S_scieng.nc
+            # Contunue silently (as this is a static method) without a histogram
+            return
+
+        m.ActivityParameterHistogram.objects.using(dbAlias).filter(activityparameter=ap).delete()
+        m.ActivityParameterHistogram.objects.using(dbAlias).bulk_create(
+                m.ActivityParameterHistogram(activityparameter=ap, bincount=count,
+                                             binlo=bins[i], binhi=bins[i+1])
+                for i, count in enumerate(counts))
+
+    @classmethod
+    def merge_ap_stats(cls, dbAlias, ap, values):
+        '''Merge the numpy array values into the saved statistics, histogram and sketch of the
+        ActivityParameter ap without reading the values it already summarizes
+        '''
+        hist = list(m.ActivityParameterHistogram.objects.using(dbAlias).filter(activityparameter=ap)
+                        .order_by('binlo').values_list('binlo', 'binhi', 'bincount'))
+        if hist:
+            bins = np.array([h[0] for h in hist] + [hist[-1][1]])
+            counts = np.array([h[2] for h in hist], dtype=np.int64)
+        else:
+            bins = counts = None
+
+        sketch = QuantileSketch.from_bytes(ap.sketch)
+        stats, (counts, bins) = merge_stats({field: getattr(ap, field) for field in ('number', 'min', 'max', 'mean')},
+                                            counts, bins, sketch, values, len(hist) or 100)
+        for field, value in stats.items():
+            setattr(ap, field, value)
+        ap.sketch = sketch.to_bytes()
+        ap.save(using=dbAlias)
+
+        cls._save_ap_histogram(dbAlias, ap, counts, bins)
+
+    def update_appended_ap_stats(self, activity, since):
+        '''Update the statistics and histograms of the parameters of the Activity with just the values
+        appended after since, merging them with the saved statistics, histogram and sketch of the
+        values loaded before.  Parameters without a saved sketch get statistics computed from all their values.
+        '''
+        for p in list(self.parameter_counts.keys()):
+            ap = (m.ActivityParameter.objects.using(self.dbAlias)
+                            .filter(parameter=p, activity=activity, number__isnull=False, sketch__isnull=False).first())
+            if not ap:
+                self.update_activityparameter_stats(self.dbAlias, activity, {p: None})
+                continue
+
+            values = np.fromiter((float(d) for d in m.MeasuredParameter.objects.using(self.dbAlias)
+                                    .filter(parameter=p, measurement__instantpoint__activity=activity,
+                                            measurement__instantpoint__timevalue__gt=since, datavalue__isnull=False)
+                                    .values_list('datavalue', flat=True).iterator(chunk_size=STATS_CHUNK_SIZE)),
+                                 dtype=np.float64)
+            values = values[np.isfinite(values)]
+            if not values.size:
+                continue
+
+            self.merge_ap_stats(self.dbAlias, ap, values)
+            self.logger.debug('Merged %d appended values into statistics of %s', values.size, p)
 
     @classmethod
     def update_activityparameter_stats(cls, dbAlias, activity, parameters, sampledFlag=False):
@@ -1148,15 +1254,19 @@ class STOQS_Loader(object):
         '''
         cls.update_ap_stats(dbAlias, activity, parameters, sampledFlag)
 
-    def updateActivityParameterStats(self, act_to_update=None, sampledFlag=False):
+    def updateActivityParameterStats(self, act_to_update=None, sampledFlag=False, since=None):
         ''' 
         Examine the data for the Activity, compute and update some statistics on the measuredparameters
-        for this activity.  Store the histogram in the associated table.
+        for this activity.  Store the histogram in the associated table.  If since is given then only
+        data appended after it are read and merged into the existing statistics.
         '''
         if not act_to_update:
             act_to_update = self.activity
         try:
-            self.update_activityparameter_stats(self.dbAlias, act_to_update, self.parameter_counts, sampledFlag)
+            if since and not sampledFlag:
+                self.update_appended_ap_stats(act_to_update, since)
+            else:
+                self.update_activityparameter_stats(self.dbAlias, act_to_update, self.parameter_counts, sampledFlag)
         except ValueError as e:
             self.logger.warn(f"{e}")
             raise
@@ -1165,137 +1275,200 @@ class STOQS_Loader(object):
                              'updated statistics for Activity %s.', (e, act_to_update))
 
         self.logger.info('Updated statistics for act_to_update.name = %s', act_to_update.name)
+        # Every loader updates the statistics after writing data: invalidate the UI's cached options here
+        bump_load_generation(self.dbAlias)
 
-    def insertSimpleDepthTimeSeries(self, critSimpleDepthTime=10):
+    def insertActivityParameterTimeBins(self, act_to_update=None, since=None):
+        '''
+        Build the pyramid of ActivityParameterTimeBins for the Activity: level 0 is aggregated
+        from the MeasuredParameters, each higher level from the level below it, until a level
+        has just one bin per Parameter (and nominal depth) or TIME_BIN_MAX_LEVEL is reached.
+        Any existing bins of the Activity are replaced.  If since is given then only the bins
+        of each level from the one containing since onward are replaced, for appended data.
+        '''
+        if not act_to_update:
+            act_to_update = self.activity
+        since_seconds = (since - datetime(1970, 1, 1)).total_seconds() if since else None
+
+        table = m.ActivityParameterTimeBin._meta.db_table
+        columns = 'activity_id, parameter_id, nominaldepth, level, epochmilliseconds, min, max, mean, count'
+        level0_sql = f'''INSERT INTO {table} ({columns})
+                 SELECT stoqs_instantpoint.activity_id, stoqs_measuredparameter.parameter_id,
+                        stoqs_nominallocation.depth, 0,
+                        1000.0 * %(width)s * (FLOOR(EXTRACT(EPOCH FROM stoqs_instantpoint.timevalue) / %(width)s) + 0.5),
+                        MIN(stoqs_measuredparameter.datavalue), MAX(stoqs_measuredparameter.datavalue),
+                        AVG(stoqs_measuredparameter.datavalue), COUNT(stoqs_measuredparameter.datavalue)
+                 FROM stoqs_measuredparameter
+                 INNER JOIN stoqs_measurement ON stoqs_measurement.id = stoqs_measuredparameter.measurement_id
+                 INNER JOIN stoqs_instantpoint ON stoqs_instantpoint.id = stoqs_measurement.instantpoint_id
+                 LEFT OUTER JOIN stoqs_nominallocation ON stoqs_nominallocation.id = stoqs_measurement.nominallocation_id
+                 WHERE stoqs_instantpoint.activity_id = %(activity_id)s
+                       AND EXTRACT(EPOCH FROM stoqs_instantpoint.timevalue) >= %(start)s
+                       AND stoqs_measuredparameter.datavalue IS NOT NULL
+                       AND stoqs_measuredparameter.datavalue <> 'NaN'::float8
+                 GROUP BY stoqs_instantpoint.activity_id, stoqs_measuredparameter.parameter_id,
+                          stoqs_nominallocation.depth,
+                          FLOOR(EXTRACT(EPOCH FROM stoqs_instantpoint.timevalue) / %(width)s)'''
+        # Bins of level N nest in those of level N+1, weight the means by the number of values
+        level_sql = f'''INSERT INTO {table} ({columns})
+                 SELECT activity_id, parameter_id, nominaldepth, %(level)s,
+                        1000.0 * %(width)s * (FLOOR(epochmilliseconds / 1000.0 / %(width)s) + 0.5),
+                        MIN(min), MAX(max), SUM(mean * count) / SUM(count), SUM(count)
+                 FROM {table}
+                 WHERE activity_id = %(activity_id)s AND level = %(level)s - 1
+                       AND epochmilliseconds >= 1000.0 * %(start)s
+                 GROUP BY activity_id, parameter_id, nominaldepth,
+                          FLOOR(epochmilliseconds / 1000.0 / %(width)s)'''
+        count_sql = f'''SELECT COUNT(*), COUNT(DISTINCT (parameter_id, nominaldepth))
+                 FROM {table} WHERE activity_id = %(activity_id)s AND level = %(level)s'''
+
+        with connections[self.dbAlias].cursor() as cursor, transaction.atomic(using=self.dbAlias):
+            bins = m.ActivityParameterTimeBin.objects.using(self.dbAlias).filter(activity=act_to_update)
+            if not since:
+                bins.delete()
+            for level in range(TIME_BIN_MAX_LEVEL + 1):
+                width = m.ActivityParameterTimeBin.bin_seconds(level)
+                # Bins wholly before since are unchanged, a level without bins is built in full
+                start = float('-inf')
+                if since and bins.filter(level=level).exists():
+                    start = math.floor(since_seconds / width) * width
+                    bins.filter(level=level, epochmilliseconds__gte=1000.0 * start).delete()
+                params = {'activity_id': act_to_update.id, 'level': level, 'width': width, 'start': start}
+                cursor.execute(level0_sql if level == 0 else level_sql, params)
+                cursor.execute(count_sql, params)
+                num_bins, num_series = cursor.fetchone()
+                self.logger.debug('Inserted %d ActivityParameterTimeBins at level %d', num_bins, level)
+                if num_bins <= num_series:
+                    break
+
+        self.logger.info('Inserted ActivityParameterTimeBins up to level %d for Activity %s',
+                         level, act_to_update.name)
+
+    def _read_depth_time(self, vlqs):
+        '''Return numpy arrays of epoch milliseconds, depths and InstantPoint ids read in chunks
+        from vlqs, a values_list() QuerySet of (timevalue, depth, instantpoint id) tuples
+        '''
+        ems_chunks, depth_chunks, pk_chunks = [], [], []
+        rows = vlqs.iterator(chunk_size=DEPTH_TIME_CHUNK_SIZE)
+        while True:
+            chunk = list(itertools.islice(rows, DEPTH_TIME_CHUNK_SIZE))
+            if not chunk:
+                break
+            tvs, dds, pks = zip(*chunk)
+            ems_chunks.append(np.array(tvs, dtype='datetime64[ms]').astype(np.int64).astype(np.float64))
+            depth_chunks.append(np.array([float(dd) for dd in dds]))
+            pk_chunks.append(np.array(pks, dtype=np.int64))
+
+        if not ems_chunks:
+            return np.array([]), np.array([]), np.array([], dtype=np.int64)
+
+        return np.concatenate(ems_chunks), np.concatenate(depth_chunks), np.concatenate(pk_chunks)
+
+    def _append_to_simplified(self, ems, depths, pks, last):
+        '''Return ems, depths and pks with the point of last, the latest SimpleDepthTime or 
+        SimpleBottomDepthTime (or None), before them so that the simplified appended data continue
+        its line, and the index of the first point to be inserted
+        '''
+        if last is None:
+            return ems, depths, pks, 0
+
+        depth = last.depth if hasattr(last, 'depth') else last.bottomdepth
+        return (np.concatenate(([last.epochmilliseconds], ems)), np.concatenate(([depth], depths)),
+                np.concatenate(([last.instantpoint_id], pks)), 1)
+
+    def insertSimpleDepthTimeSeries(self, critSimpleDepthTime=10, since=None):
         '''
         Read the time series of depth values for this activity, simplify it and insert the values in the
         SimpleDepthTime table that is related to the Activity.  This procedure is suitable for only
         trajectory data; timeSeriesProfile type data uses another method to produce a collection of
-        simple depth time series for display in flot.
+        simple depth time series for display in flot.  If since is given then just the data appended 
+        after it are simplified and added to the existing series.
         @param critSimpleDepthTime: An integer for the simplification factor, 10 is course, .0001 is fine
         '''
         vlqs = (m.Measurement.objects.using(self.dbAlias)
                         .filter(instantpoint__activity=self.activity)
-                        .values_list('instantpoint__timevalue', 'depth', 'instantpoint__pk'))
-        line = []
-        pklookup = []
-        for dt,dd,pk in vlqs:
-            ems = 1000 * to_udunits(dt, 'seconds since 1970-01-01')
-            d = float(dd)
-            line.append((ems,d,))
-            pklookup.append(pk)
-
-        self.logger.info('Number of points in original depth time series = %d', len(line))
-        ##self.logger.debug('line = %s', line)
-        try:
-            # Original simplify_points code modified: the index from the original line is added as 3rd item in the return
-            simple_line = simplify_points(line, critSimpleDepthTime)
-        except IndexError:
-            simple_line = []        # Likely "list index out of range" from a stride that's too big
-        self.logger.info('Number of points in simplified depth time series = %d', len(simple_line))
-        self.logger.debug('simple_line = %s', simple_line)
-
-        for t,d,k in simple_line:
-            try:
-                ip = m.InstantPoint.objects.using(self.dbAlias).get(id=pklookup[k])
-                m.SimpleDepthTime.objects.using(self.dbAlias).create(
-                                            activity=self.activity, 
-                                            instantpoint=ip,
-                                            depth=d, 
-                                            epochmilliseconds=t)
-            except ObjectDoesNotExist:
-                self.logger.warn('InstantPoint with id = %d does not exist; from point at index k = %d', pklookup[k], k)
-
-        self.logger.info('Inserted %d values into SimpleDepthTime', len(simple_line))
-
-    def saveBottomDepth(self):
-        @transaction.atomic(using=self.dbAlias)
-        def _innerSaveBottomDepth(self):
-            '''
-            Read the time series of Parameter altitude and add to depth values to compute BottomDepth
-            and add it to the Measurement so that our Matplotlib plots can also ieasily include the depth profile.  
-            This procedure is suitable for only trajectory data.
-            '''
-            mpQS = m.MeasuredParameter.objects.using(self.dbAlias).select_related('measurement'
-                                          ).filter( datavalue__isnull=False,
-                                                    measurement__instantpoint__activity=self.activity, 
-                                                    parameter__standard_name='height_above_sea_floor')
-            count =  mpQS.count()
-            self.logger.info('mpQS.count() = %s', count)
-
-            counter = 0
-            for mp in mpQS:
-                counter += 1
-                try:
-                    mp.measurement.bottomdepth = mp.measurement.depth + mp.datavalue
-                    mp.measurement.save(using=self.dbAlias)
-                except DatabaseError as e:
-                    self.logger.warn(e)
-
-                if counter % 10000 == 0:
-                    self.logger.info('%d of %d mp.measurement.bottomdepth records saved', counter, count)
+                        .values_list('instantpoint__timevalue', 'depth', 'instantpoint__pk')
+                        .order_by('instantpoint__timevalue'))
+        last = None
+        if since:
+            vlqs = vlqs.filter(instantpoint__timevalue__gt=since)
+            last = (m.SimpleDepthTime.objects.using(self.dbAlias)
+                        .filter(activity=self.activity).order_by('-epochmilliseconds').first())
+        ems, depths, pks = self._read_depth_time(vlqs)
+        self.logger.info('Number of points in original depth time series = %d', len(ems))
+        ems, depths, pks, first = self._append_to_simplified(ems, depths, pks, last)
+
+        keep = [k for k in simplify_line(ems, depths, critSimpleDepthTime) if k >= first]
+        self.logger.info('Number of points in simplified depth time series = %d', len(keep))
+        self.logger.debug('keep = %s', keep)
+
+        m.SimpleDepthTime.objects.using(self.dbAlias).bulk_create(
+                (m.SimpleDepthTime(activity=self.activity, instantpoint_id=int(pks[k]),
+                                   depth=depths[k], epochmilliseconds=ems[k]) for k in keep),
+                batch_size=DEPTH_TIME_CHUNK_SIZE)
+
+        self.logger.info('Inserted %d values into SimpleDepthTime', len(keep))
+
+    def saveBottomDepth(self, since=None):
+        '''
+        Add the Parameter altitude to depth values to compute BottomDepth and add it to the Measurement 
+        so that our Matplotlib plots can also ieasily include the depth profile, with one UPDATE of the 
+        Measurements of the Activity - just those after since, if given.  This procedure is suitable 
+        for only trajectory data.
+        '''
+        sql = '''UPDATE stoqs_measurement SET bottomdepth = stoqs_measurement.depth + stoqs_measuredparameter.datavalue
+                 FROM stoqs_measuredparameter, stoqs_parameter, stoqs_instantpoint
+                 WHERE stoqs_measuredparameter.measurement_id = stoqs_measurement.id
+                       AND stoqs_parameter.id = stoqs_measuredparameter.parameter_id
+                       AND stoqs_instantpoint.id = stoqs_measurement.instantpoint_id
+                       AND stoqs_parameter.standard_name = 'height_above_sea_floor'
+                       AND stoqs_measuredparameter.datavalue IS NOT NULL
+                       AND stoqs_instantpoint.activity_id = %s'''
+        params = [self.activity.id]
+        if since:
+            sql += ' AND stoqs_instantpoint.timevalue > %s'
+            params.append(since)
 
-            return _innerSaveBottomDepth(self)
+        try:
+            with connections[self.dbAlias].cursor() as cursor, transaction.atomic(using=self.dbAlias):
+                cursor.execute(sql, params)
+                self.logger.info('%d Measurement bottomdepth values saved', cursor.rowcount)
+        except DatabaseError as e:
+            self.logger.warn(e)
 
-    def insertSimpleBottomDepthTimeSeries(self, critSimpleBottomDepthTime=10):
+    def insertSimpleBottomDepthTimeSeries(self, critSimpleBottomDepthTime=10, since=None):
         @transaction.atomic(using=self.dbAlias)
         def _innerInsertSimpleBottomDepthTimeSeries(self, critSimpleBottomDepthTime=10):
             '''
             Read the bottomdepth from Measurement for the Activity, simplify it 
             and insert the values in the SimpleBottomDepthTime table that is related to the Activity.  
-            This procedure is suitable for only trajectory data.
+            This procedure is suitable for only trajectory data.  If since is given then just the
+            data appended after it are simplified and added to the existing series.
             @param critSimpleBottomDepthTime: An integer for the simplification factor, 10 is course, .0001 is fine
             '''
-            tbdQS = m.MeasuredParameter.objects.using(self.dbAlias).filter(measurement__instantpoint__activity=self.activity
-                                          ).values('measurement__instantpoint__timevalue', 'measurement__bottomdepth',
-                                          'measurement__instantpoint__id')
-            count =  tbdQS.count()
-
-            # simplify_points() has a limit of how many points it can handle
-            maxRecords = .1e6
-            stride = 1
-            if count > maxRecords:
-                stride = int((count + maxRecords / 2)/ maxRecords)
-                self.logger.info('Striding tbdQS by %d to be kind to simplify_points()', stride)
-
-            # Now, get time and bottomdepth that we just saved for building the SimpleBottomDepth time series
-            line = []
-            pklookup = []
-            i = 0
-            counter = 0
-            for tbd in tbdQS:
-                i += 1
-                if i % stride == 0:
-                    counter += 1
-                    ems = 1000 * to_udunits(tbd['measurement__instantpoint__timevalue'], 'seconds since 1970-01-01')
-                    if tbd['measurement__bottomdepth']:
-                        line.append( (ems, tbd['measurement__bottomdepth']) )
-                        pklookup.append(tbd['measurement__instantpoint__id'])
-                        if counter % 10000 == 0:
-                            self.logger.info('%d of %d points read', counter, int(count / stride))
-
-            if line:
-                try:
-                    # Original simplify_points code modified: the index from the original line is added as 3rd item in the return
-                    self.logger.info('Calling simplify_points with len(line) = %d', len(line))
-                    simple_line = simplify_points(line, critSimpleBottomDepthTime)
-                except IndexError:
-                    simple_line = []        # Likely "list index out of range" from a stride that's too big
-            else:
-                simple_line = []
-
-            self.logger.info('Number of points in simplified depth time series = %d', len(simple_line))
-            self.logger.debug('simple_line = %s', simple_line)
-
-            for t,d,k in simple_line:
-                try:
-                    ip = m.InstantPoint.objects.using(self.dbAlias).get(id = pklookup[k])
-                    m.SimpleBottomDepthTime.objects.using(self.dbAlias).create(
-                            activity=self.activity, instantpoint=ip, bottomdepth=d, epochmilliseconds=t)
-                except ObjectDoesNotExist:
-                    self.logger.warn('InstantPoint with id = %d does not exist; from point at index k = %d', pklookup[k], k)
-
-            self.logger.info('Inserted %d values into SimpleBottomDepthTime', len(simple_line))
+            tbdQS = (m.Measurement.objects.using(self.dbAlias)
+                            .filter(instantpoint__activity=self.activity, bottomdepth__isnull=False)
+                            .values_list('instantpoint__timevalue', 'bottomdepth', 'instantpoint__id')
+                            .order_by('instantpoint__timevalue'))
+            last = None
+            if since:
+                tbdQS = tbdQS.filter(instantpoint__timevalue__gt=since)
+                last = (m.SimpleBottomDepthTime.objects.using(self.dbAlias)
+                            .filter(activity=self.activity).order_by('-epochmilliseconds').first())
+            ems, bottomdepths, pks = self._read_depth_time(tbdQS)
+            self.logger.info('Number of points in original bottom depth time series = %d', len(ems))
+            ems, bottomdepths, pks, first = self._append_to_simplified(ems, bottomdepths, pks, last)
+
+            keep = [k for k in simplify_line(ems, bottomdepths, critSimpleBottomDepthTime) if k >= first]
+            self.logger.info('Number of points in simplified bottom depth time series = %d', len(keep))
+            self.logger.debug('keep = %s', keep)
+
+            m.SimpleBottomDepthTime.objects.using(self.dbAlias).bulk_create(
+                    (m.SimpleBottomDepthTime(activity=self.activity, instantpoint_id=int(pks[k]),
+                                             bottomdepth=bottomdepths[k], epochmilliseconds=ems[k]) for k in keep),
+                    batch_size=DEPTH_TIME_CHUNK_SIZE)
+
+            self.logger.info('Inserted %d values into SimpleBottomDepthTime', len(keep))
 
         return _innerInsertSimpleBottomDepthTimeSeries(self, critSimpleBottomDepthTime)
 
@@ -1312,30 +1485,18 @@ class STOQS_Loader(object):
             # Collect depth time series into a timeseries by activity and nominal depth hash
             ndlqs = m.Measurement.objects.using(self.dbAlias).filter( instantpoint__activity=self.activity, nominallocation=nl
                                         ).values_list('instantpoint__timevalue', 'depth', 'instantpoint__pk').order_by('instantpoint__timevalue')
-            line = []
-            pklookup = []
+            ems, depths, pks = self._read_depth_time(ndlqs)
             if trajectoryProfileDepths:
                 self.logger.info('Loading time varying depths in SimpleDepthTime for nomDepth=%s', nomDepth)
-                for (dt,dd,pk), depths in zip(ndlqs, trajectoryProfileDepths):
-                    ems = 1000 * to_udunits(dt, 'seconds since 1970-01-01')
-                    d = depths[i]
-                    line.append((ems,d,))
-                    pklookup.append(pk)
+                depths = np.array([d[i] for d in trajectoryProfileDepths[:len(ems)]], dtype=np.float64)
+                ems = ems[:len(depths)]
+                pks = pks[:len(depths)]
             else:
                 self.logger.debug('Loading depths in SimpleDepthTime for nomDepth=%s', nomDepth)
-                for dt,dd,pk in ndlqs:
-                    ems = 1000 * to_udunits(dt, 'seconds since 1970-01-01')
-                    d = float(dd)
-                    line.append((ems,d,))
-                    pklookup.append(pk)
-
-            self.logger.debug('line = %s', line)
-            self.logger.debug('Number of points in original depth time series = %d', len(line))
-            try:
-                # Original simplify_points code modified: the index from the original line is added as 3rd item in the return
-                simple_line = simplify_points(line, critSimpleDepthTime)
-            except IndexError:
-                simple_line = []        # Likely "list index out of range" from a stride that's too big
+
+            self.logger.debug('Number of points in original depth time series = %d', len(ems))
+            keep = simplify_line(ems, depths, critSimpleDepthTime)
+            simple_line = [(ems[k], depths[k], k) for k in keep]
             self.logger.debug('Number of points in simplified depth time series = %d', len(simple_line))
             self.logger.debug('simple_line = %s', simple_line)
             if len(simple_line) != 2:
@@ -1346,12 +1507,12 @@ class STOQS_Loader(object):
                 t0,d0,k0 = simple_line[0]
                 self.logger.debug('First point t0,d0,k0 = %s, %s, %s', t0,d0,k0)
                 try:
-                    ip = m.InstantPoint.objects.using(self.dbAlias).get(id = pklookup[k0])
+                    ip = m.InstantPoint.objects.using(self.dbAlias).get(id = int(pks[k0]))
                     self.logger.debug('ip = %s', ip)
                     m.SimpleDepthTime.objects.using(self.dbAlias).get_or_create(activity=self.activity, nominallocation=nl,
                                                                                 instantpoint=ip, depth=d0, epochmilliseconds=t0)
                 except ObjectDoesNotExist:
-                    self.logger.warn('InstantPoint with id = %d does not exist; from point at index k = %d', pklookup[k0], k0)
+                    self.logger.warn('InstantPoint with id = %d does not exist; from point at index k = %d', pks[k0], k0)
                 except MultipleObjectsReturned as e:
                     self.logger.warn(e)
                     firstPoints = m.SimpleDepthTime.objects.using(self.dbAlias).filter(activity=self.activity, nominallocation=nl,
@@ -1371,33 +1532,34 @@ class STOQS_Loader(object):
                     self.logger.debug('Deleting SimpleDepthTime point with epochmilliseconds=%s', lp.epochmilliseconds)
                     lp.delete(using=self.dbAlias)
                 try:
-                    ip = m.InstantPoint.objects.using(self.dbAlias).get(id = pklookup[k1])
+                    ip = m.InstantPoint.objects.using(self.dbAlias).get(id = int(pks[k1]))
                     self.logger.debug('ip = %s', ip)
                     m.SimpleDepthTime.objects.using(self.dbAlias).create(activity=self.activity, nominallocation=nl,
                                                                          instantpoint=ip, depth=d1, epochmilliseconds=t1)
                 except ObjectDoesNotExist:
-                    self.logger.warn('InstantPoint with id = %d does not exist; from point at index k = %d', pklookup[k1], k1)
+                    self.logger.warn('InstantPoint with id = %d does not exist; from point at index k = %d', pks[k1], k1)
                 
             else:
-                for t,d,k in simple_line:
-                    self.logger.debug('t,d,k = %s, %s, %s', t,d,k)
-                    try:
-                        ip = m.InstantPoint.objects.using(self.dbAlias).get(id = pklookup[k])
-                        self.logger.debug('ip = %s', ip)
-                        m.SimpleDepthTime.objects.using(self.dbAlias).create(activity=self.activity, nominallocation=nl,
-                                                                         instantpoint=ip, depth=d, epochmilliseconds=t)
-                    except ObjectDoesNotExist:
-                        self.logger.warn('InstantPoint with id = %d does not exist; from point at index k = %d', pklookup[k], k)
+                m.SimpleDepthTime.objects.using(self.dbAlias).bulk_create(
+                        (m.SimpleDepthTime(activity=self.activity, nominallocation=nl, instantpoint_id=int(pks[k]),
+                                           depth=d, epochmilliseconds=t) for t,d,k in simple_line),
+                        batch_size=DEPTH_TIME_CHUNK_SIZE)
 
             self.logger.debug('Inserted %d values into SimpleDepthTime for nomDepth = %f', len(simple_line), nomDepth)
 
-    def updateActivityMinMaxDepth(self, act_to_update):
+    def updateActivityMinMaxDepth(self, act_to_update, since=None):
         '''
-        Pull the min & max depth from Measurement and set the Activity mindepth and maxdepth
+        Pull the min & max depth from Measurement and set the Activity mindepth and maxdepth,
+        if since is given then from the Measurements after it and the Activity's current values
         '''
-        m_qs = (m.Measurement.objects.using(self.dbAlias)
-                        .filter(instantpoint__activity__id=act_to_update.id)
-                        .aggregate(Max('depth'), Min('depth')))
+        measurements = m.Measurement.objects.using(self.dbAlias).filter(instantpoint__activity__id=act_to_update.id)
+        if since:
+            measurements = measurements.filter(instantpoint__timevalue__gt=since)
+        m_qs = measurements.aggregate(Max('depth'), Min('depth'))
+        if since:
+            act = m.Activity.objects.using(self.dbAlias).get(id=act_to_update.id)
+            m_qs['depth__min'] = min((d for d in (act.mindepth, m_qs['depth__min']) if d is not None), default=None)
+            m_qs['depth__max'] = max((d for d in (act.maxdepth, m_qs['depth__max']) if d is not None), default=None)
         m.Activity.objects.using(self.dbAlias).filter(id=act_to_update.id).update(
                                                         mindepth = m_qs['depth__min'],
                                                         maxdepth = m_qs['depth__max'])
@@ -1405,57 +1567,87 @@ class STOQS_Loader(object):
         '''
         Pull the min & max from InstantPoint and set the Campaign start and end from these
         '''
-        try:
-            if self.campaign:
-                ip_qs = m.InstantPoint.objects.using(self.dbAlias).aggregate(Max('timevalue'), Min('timevalue'))
-                m.Campaign.objects.using(self.dbAlias).filter(id=self.campaign.id).update(
-                                                                                startdate = ip_qs['timevalue__min'],
-                                                                                enddate = ip_qs['timevalue__max'])
-        except AttributeError as e:
-            self.logger.warn(e)
+        with shared_step(self.dbAlias, 'campaign'):
+            try:
+                if self.campaign:
+                    ip_qs = m.InstantPoint.objects.using(self.dbAlias).aggregate(Max('timevalue'), Min('timevalue'))
+                    m.Campaign.objects.using(self.dbAlias).filter(id=self.campaign.id).update(
+                                                                                    startdate = ip_qs['timevalue__min'],
+                                                                                    enddate = ip_qs['timevalue__max'])
+            except AttributeError as e:
+                self.logger.warn(e)
 
     def assignParameterGroup(self, groupName=MEASUREDINSITU):
         ''' 
         For all the parameters in self.parameter_counts create a many-to-many association with the Group named @groupName
         '''                 
-        g, _ = m.ParameterGroup.objects.using(self.dbAlias).get_or_create(name=groupName)
-        for p in self.parameter_counts:
-            pgps = m.ParameterGroupParameter.objects.using(self.dbAlias).filter(parameter=p, parametergroup=g)
-            if not pgps:
-                # Attempt saving relation only if it does not exist
-                pgp = m.ParameterGroupParameter(parameter=p, parametergroup=g)
-                try:
-                    pgp.save(using=self.dbAlias)
-                except Exception as e:
-                    self.logger.warn('%s: Cannot create ParameterGroupParameter name = %s for parameter.name = %s. Skipping.', e, groupName, p.name)
+        with shared_step(self.dbAlias, 'parametergroup'):
+            g, _ = m.ParameterGroup.objects.using(self.dbAlias).get_or_create(name=groupName)
+            for p in self.parameter_counts:
+                pgps = m.ParameterGroupParameter.objects.using(self.dbAlias).filter(parameter=p, parametergroup=g)
+                if not pgps:
+                    # Attempt saving relation only if it does not exist
+                    pgp = m.ParameterGroupParameter(parameter=p, parametergroup=g)
+                    try:
+                        pgp.save(using=self.dbAlias)
+                    except Exception as e:
+                        self.logger.warn('%s: Cannot create ParameterGroupParameter name = %s for parameter.name = %s. Skipping.', e, groupName, p.name)
 
-    def _generate_sigmat_mps(self, p_sigmat, ms, salinity_standard_name):
-        '''Yield calculated sigmat from ms QuerySet
-        '''
-        for measurement in ms:
-            mps = m.MeasuredParameter.objects.using(self.dbAlias).filter(measurement=measurement)
+        # Also called after adding derived Parameters, e.g. by addSigmaTandSpice() and addAltitude()
+        bump_load_generation(self.dbAlias)
 
-            temp_mp = mps.filter(parameter__standard_name='sea_water_temperature')
-            sal_mp = mps.filter(parameter__standard_name=salinity_standard_name)
+    def _read_sea_water_arrays(self, activity, sea_water_temperature_parm, sea_water_salinity_parm):
+        '''Return numpy arrays of Measurement id, depth, latitude, temperature and salinity for all
+        Measurements (of activity, if specified) that have both temperature and salinity values.
+        One joined query is made for all the Measurements.
+        '''
+        sql = '''SELECT stoqs_measurement.id, stoqs_measurement.depth, ST_Y(stoqs_measurement.geom),
+                        temp_mp.datavalue, sal_mp.datavalue
+                 FROM stoqs_measurement
+                 INNER JOIN stoqs_instantpoint ON stoqs_instantpoint.id = stoqs_measurement.instantpoint_id
+                 INNER JOIN stoqs_measuredparameter temp_mp ON (temp_mp.measurement_id = stoqs_measurement.id
+                            AND temp_mp.parameter_id = %s)
+                 INNER JOIN stoqs_measuredparameter sal_mp ON (sal_mp.measurement_id = stoqs_measurement.id
+                            AND sal_mp.parameter_id = %s)
+                 WHERE temp_mp.datavalue IS NOT NULL AND sal_mp.datavalue IS NOT NULL'''
+        params = [sea_water_temperature_parm.id, sea_water_salinity_parm.id]
+        if activity:
+            sql += ' AND stoqs_instantpoint.activity_id = %s'
+            params.append(activity.id)
+        if self.dataStartDatetime:
+            sql += ' AND stoqs_instantpoint.timevalue > %s'
+            params.append(self.dataStartDatetime)
 
-            sigmat = sw.pden(sal_mp[0].datavalue, temp_mp[0].datavalue, sw.pres(measurement.depth, measurement.geom.y)) - 1000.0
-            sigmat_mp = m.MeasuredParameter(measurement=measurement, parameter=p_sigmat, datavalue=sigmat)
+        with connections[self.dbAlias].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 5)
 
-            yield sigmat_mp
+        return rows[:,0].astype(np.int64), rows[:,1], rows[:,2], rows[:,3], rows[:,4]
 
-    def _generate_spice_mps(self, p_spice, ms, salinity_standard_name):
-        '''Yield calculated spice from ms QuerySet
+    def _load_derived_mps(self, meas_ids, values_by_parameter):
+        '''Insert MeasuredParameters for STOQS calculated Parameters in one pass.  values_by_parameter
+        is a dictionary of Parameter to numpy array of datavalues that are aligned with the meas_ids
+        array.  Values that are not finite are not loaded.  Returns dictionary of Parameter to number 
+        of MeasuredParameters loaded.
         '''
-        for measurement in ms:
-            mps = m.MeasuredParameter.objects.using(self.dbAlias).filter(measurement=measurement)
+        counts = {}
+        goods = {}
+        for parameter, values in values_by_parameter.items():
+            goods[parameter] = np.isfinite(values)
+            counts[parameter] = int(goods[parameter].sum())
+
+        if getattr(self, 'use_copy', False):
+            rows = ((meas_id, parameter.id, value) for parameter, values in values_by_parameter.items()
+                        for meas_id, value in zip(meas_ids[goods[parameter]], values[goods[parameter]]))
+            with connections[self.dbAlias].cursor() as cursor, transaction.atomic(using=self.dbAlias):
+                bulk_copy.copy_rows(cursor, m.MeasuredParameter, ('measurement', 'parameter', 'datavalue'), rows)
+        else:
+            mps = (m.MeasuredParameter(measurement_id=meas_id, parameter=parameter, datavalue=value) 
+                        for parameter, values in values_by_parameter.items()
+                        for meas_id, value in zip(meas_ids[goods[parameter]].tolist(), values[goods[parameter]].tolist()))
+            m.MeasuredParameter.objects.using(self.dbAlias).bulk_create(mps, batch_size=10000)
 
-            temp_mp = mps.filter(parameter__standard_name='sea_water_temperature')
-            sal_mp = mps.filter(parameter__standard_name=salinity_standard_name)
-
-            spice = spiciness(temp_mp[0].datavalue, sal_mp[0].datavalue)
-            spice_mp = m.MeasuredParameter(measurement=measurement, parameter=p_spice, datavalue=spice)
-            
-            yield spice_mp
+        return counts
 
     def _get_sea_water_parameters(self):
         '''Check for more than one set of sea_water_temperature nand sea_water_salinity standard names as in
@@ -1511,11 +1703,8 @@ class STOQS_Loader(object):
         For all measurements that have standard_name parameters of (sea_water_salinity or sea_water_practical_salinity) and sea_water_temperature 
         compute sigma-t and add it as a parameter
         '''                 
-        # Find all measurements with 'sea_water_temperature' and ('sea_water_salinity' or 'sea_water_practical_salinity')
-        ms = m.Measurement.objects.using(self.dbAlias)
         if activity:
             self.logger.info(f'activity = {activity}')
-            ms = ms.filter(instantpoint__activity=activity)
 
         try:
             sea_water_temperature_parm, sea_water_salinity_parm, salinity_standard_name = self._get_sea_water_parameters()
@@ -1524,16 +1713,14 @@ class STOQS_Loader(object):
             self.logger.info("No sea_water_temperature and sea_water_salinity Parameters. Not adding SigmaT and Spice.")
             return
 
-        ms = ms.filter(measuredparameter__parameter=sea_water_temperature_parm)
-        ms = ms.filter(measuredparameter__parameter=sea_water_salinity_parm)
+        # Read all measurements with 'sea_water_temperature' and ('sea_water_salinity' or 'sea_water_practical_salinity')
+        meas_ids, depths, latitudes, temperatures, salinities = self._read_sea_water_arrays(
+                                activity, sea_water_temperature_parm, sea_water_salinity_parm)
 
-        if not ms:
+        if not len(meas_ids):
             self.logger.info("No sea_water_temperature and sea_water_salinity measurements. Not adding SigmaT and Spice.")
             return
 
-        if self.dataStartDatetime:
-            ms = ms.filter(instantpoint__timevalue__gt=self.dataStartDatetime)
-
         # Create our new Parameters
         p_sigmat, _ = m.Parameter.objects.using(self.dbAlias).get_or_create(
                 standard_name='sea_water_sigma_t',
@@ -1561,95 +1748,58 @@ class STOQS_Loader(object):
                                " http://www.satlab.hawaii.edu/spice.")
         p_spice.save(using=self.dbAlias)
 
-        self.parameter_counts[p_sigmat] = ms.count()
-        self.parameter_counts[p_spice] = ms.count()
-        self.assignParameterGroup(groupName=MEASUREDINSITU)
-        self.assignParameterGroup(groupName=MEASUREDINSITU)
-
-        sigmat_mps = []
-        spice_mps = []
-        self.logger.info(f'Calculating {self.parameter_counts[p_sigmat]} sigmat & spice MeasuredParameters')
-        sigmat_mps = self._generate_sigmat_mps(p_sigmat, ms, salinity_standard_name)
-        spice_mps = self._generate_spice_mps(p_spice, ms, salinity_standard_name)
+        self.logger.info(f'Calculating {len(meas_ids)} sigmat & spice MeasuredParameters')
+        sigmat = sw.pden(salinities, temperatures, sw.pres(depths, latitudes)) - 1000.0
+        spice = spiciness(temperatures, salinities)
 
-        self.logger.info(f'Bulk loading {self.parameter_counts[p_sigmat]} sigmat MeasuredParameters')
-        m.MeasuredParameter.objects.using(self.dbAlias).bulk_create(sigmat_mps)
-        self.logger.info(f'Bulk loading {self.parameter_counts[p_spice]} spice MeasuredParameters')
-        m.MeasuredParameter.objects.using(self.dbAlias).bulk_create(spice_mps)
+        self.logger.info(f'Bulk loading {len(meas_ids)} sigmat and spice MeasuredParameters')
+        counts = self._load_derived_mps(meas_ids, {p_sigmat: sigmat, p_spice: spice})
+        self.parameter_counts[p_sigmat] = counts[p_sigmat]
+        self.parameter_counts[p_spice] = counts[p_spice]
+        self.assignParameterGroup(groupName=MEASUREDINSITU)
 
     def addAltitude(self, activity=None):
         ''' 
-        For all measurements lookup the water depth from a GMT grd file using grdtrack(1), 
-        subtract the depth and add altitude as a new Parameter to the Measurement
+        For all measurements lookup the water depth from a GMT grd file by bilinear interpolation
+        with utils.terrain, subtract the depth and add altitude as a new Parameter to the Measurement.
         To be called from load script after process_command_line().
         '''
-        # Read the bounding box of the terrain file. The grdtrack command quietly does not write any lines for points outside of the grid.
-        if self.grdTerrain:
-            try:
-                fh = Dataset(self.grdTerrain)
-                # Old GMT format
-                xmin, xmax = fh.variables['x_range'][:]
-                ymin, ymax = fh.variables['y_range'][:]
-            except IOError as e:
-                self.logger.error(f'Cannot add {ALTITUDE}. Make sure file {os.path.abspath(self.grdTerrain)} is present.')
-                self.logger.error(f'cd stoqs/loaders && wget https://stoqs.mbari.org/terrain/{os.path.basename(self.grdTerrain)}')
-                self.logger.error('Exiting with error')
-                sys.exit(-1)
-            except KeyError as e:
-                try:
-                    # New GMT format
-                    xmin, xmax = fh.variables['lon'].actual_range
-                    ymin, ymax = fh.variables['lat'].actual_range
-                except Exception as e:
-                    try:
-                        # Yet another format (seen in SanPedroBasin50.grd)
-                        xmin, xmax = fh.variables['x'].actual_range
-                        ymin, ymax = fh.variables['y'].actual_range
-                    except Exception as e:
-                        self.logger.error(f'Cannot read range metadata from {self.grdTerrain}. Not able to load'
-                                          ' {ALTITUDE}, bottomdepth or simplebottomdepthtime')
-                        return
-            except Exception as e:
-                self.logger.exception(e)
-                return
-
-            bbox = Polygon.from_bbox( (xmin, ymin, xmax, ymax) )
+        try:
+            grid = open_grid(self.grdTerrain)
+        except (IOError, OSError) as e:
+            self.logger.error(f'Cannot add {ALTITUDE}. Make sure file {os.path.abspath(self.grdTerrain)} is present.')
+            self.logger.error(f'cd stoqs/loaders && wget https://stoqs.mbari.org/terrain/{os.path.basename(self.grdTerrain)}')
+            self.logger.error('Exiting with error')
+            sys.exit(-1)
+        except KeyError as e:
+            self.logger.error(f'Cannot read range metadata from {self.grdTerrain}. Not able to load'
+                              f' {ALTITUDE}, bottomdepth or simplebottomdepthtime: {e}')
+            return
+        except Exception as e:
+            self.logger.exception(e)
+            return
 
-        # Build file of Measurement lon & lat for grdtrack to process
-        xyFileName = NamedTemporaryFile(dir='/dev/shm', prefix='STOQS_LatLon_', suffix='.txt').name
-        xyFH = open(xyFileName, 'w')
-        ms = m.Measurement.objects.using(self.dbAlias).filter(geom__within=bbox)
+        # Read Measurement ids, longitudes, latitudes and depths in one query
+        sql = '''SELECT stoqs_measurement.id, ST_X(stoqs_measurement.geom), ST_Y(stoqs_measurement.geom),
+                        stoqs_measurement.depth
+                 FROM stoqs_measurement
+                 INNER JOIN stoqs_instantpoint ON stoqs_instantpoint.id = stoqs_measurement.instantpoint_id
+                 WHERE stoqs_measurement.geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)'''
+        params = list(grid.bounds)
         if activity:
-            ms = ms.filter(instantpoint__activity=activity)
-        ms = ms.order_by('instantpoint__activity__id', 'instantpoint__timevalue').values('id', 'geom', 'depth').distinct()
-        mList = []
-        depthList = []
-        for me in ms:
-            mList.append(me['id'])
-            depthList.append(me['depth'])
-            xyFH.write("%f %f\n" % (me['geom'].x, me['geom'].y))
-
-        xyFH.close()
-        inputFileCount = len(mList)
-        self.logger.debug('Wrote file %s with %d records', xyFileName, inputFileCount)
-
-        # Requires GMT (yum install GMT)
-        bdepthFileName = NamedTemporaryFile(dir='/dev/shm', prefix='STOQS_BDepth', suffix='.txt').name
-        if cmd_exists('grdtrack'):
-            cmd = "grdtrack %s -V -G%s > %s" % (xyFileName, self.grdTerrain, bdepthFileName)
-        else:
-            # Assume we have GMT Version 5 installed
-            cmd = "gmt grdtrack %s -V -G%s > %s" % (xyFileName, self.grdTerrain, bdepthFileName)
-
-        self.logger.info('Executing %s' % cmd)
-        os.system(cmd)
-        if self.totalRecords > 1e6:
-            self.logger.info('This is lame... Sleeping 60 seconds to give time for system call to finish writing to %s', bdepthFileName)
-            time.sleep(60)
-        if self.totalRecords > 1e7:
-            self.logger.info('Sleeping another 300 seconds to give time for system call to'
-                             ' finish writing to %s for more than 10 million records', bdepthFileName)
-            time.sleep(300)
+            sql += ' AND stoqs_instantpoint.activity_id = %s'
+            params.append(activity.id)
+        if getattr(self, 'dataStartDatetime', None):
+            sql += ' AND stoqs_instantpoint.timevalue > %s'
+            params.append(self.dataStartDatetime)
+
+        with connections[self.dbAlias].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 4)
+
+        meas_ids = rows[:,0].astype(np.int64)
+        self.logger.info(f'Sampling {os.path.basename(self.grdTerrain)} for {len(meas_ids)} Measurements')
+        altitudes = -grid.sample(rows[:,1], rows[:,2]) - rows[:,3]
 
         # Create our new Parameter
         self.logger.debug('Getting or creating new altitude Parameter')
@@ -1657,46 +1807,30 @@ class STOQS_Loader(object):
             p_alt, _ = m.Parameter.objects.using(self.dbAlias).get_or_create(
                     standard_name='height_above_sea_floor',
                     long_name='Altitude',
-                    description=("Calculated in STOQS loader by using GMT's grdtrack(1) program on the Platform's"
-                                 " latitude, longitude values and differencing the Platform's depth with the"
-                                 " bottom depth data in file %s." % self.grdTerrain.split('/')[-1]),
+                    description=("Calculated in STOQS loader by bilinear interpolation of bottom depth from"
+                                 " the Platform's latitude, longitude values and differencing the Platform's"
+                                 " depth with the bottom depth data in file %s." % self.grdTerrain.split('/')[-1]),
                     units='m',
                     name=ALTITUDE,
-                    origin='https://github.com/stoqs/stoqs/blob/45f53d134d336fdbdb38f73959a2ce3be4148227/stoqs/loaders/__init__.py#L1216-L1322'
+                    origin='https://github.com/stoqs/stoqs/blob/master/stoqs/utils/terrain.py'
             )
         except IntegrityError:
             # A bit of a mystery why sometimes this Exception happens (simply get p_alt if it happens):
             # IntegrityError: duplicate key value violates unique constraint "stoqs_parameter_name_key"
             p_alt = m.Parameter.objects.using(self.dbAlias).get(name=ALTITUDE)
 
-        self.parameter_counts[p_alt] = ms.count()
-        self.assignParameterGroup(groupName=MEASUREDINSITU)
+        # Points off the grid are nan and are not loaded
+        try:
+            counts = self._load_derived_mps(meas_ids, {p_alt: altitudes})
+        except (IntegrityError, DatabaseError) as e:
+            self.logger.warn(e)
+            return
 
-        # Read values from the grid sampling (bottom depths) and add datavalues to the altitude parameter using the save Measurements
-        count = 0
-        with open(bdepthFileName) as altFH:
-            try:
-                with transaction.atomic():
-                    for line in altFH:
-                        try:
-                            bdepth = line.split()[2]
-                        except IndexError:
-                            # Likely list index out of range
-                            continue
-                        alt = -float(bdepth)-depthList.pop(0)
-                        meas = m.Measurement.objects.using(self.dbAlias).get(id=mList.pop(0))
-                        mp_alt = m.MeasuredParameter(datavalue=alt, measurement=meas, parameter=p_alt)
-                        mp_alt.save(using=self.dbAlias)
-                        count += 1
-            except IntegrityError as e:
-                self.logger.warn(e)
-            except DatabaseError as e:
-                self.logger.warn(e)
+        self.parameter_counts[p_alt] = counts[p_alt]
+        self.assignParameterGroup(groupName=MEASUREDINSITU)
 
-        # Cleanup and sanity check
-        os.remove(xyFileName)
-        os.remove(bdepthFileName)
-        if inputFileCount != count:
-            self.logger.warn('Counts are not equal! inputFileCount = %s, count from grdtrack output = %s', inputFileCount, count)
+        if len(meas_ids) != counts[p_alt]:
+            self.logger.info('%d of %d Measurements are outside of %s or over missing values', 
+                             len(meas_ids) - counts[p_alt], len(meas_ids), self.grdTerrain)
 
         return
@@ -0,0 +1,86 @@
+'''
+Helpers for streaming rows into a STOQS database with PostgreSQL's COPY FROM STDIN.
+
+Used by the DAPloaders when a load script is executed with the --copy option.  Rows
+are formatted directly from the values read from OPeNDAP - no Django model instances
+are created.  Primary keys are reserved in bulk from the table's sequence so that
+dependent rows (Measurement -> InstantPoint, MeasuredParameter -> Measurement) can be
+written without reading anything back from the database.
+'''
+
+import io
+import logging
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of rows sent in each COPY statement, keeps the StringIO buffer to a few tens of MB
+COPY_CHUNK_SIZE = 100000
+
+NULL = '\\N'
+
+
+def _copy_text(value):
+    '''Return value formatted for PostgreSQL's COPY text format
+    '''
+    if value is None:
+        return NULL
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (list, tuple, np.ndarray)):
+        # ArrayField(FloatField()), e.g. LOPC dataarray
+        return '{' + ','.join(repr(float(v)) for v in value) + '}'
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value))
+
+    return str(value)
+
+
+def ewkt_point(lon, lat, srid=4326):
+    '''Return Extended Well Known Text that COPY accepts for a PointField with srid
+    '''
+    return f'SRID={srid};POINT({float(lon)!r} {float(lat)!r})'
+
+
+def reserve_ids(cursor, model, count):
+    '''Draw count values from the id sequence of model's table and return them as a
+    numpy array.  The ids are ours alone, even with other loads running concurrently.
+    '''
+    if not count:
+        return np.array([], dtype=np.int64)
+    cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                   [model._meta.db_table, int(count)])
+
+    return np.fromiter((row[0] for row in cursor.fetchall()), dtype=np.int64, count=count)
+
+
+def copy_rows(cursor, model, fields, rows, chunk_size=COPY_CHUNK_SIZE):
+    '''COPY rows (an iterable of tuples with values in the order of the model's fields)
+    into the table for model.  Returns the number of rows copied.  Callers wanting
+    all-or-nothing behavior should wrap the call in transaction.atomic().
+    '''
+    columns = ', '.join(model._meta.get_field(f).column for f in fields)
+    sql = f'COPY {model._meta.db_table} ({columns}) FROM STDIN'
+
+    count = 0
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(_copy_text(v) for v in row))
+        buf.write('\n')
+        count += 1
+        if count % chunk_size == 0:
+            _copy_buffer(cursor, sql, buf)
+            logger.debug('%d rows copied into %s', count, model._meta.db_table)
+            buf = io.StringIO()
+
+    if buf.tell():
+        _copy_buffer(cursor, sql, buf)
+
+    return count
+
+
+def _copy_buffer(cursor, sql, buf):
+    buf.seek(0)
+    cursor.copy_expert(sql, buf)
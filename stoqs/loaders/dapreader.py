@@ -0,0 +1,156 @@
+'''
+Read variables from an OPeNDAP dataset in chunks, in parallel, through an on-disk cache.
+
+DAPReader.read() returns the (strided) slice of a variable as a numpy array.  The slice
+is requested from the server in chunks of at most max_chunk_bytes by a pool of threads
+and the chunks are written into a .npy file that is returned memory mapped, so that
+the loaders can iterate over the values of large variables without holding them in
+memory.  The .npy files are named by a hash of the URL, the variable, the slice and the
+Last-Modified time of the dataset.  When a cache_dir is given (load scripts' --dapcache
+option) they are kept there and reloading or restriding the same data reads it from
+local disk.  Without a cache_dir they go to a temporary directory that is removed with
+the DAPReader.  Datasets whose Last-Modified time can't be determined are not cached
+across loads.
+
+The dataset is anything that can be indexed like a pydap DatasetType, i.e.
+ds[name].data[slice] or ds[name][name].data[slice] for GridTypes, so that a
+stand-in backed by local files may be used in tests.
+'''
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Upper limit on the size of the response to each request for part of a variable
+MAX_CHUNK_BYTES = 32 * 1024 * 1024
+
+# Number of requests made to the server at a time
+WORKERS = 4
+
+
+def last_modified(url):
+    '''Return Last-Modified time of the OPeNDAP url (or local file) as a string, None if not known
+    '''
+    if os.path.exists(url):
+        return str(os.path.getmtime(url))
+    try:
+        response = requests.head(url + '.dds', timeout=30, allow_redirects=True)
+    except requests.exceptions.RequestException as e:
+        logger.debug('Cannot get Last-Modified time of %s: %s', url, e)
+        return None
+    if response.ok and 'Last-Modified' in response.headers:
+        return parsedate_to_datetime(response.headers['Last-Modified']).isoformat()
+
+    return None
+
+
+class DAPReader(object):
+    '''Read slices of the variables of the dataset ds opened from url
+    '''
+    def __init__(self, ds, url, cache_dir=None, max_chunk_bytes=MAX_CHUNK_BYTES, workers=WORKERS, modified=None):
+        self.ds = ds
+        self.url = url
+        self.max_chunk_bytes = max_chunk_bytes
+        self.workers = workers
+        self.modified = modified if modified is not None else last_modified(url)
+        self._tmp_dir = None
+        if cache_dir and self.modified:
+            self.cache_dir = cache_dir
+            os.makedirs(cache_dir, exist_ok=True)
+        else:
+            if cache_dir:
+                logger.info('Not caching data from %s: its Last-Modified time is not known', url)
+            self._tmp_dir = tempfile.mkdtemp(prefix='stoqs_dap_')
+            self.cache_dir = self._tmp_dir
+
+    def close(self):
+        if self._tmp_dir:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __del__(self):
+        self.close()
+
+    def _variable(self, name, grid):
+        if grid:
+            return self.ds[name][name]
+        return self.ds[name]
+
+    def _path(self, name, grid, start, stop, step):
+        key = f'{self.url} {name} {grid} {start}:{stop}:{step} {self.modified}'
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+
+    def _chunks(self, variable, start, stop, step):
+        '''Return list of (start, stop) of chunks of the indices start:stop:step of variable,
+        the starts are on the stride so that the chunks concatenate to the whole slice
+        '''
+        item_bytes = np.dtype(variable.dtype).itemsize * int(np.prod(variable.shape[1:]))
+        per_chunk = max(self.max_chunk_bytes // max(item_bytes, 1), 1) * step
+        return [(a, min(a + per_chunk, stop)) for a in range(start, stop, per_chunk)]
+
+    def read(self, name, start=0, stop=None, step=1, grid=False):
+        '''Return numpy array, memory mapped from the cache, of name[start:stop:step] or,
+        if grid is True, of name[name][start:stop:step] from the dataset
+        '''
+        variable = self._variable(name, grid)
+        if not variable.shape:
+            # Scalar variable, nothing to chunk or stride
+            return np.asarray(variable.data)
+
+        length = variable.shape[0]
+        start, stop, step = slice(start, stop, step).indices(length)
+        path = self._path(name, grid, start, stop, step)
+        if os.path.exists(path):
+            logger.debug('Reading %s[%d:%d:%d] from %s', name, start, stop, step, path)
+            return np.load(path, mmap_mode='r')
+
+        count = len(range(start, stop, step))
+        if not count:
+            raise ValueError(f'No values in {name}[{start}:{stop}:{step}] of {self.url}')
+
+        chunks = self._chunks(variable, start, stop, step)
+        logger.debug('Reading %s[%d:%d:%d] from %s in %d chunks', name, start, stop, step, self.url, len(chunks))
+        tmp_path = path + f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=variable.dtype,
+                                        shape=(count,) + tuple(variable.shape[1:]))
+        try:
+            with ThreadPoolExecutor(self.workers) as executor:
+                # Keep no more than 2 * workers chunks in memory while they're written to the file
+                pending = deque()
+                for a, b in chunks:
+                    pending.append((len(range(start, a, step)),
+                                    executor.submit(lambda a=a, b=b: np.asarray(variable.data[a:b:step]))))
+                    while len(pending) >= 2 * self.workers or (pending and a == chunks[-1][0]):
+                        offset, future = pending.popleft()
+                        values = future.result()
+                        out[offset:offset + len(values)] = values
+            out.flush()
+            del out
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return np.load(path, mmap_mode='r')
+
+    def prefetch(self, reads):
+        '''Execute the read()s of the (name, start, stop, step, grid) tuples in reads concurrently
+        so that the following read()s of them come from the cache.  Errors are left for read() to raise.
+        '''
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = [executor.submit(self.read, *args) for args in reads]
+        for args, future in zip(reads, futures):
+            if future.exception():
+                logger.debug('Prefetch of %s failed: %s', args[0], future.exception())
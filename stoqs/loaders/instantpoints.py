@@ -0,0 +1,144 @@
+'''
+Find the InstantPoints of an Activity closest in time to the times of Samples and of
+instrument data that are loaded after the Activity's Measurements.
+
+closest_instantpoint() answers one time with a single query that reads at most two
+InstantPoints on each side of the time with the timevalue index.  InstantPointIndex
+reads the times of the matching Activities once into a sorted numpy array and matches
+a whole batch of times with np.searchsorted().  Both take an explicit maximum distance
+and tie rule and report ties and times without an InstantPoint near enough.
+'''
+
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+
+from stoqs.models import InstantPoint
+
+logger = logging.getLogger(__name__)
+
+# Time within which an InstantPoint must be found
+MAX_SECONDS = 86400
+
+# Tie rules for a time that is equidistant from an earlier and a later InstantPoint
+EARLIER = 'earlier'
+LATER = 'later'
+TIE_RULES = (EARLIER, LATER)
+
+# instantpoint is None when no InstantPoint is within max_seconds; tied is the number of
+# InstantPoints at the same distance as the chosen one, 1 when there is no tie
+Match = namedtuple('Match', 'instantpoint seconds tied')
+
+
+class ClosestTimeNotFoundException(Exception):
+    pass
+
+
+def _check_tie(tie):
+    if tie not in TIE_RULES:
+        raise ValueError(f'tie must be one of {TIE_RULES}, not {tie}')
+
+
+def closest_instantpoint(aName, tv, dbAlias, max_seconds=MAX_SECONDS, tie=EARLIER):
+    '''Return Match of the InstantPoint of the Activities with names containing aName closest to the
+    datetime tv.  Raise ClosestTimeNotFoundException if none is within max_seconds.  When InstantPoints
+    are at the same distance the earliest, or with tie=LATER the latest, is returned, the one with the
+    lowest id among those at the same time.
+    '''
+    _check_tie(tie)
+    qs = InstantPoint.objects.using(dbAlias).filter(activity__name__contains=aName,
+                                                    timevalue__gte=tv - timedelta(seconds=max_seconds),
+                                                    timevalue__lte=tv + timedelta(seconds=max_seconds))
+    before = qs.filter(timevalue__lte=tv).order_by('-timevalue', 'id')[:2]
+    after = qs.filter(timevalue__gt=tv).order_by('timevalue', 'id')[:2]
+    ips = list(before.union(after, all=True))
+    if not ips:
+        raise ClosestTimeNotFoundException(f'No InstantPoint of Activity {aName} within {max_seconds} seconds of {tv}')
+
+    seconds = min(abs(ip.timevalue - tv).total_seconds() for ip in ips)
+    closest = [ip for ip in ips if abs(ip.timevalue - tv).total_seconds() == seconds]
+    chosen_time = (min if tie == EARLIER else max)(ip.timevalue for ip in closest)
+    ip = min((ip for ip in closest if ip.timevalue == chosen_time), key=lambda ip: ip.id)
+    if len(closest) > 1:
+        logger.info('%d InstantPoints %s seconds from %s, chose %s with tie = %s',
+                    len(closest), seconds, tv, ip.timevalue, tie)
+
+    return Match(ip, seconds, len(closest))
+
+
+class InstantPointIndex(object):
+    '''Sorted times of the InstantPoints of the Activities with names containing aName, for matching
+    many times with one query
+    '''
+    def __init__(self, aName, dbAlias):
+        self.aName = aName
+        self.dbAlias = dbAlias
+        rows = (InstantPoint.objects.using(dbAlias).filter(activity__name__contains=aName)
+                                    .order_by('timevalue', 'id').values_list('id', 'timevalue'))
+        ids, timevalues = zip(*rows) if rows else ((), ())
+        self.ids = np.array(ids, dtype=np.int64)
+        self.times = np.array(timevalues, dtype='datetime64[us]')
+        logger.debug('Read %d InstantPoint times of Activity %s', len(self.ids), aName)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def match_ids(self, timevalues, max_seconds=MAX_SECONDS, tie=EARLIER):
+        '''Return arrays of the ids of the closest InstantPoints to the datetimes in timevalues, their
+        distances in seconds and the number of InstantPoints at that distance.  The id is -1 where no
+        InstantPoint is within max_seconds.  Ties are resolved as in closest_instantpoint().
+        '''
+        _check_tie(tie)
+        tvs = np.array(list(timevalues), dtype='datetime64[us]')
+        ids = np.full(len(tvs), -1, dtype=np.int64)
+        seconds = np.full(len(tvs), np.nan)
+        tied = np.zeros(len(tvs), dtype=np.int64)
+        if not len(self) or not len(tvs):
+            return ids, seconds, tied
+
+        # Candidates are the last InstantPoint at or before and the first one after each time
+        after = np.searchsorted(self.times, tvs, side='right')
+        before = after - 1
+        has_before = before >= 0
+        has_after = after < len(self.times)
+        before_secs = np.where(has_before, (tvs - self.times[np.clip(before, 0, None)]) / np.timedelta64(1, 's'), np.inf)
+        after_secs = np.where(has_after, (self.times[np.clip(after, None, len(self) - 1)] - tvs) / np.timedelta64(1, 's'),
+                              np.inf)
+
+        equal = before_secs == after_secs
+        use_after = (after_secs < before_secs) | (equal & (tie == LATER))
+        chosen = np.where(use_after, after, before)
+        seconds = np.where(use_after, after_secs, before_secs)
+
+        # First (lowest id) of the InstantPoints at the chosen time, and how many share it
+        chosen_times = self.times[np.clip(chosen, 0, len(self) - 1)]
+        first = np.searchsorted(self.times, chosen_times, side='left')
+        same_time = np.searchsorted(self.times, chosen_times, side='right') - first
+        other_times = self.times[np.where(use_after, np.clip(before, 0, None), np.clip(after, None, len(self) - 1))]
+        other_same = (np.searchsorted(self.times, other_times, side='right')
+                      - np.searchsorted(self.times, other_times, side='left'))
+
+        found = seconds <= max_seconds
+        ids[found] = self.ids[first[found]]
+        tied = np.where(found, same_time + np.where(equal & found, other_same, 0), 0)
+        seconds = np.where(found, seconds, np.nan)
+
+        return ids, seconds, tied
+
+    def match(self, timevalues, max_seconds=MAX_SECONDS, tie=EARLIER):
+        '''Return list of the Matches of the InstantPoints closest to the datetimes in timevalues,
+        logging the number of ties and of times without an InstantPoint within max_seconds
+        '''
+        ids, seconds, tied = self.match_ids(timevalues, max_seconds, tie)
+        ips = InstantPoint.objects.using(self.dbAlias).in_bulk(ids[ids >= 0].tolist())
+        if np.any(tied > 1):
+            logger.info('%d of %d times tied between InstantPoints of Activity %s, chose with tie = %s',
+                        np.count_nonzero(tied > 1), len(ids), self.aName, tie)
+        if np.any(ids < 0):
+            logger.warning('%d of %d times have no InstantPoint of Activity %s within %s seconds',
+                           np.count_nonzero(ids < 0), len(ids), self.aName, max_seconds)
+
+        return [Match(ips.get(ip_id), secs, tie_count) if ip_id >= 0 else Match(None, None, 0)
+                for ip_id, secs, tie_count in zip(ids.tolist(), seconds.tolist(), tied.tolist())]
@@ -38,6 +38,7 @@ from slacker import Slacker
 from stoqs.models import ResourceType, Resource, Campaign, CampaignResource, MeasuredParameter, \
                          SampledParameter, Activity, Parameter, Platform
 from loaders.timing import MINUTES
+from loaders.partitions import partition_tables
 
 def tail(f, n):
     return subprocess.getoutput(f"tail -{n} {f}")
@@ -439,7 +440,9 @@ local   all             all                                     peer
                 
                 db += '_t'
 
-            command = 'psql -p {port} -c \"GRANT SELECT ON ALL TABLES IN SCHEMA public TO everyone;\" -d {db} -U postgres'
+            # Sequences too, for the load generation read by utils/optionscache.py
+            command = ('psql -p {port} -c \"GRANT SELECT ON ALL TABLES IN SCHEMA public TO everyone;'
+                       ' GRANT SELECT ON ALL SEQUENCES IN SCHEMA public TO everyone;\" -d {db} -U postgres')
             grant = command.format(**{'port': settings.DATABASES[db]['PORT'], 'db': db})
 
             self.logger.info('Granting SELECT to everyone on database %s', db)
@@ -663,6 +666,10 @@ local   all             all                                     peer
                 except TypeError:
                     call_command('migrate', settings='config.settings.local', interactive=False, database=db)
 
+                if getattr(self.args, 'partition', False):
+                    self.logger.info('Partitioning measurement tables...')
+                    partition_tables(db)
+
                 if create_only:
                     return
 
@@ -851,6 +858,8 @@ To get any stdout/stderr output you must use -v, the default is no output.
         parser.add_argument('--grant_everyone_select', action='store_true', help='Grant everyone role select privileges on all relations')
         parser.add_argument('--add_resource', action='store_true', help='Add a Resource to all databases: e.g. for zNear & zFar')
         parser.add_argument('--drop_indexes', action='store_true', help='Before load drop indexes and create them following the load')
+        parser.add_argument('--partition', action='store_true', help=('Store the measurement tables partitioned by Activity with'
+                                                                     ' a BRIN index on time - requires PostgreSQL 11 or later'))
         parser.add_argument('--pg_dump', action='store_true', help='Store a pg_dump(1) with "-Fc" option file on the server')
         parser.add_argument('--noinput', action='store_true', help='Execute without asking for a response, e.g. for --clobber')
         parser.add_argument('--drop_if_fail', action='store_true', help='Drop database if fail to load data')
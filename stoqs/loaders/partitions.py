@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+'''
+Optional partitioned storage of the InstantPoint, Measurement and MeasuredParameter tables.
+
+partition_tables() converts the tables of a new campaign database to tables partitioned by
+range of id.  Loads write to the DEFAULT partitions with the same SQL as before - table names,
+columns and id sequences don't change - and at the end of the load of an Activity
+seal_activity() moves its rows, which have consecutive ids, out of the DEFAULT partitions to
+partitions of their own.  drop_activity() then removes an Activity by dropping its partitions
+instead of with a DELETE of all of its rows.
+
+The rows of each Activity are written in time order, so the B-tree index on
+InstantPoint.timevalue is replaced with a much smaller BRIN index.  Unique constraints of
+the models are enforced by indexes on each partition and Django's foreign key constraints
+on the partitioned tables are dropped: the ORM cascades deletes itself.  PostgreSQL 11 or
+later is required.
+'''
+
+import os
+import sys
+# Add parent dir to pythonpath so that we can see the loaders and stoqs modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../") )
+if 'DJANGO_SETTINGS_MODULE' not in os.environ:
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'config.settings.local'
+import django
+django.setup()
+
+import logging
+import re
+
+from django.db import connections, transaction
+from stoqs.models import Activity, InstantPoint, Measurement, MeasuredParameter
+from utils.optionscache import bump_load_generation
+
+logger = logging.getLogger(__name__)
+
+# Partitioned models, each referencing the one before it, and their lookups of the Activity
+MODELS = (InstantPoint, Measurement, MeasuredParameter)
+ACTIVITY_LOOKUPS = {InstantPoint: 'activity',
+                    Measurement: 'instantpoint__activity',
+                    MeasuredParameter: 'measurement__instantpoint__activity'}
+
+# Naturally ordered columns indexed with BRIN instead of B-tree
+BRIN_COLUMNS = {InstantPoint: 'timevalue'}
+
+# Earliest PostgreSQL with DEFAULT partitions, and primary keys, indexes and ON CONFLICT on partitioned tables
+MIN_PG_VERSION = 110000
+
+DEFAULT = 'default'
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def _table(model):
+    return model._meta.db_table
+
+
+def _activity_ids_sql(model, table):
+    '''Return SQL selecting the ids of the rows of table, model's table or one of its partitions,
+    that belong to the Activity with id %s
+    '''
+    if model is InstantPoint:
+        return f'SELECT t.id FROM {table} t WHERE t.activity_id = %s'
+    if model is Measurement:
+        return (f'SELECT t.id FROM {table} t JOIN stoqs_instantpoint ip ON ip.id = t.instantpoint_id'
+                ' WHERE ip.activity_id = %s')
+
+    return (f'SELECT t.id FROM {table} t JOIN stoqs_measurement me ON me.id = t.measurement_id'
+            ' JOIN stoqs_instantpoint ip ON ip.id = me.instantpoint_id WHERE ip.activity_id = %s')
+
+
+def is_partitioned(dbAlias):
+    '''Return True if the tables of database dbAlias have been converted by partition_tables()
+    '''
+    with connections[dbAlias].cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE relname = %s', [_table(MeasuredParameter)])
+        row = cursor.fetchone()
+
+    return bool(row) and row[0] == 'p'
+
+
+def _create_default(cursor, model):
+    '''Create the DEFAULT partition of model's table with the unique indexes of the model
+    '''
+    table = _table(model)
+    default = f'{table}_{DEFAULT}'
+    cursor.execute(f'CREATE TABLE {default} PARTITION OF {table} DEFAULT')
+    for i, fields in enumerate(model._meta.unique_together):
+        columns = ', '.join(model._meta.get_field(f).column for f in fields)
+        cursor.execute(f'CREATE UNIQUE INDEX {default}_uniq{i} ON {default} ({columns})')
+
+
+def _partition_table(cursor, model):
+    '''Replace model's table with a table partitioned by range of id having the same columns,
+    id sequence, rows and indexes, but with a BRIN index on its BRIN_COLUMNS
+    '''
+    table = _table(model)
+    brin_column = BRIN_COLUMNS.get(model)
+
+    # Indexes that aren't for the primary key or unique constraints
+    cursor.execute('SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN '
+                   '(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)', [table, table])
+    index_defs = [row[0] for row in cursor.fetchall()
+                  if not (brin_column and row[0].endswith(f'USING btree ({brin_column})'))]
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_unpartitioned')
+    cursor.execute(f'CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS INCLUDING STORAGE)'
+                    ' PARTITION BY RANGE (id)')
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+    _create_default(cursor, model)
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {table}_unpartitioned')
+    cursor.execute(f'DROP TABLE {table}_unpartitioned')
+
+    cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id)')
+    for index_def in index_defs:
+        cursor.execute(index_def)
+    if brin_column:
+        cursor.execute(f'CREATE INDEX {table}_{brin_column}_brin ON {table} USING brin ({brin_column})')
+
+
+def partition_tables(dbAlias):
+    '''Convert the InstantPoint, Measurement and MeasuredParameter tables of database dbAlias,
+    normally just after it's been migrated, to tables partitioned by range of id
+    '''
+    connection = connections[dbAlias]
+    connection.ensure_connection()
+    if connection.pg_version < MIN_PG_VERSION:
+        raise PartitioningError(f'Partitioned tables need PostgreSQL 11 or later, database {dbAlias}'
+                                f' is on version {connection.pg_version}')
+    if is_partitioned(dbAlias):
+        logger.info('Tables of database %s are already partitioned', dbAlias)
+        return
+
+    tables = [_table(model) for model in MODELS]
+    with transaction.atomic(using=dbAlias), connection.cursor() as cursor:
+        # Foreign keys would keep partitions from being detached while they are referenced
+        cursor.execute("SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE contype = 'f'"
+                       ' AND (conrelid = ANY(%s::regclass[]) OR confrelid = ANY(%s::regclass[]))', [tables, tables])
+        for table, conname in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {conname}')
+
+        for model in MODELS:
+            _partition_table(cursor, model)
+
+    logger.info('Partitioned tables %s of database %s', tables, dbAlias)
+
+
+def _partition_bounds(cursor, table):
+    '''Return list of the (name, lo, hi) ranges of ids, hi exclusive, of the partitions of table
+    other than the DEFAULT partition
+    '''
+    cursor.execute('SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i'
+                   ' JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass', [table])
+    bounds = []
+    for name, bound in cursor.fetchall():
+        # e.g. FOR VALUES FROM ('100') TO ('200'), or DEFAULT
+        match = re.search(r"FROM \('?(-?\d+)'?\) TO \('?(-?\d+)'?\)", bound)
+        if match:
+            bounds.append((name, int(match.group(1)), int(match.group(2))))
+
+    return bounds
+
+
+def _split_default(cursor, model, activity, lo, hi):
+    '''Move the rows of activity with ids from lo to hi from the DEFAULT partition of model's table
+    to a new partition, leaving the rows of other Activities where they are
+    '''
+    table = _table(model)
+    default = f'{table}_{DEFAULT}'
+    partition = f'{table}_a{activity.id}_{lo}'
+
+    cursor.execute(f'CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING STORAGE)')
+    cursor.execute(f'INSERT INTO {partition} SELECT * FROM {default} WHERE id BETWEEN %s AND %s', [lo, hi])
+    cursor.execute(f'DELETE FROM {default} WHERE id BETWEEN %s AND %s', [lo, hi])
+    for i, fields in enumerate(model._meta.unique_together):
+        columns = ', '.join(model._meta.get_field(f).column for f in fields)
+        cursor.execute(f'CREATE UNIQUE INDEX {partition}_uniq{i} ON {partition} ({columns})')
+
+    # The primary key and other indexes of the partitioned table are built on the partition as it's attached
+    cursor.execute(f'ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM (%s) TO (%s)', [lo, hi + 1])
+
+
+def seal_activity(dbAlias, activity):
+    '''Move the rows of activity in the DEFAULT partitions to partitions of their own.  Returns False,
+    leaving the rows where they are, when they are interleaved with the rows of other Activities
+    loaded at the same time, including those already sealed in partitions within their range of ids.
+    '''
+    ranges = {}
+    with transaction.atomic(using=dbAlias), connections[dbAlias].cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {', '.join(_table(model) for model in MODELS)} IN ACCESS EXCLUSIVE MODE")
+        for model in MODELS:
+            default = f'{_table(model)}_{DEFAULT}'
+            cursor.execute(f'SELECT min(id), max(id), count(*) FROM ({_activity_ids_sql(model, default)}) AS a',
+                           [activity.id])
+            lo, hi, count = cursor.fetchone()
+            if not count:
+                continue
+            cursor.execute(f'SELECT count(*) FROM {default} WHERE id BETWEEN %s AND %s', [lo, hi])
+            if cursor.fetchone()[0] != count:
+                logger.warning('Rows of Activity %s in %s are interleaved with those of other Activities,'
+                               ' leaving them in the DEFAULT partition', activity, default)
+                return False
+            overlapping = [name for name, p_lo, p_hi in _partition_bounds(cursor, _table(model)) if p_lo <= hi and p_hi > lo]
+            if overlapping:
+                logger.warning('Rows of Activity %s in %s are interleaved with those in partitions %s,'
+                               ' leaving them in the DEFAULT partition', activity, default, overlapping)
+                return False
+            ranges[model] = (lo, hi)
+
+        for model, (lo, hi) in ranges.items():
+            _split_default(cursor, model, activity, lo, hi)
+
+    if ranges:
+        logger.info('Sealed partitions of Activity %s with id ranges %s', activity,
+                    {_table(model): r for model, r in ranges.items()})
+
+    return bool(ranges)
+
+
+def drop_activity(dbAlias, activity):
+    '''Delete activity, dropping the partitions made by seal_activity().  The rows of other tables
+    that reference the Activity's rows and its rows still in the DEFAULT partitions, e.g.
+    MeasuredParameters added to a sealed load, are deleted first, while they can still be joined to
+    the Activity.  Returns the number of partitions dropped.
+    '''
+    dropped = 0
+    with transaction.atomic(using=dbAlias), connections[dbAlias].cursor() as cursor:
+        for model in reversed(MODELS):
+            for related in model._meta.related_objects:
+                if related.related_model in MODELS or not related.one_to_many:
+                    continue
+                lookup = f'{related.field.name}__{ACTIVITY_LOOKUPS[model]}'
+                related.related_model.objects.using(dbAlias).filter(**{lookup: activity}).delete()
+
+        for model in reversed(MODELS):
+            default = f'{_table(model)}_{DEFAULT}'
+            cursor.execute(f'DELETE FROM {default} WHERE id IN ({_activity_ids_sql(model, default)})', [activity.id])
+            if cursor.rowcount:
+                logger.info('Deleted %d rows of Activity %s from %s', cursor.rowcount, activity, default)
+
+        for model in reversed(MODELS):
+            table = _table(model)
+            cursor.execute('SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid'
+                           ' WHERE i.inhparent = %s::regclass AND c.relname LIKE %s',
+                           [table, f'{table}\\_a{activity.id}\\_%'])
+            partitions = [row[0] for row in cursor.fetchall()]
+            for partition in partitions:
+                cursor.execute(f'DROP TABLE {partition}')
+            dropped += len(partitions)
+
+        Activity.objects.using(dbAlias).filter(id=activity.id).delete()
+
+    bump_load_generation(dbAlias)
+    logger.info('Dropped %d partitions of Activity %s', dropped, activity)
+
+    return dropped
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Manage partitioned storage of the measurement tables of a STOQS database')
+    parser.add_argument('-d', '--database', action='store', required=True, help='Database alias')
+    parser.add_argument('--partition', action='store_true', help='Convert the tables to partitioned tables')
+    parser.add_argument('--seal', action='store', nargs='*', default=[], help='Names of Activities to seal in partitions')
+    parser.add_argument('--drop', action='store', nargs='*', default=[], help='Names of Activities to delete')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.partition:
+        partition_tables(args.database)
+    for name in args.seal:
+        seal_activity(args.database, Activity.objects.using(args.database).get(name=name))
+    for name in args.drop:
+        drop_activity(args.database, Activity.objects.using(args.database).get(name=name))
@@ -0,0 +1,225 @@
+'''
+Run the Activity loads of a campaign load script in parallel worker processes.
+
+Load scripts executed with --workers N (N > 1) queue each load of an OPeNDAP URL with
+LoadScript.schedule_load() instead of executing it.  The queued loads are executed in
+a pool of N forked processes by LoadScheduler.run(), which LoadScript.run_scheduled_loads()
+calls before anything that depends on the loaded Activities, e.g. addTerrainResources()
+at the end of a load script.  Steps that write rows shared by all the Activities of a
+Campaign - creating the Campaign and Parameters, updateCampaignStartEnd() and
+assignParameterGroup() - are serialized across the workers with shared_step().
+
+A load that fails is retried up to --retries times after deleting the Activities that
+it created, recorded by created_activity(), so that partial data is never left for the
+retry or a later run of the script to mistake for a completed load.  With --journal FILE the outcome of each load is appended to FILE
+as a line of JSON; URLs recorded there as done are skipped when the script is run again.
+'''
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+import zlib
+from contextlib import contextmanager
+
+from django.db import connections
+from loaders import partitions
+from stoqs import models as m
+
+logger = logging.getLogger(__name__)
+
+DONE = 'done'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+# Seconds to wait before the first retry of a failed load, doubled for each subsequent retry
+RETRY_DELAY = 30
+
+# Loads queued for the workers - inherited by them when the pool is forked, so that
+# closures and bound methods of the load script can be executed without pickling
+_tasks = []
+_in_worker = False
+
+# Ids of the Activities created by the attempt of a load executing in this worker
+_created_activity_ids = []
+
+# Ids of the Parameters left without data by the load executing in this worker, for LoadScheduler to delete
+_empty_parameter_ids = []
+
+
+@contextmanager
+def shared_step(dbAlias, name):
+    '''Hold a PostgreSQL advisory lock for name in database dbAlias so that only
+    one load process at a time executes the step that writes shared rows
+    '''
+    key = zlib.crc32(f'stoqs load {name}'.encode())
+    with connections[dbAlias].cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s)', [key])
+    try:
+        yield
+    finally:
+        with connections[dbAlias].cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+
+
+def in_worker():
+    '''Return True when executing in a worker process of a LoadScheduler
+    '''
+    return _in_worker
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+
+
+def created_activity(activity):
+    '''Record that the load executing in this worker created activity, to be deleted if the load fails
+    '''
+    if _in_worker:
+        _created_activity_ids.append(activity.id)
+
+
+def empty_parameter(parameter):
+    '''Record that the load executing in this worker left parameter without data.  It's not deleted
+    by the worker as another one may be loading data for it, LoadScheduler deletes it if it's still empty.
+    '''
+    if _in_worker:
+        _empty_parameter_ids.append(parameter.id)
+
+
+def _delete_partial_activities(dbAlias, activity_ids):
+    '''Delete the Activities with activity_ids, created by an attempt of a load that failed
+    before completing, so that the load may be retried
+    '''
+    partitioned = partitions.is_partitioned(dbAlias)
+    for activity in m.Activity.objects.using(dbAlias).filter(id__in=activity_ids):
+        if partitioned:
+            # Rows may have been moved to partitions of their own, which the ORM doesn't cascade to
+            partitions.drop_activity(dbAlias, activity)
+            logger.info('Deleted partially loaded Activity %s', activity)
+            continue
+        num, _ = activity.delete()
+        logger.info('Deleted %d objects of partially loaded Activity %s', num, activity)
+
+
+def _run_task(index):
+    '''Execute the load at index in _tasks in a worker process, retrying it if it fails
+    '''
+    task = _tasks[index]
+    start = time.time()
+    for attempt in range(1, task['retries'] + 2):
+        del _created_activity_ids[:]
+        del _empty_parameter_ids[:]
+        try:
+            task['func'](*task['args'], **task['kwargs'])
+            status, error = DONE, None
+            break
+        except task['no_retry'] as e:
+            status, error = SKIPPED, f'{e.__class__.__name__}: {e}'
+            logger.warning('Skipping load of %s: %s', task['url'], error)
+            break
+        except Exception as e:
+            status, error = FAILED, traceback.format_exc()
+            logger.error('Attempt %d of load of %s failed: %s', attempt, task['url'], e)
+            connections.close_all()
+            _delete_partial_activities(task['dbAlias'], list(_created_activity_ids))
+            if attempt <= task['retries']:
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+
+    connections.close_all()
+
+    return index, {'url': task['url'], 'activity_name': task['activity_name'], 'status': status,
+                   'attempts': attempt, 'seconds': round(time.time() - start, 1), 'error': error,
+                   'empty_parameter_ids': list(_empty_parameter_ids)}
+
+
+class LoadScheduler(object):
+    '''Queue loads with submit() and execute them in a pool of worker processes with run()
+    '''
+    def __init__(self, dbAlias, workers, retries=2, journal=None, no_retry=()):
+        self.dbAlias = dbAlias
+        self.workers = workers
+        self.retries = retries
+        self.journal = journal
+        self.no_retry = tuple(no_retry)
+        self.after_loads = []
+        self.done_urls = set()
+        if journal and os.path.exists(journal):
+            with open(journal) as fh:
+                for line in fh:
+                    entry = json.loads(line)
+                    if entry['status'] == DONE:
+                        self.done_urls.add(entry['url'])
+            logger.info('Read %d completed loads from journal %s', len(self.done_urls), journal)
+
+    def submit(self, url, activity_name, func, *args, **kwargs):
+        '''Queue func(*args, **kwargs), the load of url into Activity activity_name
+        '''
+        if url in self.done_urls:
+            logger.info('Skipping %s: load is recorded as done in %s', url, self.journal)
+            return
+        _tasks.append({'url': url, 'activity_name': activity_name, 'func': func, 'args': args,
+                       'kwargs': kwargs, 'retries': self.retries, 'no_retry': self.no_retry,
+                       'dbAlias': self.dbAlias})
+
+    def defer(self, func, *args, **kwargs):
+        '''Execute func(*args, **kwargs) in this process after the queued loads have been run
+        '''
+        self.after_loads.append((func, args, kwargs))
+
+    @property
+    def pending(self):
+        return bool(_tasks or self.after_loads)
+
+    def _record(self, result):
+        if self.journal:
+            with open(self.journal, 'a') as fh:
+                fh.write(json.dumps(result) + '\n')
+        if result['status'] == DONE:
+            self.done_urls.add(result['url'])
+
+    def _delete_empty_parameters(self, parameter_ids):
+        '''Workers don't delete Parameters left without data by their load as another worker
+        may be loading data for them, delete those with parameter_ids here if they still have none
+        '''
+        if not parameter_ids:
+            return
+        num, _ = (m.Parameter.objects.using(self.dbAlias)
+                    .filter(id__in=parameter_ids, measuredparameter__isnull=True, sampledparameter__isnull=True)
+                    .delete())
+        if num:
+            logger.info('Deleted %d objects of Parameters that have no valid data', num)
+
+    def run(self):
+        '''Execute the queued loads in the pool of worker processes, then the deferred steps.
+        Returns list of results of the loads that did not succeed.
+        '''
+        failures = []
+        empty_parameter_ids = set()
+        if _tasks:
+            logger.info('Executing %d loads with %d worker processes', len(_tasks), self.workers)
+            # Forked workers must not share the database connections of this process
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(self.workers, initializer=_init_worker) as pool:
+                for index, result in pool.imap_unordered(_run_task, range(len(_tasks))):
+                    empty_parameter_ids.update(result.pop('empty_parameter_ids'))
+                    self._record(result)
+                    logger.info('Load %s of %s in %.1f s: %s', result['status'], result['url'],
+                                result['seconds'], result['activity_name'])
+                    if result['status'] == FAILED:
+                        logger.error(result['error'])
+                        failures.append(result)
+            del _tasks[:]
+            self._delete_empty_parameters(empty_parameter_ids)
+
+        after_loads, self.after_loads = self.after_loads, []
+        for func, args, kwargs in after_loads:
+            func(*args, **kwargs)
+
+        if failures:
+            logger.error('%d loads failed: %s', len(failures), ' '.join(f['url'] for f in failures))
+
+        return failures
@@ -12,6 +12,9 @@ MBARI 17 March 2012
 
 from django.contrib.gis.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from utils.optionscache import bump_load_generation
 
 try:
     import uuid
@@ -534,6 +537,8 @@ class ActivityParameter(models.Model):
     # Useful for visualiztion, ignoring fewer min & max outliers - 1% & 99% percentiles of the parameter
     p010 = models.FloatField(null=True)
     p990 = models.FloatField(null=True)
+    # Serialized utils.stats.QuantileSketch of the values so that the statistics can be updated when data are appended
+    sketch = models.BinaryField(null=True)
     class Meta(object):
         verbose_name = 'Activity Parameter'
         verbose_name_plural = 'Activity Parameter'
@@ -552,6 +557,36 @@ class ActivityParameterHistogram(models.Model):
     bincount = models.IntegerField()
 
 
+class ActivityParameterTimeBin(models.Model):
+    '''
+    Minimum, maximum and mean of the datavalues of a Parameter of an Activity (at a nominal
+    depth for timeSeries Activities) in a time bin.  Bins at level 0 are BIN_SECONDS wide,
+    bins at each higher level are BIN_FACTOR times wider.  The levels form a pyramid that
+    is built at load time for serving the Parameter-time plots at any time resolution.
+    '''
+    BIN_SECONDS = 60
+    BIN_FACTOR = 4
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, on_delete=models.CASCADE)
+    nominaldepth = models.FloatField(null=True)
+    level = models.IntegerField()
+    # Center of the time bin
+    epochmilliseconds = models.FloatField()
+    min = models.FloatField()
+    max = models.FloatField()
+    mean = models.FloatField()
+    count = models.IntegerField()
+    class Meta(object):
+        verbose_name = 'Activity Parameter Time Bin'
+        verbose_name_plural = 'Activity Parameter Time Bin'
+        app_label = 'stoqs'
+        index_together = ['activity', 'parameter', 'level']
+
+    @classmethod
+    def bin_seconds(cls, level):
+        return cls.BIN_SECONDS * cls.BIN_FACTOR ** level
+
+
 class MeasuredParameter(models.Model):
     '''
     Association class pairing Measurements with Parameters.  This is where the measured values are stored -- in the datavalue field.
@@ -624,3 +659,11 @@ class PermaLink(models.Model):
     create_date=models.DateTimeField(auto_now_add=True)
     usage_count=models.IntegerField(default=0)
     last_usage=models.DateTimeField(auto_now=True)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_delete, sender=Activity)
+def activity_changed(sender, instance, using, **kwargs):
+    '''Invalidate the cached UI options of the database of an Activity saved or deleted by any writer
+    '''
+    bump_load_generation(using)
@@ -28,9 +28,10 @@ import time
 import json
 import time
 import logging
+from unittest import mock
 
 from django.conf import settings
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
 from stoqs.models import Activity, Parameter, Resource, MeasuredParameter
 
@@ -164,7 +165,7 @@ class BaseAndMeasurementViewsTestCase(TestCase):
            self.assertEqual(response.status_code, 200, 'Status code should be 200 for %s' % req)
    
     def test_measuredparameter(self):
-        for fmt in  ['.html', '.json', '.csv', '.tsv', '.kml', '.count']:
+        for fmt in  ['.html', '.json', '.ndjson', '.csv', '.tsv', '.kml', '.count', '.parquet', '.arrow', '.nc']:
             logger.debug('fmt = %s', fmt)
             base = reverse('stoqs:show-measuredparmeter', kwargs={ 'fmt': fmt,
                                                             'dbAlias': 'default'})
@@ -182,6 +183,48 @@ class BaseAndMeasurementViewsTestCase(TestCase):
             if fmt == '.count':
                 logger.debug(response.content)
                 self.assertEqual(response.content, b'50', 'Response should be "50" for %s' % req)
+            elif fmt == '.json':
+                data = json.loads(b''.join(response.streaming_content))
+                self.assertEqual(len(data), 50, 'Streamed JSON should have 50 rows for %s' % req)
+            elif fmt == '.ndjson':
+                lines = b''.join(response.streaming_content).splitlines()
+                self.assertEqual(len(lines), 50, 'Streamed NDJSON should have 50 lines for %s' % req)
+                json.loads(lines[0])
+            elif fmt in ('.parquet', '.arrow', '.nc'):
+                self._check_columnar(fmt, b''.join(response.streaming_content), 50, req)
+
+    def _check_columnar(self, fmt, content, num_rows, req):
+        # Read back a columnar response and check its number of rows and columns
+        from utils.columnar import COLUMNS
+
+        if fmt == '.nc':
+            from netCDF4 import Dataset
+            with Dataset('response.nc', memory=content) as nc:
+                self.assertEqual(set(nc.variables), set(COLUMNS), 'Unexpected variables in %s' % req)
+                self.assertEqual(len(nc.dimensions['obs']), num_rows, 'netCDF should have %d obs for %s' % (num_rows, req))
+            return
+
+        import pyarrow as pa
+        if fmt == '.parquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(pa.BufferReader(content))
+        else:
+            table = pa.ipc.open_stream(content).read_all()
+        self.assertEqual(table.column_names, list(COLUMNS), 'Unexpected columns in %s' % req)
+        self.assertEqual(table.num_rows, num_rows, 'Table should have %d rows for %s' % (num_rows, req))
+
+    def test_measuredparameter_downsample(self):
+        # Downsampling selects about downsample rows of each Activity and Parameter
+        from collections import Counter
+
+        base = reverse('stoqs:show-measuredparmeter', kwargs={'fmt': '.json', 'dbAlias': 'default'})
+        req = base + '?parameter__name__contains=temperature&cmin=11.5&cmax=14.1&downsample=5'
+        response = self.client.get(req)
+        self.assertEqual(response.status_code, 200, 'Status code should be 200 for %s' % req)
+        data = json.loads(b''.join(response.streaming_content))
+        groups = Counter((row['measurement__instantpoint__activity__name'], row['parameter__name']) for row in data)
+        self.assertTrue(0 < len(data) < 50, 'Downsampled JSON should have fewer than 50 rows for %s' % req)
+        self.assertTrue(all(count <= 5 for count in groups.values()), f'Expected at most 5 rows in each of {groups}')
     
    
     def test_measuredparameter_with_parametervalues(self):
@@ -206,6 +249,28 @@ class BaseAndMeasurementViewsTestCase(TestCase):
                 logger.debug(response.content)
                 self.assertEqual(response.content, b'50', 'Response should be "50" for %s' % req)
 
+    def test_measuredparameter_kml_tile(self):
+        base = reverse('stoqs:show-measuredparmeter', kwargs={'fmt': '.kml', 'dbAlias': 'default'})
+        req = base + '?parameter__name__contains=temperature&cmin=11.5&cmax=14.1'
+        response = self.client.get(req)
+        self.assertEqual(response.status_code, 200, 'Status code should be 200 for %s' % req)
+        kml = b''.join(response.streaming_content)
+        self.assertEqual(kml.count(b'<Point>'), 50, 'KML should have 50 Point Placemarks for %s' % req)
+
+        # A tile covering the whole world has all of the points, one with none of them an empty response
+        for tile, count in (('-180,-90,180,90', 50), ('0,0,1,1', 0)):
+            response = self.client.get(req + '&kmltile=' + tile)
+            self.assertEqual(response.status_code, 200, 'Status code should be 200 for %s' % req)
+            kml = b''.join(response.streaming_content) if response.streaming else response.content
+            self.assertEqual(kml.count(b'<Point>'), count, 'Tile %s should have %d points' % (tile, count))
+
+        # With more points than KML_MAX_PLACEMARKS the database strides through them for a super-overlay
+        with mock.patch('utils.Viz.KML.KML_MAX_PLACEMARKS', 20):
+            response = self.client.get(req)
+            kml = b''.join(response.streaming_content)
+        self.assertEqual(kml.count(b'<Point>'), 17, 'Every 3rd of the 50 points should be read for %s' % req)
+        self.assertEqual(kml.count(b'<NetworkLink>'), 4, 'Should link to the 4 quadrant tiles for %s' % req)
+
     def test_query_summary(self):
         req = reverse('stoqs:stoqs-query-summary', kwargs={'dbAlias': 'default'})
         response = self.client.get(req)
@@ -342,6 +407,24 @@ class SummaryDataTestCase(TestCase):
         ##img_resp = self.client.get(img_url)
         ##self.assertEqual(img_resp.status_code, 200, 'Status code for image should be 200 for %s' % img_url)
 
+    def test_parameterplot_contour(self):
+        base = reverse('stoqs:stoqs-query-summary', kwargs={'dbAlias': 'default'})
+
+        for method in ('cubic', 'linear', 'binned'):
+            qstring = ('only=parameterplatformdatavaluepng'
+                       '&except=spsql&except=mpsql&xaxis_min=1288216319000'
+                       '&xaxis_max=1288279374000&yaxis_min=-10&yaxis_max=50'
+                       '&parameterplotid=4&platformplotname=dorado&'
+                       'showdataas=contour&gridding_method={}'.format(method))
+
+            req = base + '?' + qstring
+            response = self.client.get(req)
+            data = json.loads(response.content)
+            self.assertEqual(response.status_code, 200, 'Status code should be 200 for %s' % req)
+            self.assertTrue(data.get('parameterplatformdatavaluepng')[0], data.get('parameterplatformdatavaluepng')[2])
+            img_path = os.path.join(settings.MEDIA_ROOT, 'sections/', data.get('parameterplatformdatavaluepng')[0])
+            self.assertTrue(os.path.isfile(img_path), 'File %s was not created' % img_path)
+
     def test_parameterparameterplot1(self):
         base = reverse('stoqs:stoqs-query-summary', kwargs={'dbAlias': 'default'})
 
@@ -554,3 +637,231 @@ class BugsFoundTestCase(TestCase):
         act = Activity.objects.get(name__contains='Dorado')
         self.assertIsNotNone(act.maptrack, 'Dorado activity should have maptrack set')
 
+    def test_closest_instantpoint(self):
+        from datetime import timedelta
+        from loaders.instantpoints import closest_instantpoint, InstantPointIndex, ClosestTimeNotFoundException, Match
+
+        act = Activity.objects.get(name__contains='Dorado')
+        ips = list(act.instantpoint_set.order_by('timevalue')[:2])
+        tvs = [ips[0].timevalue, ips[0].timevalue + timedelta(seconds=1), ips[1].timevalue - timedelta(seconds=1)]
+
+        ip_index = InstantPointIndex(act.name, 'default')
+        for tv, match in zip(tvs, ip_index.match(tvs)):
+            single = closest_instantpoint(act.name, tv, 'default')
+            self.assertEqual(match.instantpoint, single.instantpoint, f'Batch and single lookups differ for {tv}')
+            self.assertEqual(match.seconds, single.seconds)
+        self.assertEqual(ip_index.match(tvs[:1])[0].seconds, 0, 'InstantPoint time should match exactly')
+
+        # A time more than max_seconds from the first InstantPoint has no match
+        max_seconds = 60
+        too_early = ips[0].timevalue - timedelta(seconds=max_seconds + 1)
+        self.assertEqual(ip_index.match([too_early], max_seconds=max_seconds)[0], Match(None, None, 0),
+                         f'No InstantPoint expected within {max_seconds} seconds')
+        with self.assertRaises(ClosestTimeNotFoundException):
+            closest_instantpoint(act.name, too_early, 'default', max_seconds=max_seconds)
+
+    def test_delete_partial_activities(self):
+        # Only the Activity created by a failed load is deleted, not others with similar names
+        from loaders import scheduler
+
+        act = Activity.objects.get(name__contains='Dorado')
+        partial = Activity.objects.create(name=act.name[:5], platform=act.platform, campaign=act.campaign,
+                                          startdate=act.startdate, enddate=act.enddate)
+        scheduler._init_worker()
+        try:
+            scheduler.created_activity(partial)
+        finally:
+            scheduler._in_worker = False
+        scheduler._delete_partial_activities('default', scheduler._created_activity_ids)
+        del scheduler._created_activity_ids[:]
+
+        self.assertFalse(Activity.objects.filter(id=partial.id).exists(), 'Partially loaded Activity should be deleted')
+        self.assertTrue(Activity.objects.filter(id=act.id).exists(), 'Other Activities should not be deleted')
+
+    def test_delete_empty_parameters(self):
+        # Only the Parameters that loads left without data are deleted, and only if they still have none
+        from loaders.scheduler import LoadScheduler
+
+        loaded = Parameter.objects.filter(measuredparameter__isnull=False).first()
+        emptied = Parameter.objects.create(name='emptied_by_load')
+        unrelated = Parameter.objects.create(name='without_data')
+        LoadScheduler('default', 1)._delete_empty_parameters([loaded.id, emptied.id])
+
+        self.assertFalse(Parameter.objects.filter(id=emptied.id).exists(), 'Parameter emptied by a load should be deleted')
+        self.assertTrue(Parameter.objects.filter(id=loaded.id).exists(), 'Parameter with data should be kept')
+        self.assertTrue(Parameter.objects.filter(id=unrelated.id).exists(), 'Parameters not from the loads should be kept')
+
+    def test_drop_sealed_activity(self):
+        # The partitions of a sealed load and its rows added later to the DEFAULT partitions are all dropped
+        from datetime import timedelta
+        from django.contrib.gis.geos import Point
+        from django.db import connections
+        from loaders import partitions
+        from stoqs.models import InstantPoint, Measurement
+
+        connections['default'].ensure_connection()
+        if connections['default'].pg_version < partitions.MIN_PG_VERSION:
+            self.skipTest('Partitioned tables need PostgreSQL 11 or later')
+        partitions.partition_tables('default')
+
+        act = Activity.objects.get(name__contains='Dorado')
+        p1, p2 = Parameter.objects.all()[:2]
+        load = Activity.objects.create(name='sealed_load', platform=act.platform, campaign=act.campaign,
+                                       startdate=act.startdate, enddate=act.enddate)
+        measurements = []
+        for i in range(3):
+            ip = InstantPoint.objects.create(activity=load, timevalue=act.startdate + timedelta(seconds=i))
+            measurements.append(Measurement.objects.create(instantpoint=ip, depth=i, geom=Point(-122.0, 36.8)))
+            MeasuredParameter.objects.create(measurement=measurements[-1], parameter=p1, datavalue=i)
+        self.assertTrue(partitions.seal_activity('default', load), 'Rows of the load should be moved to partitions')
+
+        # Added after sealing, so in the DEFAULT partition but referencing a sealed Measurement
+        MeasuredParameter.objects.create(measurement=measurements[0], parameter=p2, datavalue=0)
+        self.assertEqual(partitions.drop_activity('default', load), 3, 'A partition of each table should be dropped')
+
+        measurement_ids = [me.id for me in measurements]
+        self.assertFalse(Activity.objects.filter(id=load.id).exists(), 'Activity should be deleted')
+        self.assertFalse(InstantPoint.objects.filter(activity_id=load.id).exists(), 'No InstantPoints should be left')
+        self.assertFalse(Measurement.objects.filter(id__in=measurement_ids).exists(), 'No Measurements should be left')
+        self.assertFalse(MeasuredParameter.objects.filter(measurement_id__in=measurement_ids).exists(),
+                         'No MeasuredParameters should be left')
+        self.assertTrue(MeasuredParameter.objects.filter(measurement__instantpoint__activity=act).exists(),
+                        'Rows of other Activities should be kept')
+
+    def test_seal_interleaved_with_sealed_activity(self):
+        # A load whose range of ids spans the partitions of a load sealed before it stays in the DEFAULT partitions
+        from datetime import timedelta
+        from django.contrib.gis.geos import Point
+        from django.db import connections
+        from loaders import partitions
+        from stoqs.models import InstantPoint, Measurement
+
+        connections['default'].ensure_connection()
+        if connections['default'].pg_version < partitions.MIN_PG_VERSION:
+            self.skipTest('Partitioned tables need PostgreSQL 11 or later')
+        partitions.partition_tables('default')
+
+        act = Activity.objects.get(name__contains='Dorado')
+        p = Parameter.objects.first()
+        loads = [Activity.objects.create(name=f'interleaved_load_{i}', platform=act.platform, campaign=act.campaign,
+                                         startdate=act.startdate, enddate=act.enddate) for i in range(2)]
+        # Rows of the first load before and after those of the second, as from concurrent scheduler loads
+        for i, load in enumerate((loads[0], loads[1], loads[0])):
+            ip = InstantPoint.objects.create(activity=load, timevalue=act.startdate + timedelta(seconds=i))
+            me = Measurement.objects.create(instantpoint=ip, depth=i, geom=Point(-122.0, 36.8))
+            MeasuredParameter.objects.create(measurement=me, parameter=p, datavalue=i)
+
+        self.assertTrue(partitions.seal_activity('default', loads[1]), 'Rows of the second load should be sealed')
+        self.assertFalse(partitions.seal_activity('default', loads[0]),
+                         'Rows of the first load overlap the partitions of the second and should not be sealed')
+        self.assertEqual(MeasuredParameter.objects.filter(measurement__instantpoint__activity=loads[0]).count(), 2,
+                         'Rows of the first load should be left in the DEFAULT partitions')
+
+    def test_merge_ap_stats(self):
+        # New values are merged into the saved statistics, histogram and sketch, as the realtime Consumer does
+        import numpy as np
+        from loaders import STOQS_Loader
+        from stoqs.models import ActivityParameter
+
+        act = Activity.objects.get(name__contains='Dorado')
+        p = Parameter.objects.filter(name__contains='temperature',
+                                     measuredparameter__measurement__instantpoint__activity=act).distinct().first()
+        STOQS_Loader.update_ap_stats('default', act, {p: None})
+        ap = ActivityParameter.objects.get(activity=act, parameter=p)
+        number, vmax = ap.number, ap.max
+
+        STOQS_Loader.merge_ap_stats('default', ap, np.array([vmax + 1.0, vmax + 2.0]))
+        ap = ActivityParameter.objects.get(activity=act, parameter=p)
+        self.assertEqual(ap.number, number + 2)
+        self.assertAlmostEqual(ap.max, vmax + 2.0)
+        self.assertEqual(sum(ap.activityparameterhistogram_set.values_list('bincount', flat=True)), number + 2,
+                         'Merged histogram should count all the values')
+
+    def test_activity_change_bumps_load_generation(self):
+        # Cached UI options are invalidated by any save or delete of an Activity
+        from utils.optionscache import load_generation
+
+        act = Activity.objects.get(name__contains='Dorado')
+        generation = load_generation('default')
+        act.save()
+        self.assertGreater(load_generation('default'), generation, 'Saving an Activity should bump the load generation')
+
+        generation = load_generation('default')
+        act.delete()
+        self.assertGreater(load_generation('default'), generation, 'Deleting an Activity should bump the load generation')
+
+
+class StatsTestCase(SimpleTestCase):
+
+    def test_constant_values(self):
+        # A Parameter with the same value everywhere has a histogram over a widened range
+        import numpy as np
+        from utils.stats import StreamingStats, array_stats
+
+        values = np.full(50, 3.5)
+        streaming_stats = StreamingStats(3.5, 3.5)
+        for chunk in np.array_split(values, 5):
+            streaming_stats.update(chunk)
+        for stats, (counts, bins) in (array_stats(values), streaming_stats.result()):
+            self.assertEqual(stats['number'], 50)
+            self.assertEqual(stats['mode'], 3.5)
+            self.assertEqual(counts.sum(), 50, 'All values should be in the histogram')
+            self.assertTrue(bins[0] < 3.5 < bins[-1], 'Histogram range should contain the constant value')
+
+    def test_merge_stats_without_finite_values(self):
+        # Appended values that are all NaN leave the saved statistics unchanged
+        import numpy as np
+        from utils.stats import QuantileSketch, StreamingStats, merge_stats
+
+        values = np.arange(10.0)
+        streaming_stats = StreamingStats(0.0, 9.0)
+        streaming_stats.update(values)
+        stats, (counts, bins) = streaming_stats.result()
+        sketch = QuantileSketch()
+        sketch.update(values)
+
+        merged, (merged_counts, merged_bins) = merge_stats(stats, counts, bins, sketch,
+                                                           np.array([np.nan, np.inf, np.nan]))
+        self.assertEqual(merged['number'], 10)
+        self.assertEqual(merged['min'], 0.0)
+        self.assertEqual(merged['max'], 9.0)
+        self.assertEqual(merged_counts.sum(), 10)
+
+
+class DAPReaderTestCase(SimpleTestCase):
+
+    def test_chunked_read(self):
+        # Strided reads of a local NetCDF file in small chunks match reading the variables directly
+        import shutil
+        import tempfile
+        import numpy as np
+        from netCDF4 import Dataset
+        from loaders.dapreader import DAPReader
+
+        class LocalVariable(object):
+            # Stand-in for a pydap BaseType with the data of a netCDF4 Variable
+            def __init__(self, variable):
+                variable.set_auto_mask(False)
+                self.data = variable
+                self.shape = variable.shape
+                self.dtype = variable.dtype
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        url = os.path.join(tmp_dir, 'test.nc')
+        with Dataset(url, 'w') as nc:
+            nc.createDimension('time', 1000)
+            nc.createDimension('bin', 3)
+            nc.createVariable('time', 'f8', ('time',))[:] = np.arange(1000) * 1.5
+            nc.createVariable('counts', 'i4', ('time', 'bin'))[:] = np.arange(3000).reshape(1000, 3)
+
+        nc = Dataset(url)
+        self.addCleanup(nc.close)
+        ds = {name: LocalVariable(variable) for name, variable in nc.variables.items()}
+        reader = DAPReader(ds, url, cache_dir=os.path.join(tmp_dir, 'cache'), max_chunk_bytes=100)
+        self.addCleanup(reader.close)
+        for name, start, stop, step in (('time', 0, None, 1), ('time', 7, 993, 10), ('counts', 1, 1000, 3)):
+            expected = nc.variables[name][start:stop:step]
+            np.testing.assert_array_equal(reader.read(name, start, stop, step), expected)
+            # Read again from the cache
+            np.testing.assert_array_equal(reader.read(name, start, stop, step), expected)
@@ -16,7 +16,7 @@ from stoqs.views import (showActivityResource, showActivityParameter, showActivi
 from stoqs.views.app import (showMeasuredParameter, showSampledParameter, 
                              showActivityParameterHistogram, showResourceActivity,
                              showSampleDT, showQuickLookPlots)
-from stoqs.views.query import queryData, queryMap, queryUI
+from stoqs.views.query import queryData, queryMap, queryCacheMetrics, queryUI
 from stoqs.views.management import showCampaigns, showDatabase, showActivitiesMBARICustom
 from stoqs.views.permalinks import generate_permalink, load_permalink
 from stoqs.views.parameterinfo import parameterinfo
@@ -27,7 +27,7 @@ app_name = 'stoqs'
 pre = r'^(?P<dbAlias>[^/]+)/'  
 
 # format is one of: 'html', 'csv', 'kml', 'json'
-formatPat = r'(?P<fmt>[^/]{0,5})'
+formatPat = r'(?P<fmt>[^/]{0,7})'
 
 urlpatterns = [
     # New Map interfaces with inheritence of bootstrap template
@@ -80,6 +80,7 @@ urlpatterns = [
     # URL For Chander's STOQSQManager related views
     url(pre + r'query/summary/$', queryData, {}, name='stoqs-query-summary'),
     url(pre + r'query/map/$', queryMap, {}, name='stoqs-query-map'),
+    url(pre + r'query/cachemetrics/$', queryCacheMetrics, {}, name='stoqs-query-cachemetrics'),
     url(pre + r'query/', queryUI, {}, name='stoqs-query-ui'),
 
     # Management, base of campaign, etc.
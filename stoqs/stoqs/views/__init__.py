@@ -16,9 +16,11 @@ positions, it also delivers measured_paramaters based on various common query cr
 
 from django.shortcuts import render
 from django.template import RequestContext
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, HttpResponseBadRequest, Http404, StreamingHttpResponse, FileResponse
 from django.conf import settings
 from django.core import serializers
+from django.db.models.query import QuerySet
+from django.contrib.gis.geos import Polygon
 
 import json
 import stoqs.models as mod
@@ -26,10 +28,11 @@ import csv
 import logging 
 import tempfile
 from utils.utils import postgresifySQL
-from utils.MPQuery import MPQuery, MPQuerySet
+from utils.MPQuery import MPQuery, MPQuerySet, STREAM_CHUNK_SIZE
+from utils.downsample import LTTB, METHODS as DOWNSAMPLE_METHODS
 from utils.PQuery import PQuery
-from utils import encoders
-from utils.Viz.KML import KML
+from utils import encoders, columnar
+from utils.Viz.KML import KML, tile_bbox
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +41,14 @@ class EmptyQuerySetException(Exception):
     pass
 
 
+class Echo(object):
+    '''
+    File-like object whose write() returns what's written, for csv.writer() to format rows for a streaming response
+    '''
+    def write(self, value):
+        return value
+
+
 class BaseOutputer(object):
     '''
     Base methods for supported responses for all STOQS objects: csv, json, kml, html, etc.
@@ -55,6 +66,8 @@ class BaseOutputer(object):
                       'overlaps_right', 'overlaps_above', 'overlaps_below', 'strictly_above', 'strictly_below')
     fields = []
     geomFields = []
+    # Model ('measurement' or 'sample') with the depth, geom, and instantpoint of the rows, set to offer columnar formats
+    columnar_prefix = None
 
     def __init__(self, request, fmt, query_set, stoqs_object=None):
         '''
@@ -72,7 +85,9 @@ class BaseOutputer(object):
         self.html_tmpl_path = tempfile.NamedTemporaryFile(dir='/tmp', prefix=self.stoqs_object_name+'_', suffix='.html').name
 
         # May be overridden by classes that provide other responses, such as '.png' in an overridden process_request() method
-        self.responses = ['.help', '.html', '.json', '.csv', '.tsv', '.xml', '.count']
+        self.responses = ['.help', '.html', '.json', '.ndjson', '.csv', '.tsv', '.xml', '.count']
+        if self.columnar_prefix:
+            self.responses.extend('.' + fmt for fmt in columnar.FORMATS)
 
     def build_html_template(self):
         '''
@@ -243,6 +258,50 @@ class BaseOutputer(object):
             else:
                 yield row[field]
 
+    def iter_qs(self):
+        '''
+        Iterate over all the rows of self.qs, reading QuerySets STREAM_CHUNK_SIZE rows at a time from a
+        server-side cursor so that memory use doesn't grow with the size of the response
+        '''
+        if isinstance(self.qs, (QuerySet, MPQuerySet)):
+            return self.qs.iterator(chunk_size=STREAM_CHUNK_SIZE)
+        return iter(self.qs)
+
+    def _chunked(self, lines):
+        '''
+        Join the strings generated by @lines into about STREAM_CHUNK_SIZE line pieces of a streaming response
+        '''
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+
+    def stream_csv(self, delimiter=','):
+        writer = csv.writer(Echo(), delimiter=delimiter)
+        yield writer.writerow(self.fields)
+        for obj in self.iter_qs():
+            yield writer.writerow(self.row_of_fields(obj))
+
+    def stream_json(self):
+        '''
+        Generate the same JSON array as json.dumps(self.qs) would, a row at a time
+        '''
+        encoder = encoders.STOQSJSONEncoder()
+        separator = '['
+        for obj in self.iter_qs():
+            yield separator + encoder.encode(obj)
+            separator = ', '
+        yield ']' if separator == ', ' else '[]'
+
+    def stream_ndjson(self):
+        encoder = encoders.STOQSJSONEncoder()
+        for obj in self.iter_qs():
+            yield encoder.encode(obj) + '\n'
+
     def process_request(self):
         '''
         Default request processing: Apply any query parameters and get fields for the values.  Respond with requested format.
@@ -254,6 +313,15 @@ class BaseOutputer(object):
         except EmptyQuerySetException:
             raise Http404
 
+        if self.format in ('kml', 'kmln') and self.columnar_prefix:
+            # Constrain to the tile of a KML super-overlay that Google Earth requests as it comes into view
+            try:
+                bbox = tile_bbox(self.request)
+            except ValueError:
+                return HttpResponseBadRequest('kmltile must be west,south,east,north')
+            if bbox:
+                self.qs = self.qs.filter(**{f'{self.columnar_prefix}__geom__coveredby': Polygon.from_bbox(bbox)})
+
         # A terrible hack to add latitude and longitude columns to the response - must call following assign_qs()
         fields = self.add_lon_lat_cols()
 
@@ -268,27 +336,56 @@ class BaseOutputer(object):
             else:
                 self.qs = MPQuerySet(self.request.META['dbAlias'], None, MPQuerySet.rest_columns, qs_mp=self.qs)
 
+            # Opt-in reduction to about 'downsample' rows per Activity and Parameter, e.g. &downsample=2000&downsample_method=grid
+            if self.request.GET.get('downsample') and self.format != 'count':
+                method = self.request.GET.get('downsample_method', LTTB)
+                try:
+                    npoints = int(self.request.GET.get('downsample'))
+                except ValueError:
+                    return HttpResponseBadRequest('downsample must be an integer number of points per Activity and Parameter')
+                if method not in DOWNSAMPLE_METHODS:
+                    return HttpResponseBadRequest(f'downsample_method must be one of {DOWNSAMPLE_METHODS}')
+                self.qs = self.qs.downsample(npoints, method)
+
         # Process request based on format requested
+        # The csv, tsv, json, and ndjson responses are streamed so that they may be of any number of rows
         if self.format == 'csv' or self.format == 'tsv':
-            response = HttpResponse()
             if self.format == 'tsv':
-                response['Content-type'] = 'text/tab-separated-values'
+                response = StreamingHttpResponse(self._chunked(self.stream_csv(delimiter='\t')),
+                                                 content_type='text/tab-separated-values')
                 response['Content-Disposition'] = 'attachment; filename=%s.tsv' % self.stoqs_object_name
-                writer = csv.writer(response, delimiter='\t')
             else:
-                response['Content-type'] = 'text/csv'
+                response = StreamingHttpResponse(self._chunked(self.stream_csv()), content_type='text/csv')
                 response['Content-Disposition'] = 'attachment; filename=%s.csv' % self.stoqs_object_name
-                writer = csv.writer(response)
-            writer.writerow(fields)
-            for obj in self.qs:
-                writer.writerow(self.row_of_fields(obj))
 
             return response
+        elif self.format in columnar.FORMATS and self.columnar_prefix:
+            filename = '%s.%s' % (self.stoqs_object_name, self.format)
+            if self.format == columnar.NETCDF:
+                fh = columnar.write_netcdf(self.iter_qs(), self.columnar_prefix,
+                                           title='STOQS %s from %s' % (self.stoqs_object_name, self.request.META['dbAlias']))
+                return FileResponse(fh, as_attachment=True, filename=filename,
+                                    content_type=columnar.CONTENT_TYPES[self.format])
+            if self.format == columnar.PARQUET:
+                pieces = columnar.stream_parquet(self.iter_qs(), self.columnar_prefix)
+            else:
+                pieces = columnar.stream_arrow(self.iter_qs(), self.columnar_prefix)
+            response = StreamingHttpResponse(pieces, content_type=columnar.CONTENT_TYPES[self.format])
+            response['Content-Disposition'] = 'attachment; filename=%s' % filename
+
+            return response
+
         elif self.format == 'xml':
             return HttpResponse(serializers.serialize('xml', self.query_set), 'application/xml')
 
         elif self.format == 'json':
-            return HttpResponse(json.dumps(self.qs, cls=encoders.STOQSJSONEncoder), 'application/json')
+            if isinstance(self.qs, dict):
+                # Already assembled, e.g. by SampleDataTable
+                return HttpResponse(json.dumps(self.qs, cls=encoders.STOQSJSONEncoder), 'application/json')
+            return StreamingHttpResponse(self._chunked(self.stream_json()), content_type='application/json')
+
+        elif self.format == 'ndjson':
+            return StreamingHttpResponse(self._chunked(self.stream_ndjson()), content_type='application/x-ndjson')
 
         elif self.format == 'kml':
             kml = KML(self.request, self.qs, self.qparams, self.stoqs_object_name)
@@ -309,6 +406,9 @@ class BaseOutputer(object):
                 helpText += '\n\nSpatial and distance Lookups that may be appended to: %s\n\n%s\n\n%s' % (geomFields, 
                             self.distanceLookups, self.spatialLookups)
             helpText += '\n\nResponses: %s' % (self.responses,)
+            if self.stoqs_object_name == 'measured_parameter':
+                helpText += ('\n\nDownsampling: add downsample=<points per Activity and Parameter> and optionally downsample_method=%s'
+                             % ('|'.join(DOWNSAMPLE_METHODS),))
             response = HttpResponse(helpText, content_type="text/plain")
             return response
 
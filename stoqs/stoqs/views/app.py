@@ -104,6 +104,7 @@ class MeasuredParameter(BaseOutputer):
     fields = [ 'parameter__id', 'parameter__name', 'parameter__standard_name', 'measurement__depth', 'measurement__geom', 
                'measurement__instantpoint__timevalue',  'measurement__instantpoint__activity__name',
                'measurement__instantpoint__activity__platform__name', 'datavalue', 'parameter__units' ]
+    columnar_prefix = 'measurement'
 
 
 class SampledParameter(BaseOutputer):
@@ -114,6 +115,7 @@ class SampledParameter(BaseOutputer):
     fields = [ 'parameter__id', 'parameter__name', 'parameter__standard_name', 'sample__depth', 'sample__geom', 
                'sample__instantpoint__timevalue',  'sample__instantpoint__activity__name', 'sample__name',
                'sample__instantpoint__activity__platform__name', 'datavalue', 'parameter__units' ]
+    columnar_prefix = 'sample'
 
 
 class ResourceActivity(BaseOutputer):
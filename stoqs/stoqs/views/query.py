@@ -21,7 +21,6 @@ from django.core import serializers
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.db.utils import ConnectionDoesNotExist
-from django.views.decorators.cache import cache_page
 from utils.STOQSQManager import STOQSQManager
 from utils import encoders
 import json
@@ -187,8 +186,7 @@ def _buildMapFile(request, qm, options):
     av = ActivityView(request, item_list, trajectory_union_layer_string, station_union_layer_string)
     av.generateActivityMapFile()
 
-# Cache responses from this view for 15 minutes
-@cache_page(60 * 15)
+# Not cached with cache_page(), STOQSQManager.generateOptions() caches its results until the next load
 def queryData(request, fmt=None):
     '''
     Process data requests from the main query web page.  Returns both summary Activity and actual MeasuredParameter data
@@ -281,6 +279,17 @@ def queryMap(request):
 
     return response
 
+# Do not cache this "view", it reports the current cache metrics
+def queryCacheMetrics(request):
+    '''
+    Return hits, misses and hit ratio of the generateOptions() cache for each option as JSON
+    '''
+    qm = STOQSQManager(request, HttpResponse(), request.META['dbAlias'])
+    response = HttpResponse(content_type='text/json')
+    response.write(json.dumps(qm.getCacheMetrics()))
+
+    return response
+
 # Do not cache this "view", otherwise the incorrect url_mappath is used
 def queryUI(request):
     '''
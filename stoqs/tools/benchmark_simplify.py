@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+'''
+Benchmark utils.utils.simplify_line() against the pure-Python simplify_points() that
+the loaders used to build the SimpleDepthTime and SimpleBottomDepthTime series.
+
+A synthetic yo-yo depth time series (like a Dorado or LRAUV mission sampled at 1 Hz)
+is simplified by both functions at increasing lengths and the kept indices are
+compared, simplify_points() being given the same runs of --window points as
+simplify_line().  simplify_points() is skipped for series longer than --max_python_points.
+The time per point of simplify_line() on the longest series is checked against that on
+the shortest series of at least --min_scaling_points: the exit status is 1 if it has
+grown by more than --max_growth times, as it would were the work quadratic.
+To use:
+    ./benchmark_simplify.py
+    ./benchmark_simplify.py --points 1000 100000 10000000 --tolerance 10
+'''
+
+import argparse
+import os
+import sys
+
+import numpy as np
+from timeit import default_timer
+
+# Insert Django App directory (parent of config) into python path
+sys.path.insert(0, os.path.abspath(os.path.join(
+                    os.path.dirname(__file__), "../")))
+
+from utils.utils import SIMPLIFY_WINDOW, simplify_line, simplify_points
+
+
+def yoyo_series(count, seed=0):
+    '''Return epoch milliseconds and depths of count points of a noisy 0 to 100 m yo-yo at 1 Hz
+    '''
+    rng = np.random.default_rng(seed)
+    ems = 1.5e12 + 1000.0 * np.arange(count)
+    depths = 50.0 - 50.0 * np.cos(2 * np.pi * np.arange(count) / 600.0) + rng.normal(0, 0.2, count)
+
+    return ems, depths
+
+
+def simplify_runs(ems, depths, tolerance, window):
+    '''Return indices kept by simplify_points() of the runs of window points that simplify_line() simplifies
+    '''
+    keep = set()
+    for start in range(0, len(ems) - 1, window):
+        stop = min(start + window, len(ems) - 1) + 1
+        line = list(zip(ems[start:stop].tolist(), depths[start:stop].tolist()))
+        keep.update(start + k for _, _, k in simplify_points(line, tolerance))
+
+    return sorted(keep)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, nargs='+', default=[1000, 10000, 100000, 1000000, 10000000],
+                        help='Lengths of the series to simplify')
+    parser.add_argument('--tolerance', type=float, default=10,
+                        help='Simplification factor, same as critSimpleDepthTime used by the loaders')
+    parser.add_argument('--window', type=int, default=SIMPLIFY_WINDOW,
+                        help='Longest run of points simplified as one line')
+    parser.add_argument('--max_python_points', type=int, default=100000,
+                        help='Longest series to give to the pure-Python simplify_points()')
+    parser.add_argument('--min_scaling_points', type=int, default=100000,
+                        help='Shortest series used for the scaling check, shorter ones are dominated by overhead')
+    parser.add_argument('--max_growth', type=float, default=4,
+                        help='Largest allowed ratio of the times per point of the longest and shortest series')
+    args = parser.parse_args()
+
+    print(f"{'points':>10} {'kept':>8} {'simplify_points (s)':>20} {'simplify_line (s)':>18} {'speedup':>8}  same")
+    per_point = {}
+    for count in args.points:
+        ems, depths = yoyo_series(count)
+
+        start = default_timer()
+        keep = simplify_line(ems, depths, args.tolerance, args.window)
+        vectorized = default_timer() - start
+        per_point[count] = vectorized / count
+
+        if count <= args.max_python_points:
+            start = default_timer()
+            same = simplify_runs(ems, depths, args.tolerance, args.window) == keep.tolist()
+            pure_python = default_timer() - start
+            print(f'{count:10d} {len(keep):8d} {pure_python:20.3f} {vectorized:18.3f} {pure_python / vectorized:8.1f}  {same}')
+        else:
+            print(f"{count:10d} {len(keep):8d} {'-':>20} {vectorized:18.3f} {'-':>8}  -")
+
+    counts = sorted(c for c in per_point if c >= args.min_scaling_points)
+    if len(counts) < 2:
+        return 0
+    growth = per_point[counts[-1]] / per_point[counts[0]]
+    print(f'Time per point grew {growth:.1f} times from {counts[0]} to {counts[-1]} points')
+    if growth > args.max_growth:
+        print(f'simplify_line() does not scale: growth is more than --max_growth {args.max_growth}')
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,13 +21,16 @@ a Sample or a Measurement.
 '''
 from django.conf import settings
 from django.db.models.query import REPR_OUTPUT_SIZE, RawQuerySet, QuerySet
-from django.db import DatabaseError
+from django.db import DatabaseError, connections
+from django.contrib.gis.geos import GEOSGeometry
 from datetime import datetime
 from stoqs.models import MeasuredParameter, Parameter, SampledParameter, ParameterGroupParameter, MeasuredParameterResource
 from .utils import postgresifySQL, getGet_Actual_Count, getParameterGroups
 from loaders import MEASUREDINSITU
 from loaders.SampleLoaders import SAMPLED
 from .PQuery import PQuery
+from .downsample import downsample_rows, LTTB
+import copy
 import logging
 import pprint
 import re
@@ -41,6 +44,13 @@ logger = logging.getLogger(__name__)
 
 ITER_HARD_LIMIT = 1000000
 
+# Number of rows fetched at a time from the server-side cursor of MPQuerySet.iterator()
+STREAM_CHUNK_SIZE = 2000
+
+# Order of the rows read for downsampling, which selects rows of each Activity and Parameter in turn
+DOWNSAMPLE_ORDER = ('measurement__instantpoint__activity__name', 'parameter__name',
+                    'measurement__instantpoint__timevalue')
+
 class MPQuerySet(object):
     '''
     A class to simulate a QuerySet that's suitable for use everywhere a QuerySet may be used.
@@ -102,12 +112,84 @@ class MPQuerySet(object):
         self.values_list = values_list
         self.ordering = ('id',)
         self._count = None
+        self._downsample = None
+
+    def downsample(self, npoints, method=LTTB):
+        '''
+        Return copy of this MPQuerySet that iterates over about @npoints rows for each Activity
+        and Parameter selected with @method, one of the methods in utils/downsample.py, instead
+        of up to ITER_HARD_LIMIT rows.  The rows are then generated grouped by Activity and Parameter.
+        '''
+        qs = copy.copy(self)
+        qs._downsample = (npoints, method)
+        return qs
+
+    @property
+    def is_downsampled(self):
+        return self._downsample is not None
 
     def __iter__(self):
         '''
         Main way to access data that is used by interators in templates, etc.
         Simulate behavior of regular QuerySets.  Modify & format output as needed.
         '''
+        if self._downsample:
+            npoints, method = self._downsample
+            logger.debug('Downsampling to %d rows per Activity with method %s', npoints, method)
+            yield from downsample_rows(self._grouped_rows(), npoints, method)
+        else:
+            yield from self._rows()
+
+    def iterator(self, chunk_size=STREAM_CHUNK_SIZE):
+        '''
+        Generate all the rows of the query, without the ITER_HARD_LIMIT truncation of __iter__(),
+        reading them @chunk_size at a time from a server-side cursor.  Used for streaming responses.
+        '''
+        if self._downsample:
+            npoints, method = self._downsample
+            yield from downsample_rows(self._grouped_rows(chunk_size), npoints, method)
+        elif self.isRawQuerySet:
+            yield from self._rows(self._raw_rows(chunk_size))
+        else:
+            yield from self._rows(self.mp_query.iterator(chunk_size=chunk_size))
+
+    def _grouped_rows(self, chunk_size=STREAM_CHUNK_SIZE):
+        '''
+        Generate all the rows of the query ordered by DOWNSAMPLE_ORDER, reading them @chunk_size
+        at a time from a server-side cursor, so that they can be downsampled a group at a time
+        '''
+        if self.isRawQuerySet:
+            query = f"SELECT * FROM ({self.query}) AS mp ORDER BY {', '.join(DOWNSAMPLE_ORDER)}"
+            yield from self._rows(self._raw_rows(chunk_size, query))
+        else:
+            yield from self._rows(self.mp_query.order_by(*DOWNSAMPLE_ORDER).iterator(chunk_size=chunk_size))
+
+    def _raw_rows(self, chunk_size, query=None):
+        '''
+        Generate dictionaries of the columns of the raw SQL query, or of @query, read from a server-side cursor
+        '''
+        with connections[self.dbAlias].chunked_cursor() as cursor:
+            cursor.execute(query or self.query)
+            names = [col[0] for col in cursor.description]
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    mp = dict(zip(names, row))
+                    if isinstance(mp.get('measurement__geom'), str):
+                        # Hex EWKB from the database
+                        mp['measurement__geom'] = GEOSGeometry(mp['measurement__geom'])
+                    yield mp
+
+    def _rows(self, mps=None):
+        '''
+        Generate the rows of the query as dictionaries, from @mps if given, which must then
+        generate dictionaries as it can't be restarted with model objects
+        '''
+        if mps is None:
+            mps = self.mp_query[:ITER_HARD_LIMIT]
+
         minimal_values_list = False
         for item in self.rest_columns:
             if item not in self.values_list:
@@ -123,7 +205,7 @@ class MPQuerySet(object):
             # Likely for Flot contour plot
             try:
                 # Dictionaries
-                for mp in self.mp_query[:ITER_HARD_LIMIT]:
+                for mp in mps:
                     # TODO: Fix this to make it a more performant generator - making row takes time
                     row = { 'measurement__depth': mp['measurement__depth'],
                             'measurement__instantpoint__timevalue': mp['measurement__instantpoint__timevalue'],
@@ -133,7 +215,7 @@ class MPQuerySet(object):
                     yield row
 
             except TypeError:
-                for mp in self.mp_query[:ITER_HARD_LIMIT]:
+                for mp in mps:
                     row = { 'measurement__depth': mp.measurement.depth,
                             'measurement__instantpoint__timevalue': mp.measurement.instantpoint.timevalue,
                             'measurement__instantpoint__activity__name': mp.measurement.instantpoint.activity.name,
@@ -146,7 +228,7 @@ class MPQuerySet(object):
             logger.debug('type(self.mp_query) = %s', type(self.mp_query))
             try:
                 # Dictionaries
-                for mp in self.mp_query[:ITER_HARD_LIMIT]:
+                for mp in mps:
                     row = { 
                             'measurement__depth': mp['measurement__depth'],
                             'parameter__id': mp['parameter__id'],
@@ -164,7 +246,7 @@ class MPQuerySet(object):
 
             except (TypeError, AttributeError):
                 # Model objects
-                for mp in self.mp_query[:ITER_HARD_LIMIT]:
+                for mp in mps:
                     row = { 
                             'measurement__depth': mp.measurement.depth,
                             'parameter__id': mp.parameter__id,
@@ -241,6 +323,7 @@ class MPQuerySet(object):
  
     def _clone(self):
         qs = MPQuerySet(self.dbAlias, self.query, self.values_list)
+        qs._downsample = self._downsample
         try:
             qs.mp_query = self.mp_query._clone()
         except AttributeError as e:
@@ -471,6 +554,7 @@ class MPQuery(object):
                          stoqs_measurement.depth as measurement__depth,
                          stoqs_measurement.geom as measurement__geom,
                          stoqs_instantpoint.timevalue as measurement__instantpoint__timevalue, 
+                         stoqs_activity.name as measurement__instantpoint__activity__name,
                          stoqs_platform.name as measurement__instantpoint__activity__platform__name,
                          stoqs_measuredparameter.datavalue as datavalue,
                          stoqs_parameter.units as parameter__units'''
@@ -30,6 +30,7 @@ from .utils import round_to_n, postgresifySQL, EPOCH_STRING, EPOCH_DATETIME
 from .utils import (getGet_Actual_Count, getShow_Sigmat_Parameter_Values, getShow_StandardName_Parameter_Values, 
                    getShow_All_Parameter_Values, getShow_Parameter_Platform_Data)
 from .utils import simplify_points, getParameterGroups
+from . import optionscache
 from .geo import GPS
 from .MPQuery import MPQuery
 from .PQuery import PQuery
@@ -63,6 +64,9 @@ LATITUDE_UNITS = 'degrees_north'
 DEPTH_UNITS = 'm'
 TIME_UNITS = 'seconds since 1970-01-01'
 
+# Options that are cheaper to generate than to look up in the cache
+UNCACHED_OPTIONS = ('activitynames', 'updatefromzoom')
+
 
 class STOQSQManager(object):
     '''
@@ -240,8 +244,11 @@ class STOQSQManager(object):
         
         These objects are "simple" dictionaries using only Python's built-in types - so conversion to a
         corresponding JSON object should be trivial.
+        Results are cached by database, load generation and selection, see utils/optionscache.py.
         '''
         
+        generation = optionscache.load_generation(self.dbname)
+        params = {k: self.request.GET.getlist(k) for k in self.request.GET}
         results = {}
         for k, v in list(self.options_functions.items()):
             if self.kwargs['only'] != []:
@@ -251,6 +258,12 @@ class STOQSQManager(object):
                 continue
 
             start_time = time.time()
+            if k not in UNCACHED_OPTIONS:
+                found, results[k] = optionscache.lookup(self.dbname, generation, k, self.kwargs, params)
+                if found:
+                    logger.info(f"Got in {1000*(time.time()-start_time):6.1f} ms {k} from cache")
+                    continue
+
             if k == 'measuredparametersgroup':
                 results[k] = v(MEASUREDINSITU)
             elif k == 'sampledparametersgroup':
@@ -258,9 +271,18 @@ class STOQSQManager(object):
             else:
                 results[k] = v()
 
+            if k not in UNCACHED_OPTIONS:
+                optionscache.store(self.dbname, generation, k, self.kwargs, params, results[k])
+
             logger.info(f"Built in {1000*(time.time()-start_time):6.1f} ms {k} with {str(v).split('.')[1].split(' ')[0]}()")
         
         return results
+
+    def getCacheMetrics(self):
+        '''
+        Return dictionary of hits, misses and hit ratio of the generateOptions() cache for each option
+        '''
+        return optionscache.metrics(self.dbname, [k for k in self.options_functions if k not in UNCACHED_OPTIONS])
     
     #
     # Methods that generate summary data, based on the current query criteria
@@ -1215,6 +1237,70 @@ class STOQSQManager(object):
 
         return pt
 
+    def _timeBinsUsable(self, secondsperpixel, only_coords_flag):
+        '''
+        Return True if the Parameter-time plot may be built from the ActivityParameterTimeBin table: the
+        time bins are no finer than BIN_SECONDS and can be selected only by Activity, Parameter and time
+        '''
+        if float(secondsperpixel) < models.ActivityParameterTimeBin.BIN_SECONDS or only_coords_flag:
+            return False
+        if self.kwargs.get('parametertimeplotcoord') or self.kwargs.get('mplabels'):
+            return False
+        if any(d is not None for d in self.kwargs.get('depth') or []):
+            return False
+
+        return True
+
+    def _getParameterTimeFromBins(self, pt, pa_units, a, p, is_standard_name, a_nds, secondsperpixel, strides):
+        '''
+        Return hash of time series of min and max values from the coarsest level of ActivityParameterTimeBins
+        whose bins are no wider than secondsperpixel, and whether any bins were found for the activity and
+        parameter.  Bins with a single value contribute just one point.
+        '''
+        qs_bins = models.ActivityParameterTimeBin.objects.using(self.dbname).filter(activity=a)
+        if is_standard_name[p]:
+            qs_bins = qs_bins.filter(parameter__standard_name=p)
+        else:
+            qs_bins = qs_bins.filter(parameter__name=p)
+
+        level = 0
+        while models.ActivityParameterTimeBin.bin_seconds(level + 1) <= float(secondsperpixel):
+            level += 1
+        level = qs_bins.filter(level__lte=level).aggregate(Max('level'))['level__max']
+        if level is None:
+            return pt, strides, False
+
+        qs_bins = qs_bins.filter(level=level)
+        if self.kwargs.get('time'):
+            if self.kwargs['time'][0] is not None:
+                s_ems = 1000 * to_udunits(datetime.strptime(self.kwargs['time'][0], '%Y-%m-%d %H:%M:%S'), 'seconds since 1970-01-01')
+                qs_bins = qs_bins.filter(epochmilliseconds__gte=s_ems)
+            if self.kwargs['time'][1] is not None:
+                e_ems = 1000 * to_udunits(datetime.strptime(self.kwargs['time'][1], '%Y-%m-%d %H:%M:%S'), 'seconds since 1970-01-01')
+                qs_bins = qs_bins.filter(epochmilliseconds__lte=e_ems)
+
+        logger.debug('Adding time series of parameter = %s from time bins at level %d', p, level)
+        for nd, ems, vmin, vmax in qs_bins.values_list('nominaldepth', 'epochmilliseconds', 'min', 'max'
+                                                       ).order_by('nominaldepth', 'epochmilliseconds'):
+            if nd:
+                an_nd = "%s - %s - %s @ %s" % (pa_units[p], p, a.name, nd,)
+            elif a in a_nds:
+                try:
+                    an_nd = "%s - %s - %s starting @ %s m" % (pa_units[p], p, a.name, a_nds[a],)
+                except KeyError:
+                    an_nd = "%s - %s - %s starting @ ? m" % (pa_units[p], p, a.name)
+            else:
+                an_nd = "%s - %s - %s" % (pa_units[p], p, a.name)
+
+            points = pt[pa_units[p]].setdefault(an_nd, [])
+            points.append((int(ems), vmin))
+            if vmax != vmin:
+                points.append((int(ems), vmax))
+
+        strides[p][a.name] = 'min & max of %d second bins' % models.ActivityParameterTimeBin.bin_seconds(level)
+
+        return pt, strides, True
+
     def _parameterInSelection(self, p, is_standard_name, parameterType=MEASUREDINSITU):
         '''
         Return True if parameter name is in the UI selection, either from constraints other than
@@ -1311,6 +1397,13 @@ class STOQSQManager(object):
                 logger.debug('a.name = %s, a.startdate = %s, a.enddate %s, aseconds = %s, secondsperpixel = %s', 
                              a.name, a.startdate, a.enddate, aseconds, secondsperpixel)
                 if float(aseconds) > float(secondsperpixel) or len(self.kwargs.get('platforms')) == 1:
+                    if self._timeBinsUsable(secondsperpixel, only_coords_flag):
+                        # Use the precomputed pyramid of time bins, if it was built when this activity was loaded
+                        pt, strides, found = self._getParameterTimeFromBins(pt, pa_units, a, p, is_standard_name,
+                                                                            a_nds, secondsperpixel, strides)
+                        if found:
+                            continue
+
                     # Multiple points of this activity can be displayed in the flot, get an appropriate stride
                     logger.debug('PIXELS_WIDE = %s, ndCounts[p] = %s', PIXELS_WIDE, ndCounts[p])
                     stride = int(round(qs_mp_a.count() / PIXELS_WIDE / ndCounts[p]))
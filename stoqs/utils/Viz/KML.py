@@ -1,21 +1,91 @@
 import os
-import time
 import numpy
 import logging
 from .plotting import BaseParameter
 from stoqs import models as m
 from django.conf import settings
-from django.db import DataError
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connections, DataError
 from django.db.models import Avg
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from utils.MPQuery import STREAM_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
+# Responses with more points than this are split into a super-overlay of Region/NetworkLink tiles
+KML_MAX_PLACEMARKS = 20000
+# Number of Placemarks formatted into each piece of a streamed response
+KML_CHUNK_PLACEMARKS = 5000
+# Request parameter with the west,south,east,north bounds of a super-overlay tile
+KML_TILE_PARAM = 'kmltile'
+# Tiles are not divided further when smaller than this many degrees
+KML_MIN_TILE_DEGREES = 1.e-4
+# Size on the screen that a tile's Region must have before Google Earth loads it
+KML_MIN_LOD_PIXELS = 128
+
+KML_CONTENT_TYPE = 'application/vnd.google-earth.kml+xml'
+
+LINE_STYLES = '''
+<Style id="Tethys">
+<LineStyle>
+<color>ff0055ff</color>
+<width>2</width>
+</LineStyle>
+</Style>
+<Style id="Gulper_AUV">
+<LineStyle>
+<color>ff00ffff</color>
+<width>2</width>
+</LineStyle>
+</Style>
+<Style id="John Martin">
+<LineStyle>
+<color>ffffffff</color>
+<width>1</width>
+</LineStyle>
+</Style>
+'''
+
 
 class InvalidLimits(Exception):
     pass
 
 
+def tile_bbox(request):
+    '''
+    Return (west, south, east, north) of the super-overlay tile requested with KML_TILE_PARAM, None if not requested
+    '''
+    if not hasattr(request, 'GET') or not request.GET.get(KML_TILE_PARAM):
+        return None
+
+    west, south, east, north = (float(v) for v in request.GET.get(KML_TILE_PARAM).split(','))
+
+    return west, south, east, north
+
+
+def data_arrays(rows):
+    '''
+    Return dictionary of numpy arrays of the time, lon, lat, depth, and datavalue items of the
+    (time, lon, lat, depth, parameter, datavalue, platform) tuples in rows
+    '''
+    rows = list(rows)
+    data = {'time': numpy.array([r[0] for r in rows], dtype='datetime64[s]'),
+            'lon': numpy.array([r[1] for r in rows], dtype=numpy.float64),
+            'lat': numpy.array([r[2] for r in rows], dtype=numpy.float64),
+            'depth': numpy.array([r[3] for r in rows], dtype=numpy.float64),
+            'datavalue': numpy.array([numpy.nan if r[5] is None else float(r[5]) for r in rows], dtype=numpy.float64)}
+
+    # HACK warning: Fix any accidentally swapped lat & lons
+    swapped = (data['lat'] < -90) | (data['lat'] > 90)
+    data['lon'][swapped], data['lat'][swapped] = data['lat'][swapped], data['lon'][swapped]
+
+    return data
+
+
+def _subset(data, indices):
+    return {k: v[indices] for k, v in data.items()}
+
+
 class KML(BaseParameter):
     '''
     Manage the construcion of KML files from stoqs.  Several options may be set on initialization and
@@ -47,7 +117,7 @@ class KML(BaseParameter):
             self.withLineStringsFlag = kwargs['withLineStrings']
         else:
             self.withLineStringsFlag = True
-            
+
         if 'withFullIconURL' in kwargs:
             self.withFullIconURLFlag = kwargs['withFullIconURL']
         else:
@@ -60,15 +130,93 @@ class KML(BaseParameter):
             # Check if in request, otherwise set it to 1
             self.stride = int(self.request.GET.get('stride', 1))
 
+    def _rows(self, mps):
+        '''
+        Generate (time, lon, lat, depth, parameter, datavalue, platform) tuples of the MeasuredParameters
+        or SampledParameters in mps
+        '''
+        prefix = 'measurement' if self.stoqs_object_name == 'measured_parameter' else 'sample'
+        for mp in mps:
+            try:
+                # Expect the query set self.qs_mp to be a collection of value lists
+                yield (mp[f'{prefix}__instantpoint__timevalue'], mp[f'{prefix}__geom'].x, mp[f'{prefix}__geom'].y,
+                       mp[f'{prefix}__depth'], mp['parameter__name'], mp['datavalue'],
+                       mp[f'{prefix}__instantpoint__activity__platform__name'])
+            except TypeError:
+                # Otherwise expect self.qs_mp to be a collection of model instances
+                obj = getattr(mp, prefix)
+                yield (obj.instantpoint.timevalue, obj.geom.x, obj.geom.y, obj.depth, mp.parameter.name,
+                       mp.datavalue, obj.instantpoint.activity.platform.name)
+
+    def _sql(self):
+        '''
+        Return (sql, params, names) of the query of self.qs_mp, names are the keys of its rows or None if
+        they are the names of the columns of the SQL
+        '''
+        if getattr(self.qs_mp, 'isRawQuerySet', False):
+            # MPQuerySet of SQL with ParameterValue self joins, its columns are named like the values() keys
+            return self.qs_mp.query, None, None
+
+        # A values() QuerySet, possibly wrapped in an MPQuerySet, selects its columns in the order that Django reads them
+        query = getattr(self.qs_mp, 'mp_query', self.qs_mp).query
+        sql, params = query.sql_with_params()
+
+        return sql, params, list(query.extra_select) + list(query.values_select) + list(query.annotation_select)
+
+    def _count(self):
+        '''
+        Return the number of rows of self.qs_mp, counted by the database
+        '''
+        sql, params, _ = self._sql()
+        with connections[self.request.META['dbAlias']].cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM ({sql}) AS kml_rows', params)
+            return cursor.fetchone()[0]
+
+    def _getStridedSQL(self, sql, stride_val):
+        '''
+        Modify sql so that the database returns only every stride_val-th row, the row number is added as the last column
+        '''
+        if stride_val == 1:
+            return sql
+
+        return ('SELECT * FROM (SELECT kml_rows.*, row_number() OVER () AS kml_row FROM ({}) AS kml_rows) AS kml_numbered '
+                'WHERE mod(kml_row - 1, {:d}) = 0').format(sql, stride_val)
+
+    def _stridedRows(self, stride_val):
+        '''
+        Generate dictionaries of every stride_val-th row of self.qs_mp, read from a server-side cursor
+        '''
+        sql, params, names = self._sql()
+        with connections[self.request.META['dbAlias']].chunked_cursor() as cursor:
+            cursor.execute(self._getStridedSQL(sql, stride_val), params)
+            names = names or [col[0] for col in cursor.description]
+            geom = f"{'measurement' if self.stoqs_object_name == 'measured_parameter' else 'sample'}__geom"
+            while True:
+                rows = cursor.fetchmany(STREAM_CHUNK_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    mp = dict(zip(names, row))
+                    if isinstance(mp.get(geom), (bytes, memoryview)):
+                        # EWKB of the geom::bytea that Django's PostGIS backend selects, GEOSGeometry reads it from a memoryview
+                        mp[geom] = GEOSGeometry(memoryview(mp[geom]))
+                    elif isinstance(mp.get(geom), str):
+                        # Hex EWKB from the database
+                        mp[geom] = GEOSGeometry(mp[geom])
+                    yield mp
+
     def kmlResponse(self):
         '''
         Return a response that is a KML represenation of the existing MeasuredParameter query that is in self.qs_mp.
         pName is either the parameter__name or parameter__standard_name string.  Use @stride to return a subset of data.
+        The document is streamed, with more than KML_MAX_PLACEMARKS points it is a super-overlay of tiles that
+        Google Earth requests with KML_TILE_PARAM as they come into view.  The rows are counted first and then
+        strided by the database, so that at most KML_MAX_PLACEMARKS of them are read for the document or a tile.
         '''
         response = HttpResponse()
         if self.qs_mp is None:
             raise Exception('self.qs_mp is None.')
-    
+
         # If both selected parameter__name takes priority over parameter__standard_name. If parameter__id supplied that takes overall precedence.
         pName = None
         if 'parameter__standard_name' in self.qparams:
@@ -81,7 +229,7 @@ class KML(BaseParameter):
             logger.debug('parameter__id = %s', self.qparams['parameter__id'])
             pName = m.Parameter.objects.using(self.request.META['dbAlias']).get(id=int(self.qparams['parameter__id'])).name
             logger.debug('pName = %s', pName)
-    
+
         if not pName:
             raise ValueError('parameter__name, parameter__standard_name, or parameter__id is not specified')
 
@@ -89,112 +237,112 @@ class KML(BaseParameter):
         logger.debug('self.stride = %d', self.stride)
 
         logger.debug('self.stoqs_object_name = %s', self.stoqs_object_name)
-        if self.stoqs_object_name == 'measured_parameter':
-            try:
-                # Expect the query set self.qs_mp to be a collection of value lists
-                data = [(mp['measurement__instantpoint__timevalue'], mp['measurement__geom'].x, mp['measurement__geom'].y,
-                         mp['measurement__depth'], mp['parameter__name'],  mp['datavalue'], mp['measurement__instantpoint__activity__platform__name'])
-                         for mp in self.qs_mp[::self.stride]]
-            except TypeError:
-                # Otherwise expect self.qs_mp to be a collection of model instances
-                data = [(mp.measurement.instantpoint.timevalue, mp.measurement.geom.x, mp.measurement.geom.y,
-                         mp.measurement.depth, mp.parameter.name,  mp.datavalue, mp.measurement.instantpoint.activity.platform.name)
-                         for mp in self.qs_mp[::self.stride]]
-            try:
-                folderName = "%s_%.1f_%.1f" % (pName, float(self.qparams['measurement__depth__gte']), float(self.qparams['measurement__depth__lte']))
-            except KeyError:
-                folderName = "%s_" % (pName,)
+        npoints = None
+        if getattr(self.qs_mp, 'is_downsampled', False):
+            # Striding would bypass the downsampling that MPQuerySet iteration does
+            mps = iter(self.qs_mp)
+        else:
+            # Stride through the rows in the database, more than requested if needed to read at most KML_MAX_PLACEMARKS
+            npoints = -(-self._count() // self.stride)
+            stride_val = self.stride * -(-npoints // KML_MAX_PLACEMARKS)
+            logger.debug('Reading every %d-th of %d rows', stride_val, npoints * self.stride)
+            mps = self._stridedRows(stride_val)
 
-        elif self.stoqs_object_name == 'sampled_parameter':
-            try:
-                # Expect the query set self.qs_mp to be a collection of value lists
-                data = [(mp['sample__instantpoint__timevalue'], mp['sample__geom'].x, mp['sample__geom'].y,
-                         mp['sample__depth'], mp['parameter__name'],  mp['datavalue'], mp['sample__instantpoint__activity__platform__name'])
-                         for mp in self.qs_mp[::self.stride]]
-            except TypeError:
-                # Otherwise expect self.qs_mp to be a collection of model instances
-                data = [(mp.sample.instantpoint.timevalue, mp.sample.geom.x, mp.sample.geom.y,
-                         mp.sample.depth, mp.parameter.name,  mp.datavalue, mp.sample.instantpoint.activity.platform.name)
-                         for mp in self.qs_mp[::self.stride]]
-            try:
-                folderName = "%s_%.1f_%.1f" % (pName, float(self.qparams['sample__depth__gte']), float(self.qparams['sample__depth__lte']))
-            except KeyError:
-                folderName = "%s_" % (pName,)
+        depth_prefix = 'measurement' if self.stoqs_object_name == 'measured_parameter' else 'sample'
+        try:
+            folderName = "%s_%.1f_%.1f" % (pName, float(self.qparams[f'{depth_prefix}__depth__gte']),
+                                           float(self.qparams[f'{depth_prefix}__depth__lte']))
+        except KeyError:
+            folderName = "%s_" % (pName,)
 
+        rowsHash = {}
+        for row in self._rows(mps):
+            rowsHash.setdefault(row[6], []).append(row)
 
-        dataHash = {}
-        for d in data:
-            try:
-                dataHash[d[6]].append(d)
-            except KeyError:
-                dataHash[d[6]] = []
-                dataHash[d[6]].append(d)
-
-        if not dataHash:
+        if not rowsHash:
             logger.exception('No data collected for making KML within the constraints provided')
             return response
 
+        dataHash = {plat: data_arrays(rows) for plat, rows in rowsHash.items()}
+        del rowsHash
+
         descr = self.request.get_full_path().replace('&', '&amp;')
         logger.debug(descr)
         try:
-            kml = self.makeKML(self.request.META['dbAlias'], dataHash, pName, folderName, descr, 
-                    self.cmin, self.cmax)
+            clim = self._getClim(self.request.META['dbAlias'], pName, self.cmin, self.cmax)
         except InvalidLimits as e:
             logger.exception(e)
             return response
 
-        response['Content-Type'] = 'application/vnd.google-earth.kml+xml'
-        response.write(kml)
+        if npoints is None:
+            npoints = sum(len(data['time']) for data in dataHash.values())
+        bbox = tile_bbox(self.request) or (min(numpy.nanmin(d['lon']) for d in dataHash.values()),
+                                           min(numpy.nanmin(d['lat']) for d in dataHash.values()),
+                                           max(numpy.nanmax(d['lon']) for d in dataHash.values()),
+                                           max(numpy.nanmax(d['lat']) for d in dataHash.values()))
+        networkLinks = ''
+        if npoints > KML_MAX_PLACEMARKS and min(bbox[2] - bbox[0], bbox[3] - bbox[1]) > KML_MIN_TILE_DEGREES:
+            # Show evenly spaced points at this level and load the detail of the quadrants as they're zoomed into
+            logger.debug('Making super-overlay tile %s of %d points', bbox, npoints)
+            nread = sum(len(data['time']) for data in dataHash.values())
+            if nread > KML_MAX_PLACEMARKS:
+                # Downsampled rows, the others have been strided by the database
+                for plat, data in list(dataHash.items()):
+                    count = int(round(KML_MAX_PLACEMARKS * len(data['time']) / float(nread)))
+                    dataHash[plat] = _subset(data, numpy.unique(numpy.linspace(0, len(data['time']) - 1, max(count, 2)).astype(int)))
+            networkLinks = self._buildKMLnetworkLinks(bbox)
+
+        response = StreamingHttpResponse(self.generateKML(dataHash, folderName, descr, clim, networkLinks),
+                                         content_type=KML_CONTENT_TYPE)
         return response
 
-    def makeKML(self, dbAlias, dataHash, pName, title, desc, cmin=None, cmax=None):
+    def _getClim(self, dbAlias, pName, cmin=None, cmax=None):
         '''
-        Generate the KML for the point in mpList
-        cmin and cmax are the color min and max 
+        Return the color limits, cmin and cmax if given, otherwise the average 2.5 and 97.5 percentiles of pName
         '''
-
-        #
-        # Define the color lookup table and the color limits from 2.5 and 97.5 percentiles for each variable
-        #
-        climHash = {}
-        for p in m.Parameter.objects.using(dbAlias).all().values_list('name'):
-            pn = p[0]
-            try:
-                qs = m.ActivityParameter.objects.using(dbAlias).filter(parameter__name=pn).aggregate(Avg('p025'), Avg('p975'))
-                climHash[pn] = (qs['p025__avg'], qs['p975__avg'],)
-            except DataError:
-                # Can have overflow, e.g. nitrate from tethys/daphne in September 2015
-                pass
-        ##logger.debug('Color lookup min, max values:\n' + pprint.pformat(climHash))
-
-
-        pointKMLHash = {}
-        lineKMLHash = {}
         if cmin and cmax:
             try:
                 clim = (float(cmin), float(cmax),)
             except ValueError:
                 raise InvalidLimits('Cannot make KML with specified cmin, cmax of %s, %s' % (cmin, cmax))
-        else:
-            try:
-                clim = climHash[pName]
-            except KeyError:
-                logger.warn('Parameter "%s" not in Parameter table in database %s', pName, dbAlias)
-                logger.warn('Setting clim to (-1, 1)')
-                clim = (-1, 1)
+            if clim[0] == clim[1]:
+                raise InvalidLimits('cmin and cmax are the same value')
+            return clim
+
+        if not m.Parameter.objects.using(dbAlias).filter(name=pName).exists():
+            logger.warn('Parameter "%s" not in Parameter table in database %s', pName, dbAlias)
+            logger.warn('Setting clim to (-1, 1)')
+            return (-1, 1)
+
+        try:
+            qs = m.ActivityParameter.objects.using(dbAlias).filter(parameter__name=pName).aggregate(Avg('p025'), Avg('p975'))
+        except DataError:
+            # Can have overflow, e.g. nitrate from tethys/daphne in September 2015
+            logger.warn('Cannot get percentiles of Parameter "%s", setting clim to (-1, 1)', pName)
+            return (-1, 1)
+
+        return (qs['p025__avg'], qs['p975__avg'],)
+
+    def makeKML(self, dbAlias, dataHash, pName, title, desc, cmin=None, cmax=None):
+        '''
+        Generate the KML for the point in mpList
+        cmin and cmax are the color min and max
+        dataHash is keyed by platform name with lists of (time, lon, lat, depth, parameter, datavalue, platform) tuples
+        '''
+        clim = self._getClim(dbAlias, pName, cmin, cmax)
         ##logger.debug('clim = %s', clim)
-    
-        for k in list(dataHash.keys()):
-            (pointStyleKML, pointKMLHash[k]) = self._buildKMLpoints(dataHash[k], clim)
-            if self.withLineStringsFlag:
-                (lineStyleKML, lineKMLHash[k]) = self._buildKMLlines(dataHash[k])
-            else:
-                logger.debug('Not drawing LineStrings for platform = %s', k)
 
+        return ''.join(self.generateKML({k: data_arrays(v) for k, v in dataHash.items()}, title, desc, clim))
+
+    def generateKML(self, dataHash, title, desc, clim, networkLinks=''):
+        '''
+        Generate the pieces of a KML document of the data, a dictionary of data_arrays() keyed by platform name,
+        followed by the NetworkLinks to the tiles of a super-overlay
+        '''
         #
         # KML header
         #
-        kml = '''<?xml version="1.0" encoding="UTF-8"?>
+        yield '''<?xml version="1.0" encoding="UTF-8"?>
 <kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:kml="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
 <!-- %s -->
 <!-- Mike McCann MBARI 28 October 2010 -->
@@ -203,133 +351,133 @@ class KML(BaseParameter):
 <description>%s</description>
 ''' % ('Automatically generated by STOQS', title, desc)
 
-        kml += pointStyleKML
+        yield self._buildKMLpointStyles()
         if self.withLineStringsFlag:
-            kml += lineStyleKML
+            yield LINE_STYLES
 
         #
-        # See that the platforms are alphabetized in the KML.  (The point and line KMLHashes will have the same keys.)
+        # See that the platforms are alphabetized in the KML
         #
-        platList = list(pointKMLHash.keys())
-        platList.sort()
-        for plat in platList:
-            kml += '''<Folder>
+        for plat in sorted(dataHash.keys()):
+            yield '''<Folder>
 <name>%s Points</name>
-%s
-</Folder>''' % (plat, pointKMLHash[plat])
+''' % (plat, )
+            yield from self._buildKMLpoints(dataHash[plat], clim)
+            yield '''
+</Folder>'''
 
             if self.withLineStringsFlag:
-                kml += '''<Folder>
+                yield '''<Folder>
 <name>%s Lines</name>
-%s
-</Folder>''' % (plat, lineKMLHash[plat])
+''' % (plat, )
+                yield from self._buildKMLlines(dataHash[plat])
+                yield '''
+</Folder>'''
+            else:
+                logger.debug('Not drawing LineStrings for platform = %s', plat)
 
+        yield networkLinks
 
         #
         # Footer
         #
-        kml += '''</Document>
+        yield '''</Document>
 </kml>'''
 
+    def _buildKMLnetworkLinks(self, bbox):
+        '''
+        Return NetworkLinks to the quadrants of bbox, each with a Region so that it's loaded when it comes into view
+        '''
+        west, south, east, north = bbox
+        mid_lon = (west + east) / 2.0
+        mid_lat = (south + north) / 2.0
+        params = self.request.GET.copy()
+        kml = ''
+        for tile in ((west, mid_lat, mid_lon, north), (mid_lon, mid_lat, east, north),
+                     (west, south, mid_lon, mid_lat), (mid_lon, south, east, mid_lat)):
+            params[KML_TILE_PARAM] = '%.8f,%.8f,%.8f,%.8f' % tile
+            url = self.request.build_absolute_uri(self.request.path + '?' + params.urlencode())
+            kml += '''<NetworkLink>
+<name>%.5f,%.5f,%.5f,%.5f</name>
+<Region>
+<LatLonAltBox>
+<north>%.8f</north>
+<south>%.8f</south>
+<east>%.8f</east>
+<west>%.8f</west>
+</LatLonAltBox>
+<Lod>
+<minLodPixels>%d</minLodPixels>
+<maxLodPixels>-1</maxLodPixels>
+</Lod>
+</Region>
+<Link>
+<href>%s</href>
+<viewRefreshMode>onRegion</viewRefreshMode>
+</Link>
+</NetworkLink>
+''' % (tile + (tile[3], tile[1], tile[2], tile[0], KML_MIN_LOD_PIXELS, url.replace('&', '&amp;')))
+
         return kml
 
     def _buildKMLlines(self, data):
         '''
-        Build KML placemark LineStrings of all the point data in `list`
+        Generate KML placemark LineStrings of all the point data in `data` a KML_CHUNK_PLACEMARKS at a time.
         Use distinctive line colors for each platform.
         the same way as is done in the auvctd dorado science data processing.
-        `data` are the results of a query, say from xySlice()
-        `clt` is a Color Lookup Table equivalent to a jetplus clt as used in Matlab
-        `clim` is a 2 element list equivalent to clim in Matlab
-    
-        Return strings of style and point KML that can be included in a master KML file.
+        `data` is a dictionary of data_arrays()
         '''
-
-        styleKml = '''
-<Style id="Tethys">
-<LineStyle>
-<color>ff0055ff</color>
-<width>2</width>
-</LineStyle>
-</Style>
-<Style id="Gulper_AUV">
-<LineStyle>
-<color>ff00ffff</color>
-<width>2</width>
-</LineStyle>
-</Style>
-<Style id="John Martin">
-<LineStyle>
-<color>ffffffff</color>
-<width>1</width>
-</LineStyle>
-</Style>
-'''
-
-        #
-        # Build the LineString for the points
-        #
-        lineKml = ''
-        lastCoordStr = ''
-        for row in data:
-            dt, lon, lat, depth, _, _, _ = row
-
-            if lat < -90 or lat > 90:
-                # HACK warning: Fix any accidentally swapped lat & lons
-                lon2 = lon
-                lon = lat
-                lat = lon2
-
-            coordStr = "%.6f,%.6f,-%.1f" % (lon, lat, depth)
-    
-            if lastCoordStr:
-                if self.withTimeStampsFlag:
-                    placemark = """
+        if self.withTimeStampsFlag:
+            placemark = """
 <Placemark>
 <TimeStamp>
-<when>%s</when>
+<when>%sZ</when>
 </TimeStamp>
 <LineString>
 <altitudeMode>absolute</altitudeMode>
 <coordinates>
-%s
+%s %s
 </coordinates>
 </LineString>
-</Placemark> """         % (time.strftime("%Y-%m-%dT%H:%M:%SZ", dt.timetuple()), lastCoordStr + ' ' + coordStr)
-                else:
-                    placemark = """
+</Placemark> """
+        else:
+            placemark = """
 <Placemark>
 <LineString>
 <altitudeMode>absolute</altitudeMode>
 <coordinates>
-%s
+%s %s
 </coordinates>
 </LineString>
-</Placemark> """         % (lastCoordStr + ' ' + coordStr)
+</Placemark> """
 
-                lineKml += placemark
+        #
+        # Build the LineString for each point and the one before it
+        #
+        for start in range(1, len(data['time']), KML_CHUNK_PLACEMARKS):
+            end = min(start + KML_CHUNK_PLACEMARKS, len(data['time']))
+            coords = self._coordStrs(data, start - 1, end, "%.6f,%.6f,-%.1f")
+            columns = [coords[:-1], coords[1:]]
+            if self.withTimeStampsFlag:
+                columns.insert(0, numpy.datetime_as_string(data['time'][start:end], unit='s').tolist())
+            yield (placemark * (end - start)) % tuple(v for row in zip(*columns) for v in row)
 
-            lastCoordStr = coordStr
+    def _coordStrs(self, data, start, end, fmt):
+        '''
+        Return list of the coordinates of the points from start to end formatted with fmt
+        '''
+        columns = (data['lon'][start:end], data['lat'][start:end], data['depth'][start:end])
+        flat = numpy.column_stack(columns).ravel().tolist()
 
-        return (styleKml, lineKml)
+        return (('\n'.join([fmt] * (end - start))) % tuple(flat)).split('\n') if end > start else []
 
-    def _buildKMLpoints(self, data, clim):
+    def _buildKMLpointStyles(self):
         '''
-        Build KML Placemarks of all the point data in `list` and use colored styles 
-        the same way as is done in the auvctd dorado science data processing.
-        `data` are the results of a query, say from xySlice()
-        `self.clt` is a Color Lookup Table equivalent to a jetplus clt as used in Matlab,
-        it is assigned in the base class BaseParameter.
-        `clim` is a 2 element list equivalent to clim in Matlab
-
-        Return strings of style and point KML that can be included in a master KML file.
+        Reduce self.clt, the Color Lookup Table assigned in the base class BaseParameter, to self.num_colors
+        and return the KML Styles of its colors
         '''
-
         _debug = False
 
-        #
-        # Build the styles for the colors in clt using clim
-        #
         if self.withFullIconURLFlag:
             try:
                 baseURL = self.request.build_absolute_uri('/')[:-1] + '/' + settings.STATIC_URL
@@ -344,13 +492,13 @@ class KML(BaseParameter):
         if stride < 1:
             stride = 1
         self.clt = [ (float(c[0]), float(c[1]), float(c[2])) for c in self.clt[::stride] ]
-        for c in self.clt:
-            ge_color = "ff%02x%02x%02x" % ((round(c[2] * 255), round(c[1] * 255), round(c[0] * 255)))
+        self.ge_colors = numpy.array(["ff%02x%02x%02x" % ((round(c[2] * 255), round(c[1] * 255), round(c[0] * 255)))
+                                      for c in self.clt])
+        for c, ge_color in zip(self.clt, self.ge_colors):
             if _debug:
                 logger.debug("c = %s", c)
                 logger.debug("ge_color = %s", ge_color)
 
-
             style = '''<Style id="%s">
 <IconStyle>
 <color>%s</color>
@@ -364,48 +512,42 @@ class KML(BaseParameter):
 
             styleKml += style
 
-        #
-        # Build the placemarks for the points
-        #
-        pointKml = ''
-        for row in data:
-            dt, lon, lat, depth, _, datavalue, _ = row
-    
-            if lat < -90 or lat > 90:
-                # HACK Warning: Fix any accidentally swapped lat & lons
-                lon2 = lon
-                lon = lat
-                lat = lon2
-
-            coordStr = "%.6f, %.6f,-%.1f" % (lon, lat, depth)
+        return styleKml
 
-            if _debug:
-                logger.debug("datavalue = %f", float(datavalue))
-                logger.debug("clim = %s", clim)
+    def _colorIndices(self, datavalues, clim):
+        '''
+        Return indices into the reduced self.clt of datavalues within clim, -1 where there's no color
+        '''
+        try:
+            scale = (len(self.clt) - 1) / float(clim[1] - clim[0])
+        except ZeroDivisionError:
+            raise InvalidLimits('cmin and cmax are the same value')
+        except (ValueError, TypeError):
+            # Likely None for the clim of a Parameter without percentiles
+            return numpy.full(len(datavalues), -1)
 
-            try:
-                clt_index = int(round((float(datavalue) - clim[0]) * ((len(self.clt) - 1) / float(numpy.diff(clim)))))
-                clt_index = int(self.num_colors * float(clt_index) / len(self.clt))
-            except ZeroDivisionError:
-                raise InvalidLimits('cmin and cmax are the same value')
-            except (ValueError, TypeError):
-                # Likely: 'cannot convert float NaN or None to integer' e.g. for altitude outside of terrain coverage
-                continue
-
-            if clt_index < 0:
-                clt_index = 0;
-            if clt_index > (len(self.clt) - 1):
-                clt_index = int(len(self.clt) - 1);
-            if _debug:
-                logger.debug("clt_index = %d", clt_index)
-            ge_color_val = "ff%02x%02x%02x" % ((round(self.clt[clt_index][2] * 255), round(self.clt[clt_index][1] * 255), round(self.clt[clt_index][0] * 255)))
+        indices = numpy.full(len(datavalues), -1)
+        valid = ~numpy.isnan(datavalues)
+        clt_index = numpy.round((datavalues[valid] - clim[0]) * scale)
+        clt_index = numpy.trunc(self.num_colors * clt_index / len(self.clt))
+        indices[valid] = numpy.clip(clt_index, 0, len(self.clt) - 1)
 
-            if self.withTimeStampsFlag:
-                placemark = """
+        return indices
+
+    def _buildKMLpoints(self, data, clim):
+        '''
+        Generate KML Placemarks of all the point data in `data` a KML_CHUNK_PLACEMARKS at a time and use colored styles
+        the same way as is done in the auvctd dorado science data processing.
+        `data` is a dictionary of data_arrays()
+        `clim` is a 2 element list equivalent to clim in Matlab
+        Call _buildKMLpointStyles() first to reduce self.clt for the colors of the styles.
+        '''
+        if self.withTimeStampsFlag:
+            placemark = """
 <Placemark>
 <styleUrl>#%s</styleUrl>
 <TimeStamp>
-<when>%s</when>
+<when>%sZ</when>
 </TimeStamp>
 <Point>
 <altitudeMode>absolute</altitudeMode>
@@ -413,9 +555,9 @@ class KML(BaseParameter):
 %s
 </coordinates>
 </Point>
-</Placemark> """         % (ge_color_val, time.strftime("%Y-%m-%dT%H:%M:%SZ", dt.timetuple()), coordStr)
-            else:
-                placemark = """
+</Placemark> """
+        else:
+            placemark = """
 <Placemark>
 <styleUrl>#%s</styleUrl>
 <Point>
@@ -424,11 +566,19 @@ class KML(BaseParameter):
 %s
 </coordinates>
 </Point>
-</Placemark> """         % (ge_color_val, coordStr)
+</Placemark> """
 
-            pointKml += placemark
+        # Skip points without a color, e.g. NaN for altitude outside of terrain coverage
+        indices = self._colorIndices(data['datavalue'], clim)
+        data = _subset(data, indices >= 0)
+        ge_colors = self.ge_colors[indices[indices >= 0]]
 
-        return (styleKml, pointKml)
+        for start in range(0, len(data['time']), KML_CHUNK_PLACEMARKS):
+            end = min(start + KML_CHUNK_PLACEMARKS, len(data['time']))
+            columns = [ge_colors[start:end].tolist(), self._coordStrs(data, start, end, "%.6f, %.6f,-%.1f")]
+            if self.withTimeStampsFlag:
+                columns.insert(1, numpy.datetime_as_string(data['time'][start:end], unit='s').tolist())
+            yield (placemark * (end - start)) % tuple(v for row in zip(*columns) for v in row)
 
     def _buildKMLlabels(self, plat, data, clim):
         '''
@@ -437,4 +587,3 @@ class KML(BaseParameter):
         Return strings of style and point KML that can be included in a master KML file.
         '''
         pass
-
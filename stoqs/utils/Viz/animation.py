@@ -4,20 +4,31 @@ of data from STOQS databases.
 '''
 
 import logging
-import math
 import numpy as np
 import os
-import time
-import traceback
 from collections import namedtuple
 from datetime import datetime
-from itertools import zip_longest
+from django.db.models import FloatField, Func, Max, Q
 from loaders import X3DPLATFORMMODEL, X3D_MODEL, X3D_MODEL_SCALEFACTOR
 from matplotlib.colors import hex2color
 from stoqs import models
+from utils.Viz.x3d import format_rows
 
 PA_MAX_POINTS = 10000000       # Set to avoid memory error on development system
 
+# Member variable name prefixes and the (field, value) lookups of the Parameters pivoted into columns by loadData()
+ATTITUDE_NAMES = ('yaw', 'roll', 'pitch', 'rot_x', 'rot_y', 'rot_z', 'axis_x', 'axis_y', 'axis_z', 'angle')
+ATTITUDE_COLUMNS = (('parameter__standard_name', 'platform_yaw_angle'),
+                    ('parameter__standard_name', 'platform_roll_angle'),
+                    ('parameter__standard_name', 'platform_pitch_angle'),
+                    ('parameter__name', 'ROT_X'),
+                    ('parameter__name', 'ROT_Y'),
+                    ('parameter__name', 'ROT_Z'),
+                    ('parameter__name', 'AXIS_X'),
+                    ('parameter__name', 'AXIS_Y'),
+                    ('parameter__name', 'AXIS_Z'),
+                    ('parameter__name', 'ANGLE (radian)'))
+
 
 class PlatformAnimation(object):
     '''Build X3D scene graph fragments for platforms that have X3D
@@ -168,13 +179,13 @@ class PlatformAnimation(object):
         self.af = 15        # Axis factor - to make the line an appropriate length
 
         # Platform model must be oriented with nose to -Z (north) and up to +Y
-        self.xRotFmt = '1 0 0 {:.6f} '    # pitch
-        self.yRotFmt = '0 -1 0 {:.6f} '   # yaw
-        self.zRotFmt = '0 0 -1 {:.6f} '   # roll
-        self.aaRotFmt = '{:.6f} {:.6f} {:.6f} {:.6f} '   # angle_axis
+        self.xRotFmt = ('1 0 0 %.6f',)    # pitch
+        self.yRotFmt = ('0 -1 0 %.6f',)   # yaw
+        self.zRotFmt = ('0 0 -1 %.6f',)   # roll
+        self.aaRotFmt = ('%.6f',) * 4     # angle_axis
 
         # Axis of rotation coords (2 points of MFVec3f)
-        self.axisValuesFmt = '{:.6f} {:.6f} {:.6f} {:.6f} {:.6f} {:.6f} '
+        self.axisValuesFmt = ('%.6f',) * 6
 
     def getX3DPlatformModel(self, pName):
         # Expect only one X3DPLATFORMMODEL per platform (hence .get())
@@ -203,57 +214,46 @@ class PlatformAnimation(object):
 
     def loadData(self, platform):
         '''Read the data from the database into member variables for construction 
-        of platform orientation time series.
+        of platform orientation time series.  The navigation and attitude Parameters are
+        pivoted by the database into one row per time, a column for each of the
+        ATTITUDE_COLUMNS that is NaN where the Parameter has no value at that time.
         '''
         # Save to '_by_plat' dictionaries so that each platform can be 
         # separately controlled by ROUTEs, interpolators, and JavaScript
         pqs = self.qs_mp.filter(measurement__instantpoint__activity__platform=platform)
-
-        # Must filter on one Parameter, otherwise we get multiple measurement values, 
-        # choose 'yaw' - this means that a platform must have yaw (heading) to be visualized
-        for mp in pqs.filter(parameter__standard_name='platform_yaw_angle'):
-            self.lon_by_plat.setdefault(platform.name, []).append(mp['measurement__geom'].x)
-            self.lat_by_plat.setdefault(platform.name, []).append(mp['measurement__geom'].y)
-            self.depth_by_plat.setdefault(platform.name, []).append(mp['measurement__depth'])
-
-            # Need millisecond accuracy, add microseconds to what timetuple() provides 
-            # (only to the second); time_by_plat is in Unix epoch milliseconds
-            dt = mp['measurement__instantpoint__timevalue']
-            self.time_by_plat.setdefault(platform.name, []).append(
-                    int((time.mktime(dt.timetuple()) + dt.microsecond / 1.e6) * 1000.0))
-
-        for mp in pqs.filter(parameter__standard_name='platform_roll_angle'):
-            self.roll_by_plat.setdefault(platform.name, []).append(mp['datavalue'])
-        for mp in pqs.filter(parameter__standard_name='platform_pitch_angle'):
-            self.pitch_by_plat.setdefault(platform.name, []).append(mp['datavalue'])
-        for mp in pqs.filter(parameter__standard_name='platform_yaw_angle'):
-            self.yaw_by_plat.setdefault(platform.name, []).append(mp['datavalue'])
-
-        for mp in pqs.filter(parameter__name='ROT_X'):
-            self.rot_x_by_plat.setdefault(platform.name, []).append(mp['datavalue'])
-        for mp in pqs.filter(parameter__name='ROT_Y'):
-            self.rot_y_by_plat.setdefault(platform.name, []).append(mp['datavalue'])
-        for mp in pqs.filter(parameter__name='ROT_Z'):
-            self.rot_z_by_plat.setdefault(platform.name, []).append(mp['datavalue'])
-
-        if platform.name not in self.axis_x_by_plat:
-            self.axis_x_by_plat[platform.name] = []
-        if platform.name not in self.axis_y_by_plat:
-            self.axis_y_by_plat[platform.name] = []
-        if platform.name not in self.axis_z_by_plat:
-            self.axis_z_by_plat[platform.name] = []
-        if platform.name not in self.angle_by_plat:
-            self.angle_by_plat[platform.name] = []
-
-        # Specific for BEDs data, or other platforms that have these Parameters in their NetCDF files
-        for mp in pqs.filter(parameter__name='AXIS_X'):
-            self.axis_x_by_plat[platform.name].append(mp['datavalue'])
-        for mp in pqs.filter(parameter__name='AXIS_Y'):
-            self.axis_y_by_plat[platform.name].append(mp['datavalue'])
-        for mp in pqs.filter(parameter__name='AXIS_Z'):
-            self.axis_z_by_plat[platform.name].append(mp['datavalue'])
-        for mp in pqs.filter(parameter__name='ANGLE (radian)'):
-            self.angle_by_plat[platform.name].append(mp['datavalue'])
+        pqs = pqs.filter(Q(parameter__standard_name__in=[v for k, v in ATTITUDE_COLUMNS if k == 'parameter__standard_name']) |
+                         Q(parameter__name__in=[v for k, v in ATTITUDE_COLUMNS if k == 'parameter__name']))
+
+        # Positions are those of the yaw measurements and only times with yaw are kept - this
+        # means that a platform must have yaw (heading) to be visualized
+        yaw = Q(parameter__standard_name='platform_yaw_angle')
+        aggregates = {'lon': Max(Func('measurement__geom', function='ST_X', output_field=FloatField()), filter=yaw),
+                      'lat': Max(Func('measurement__geom', function='ST_Y', output_field=FloatField()), filter=yaw),
+                      'depth': Max('measurement__depth', filter=yaw)}
+        for name, (field, value) in zip(ATTITUDE_NAMES, ATTITUDE_COLUMNS):
+            aggregates[name] = Max('datavalue', filter=Q(**{field: value}))
+
+        rows = np.array(list(pqs.order_by().values('measurement__instantpoint__activity__name',
+                                                   'measurement__instantpoint__timevalue'
+                                                  ).annotate(**aggregates).filter(yaw__isnull=False
+                                                  ).order_by('measurement__instantpoint__activity__name',
+                                                             'measurement__instantpoint__timevalue'
+                                                  ).values_list('measurement__instantpoint__timevalue',
+                                                                'lon', 'lat', 'depth', *ATTITUDE_NAMES)),
+                        dtype=object)
+        if not len(rows):
+            return
+
+        # time_by_plat is in Unix epoch milliseconds
+        self.time_by_plat[platform.name] = np.array(rows[:, 0].tolist(), dtype='datetime64[ms]').astype(np.int64)
+        columns = np.array(rows[:, 1:].tolist(), dtype=np.float64)
+        self.lon_by_plat[platform.name], self.lat_by_plat[platform.name], self.depth_by_plat[platform.name] = columns[:, :3].T
+        for name, values in zip(ATTITUDE_NAMES, columns[:, 3:].T):
+            by_plat = getattr(self, f'{name}_by_plat')
+            if name.startswith('rot_') and np.isnan(values).all():
+                # Platforms without the ROT_* Parameters don't have an axis of rotation to draw
+                continue
+            by_plat[platform.name] = values
 
     def compute_rot_axis(self):
         '''If platform has roll, pitch, and yaw convert those data to a quaternion
@@ -303,13 +303,11 @@ class PlatformAnimation(object):
         for p, r in list(time_ranges.items()):
             if r.start < min_start_time:
                 min_start_time = r.start
-                st_ems = int((time.mktime(min_start_time.timetuple()) + 
-                                min_start_time.microsecond / 1.e6) * 1000.0)
+                st_ems = int(self.time_by_plat[p.name][0])
                 earliest_platform = p
             if r.end > max_end_time:
                 max_end_time = r.end
-                et_ems = int((time.mktime(max_end_time.timetuple()) + 
-                                max_end_time.microsecond / 1.e6) * 1000.0)
+                et_ems = int(self.time_by_plat[p.name][-1])
 
         # Build X3D and assemble
         for p, r in list(time_ranges.items()):
@@ -340,111 +338,77 @@ class PlatformAnimation(object):
                              platforms_not_shown=platforms_not_shown, message=error_msg)
 
     def _deg2rad(self, angle):
-        '''Given an angle in degrees return angle in radians
+        '''Given an array of angles in degrees return angles in radians, missing angles are 0
         '''
-        try:
-            return np.pi * angle / 180.0
-        except TypeError:
-            axis = [el for el in  traceback.format_stack() if '_deg2rad' in el
-                    ][0].split('_deg2rad(')[1].split(')')[0]
-            self.logger.warn("Bad %s angle: %s", axis, angle)
-            return 0.0
+        angle = np.asarray(angle, dtype=np.float64)
+        if np.isnan(angle).any():
+            self.logger.warn("Using 0 for %d missing angles", np.isnan(angle).sum())
+        return np.nan_to_num(np.pi * angle / 180.0)
 
     def _pitch_with_ve(self, angle, ve):
-        '''Given an angle in degrees return pitch angle in radians properly
+        '''Given an array of angles in degrees return pitch angles in radians properly
         adjusted for vertical exaggeration'''
+        radians = self._deg2rad(angle)
         if ve == 1:
-            return np.pi * angle / 180.0
+            return radians
         else:
             # Account for all 4 quadrants by using atan2()
-            x = math.cos(np.pi * angle / 180.0)
-            y = math.sin(np.pi * angle / 180.0)
+            return np.arctan2(np.sin(radians) * ve, np.cos(radians))
 
-            return math.atan2(y * ve, x)
-
-    def _append_animation_values(self, st_ems, et_ems, pName, lat, lon, depth, t, vert_ex, pitch, yaw, roll,
-                                 axis_x, axis_y, axis_z, angle):
-        '''Append formatted values to X3D text items. Give preference to angle_axis axis_x, axis_y, axis_z, angle)
-        over roll, pitch, and yaw. This is identified by axis_x, axis_y, axis_z, and angle being not None.
+    def _append_values(self, attr, columns, formats):
+        '''Append rows of columns formatted with formats to X3D text item attr, ending with a space
         '''
-        self.points += '%.6f %.6f %.1f ' % (lat, lon, -depth * vert_ex)
-        self.keys += '%.4f ' % ((t - st_ems) / float(et_ems - st_ems))
+        if len(columns[0]):
+            setattr(self, attr, getattr(self, attr) + format_rows(columns, formats) + ' ')
 
-        if axis_x is not None and axis_y is not None and axis_z is not None and angle is not None:
-            if vert_ex != 1:
-                self.logger.warn('angle_axis orientation does not allow for vertical exaggeration')
-            self.aaRotValues += self.aaRotFmt.format(axis_x, axis_y, axis_z, angle)
-        else:
-            # Apply vertical exaggeration to pitch angle
-            self.xRotValues += self.xRotFmt.format(self._pitch_with_ve(pitch, vert_ex))
-            self.yRotValues += self.yRotFmt.format(self._deg2rad(yaw))
-            self.zRotValues += self.zRotFmt.format(self._deg2rad(roll))
+    def _by_plat_array(self, by_plat, pName, count):
+        '''Return float array of count values of pName from by_plat dictionary, NaN where values are missing
+        '''
+        values = np.full(count, np.nan)
+        plat_values = np.array(by_plat.get(pName, [])[:count], dtype=np.float64)
+        values[:len(plat_values)] = plat_values
+        return values
 
     def _fill_values(self, st_ems, et_ems, pName, vert_ex, pad_beginning=False):
-        '''Fill values for animating orientation and optionally the axis of rotation
+        '''Fill values for animating orientation and optionally the axis of rotation. Give preference to
+        angle_axis (axis_x, axis_y, axis_z, angle) over roll, pitch, and yaw where all of the angle_axis values
+        are present.  With pad_beginning fill values of the first position at st_ems and its time.
         '''
+        count = len(self.time_by_plat[pName])
         if pad_beginning:
-            for t in (st_ems, self.time_by_plat[pName][0]):
-                lon = self.lon_by_plat[pName][0] 
-                lat = self.lat_by_plat[pName][0] 
-                depth = self.depth_by_plat[pName][0]
-                pitch = self.pitch_by_plat[pName][0]
-                yaw = self.yaw_by_plat[pName][0]
-                roll = self.roll_by_plat[pName][0]
-                try:
-                    axis_x = self.axis_x_by_plat[pName][0]
-                except IndexError:
-                    axis_x = None
-                try:
-                    axis_y = self.axis_y_by_plat[pName][0]
-                except IndexError:
-                    axis_y = None
-                try:
-                    axis_z = self.axis_z_by_plat[pName][0]
-                except IndexError:
-                    axis_z = None
-                try:
-                    angle = self.angle_by_plat[pName][0]
-                except IndexError:
-                    angle = None
-
-                self._append_animation_values(st_ems, et_ems, pName, lat, lon, depth, t, vert_ex,
-                                              pitch, yaw, roll, axis_x, axis_y, axis_z, angle)
-
+            rows = np.zeros(2, dtype=int)
+            times = np.array([st_ems, self.time_by_plat[pName][0]], dtype=np.float64)
         else:
-            for (lon, lat, depth, t, pitch, yaw, roll, 
-                 axis_x, axis_y, axis_z, angle) in zip_longest(
-                                                    self.lon_by_plat[pName], 
-                                                    self.lat_by_plat[pName], 
-                                                    self.depth_by_plat[pName],
-                                                    self.time_by_plat[pName],
-                                                    self.pitch_by_plat[pName],
-                                                    self.yaw_by_plat[pName],
-                                                    self.roll_by_plat[pName],
-                                                    self.axis_x_by_plat[pName],
-                                                    self.axis_y_by_plat[pName],
-                                                    self.axis_z_by_plat[pName],
-                                                    self.angle_by_plat[pName],
-                                                    fillvalue=None):
-
-                self._append_animation_values(st_ems, et_ems, pName, lat, lon, depth, t, vert_ex,
-                                              pitch, yaw, roll, axis_x, axis_y, axis_z, angle)
+            rows = np.arange(count)
+            times = np.array(self.time_by_plat[pName], dtype=np.float64)
+
+        lon, lat, depth, pitch, yaw, roll, axis_x, axis_y, axis_z, angle = (
+                self._by_plat_array(by_plat, pName, count)[rows] for by_plat in (
+                    self.lon_by_plat, self.lat_by_plat, self.depth_by_plat, self.pitch_by_plat,
+                    self.yaw_by_plat, self.roll_by_plat, self.axis_x_by_plat, self.axis_y_by_plat,
+                    self.axis_z_by_plat, self.angle_by_plat))
+
+        self._append_values('points', (lat, lon, -depth * vert_ex), ('%.6f', '%.6f', '%.1f'))
+        self._append_values('keys', ((times - st_ems) / float(et_ems - st_ems),), ('%.4f',))
+
+        aa = ~(np.isnan(axis_x) | np.isnan(axis_y) | np.isnan(axis_z) | np.isnan(angle))
+        if aa.any():
+            if vert_ex != 1:
+                self.logger.warn('angle_axis orientation does not allow for vertical exaggeration')
+            self._append_values('aaRotValues', (axis_x[aa], axis_y[aa], axis_z[aa], angle[aa]),
+                                self.aaRotFmt)
+        if not aa.all():
+            # Apply vertical exaggeration to pitch angle
+            self._append_values('xRotValues', (self._pitch_with_ve(pitch[~aa], vert_ex),), self.xRotFmt)
+            self._append_values('yRotValues', (self._deg2rad(yaw[~aa]),), self.yRotFmt)
+            self._append_values('zRotValues', (self._deg2rad(roll[~aa]),), self.zRotFmt)
 
         try:
             # Make negative direction of axis half the length of the positive end
-            if pad_beginning:
-                for t in (st_ems, self.time_by_plat[pName][0]):
-                    a_x = self.af * self.rot_x_by_plat[pName][0]
-                    a_y = self.af * self.rot_y_by_plat[pName][0]
-                    a_z = self.af * self.rot_z_by_plat[pName][0]
-                    self.axisValues += self.axisValuesFmt.format(-.5 * a_x, -.5 * a_y, -.5 * a_z, a_x, a_y, a_z)
-            else:
-                for a_x, a_y, a_z in zip(self.rot_x_by_plat[pName], self.rot_y_by_plat[pName], 
-                                          self.rot_z_by_plat[pName]):
-                    a_x *= self.af
-                    a_y *= self.af
-                    a_z *= self.af
-                    self.axisValues += self.axisValuesFmt.format(-.5 * a_x, -.5 * a_y, -.5 * a_z, a_x, a_y, a_z)
+            count = min(len(self.rot_x_by_plat[pName]), len(self.rot_y_by_plat[pName]), len(self.rot_z_by_plat[pName]))
+            axes = [self.af * np.array(by_plat[pName][:count], dtype=np.float64)[rows[rows < count]]
+                    for by_plat in (self.rot_x_by_plat, self.rot_y_by_plat, self.rot_z_by_plat)]
+            self._append_values('axisValues', [-.5 * a for a in axes] + axes, self.axisValuesFmt)
         except KeyError:
             # Likely no AXIS_* variables for this platform
             pass
@@ -5,6 +5,7 @@ with all of the Matplotlib customization required for nice looking graphics.
 
 import os
 import tempfile
+from itertools import islice
 # Setup Matplotlib for running on the server
 os.environ['MPLCONFIGDIR'] = tempfile.mkdtemp()
 import matplotlib as mpl
@@ -14,7 +15,6 @@ import math
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 from matplotlib import rcParams
-from scipy.interpolate import griddata
 from scipy.stats import ttest_ind
 from matplotlib.colors import hex2color, LogNorm
 from operator import itemgetter
@@ -25,6 +25,9 @@ from django.db import connections, DatabaseError, transaction
 from datetime import datetime
 from stoqs import models
 from utils.utils import pearsonr, round_to_n, EPOCH_STRING
+from utils.downsample import METHODS as DOWNSAMPLE_METHODS
+from utils import gridding, optionscache
+from utils.Viz import x3d
 from loaders.SampleLoaders import SAMPLED, NETTOW, VERTICALNETTOW, PLANKTONPUMP, ESP_FILTERING
 from loaders import MEASUREDINSITU, X3DPLATFORMMODEL, X3D_MODEL, X3D_MODEL_SCALEFACTOR
 import seawater.eos80 as sw
@@ -41,7 +44,12 @@ import warnings
 logger = logging.getLogger(__name__)
 
 MP_MAX_POINTS = 10000          # Set by visually examing high-res Tethys data for what looks good
+MP_MIN_POINTS_PER_ACTIVITY = 500
 PA_MAX_POINTS = 10000000       # Set to avoid memory error on development system
+PLOT_DATA_BATCH = 10000        # Number of rows read from the database cursor at a time into PlotData
+PP_MAX_POINTS = 50000          # About what Matplotlib can plot in a Parameter-Parameter plot
+PP_CACHE_MAX_ROWS = 200000     # Parameter-Parameter data with more rows than this are not cached
+PP_DATA_OPTION = 'parameterparameterdata'   # Name of the Parameter-Parameter data in utils/optionscache.py
 
 cmocean_lookup = {  'sea_water_temperature':                                'thermal',
                     'sea_water_salinity':                                   'haline',
@@ -211,6 +219,66 @@ class BaseParameter(object):
             raise Exception("Only 'horizontal' orientation is supported")
 
 
+class PlotData(object):
+    '''
+    Time (x), depth (y), datavalue (z), lon and lat of data values for plotting, kept in a numpy structured
+    array with the index of the Activity of each value.  The array grows by doubling, reserve() allocates
+    it for an expected number of values.  The columns are views of the array and by_activity() returns
+    views of the values of each Activity in the array sorted by Activity.
+    '''
+    dtype = np.dtype([('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('lon', 'f8'), ('lat', 'f8'), ('activity', 'i4')])
+
+    def __init__(self, capacity=0):
+        self.rows = np.empty(capacity, dtype=self.dtype)
+        self.size = 0
+        self.activity_names = []
+        self._activity_index = {}
+        self._by_activity = None
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, capacity):
+        if capacity > len(self.rows):
+            rows = np.empty(capacity, dtype=self.dtype)
+            rows[:self.size] = self.rows[:self.size]
+            self.rows = rows
+
+    def append(self, x, y, z, lon, lat, activity_names):
+        '''
+        Append the values in the equal length sequences, None values become NaN
+        '''
+        count = len(x)
+        if self.size + count > len(self.rows):
+            self.reserve(max(2 * len(self.rows), self.size + count))
+
+        block = self.rows[self.size:self.size + count]
+        for name, values in (('x', x), ('y', y), ('z', z), ('lon', lon), ('lat', lat)):
+            block[name] = np.array(values, dtype=np.float64)
+        block['activity'] = [self._activity_index.setdefault(a, len(self._activity_index)) for a in activity_names]
+        if len(self._activity_index) > len(self.activity_names):
+            self.activity_names = sorted(self._activity_index, key=self._activity_index.get)
+
+        self.size += count
+        self._by_activity = None
+
+    def column(self, name):
+        return self.rows[name][:self.size]
+
+    def by_activity(self, name):
+        '''
+        Return dictionary of Activity name: view of the values of column name of the Activity, in the order they were appended
+        '''
+        if self._by_activity is None:
+            rows = self.rows[:self.size]
+            rows = rows[np.argsort(rows['activity'], kind='stable')]
+            bounds = np.searchsorted(rows['activity'], np.arange(len(self.activity_names) + 1))
+            self._by_activity = (rows, bounds)
+
+        rows, bounds = self._by_activity
+        return {a: rows[name][bounds[i]:bounds[i + 1]] for i, a in enumerate(self.activity_names)}
+
+
 class MeasuredParameter(BaseParameter):
     '''
     Use matploptib to create nice looking contour plots
@@ -266,13 +334,7 @@ class MeasuredParameter(BaseParameter):
             self.colorbarPngFileFullPath = os.path.join(settings.MEDIA_ROOT, 'sections', self.colorbarPngFile)
         else:
             self.colorbarPngFileFullPath = ''
-        self.x = []
-        self.y = []
-        self.z = []
-        self.lat = []
-        self.lon = []
-        self.depth = []
-        self.value = []
+        self.data = PlotData()
 
         self.xspan = []
         self.yspan = []
@@ -281,77 +343,86 @@ class MeasuredParameter(BaseParameter):
         self.lonspan = []
         self.depthspan = []
 
-    def _fillXYZ(self, mp, sampled=False, spanned=False, activitytype=None):
+    # Columns of the data values read by loadData(), depth and value are the same as y and z
+    x = property(lambda self: self.data.column('x'))
+    y = property(lambda self: self.data.column('y'))
+    z = property(lambda self: self.data.column('z'))
+    lon = property(lambda self: self.data.column('lon'))
+    lat = property(lambda self: self.data.column('lat'))
+    depth = y
+    value = z
+
+    def _fillXYZ(self, mps, sampled=False):
+        '''
+        Append the time (x), depth (y), datavalue (z), lon and lat of measured (default) or sampled data value rows
+        to self.data, PLOT_DATA_BATCH rows at a time
         '''
-        Fill up the x, y, and z member lists for measured (default) or sampled data values. 
-        If spanned is True then fill xspan, yspan, and zspan member lists with NetTow like data.
+        prefix = 'sample' if sampled else 'measurement'
+        mps = iter(mps)
+        while True:
+            batch = list(islice(mps, PLOT_DATA_BATCH))
+            if not batch:
+                return
+
+            x = np.array([mp[f'{prefix}__instantpoint__timevalue'].timestamp() for mp in batch])
+            if self.scale_factor:
+                x = x / self.scale_factor
+            geoms = [mp.get(f'{prefix}__geom') for mp in batch]
+            self.data.append(x, [mp[f'{prefix}__depth'] for mp in batch], [mp['datavalue'] for mp in batch],
+                             [g.x if g else np.nan for g in geoms], [g.y if g else np.nan for g in geoms],
+                             [mp[f'{prefix}__instantpoint__activity__name'] for mp in batch])
+            self.logger.debug('Appended %i values to self.data', len(self.data))
+
+    def _fillSpan(self, mp, activitytype=None):
+        '''
+        Fill xspan, yspan, and zspan member lists with NetTow like sampled data values
         '''
-        if sampled:
+        if activitytype == VERTICALNETTOW:
+            # Save a (start, end) tuple for each coordinate/value, VERTICALNETTOWs start at maxdepth
             if self.scale_factor:
-                self.x.append(mp['sample__instantpoint__timevalue'].timestamp() / self.scale_factor)
+                self.xspan.append(
+                        (mp['sample__instantpoint__activity__startdate'].timestamp() / self.scale_factor,
+                         mp['sample__instantpoint__activity__enddate'].timestamp() / self.scale_factor)
+                                 )
             else:
-                self.x.append(mp['sample__instantpoint__timevalue'].timestamp())
-            self.y.append(mp['sample__depth'])
-            self.depth_by_act.setdefault(mp['sample__instantpoint__activity__name'], []).append(float(mp['sample__depth']))
-            self.z.append(mp['datavalue'])
-            self.value_by_act.setdefault(mp['sample__instantpoint__activity__name'], []).append(float(mp['datavalue']))
+                self.xspan.append(
+                        (mp['sample__instantpoint__activity__startdate'].timestamp(),
+                         mp['sample__instantpoint__activity__enddate'].timestamp())
+                                 )
+            self.yspan.append(
+                    (mp['sample__instantpoint__activity__maxdepth'],
+                     mp['sample__instantpoint__activity__mindepth'])
+                             )
+            self.depth_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(
+                    (mp['sample__instantpoint__activity__maxdepth'],
+                     mp['sample__instantpoint__activity__mindepth'])
+                             )
+            self.zspan.append(float(mp['datavalue']))
+            self.value_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(float(mp['datavalue']))
 
             if 'sample__geom' in list(mp.keys()):
-                self.lon.append(mp['sample__geom'].x)
-                self.lon_by_act.setdefault(mp['sample__instantpoint__activity__name'], []).append(mp['sample__geom'].x)
-                self.lat.append(mp['sample__geom'].y)
-                self.lat_by_act.setdefault(mp['sample__instantpoint__activity__name'], []).append(mp['sample__geom'].y)
+                # Implemented for VERTICALNETTOW data where start and end geom are identical
+                self.lonspan.append((mp['sample__geom'].x, mp['sample__geom'].x))
+                self.lon_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(
+                        (mp['sample__geom'].x, mp['sample__geom'].x))
+                self.latspan.append((mp['sample__geom'].y, mp['sample__geom'].y))
+                self.lat_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(
+                        (mp['sample__geom'].y, mp['sample__geom'].y))
+
+        # TODO: Implement for other types of spanned data, e.g. use Activity.maptrack to 
+        # get start and end geom for other Horizontal or Oblique NetTows
+
+    def _downsample_method(self):
+        '''Return downsampling method requested with the downsample_method parameter, None if not requested
+        '''
+        if hasattr(self.request, 'GET') and self.request.GET.get('downsample_method') in DOWNSAMPLE_METHODS:
+            return self.request.GET.get('downsample_method')
 
-            if spanned and activitytype == VERTICALNETTOW:
-                # Save a (start, end) tuple for each coordinate/value, VERTICALNETTOWs start at maxdepth
-                if self.scale_factor:
-                    self.xspan.append(
-                            (mp['sample__instantpoint__activity__startdate'].timestamp() / self.scale_factor,
-                             mp['sample__instantpoint__activity__enddate'].timestamp() / self.scale_factor)
-                                     )
-                else:
-                    self.xspan.append(
-                            (mp['sample__instantpoint__activity__startdate'].timestamp(),
-                             mp['sample__instantpoint__activity__enddate'].timestamp())
-                                     )
-                self.yspan.append(
-                        (mp['sample__instantpoint__activity__maxdepth'],
-                         mp['sample__instantpoint__activity__mindepth'])
-                                 )
-                self.depth_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(
-                        (mp['sample__instantpoint__activity__maxdepth'],
-                         mp['sample__instantpoint__activity__mindepth'])
-                                 )
-                self.zspan.append(float(mp['datavalue']))
-                self.value_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(float(mp['datavalue']))
-
-                if 'sample__geom' in list(mp.keys()):
-                    # Implemented for VERTICALNETTOW data where start and end geom are identical
-                    self.lonspan.append((mp['sample__geom'].x, mp['sample__geom'].x))
-                    self.lon_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(
-                            (mp['sample__geom'].x, mp['sample__geom'].x))
-                    self.latspan.append((mp['sample__geom'].y, mp['sample__geom'].y))
-                    self.lat_by_act_span.setdefault(mp['sample__instantpoint__activity__name'], []).append(
-                            (mp['sample__geom'].y, mp['sample__geom'].y))
-
-            # TODO: Implement for other types of spanned data, e.g. use Activity.maptrack to 
-            # get start and end geom for other Horizontal or Oblique NetTows
-                
-        else:
-            if self.scale_factor:
-                self.x.append(mp['measurement__instantpoint__timevalue'].timestamp() / self.scale_factor)
-            else:
-                self.x.append(mp['measurement__instantpoint__timevalue'].timestamp())
-            self.y.append(mp['measurement__depth'])
-            self.depth_by_act.setdefault(mp['measurement__instantpoint__activity__name'], []).append(mp['measurement__depth'])
-            self.z.append(mp['datavalue'])
-            self.value_by_act.setdefault(mp['measurement__instantpoint__activity__name'], []).append(mp['datavalue'])
-        
-            if 'measurement__geom' in list(mp.keys()):
-                self.lon.append(mp['measurement__geom'].x)
-                self.lon_by_act.setdefault(mp['measurement__instantpoint__activity__name'], []).append(mp['measurement__geom'].x)
-                self.lat.append(mp['measurement__geom'].y)
-                self.lat_by_act.setdefault(mp['measurement__instantpoint__activity__name'], []).append(mp['measurement__geom'].y)
+    def _gridding_method(self):
+        '''Return gridding method requested with the gridding_method parameter, None for the default for the number of points
+        '''
+        if hasattr(self.request, 'GET') and self.request.GET.get('gridding_method') in gridding.METHODS:
+            return self.request.GET.get('gridding_method')
 
     def loadData(self, qs_mp):
         '''
@@ -359,18 +430,13 @@ class MeasuredParameter(BaseParameter):
         '''
         self.logger.debug('type(qs_mp) = %s', type(qs_mp))
 
-        # Save to '_by_act' dictionaries so that X3D can end each IndexedLinestring with a '-1'
-        self.depth_by_act = {}
-        self.value_by_act = {}
-        self.lon_by_act = {}
-        self.lat_by_act = {}
-
         self.depth_by_act_span = {}
         self.value_by_act_span = {}
         self.lon_by_act_span = {}
         self.lat_by_act_span = {}
 
-        stride = int(qs_mp.count() / MP_MAX_POINTS)
+        count = qs_mp.count()
+        stride = int(count / MP_MAX_POINTS)
         if stride < 1:
             stride = 1
         self.strideInfo = ''
@@ -379,43 +445,40 @@ class MeasuredParameter(BaseParameter):
 
         self.logger.debug('qs_mp.query = %s', str(qs_mp.query))
         if SAMPLED in self.parameterGroups:
-            for i, mp in enumerate(qs_mp):
-                self._fillXYZ(mp, sampled=True)
-                if (i % 10) == 0:
-                    self.logger.debug('Appended %i samples to self.x, self.y, and self.z', i)
+            self.data.reserve(count)
+            self._fillXYZ(qs_mp, sampled=True)
 
             # Build span data members for VERTICALNETTOW activity types
             # TODO: Implement other types as they are needed
             qs = qs_mp.filter(sample__instantpoint__activity__activitytype__name__contains=VERTICALNETTOW)
             for i,mp in enumerate(qs):
-                self._fillXYZ(mp, sampled=True, spanned=True, activitytype=VERTICALNETTOW)
+                self._fillXYZ([mp], sampled=True)
+                self._fillSpan(mp, activitytype=VERTICALNETTOW)
                 if (i % 10) == 0:
                     self.logger.debug('Appended %i samples to self.xspan, self.yspan, and self.zspan', i)
+        elif self._downsample_method() and hasattr(qs_mp, 'downsample'):
+            # Opt-in selection of the points that best represent the data instead of every stride-th one
+            npoints = max(MP_MAX_POINTS // max(self.qs.count(), 1), MP_MIN_POINTS_PER_ACTIVITY)
+            self.logger.debug('Reading data downsampled to %d points per Activity with method %s',
+                              npoints, self._downsample_method())
+            self.strideInfo = '%s downsampled' % self._downsample_method() if stride != 1 else ''
+            self._fillXYZ(qs_mp.downsample(npoints, self._downsample_method()))
         else:
             self.logger.debug('Reading data with a stride of %s', stride)
+            self.data.reserve(count // stride + 1)
             if qs_mp.isRawQuerySet:
                 # RawQuerySet does not support normal slicing
-                i = 0
                 self.logger.debug('Slicing with mod division on a counter...')
-                for counter, mp in enumerate(qs_mp):
-                    if counter == 0:
-                        self.logger.debug('Starting to call _fillXYZ()')
-                    if counter % stride == 0:
-                        self._fillXYZ(mp)
-                        i = i + 1
-                        if (i % 1000) == 0:
-                            self.logger.debug('Appended %i measurements to self.x, self.y, and self.z', i)
+                self._fillXYZ(islice(qs_mp, 0, None, stride))
             else:
                 self.logger.debug('Slicing Pythonicly...')
-                for i, mp in enumerate(qs_mp[::stride]):
-                    if 1 == 0:
-                        self.logger.debug('Starting to call _fillXYZ()')
-                    self._fillXYZ(mp)
-                    if (i % 1000) == 0:
-                        self.logger.debug('Appended %i measurements to self.x, self.y, and self.z', i)
+                self._fillXYZ(qs_mp[::stride])
 
-        self.depth = self.y
-        self.value = self.z
+        # Views of the values of each Activity so that X3D can end each IndexedLinestring with a '-1'
+        self.depth_by_act = self.data.by_activity('y')
+        self.value_by_act = self.data.by_activity('z')
+        self.lon_by_act = self.data.by_activity('lon')
+        self.lat_by_act = self.data.by_activity('lat')
 
     def _get_samples_for_markers(self, act_type_name=None, spanned=False, exclude_act_type_name=None):
         '''
@@ -545,7 +608,7 @@ class MeasuredParameter(BaseParameter):
             try:
                 self.logger.debug('Gridding data with self.sdt_count = %d, and self.y_count = %d', self.sdt_count, self.y_count)
                 # See https://scipy-cookbook.readthedocs.io/items/Matplotlib_Gridding_irregularly_spaced_data.html
-                zi = griddata((cx, cy), cz, (xi[None,:], yi[:,None]), method='cubic', rescale=True)
+                zi = gridding.grid(cx, cy, cz, xi, yi, method=self._gridding_method())
             except KeyError as e:
                 self.logger.exception('Got KeyError. Could not grid the data')
                 return None, None, 'Got KeyError. Could not grid the data', self.cm_name, cmocean_lookup_str, self.standard_name
@@ -636,7 +699,7 @@ class MeasuredParameter(BaseParameter):
                     ax.plot(xs, ys, c='k', lw=1, alpha=0.5)
 
             if self.contourParameterID is not None:
-                zli = griddata((clx, cly), clz, (xi[None,:], yi[:,None]), method='cubic', rescale=True)
+                zli = gridding.grid(clx, cly, clz, xi, yi, method=self._gridding_method())
                 CS = ax.contour(xi, yi, zli, colors='white')
                 ax.clabel(CS, fontsize=9, inline=1)
 
@@ -758,41 +821,39 @@ class MeasuredParameter(BaseParameter):
                 self.logger.debug('self.scale_factor = %f', self.scale_factor)
                 xi = xi / self.scale_factor
 
-            if not self.x and not self.y and not self.z and self.qs_mp is not None:
+            if not len(self.data) and self.qs_mp is not None:
                 self.loadData(self.qs_mp)
 
-            # Copy x, y, z values for color plot (scatter or "contour")
-            cx = list(self.x)
-            cy = list(self.y)
-            cz = list(self.z)
+            # x, y, z values for color plot (scatter or "contour")
+            cx = self.x
+            cy = self.y
+            cz = self.z
             self.logger.debug('Number of cx, cy, cz data values retrieved from database = %d', len(cz)) 
 
             clx = []
             cly = []
             clz = []
             if self.contourParameterID is not None:
-                self.x = []
-                self.y = []
-                self.z = []
+                self.data = PlotData()
                 self.loadData(self.contour_qs_mp)
-                # Copy x, y, z values for contour line plot
-                clx = list(self.x)
-                cly = list(self.y)
-                clz = list(self.z)
+                # x, y, z values for contour line plot
+                clx = self.x
+                cly = self.y
+                clz = self.z
                 self.logger.debug('Number of clx, cly, clz data values retrieved from database = %d', len(clz)) 
 
             if not forFlot:
                 # Serves to clip the rendered image to the limits of data, as needed for X3D curtains
                 # Operate only on Plot Data Color selections 
                 # Continue onto _make_image() if no cx or cy data, there may be clx, cly
-                if cx:
+                if len(cx):
                     if self.scale_factor:
                         tmin = cx[0] * self.scale_factor
                         tmax = cx[-1] * self.scale_factor
                     else:
                         tmin = cx[0]
                         tmax = cx[-1]
-                if cy:
+                if len(cy):
                     dmin = np.min(cy)
                     dmax = np.max(cy)
 
@@ -816,65 +877,69 @@ class MeasuredParameter(BaseParameter):
         # time_array is something like self.x with a scale_factor as applied for contour plotting
         if not self.scale_factor:
             self.scale_factor = 1
-        slice_esecs = [time_array[0] * self.scale_factor]
+        esecs = np.asarray(time_array, dtype=np.float64) * self.scale_factor
         slice_indices = [0]
-        prev_esec = time_array[0] * self.scale_factor
-        for index, x in enumerate(time_array):
-            if x * self.scale_factor > prev_esec + slice_minutes * 60:
-                slice_esecs.append(x * self.scale_factor)
-                slice_indices.append(index)
-                prev_esec = x * self.scale_factor
+        if np.all(esecs[1:] >= esecs[:-1]):
+            # Sorted times: jump to the first time past each interval instead of stepping through every one
+            index = np.searchsorted(esecs, esecs[0] + slice_minutes * 60, side='right')
+            while index < len(esecs):
+                slice_indices.append(int(index))
+                index = np.searchsorted(esecs, esecs[index] + slice_minutes * 60, side='right')
+        else:
+            prev_esec = esecs[0]
+            for index, esec in enumerate(esecs):
+                if esec > prev_esec + slice_minutes * 60:
+                    slice_indices.append(index)
+                    prev_esec = esec
 
-        slice_indices.append(len(time_array) - 1)
-        slice_esecs.append(time_array[-1] * self.scale_factor)
+        slice_indices.append(len(esecs) - 1)
+        slice_esecs = esecs[slice_indices].tolist()
 
         return slice_indices, slice_esecs
 
-    def _get_ils(self, act, istart, iend, vert_ex, lon_attr, lat_attr, depth_attr, value_attr):
+    def _x3d_binary(self):
+        '''Return True if base64 Float32Array geometry is requested with the x3d_binary parameter
+        '''
+        return hasattr(self.request, 'GET') and bool(self.request.GET.get('x3d_binary'))
 
-        lon_sliced = getattr(self, lon_attr)[act][istart:iend]
-        lat_sliced = getattr(self, lat_attr)[act][istart:iend]
-        depth_sliced = getattr(self, depth_attr)[act][istart:iend]
-        value_sliced = getattr(self, value_attr)[act][istart:iend]
+    def _get_ils(self, act, istart, iend, vert_ex, lon_attr, lat_attr, depth_attr, value_attr):
+        '''Return points, colors, and indices strings of an IndexedLineSet of the values of act from istart to iend,
+        and the points and colors as base64 Float32Arrays if requested with x3d_binary.  Values of the _span
+        attributes are (start, end) pairs that are drawn as separate line segments.
+        '''
+        lons = np.asarray(getattr(self, lon_attr)[act][istart:iend], dtype=np.float64)
+        lats = np.asarray(getattr(self, lat_attr)[act][istart:iend], dtype=np.float64)
+        depths = np.asarray(getattr(self, depth_attr)[act][istart:iend], dtype=np.float64)
+        values = np.asarray(getattr(self, value_attr)[act][istart:iend], dtype=np.float64)
 
-        points = ''
-        colors = ''
-        indices = ''
-        index = 0
-        for lon, lat, depth, value in zip(lon_sliced, lat_sliced, depth_sliced, value_sliced):
-            try:
-                cindx = int(round((value - float(self.pMinMax[1])) * (len(self.clt) - 1) / 
-                                  (float(self.pMinMax[2]) - float(self.pMinMax[1]))))
-            except ValueError as e:
-                # Likely: 'cannot convert float NaN to integer' as happens when rendering something like altitude outside of terrain coverage
-                continue
-            except ZeroDivisionError as e:
-                logger.error("Can't make color lookup table with min and max being the same, self.pMinMax = %s", self.pMinMax)
-                raise e
-
-            if cindx < 0:
-                cindx = 0
-            if cindx > len(self.clt) - 1:
-                cindx = len(self.clt) - 1
-
-            if lon_attr.endswith('_span'):
-                points = points + '%.5f %.5f %.1f %.5f %.5f %.1f ' % (lats[0], lons[0],
-                        -depths[0] * vert_ex, lats[1], lons[1], -depths[1] * vert_ex)
-                colors = colors + '%.3f %.3f %.3f %.3f %.3f %.3f ' % (self.clt[cindx][0], self.clt[cindx][1], self.clt[cindx][2],
-                                                                      self.clt[cindx][0], self.clt[cindx][1], self.clt[cindx][2])
-                indices = indices + '%i %i ' % (index, index + 1)
-                index = index + 2
-            else:
-                points = points + '%.5f %.5f %.1f ' % (lat, lon, -depth * vert_ex)
-                colors = colors + '%.3f %.3f %.3f ' % (self.clt[cindx][0], self.clt[cindx][1], self.clt[cindx][2])
-                indices = indices + '%i ' % index
-                index = index + 1
+        try:
+            cindices = x3d.color_indices(values, self.pMinMax[1], self.pMinMax[2], len(self.clt))
+        except ZeroDivisionError as e:
+            logger.error("Can't make color lookup table with min and max being the same, self.pMinMax = %s", self.pMinMax)
+            raise e
+
+        # Skip NaN values as happens when rendering something like altitude outside of terrain coverage
+        valid = cindices >= 0
+        lons, lats, depths, cindices = lons[valid], lats[valid], depths[valid], cindices[valid]
+
+        if lon_attr.endswith('_span'):
+            # Interleave the start and end points of each value, each pair a line segment of one color
+            lons, lats, depths = lons.reshape(-1), lats.reshape(-1), depths.reshape(-1)
+            cindices = np.repeat(cindices, 2)
+            indices = ' '.join('%i %i -1' % (i, i + 1) for i in range(0, len(cindices), 2))
+        else:
+            # End the IndexedLinestring with -1 so that end point does not connect to the beg point
+            indices = x3d.format_indices(len(cindices))
 
-        # End the IndexedLinestring with -1 so that end point does not 
-        # connect to the beg point, end with space for multiple activities
-        indices = indices + '-1 ' 
+        columns = (lats, lons, -depths * vert_ex)
+        ils = {'points': x3d.format_rows(columns, ('%.5f', '%.5f', '%.1f')),
+               'colors': x3d.format_colors(self.clt, cindices),
+               'index': indices}
+        if self._x3d_binary():
+            ils['points_b64'] = x3d.float32_base64(columns)
+            ils['colors_b64'] = x3d.float32_base64(np.asarray(self.clt, dtype=np.float64)[cindices, :3].T)
 
-        return points, colors, indices
+        return ils
 
     def dataValuesX3D(self, platform_name, vert_ex=10.0, slice_minutes=10):
         '''
@@ -884,7 +949,7 @@ class MeasuredParameter(BaseParameter):
         x3d_results = {}
         shape_id_dict = {}
         logger.debug("Building X3D data values with vert_ex = %f", vert_ex)
-        if not self.lon and not self.lat and not self.depth and not self.value:
+        if not len(self.data):
             self.logger.debug('Calling self.loadData()...')
             self.loadData(self.qs_mp)
         try:
@@ -900,9 +965,8 @@ class MeasuredParameter(BaseParameter):
                     iendp1 = iend + 1
                     if iendp1 > len(self.lon_by_act[act]) - 1:
                         iendp1 = iend
-                    points, colors, indices = self._get_ils(act, istart, iendp1, vert_ex, 
-                                                            'lon_by_act', 'lat_by_act', 'depth_by_act', 'value_by_act')
-                    x3d_results[shape_id] = {'colors': colors.rstrip(), 'points': points.rstrip(), 'index': indices.rstrip()}
+                    x3d_results[shape_id] = self._get_ils(act, istart, iendp1, vert_ex,
+                                                          'lon_by_act', 'lat_by_act', 'depth_by_act', 'value_by_act')
 
             # Make pairs of points for spanned NetTow-like data
             for act in list(self.value_by_act_span.keys()):
@@ -912,9 +976,8 @@ class MeasuredParameter(BaseParameter):
                 # TODO: test and fix getting start time for _span data
                 shape_id = f"ils_{platform_name}_{int(end_esecs)}_span"
                 shape_id_dict[int(end_esecs)] = [shape_id]
-                points, colors, indices = self._get_ils(act, istart, iend, vert_ex, 
-                                                        'lon_by_act_span', 'lat_by_act_span', 'depth_by_act_span', 'value_by_act_span')
-                x3d_results[shape_id] = {'colors': colors.rstrip(), 'points': points.rstrip(), 'index': indices.rstrip()}
+                x3d_results[shape_id] = self._get_ils(act, istart, iend, vert_ex,
+                                                      'lon_by_act_span', 'lat_by_act_span', 'depth_by_act_span', 'value_by_act_span')
 
         except Exception as e:
             self.logger.exception('Could not create measuredparameterx3d: %s', e)
@@ -974,11 +1037,10 @@ class MeasuredParameter(BaseParameter):
             # Make counter-clockwise planar slices at slice_minutes values along the geometry
             # Construct the geometry according to the 4 edges of the image: time moves left to right in image
             # Bottom; lon, lat in order; Top: lon, lat in reverse order - indices: 0 to len(lon_sliced) * 2
-            points = ''
-            points += '{:.5f} {:.5f} {:.1f} '.format(self.lat[sindex], self.lon[sindex], -self.dmax * vert_ex)
-            points += '{:.5f} {:.5f} {:.1f} '.format(self.lat[eindex], self.lon[eindex], -self.dmax * vert_ex)
-            points += '{:.5f} {:.5f} {:.1f} '.format(self.lat[eindex], self.lon[eindex], -self.dmin * vert_ex)
-            points += '{:.5f} {:.5f} {:.1f} '.format(self.lat[sindex], self.lon[sindex], -self.dmin * vert_ex)
+            corners = [sindex, eindex, eindex, sindex]
+            points = x3d.format_rows((self.lat[corners], self.lon[corners],
+                                      np.array([-self.dmax, -self.dmax, -self.dmin, -self.dmin]) * vert_ex),
+                                     ('%.5f', '%.5f', '%.1f'))
            
             indices = '0 1 2 3 ' 
             ifs_cindex = ifs_tcindex = indices + '-1'
@@ -1112,40 +1174,115 @@ class ParameterParameter(BaseParameter):
         self.logger.debug('csql = %s', csql)
         return csql
 
+    def _getStridedSQL(self, sql, stride_val):
+        '''
+        Modify Parameter-Parameter SQL so that the database returns only every stride_val-th row, the row
+        number is added as the last column
+        '''
+        if stride_val == 1:
+            return sql
+
+        return ('SELECT * FROM (SELECT pp_rows.*, row_number() OVER () AS pp_row FROM ({}) AS pp_rows) AS pp_numbered '
+                'WHERE mod(pp_row - 1, {:d}) = 0').format(sql, stride_val)
+
+    def _fetchRows(self, sql):
+        '''
+        Return 2-D float array of the rows of sql read PLOT_DATA_BATCH rows at a time from a server-side cursor,
+        without rows that have NULL values - SampledParameter datavalues are Decimal, everything is a float for numpy
+        '''
+        chunks = [np.empty((0, 0))]
+        with connections[self.request.META['dbAlias']].chunked_cursor() as cursor:
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(PLOT_DATA_BATCH)
+                if not rows:
+                    break
+                chunks.append(np.array(rows, dtype=np.float64))
+
+        if len(chunks) == 1:
+            return chunks[0]
+        rows = np.concatenate(chunks[1:])
+
+        return rows[~np.isnan(rows).any(axis=1)]
+
+    def _getRows(self, sql, strideFlag, count_sql=None, sample_sql=None):
+        '''
+        Return (stride_val, pp_count, rows, sample_rows) for Parameter-Parameter sql, striding through the
+        rows in the database to return about PP_MAX_POINTS of them if strideFlag.  Results are cached by
+        database, load generation and the SQL, which has the Parameters and the selection in it.
+        '''
+        dbAlias = self.request.META['dbAlias']
+        generation = optionscache.load_generation(dbAlias)
+        selection = {'sql': sql, 'sample_sql': sample_sql, 'strideFlag': strideFlag}
+        found, result = optionscache.lookup(dbAlias, generation, PP_DATA_OPTION, selection, {})
+        if found:
+            self.logger.debug('Got %d Parameter-Parameter rows from cache', len(result[2]))
+            return result
+
+        # Get count and set a stride value if more than PP_MAX_POINTS which Matplotlib cannot plot
+        cursor = connections[dbAlias].cursor()
+        try:
+            cursor.execute(self._getCountSQL(count_sql or sql))
+        except DatabaseError as e:
+            infoText = 'Parameter-Parameter: Cannot get count. Make sure you have no Parameters selected in the Filter.'
+            self.logger.warn(e)
+            raise PPDatabaseException(infoText, sql)
+
+        pp_count = cursor.fetchone()[0]
+        self.logger.debug('pp_count = %d', pp_count)
+        stride_val = 1
+        if strideFlag:
+            stride_val = max(int(pp_count / PP_MAX_POINTS), 1)
+            self.logger.debug('stride_val = %d', stride_val)
+
+        # Get the Parameter-Parameter points
+        try:
+            strided_sql = self._getStridedSQL(sql, stride_val)
+            self.logger.debug('Executing sql = %s', strided_sql)
+            rows = self._fetchRows(strided_sql)
+        except DatabaseError as e:
+            infoText = 'Parameter-Parameter: Query failed. Make sure you have no Parameters selected in the Filter.'
+            self.logger.warn('Cannot execute sql query for Parameter-Parameter plot: %s', e)
+            raise PPDatabaseException(infoText, sql)
+
+        if stride_val != 1 and len(rows):
+            # Remove the pp_row column
+            rows = rows[:, :-1]
+
+        sample_rows = []
+        if sample_sql:
+            # Get the Sample points
+            try:
+                self.logger.debug('Executing sample_sql = %s', sample_sql)
+                cursor.execute(sample_sql)
+            except DatabaseError as e:
+                infoText = 'Parameter-Parameter: Sample Query failed.'
+                self.logger.warn('Cannot execute sample_sql query for Parameter-Parameter plot: %s', e)
+                raise PPDatabaseException(infoText, sample_sql)
+
+            # Need only the x and y values for sample points, the last column is the Sample name
+            sample_rows = [tuple(float(v) for v in row[:-1]) + (row[-1], ) for row in cursor]
+
+        result = (stride_val, pp_count, rows, sample_rows)
+        if len(rows) <= PP_CACHE_MAX_ROWS:
+            optionscache.store(dbAlias, generation, PP_DATA_OPTION, selection, {}, result)
+
+        return result
+
     def _getXYCData(self, strideFlag=True, latlonFlag=False, returnIDs=False, sampleFlag=True):
         @transaction.atomic(using=self.request.META['dbAlias'])
         def inner_getXYCData(self, strideFlag, latlonFlag):
             '''
-            Construct SQL and iterate through cursor to get X, Y, and possibly C Parameter Parameter data
+            Construct SQL and read in typed columns X, Y, and possibly C Parameter Parameter data
             '''
             # Construct special SQL for P-P plot that returns up to 3 data values for the up to 3 Parameters requested for a 2D plot
             sql = str(self.pq.qs_mp.query)
             sql = self.pq.addParameterParameterSelfJoins(sql, self.pDict)
+            count_sql = sql
+            sample_sql = None
             if sampleFlag:
                 sample_sql = self.pq.addSampleConstraint(sql)
 
-            # Use cursors so that we can specify the database alias to use.
-            cursor = connections[self.request.META['dbAlias']].cursor()
-            sample_cursor = connections[self.request.META['dbAlias']].cursor()
-
-            # Get count and set a stride value if more than a PP_MAX_POINTS which Matplotlib cannot plot, about 100,000 points
-            try:
-                cursor.execute(self._getCountSQL(sql))
-            except DatabaseError as e:
-                infoText = 'Parameter-Parameter: Cannot get count. Make sure you have no Parameters selected in the Filter.'
-                self.logger.warn(e)
-                raise PPDatabaseException(infoText, sql)
-
-            pp_count = cursor.fetchone()[0]
-            self.logger.debug('pp_count = %d', pp_count)
-            stride_val = 1
-            if strideFlag:
-                PP_MAX_POINTS = 50000
-                stride_val = int(pp_count / PP_MAX_POINTS)
-                if stride_val < 1:
-                    stride_val = 1
-                self.logger.debug('stride_val = %d', stride_val)
-
             if latlonFlag:
                 if sql.find('stoqs_measurement') != -1:
                     self.logger.debug('Adding lon lat to SELECT')
@@ -1157,76 +1294,42 @@ class ParameterParameter(BaseParameter):
                 if sampleFlag:
                     sample_sql = sample_sql.replace('DISTINCT', 'DISTINCT ST_X(stoqs_sample.geom) AS lon, ST_Y(stoqs_sample.geom) AS lat,\n')
 
+            idsFlag = False
             if returnIDs:
                 if sql.find('stoqs_measurement') != -1:
                     self.logger.debug('Adding ids to SELECT for stoqs_measurement')
                     sql = sql.replace('DISTINCT', 'DISTINCT mp_x.id, mp_y.id,\n')
+                    idsFlag = True
 
-            # Get the Parameter-Parameter points
-            try:
-                self.logger.debug('Executing sql = %s', sql)
-                cursor.execute(sql)
-            except DatabaseError as e:
-                infoText = 'Parameter-Parameter: Query failed. Make sure you have no Parameters selected in the Filter.'
-                self.logger.warn('Cannot execute sql query for Parameter-Parameter plot: %s', e)
-                raise PPDatabaseException(infoText, sql)
-
-            if sampleFlag: 
-                # Get the Sample points
-                try:
-                    self.logger.debug('Executing sample_sql = %s', sample_sql)
-                    sample_cursor.execute(sample_sql)
-                except DatabaseError as e:
-                    infoText = 'Parameter-Parameter: Sample Query failed.'
-                    self.logger.warn('Cannot execute sample_sql query for Parameter-Parameter plot: %s', e)
-                    raise PPDatabaseException(infoText, sample_sql)
-
-            # Populate MeasuredParameter x,y,c member variables
-            counter = 0
-            self.logger.debug('Looping through rows in cursor with a stride of %d...', stride_val)
-            for row in cursor:
-                if counter % stride_val == 0:
-                    # SampledParameter datavalues are Decimal, convert everything to a float for numpy
-                    lrow = list(row)
-                    if None in lrow or np.nan in lrow:
-                        continue
-                    if returnIDs:
-                        self.x_id.append(int(lrow.pop(0)))
-                        self.y_id.append(int(lrow.pop(0)))
-
-                    if latlonFlag:
-                        self.lon.append(float(lrow.pop(0)))
-                        self.lat.append(float(lrow.pop(0)))
-                        
-                    self.depth.append(float(lrow.pop(0)))
-                    self.x.append(float(lrow.pop(0)))
-                    self.y.append(float(lrow.pop(0)))
-                    try:
-                        self.c.append(float(lrow.pop(0)))
-                    except IndexError:
-                        # Permit x and y, without a c selected
-                        pass
-                counter = counter + 1
-                if counter % 1000 == 0:
-                    self.logger.debug('Made it through %d of %d points', counter, pp_count)
-
-            if self.x == [] or self.y == []:
+            stride_val, pp_count, rows, sample_rows = self._getRows(sql, strideFlag, count_sql, sample_sql)
+            if not len(rows):
                 raise PPDatabaseException('No data returned from query', sql)
 
-            if sampleFlag:
-                # Populate SampledParameter x,y,c member variables
-                self.logger.debug('Looping through rows in sample_cursor')
-                for row in sample_cursor:
-                    lrow = list(row)
-                    if latlonFlag:
-                        self.lon.append(float(lrow.pop(0)))
-                        self.lat.append(float(lrow.pop(0)))
-
-                    # Need only the x and y values for sample points                
-                    self.sdepth.append(float(lrow.pop(0)))
-                    self.sx.append(float(lrow.pop(0)))
-                    self.sy.append(float(lrow.pop(0)))
-                    self.sample_names.append(lrow.pop(0))
+            # Populate MeasuredParameter x,y,c member variables from the columns of rows
+            self.logger.debug('Read %d of %d points with a stride of %d', len(rows), pp_count, stride_val)
+            columns = iter(rows.T)
+            if idsFlag:
+                self.x_id = next(columns).astype(int).tolist()
+                self.y_id = next(columns).astype(int).tolist()
+            if latlonFlag:
+                self.lon = next(columns).tolist()
+                self.lat = next(columns).tolist()
+            self.depth = next(columns).tolist()
+            self.x = next(columns).tolist()
+            self.y = next(columns).tolist()
+            # Permit x and y, without a c selected
+            self.c = next(columns, np.array([])).tolist()
+
+            # Populate SampledParameter x,y,c member variables
+            for row in sample_rows:
+                if latlonFlag:
+                    self.lon.append(row[0])
+                    self.lat.append(row[1])
+                    row = row[2:]
+                self.sdepth.append(row[0])
+                self.sx.append(row[1])
+                self.sy.append(row[2])
+                self.sample_names.append(row[3])
 
             return stride_val, sql, pp_count
 
@@ -1443,44 +1546,26 @@ class ParameterParameter(BaseParameter):
                 self.logger.debug('self.pDict = %s', self.pDict)
                 sql = self.pq.addParameterParameterSelfJoins(sql, self.pDict)
 
-                # Use cursor so that we can specify the database alias to use. Columns are always 0:x, 1:y, 2:c (optional)
-                cursor = connections[self.request.META['dbAlias']].cursor()
-                cursor.execute(sql)
-                for row in cursor:
-                    if None in row or np.nan in row:
-                        continue
-                    # SampledParameter datavalues are Decimal, convert everything to a float for numpy, row[0] is depth
-                    self.depth.append(float(row[0]))
-                    self.x.append(float(row[1]))
-                    self.y.append(float(row[2]))
-                    self.z.append(float(row[3]))
-                    try:
-                        self.c.append(float(row[4]))
-                    except IndexError:
-                        # Permit x, y, and z without a c selected
-                        pass
+                # Columns are always 0:depth, 1:x, 2:y, 3:z, 4:c (optional)
+                _, _, rows, _ = self._getRows(sql, strideFlag=not self.request.GET.get('ppns', False))
+                columns = iter(rows.T)
+                self.depth = next(columns, np.array([])).tolist()
+                self.x = next(columns, np.array([])).tolist()
+                self.y = next(columns, np.array([])).tolist()
+                self.z = next(columns, np.array([])).tolist()
+                # Permit x, y, and z without a c selected
+                self.c = next(columns, np.array([])).tolist()
+
+                # Scale to 10000 on each axis, bounded by min/max values - must be 10000 as X3D in stoqs/templates/stoqsquery.html is hard-coded with 10000
+                # This gives us enough resolution for modern displays and eliminates decimal point characters
+                scaled = [10000 / (float(self.pMinMax[a][2]) - float(self.pMinMax[a][1])) *
+                          (np.array(getattr(self, a), dtype=np.float64) - float(self.pMinMax[a][1])) for a in ('x', 'y', 'z')]
+                points = x3d.format_rows(scaled, ('%d', '%d', '%d'))
                 if self.c:
-                    self.c.reverse()    # Modifies self.c in place - needed for popping values off in loop below
-
-                points = ''
-                colors = ''
-                for x,y,z in zip(self.x, self.y, self.z):
-                    # Scale to 10000 on each axis, bounded by min/max values - must be 10000 as X3D in stoqs/templates/stoqsquery.html is hard-coded with 10000
-                    # This gives us enough resolution for modern displays and eliminates decimal point characters
-                    xs = 10000 * (x - float(self.pMinMax['x'][1])) / (float(self.pMinMax['x'][2]) - float(self.pMinMax['x'][1])) 
-                    ys = 10000 * (y - float(self.pMinMax['y'][1])) / (float(self.pMinMax['y'][2]) - float(self.pMinMax['y'][1])) 
-                    zs = 10000 * (z - float(self.pMinMax['z'][1])) / (float(self.pMinMax['z'][2]) - float(self.pMinMax['z'][1])) 
-                    points = points + '%d %d %d ' % (int(xs), int(ys), int(zs))
-                    if self.c:
-                        cindx = int(round((self.c.pop() - float(self.pMinMax['c'][1])) * (len(self.clt) - 1) / 
-                                        (float(self.pMinMax['c'][2]) - float(self.pMinMax['c'][1]))))
-                        if cindx < 0:
-                            cindx = 0
-                        if cindx > len(self.clt) - 1:
-                            cindx = len(self.clt) - 1
-                        colors = colors + '%.3f %.3f %.3f ' % (self.clt[cindx][0], self.clt[cindx][1], self.clt[cindx][2])
-                    else:
-                        colors = colors + '0 0 0 '
+                    colors = x3d.format_colors(self.clt, x3d.color_indices(self.c, self.pMinMax['c'][1],
+                                                                           self.pMinMax['c'][2], len(self.clt)))
+                else:
+                    colors = ' '.join(['0 0 0'] * len(self.x))
 
                 # Label the axes
                 try:
@@ -1557,7 +1642,7 @@ class ParameterParameter(BaseParameter):
                 x3dResults = {'colors': colors, 'points': points, 'info': '', 'x': self.pMinMax['x'], 'y': self.pMinMax['y'], 'z': self.pMinMax['z'], 
                               'colorbar': colorbarPngFile, 'sql': sql}
 
-            except DatabaseError:
+            except (DatabaseError, PPDatabaseException):
                 self.logger.exception('Cannot make parameterparameter X3D')
                 raise DatabaseError('Cannot make parameterparameter X3D')
 
@@ -0,0 +1,70 @@
+'''
+Encode numpy arrays of coordinates, colors and indices for X3D field attributes.
+
+The X3D fragments delivered to X3DOM have MFVec3f, MFColor and MFInt32 attributes of
+tens of thousands of values.  The functions here compute color lookup table indices for
+all the values at once and format all the values of an attribute with one string
+formatting operation.  float32_base64() returns the values as the base64 encoding of a
+little endian Float32Array instead, for clients that decode binary geometry.
+'''
+
+import base64
+
+import numpy as np
+
+
+def format_rows(columns, formats):
+    '''Return the values of the equal length 1-D arrays in columns as rows separated by spaces,
+    the values of each column formatted with the corresponding %-style format in formats
+
+    >>> format_rows(([1.5, 2.25], [-10, -20]), ('%.2f', '%.1f'))
+    '1.50 -10.0 2.25 -20.0'
+    '''
+    columns = [np.asarray(c, dtype=np.float64) for c in columns]
+    if not len(columns[0]):
+        return ''
+
+    return ' '.join([' '.join(formats)] * len(columns[0])) % tuple(np.column_stack(columns).ravel().tolist())
+
+
+def format_indices(count):
+    '''Return coordIndex of an IndexedLineSet of count points ended with -1
+
+    >>> format_indices(3)
+    '0 1 2 -1'
+    '''
+    return ' '.join(map(str, range(count))) + (' -1' if count else '-1')
+
+
+def color_indices(values, vmin, vmax, ncolors):
+    '''Return int array of the indices of values between vmin and vmax into a color lookup table
+    of ncolors colors, clipped to the table, -1 for NaN values
+
+    >>> color_indices(np.array([-1., 0., 5., np.nan, 20.]), 0, 10, 11).tolist()
+    [0, 0, 5, -1, 10]
+    '''
+    vmin, vmax = float(vmin), float(vmax)
+    if vmin == vmax:
+        raise ZeroDivisionError('Cannot make color lookup table indices with min and max being the same')
+
+    values = np.asarray(values, dtype=np.float64)
+    indices = np.full(values.shape, -1, dtype=np.int64)
+    valid = ~np.isnan(values)
+    indices[valid] = np.clip(np.round((values[valid] - vmin) * (ncolors - 1) / (vmax - vmin)), 0, ncolors - 1)
+
+    return indices
+
+
+def format_colors(clt, indices):
+    '''Return MFColor of the RGB colors at indices of the color lookup table clt
+    '''
+    rgb = np.asarray(clt, dtype=np.float64)[:, :3][indices]
+    return format_rows(rgb.T, ('%.3f', '%.3f', '%.3f'))
+
+
+def float32_base64(columns):
+    '''Return base64 encoding of the values of the equal length 1-D arrays in columns, interleaved by row,
+    as a little endian Float32Array
+    '''
+    values = np.column_stack([np.asarray(c, dtype=np.float64) for c in columns]).astype('<f4')
+    return base64.b64encode(values.tobytes()).decode('ascii')
@@ -0,0 +1,182 @@
+'''
+Write MeasuredParameter and SampledParameter rows as typed columns in binary formats.
+
+The REST responses for these objects are text formats that analysis clients must parse.
+The functions here write the time, depth, longitude, latitude, parameter, and datavalue
+of the rows in batches of BATCH_ROWS, as they're read from the database cursor, to
+Parquet (a row group per batch), the Arrow IPC stream format (a record batch per batch),
+or to the unlimited obs dimension of a netCDF4 file.  The Parquet and Arrow outputs are
+generated as pieces of bytes for a StreamingHttpResponse; the netCDF library needs a
+file, so that's written to a temporary file first.  pyarrow is imported only when a
+Parquet or Arrow response is requested.
+'''
+
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PARQUET = 'parquet'
+ARROW = 'arrow'
+NETCDF = 'nc'
+FORMATS = (PARQUET, ARROW, NETCDF)
+
+CONTENT_TYPES = {PARQUET: 'application/vnd.apache.parquet',
+                 ARROW: 'application/vnd.apache.arrow.stream',
+                 NETCDF: 'application/x-netcdf'}
+
+COLUMNS = ('time', 'depth', 'longitude', 'latitude', 'parameter', 'datavalue')
+
+# Number of rows in each row group/record batch/write to the netCDF file
+BATCH_ROWS = 100000
+
+
+class _Sink(object):
+    '''
+    Output file for pyarrow writers that collects what's written until drain() is called
+    '''
+    def __init__(self):
+        self.pieces = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.pieces.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def batches(rows, prefix, batch_rows=BATCH_ROWS):
+    '''
+    Generate dictionaries of numpy arrays of the COLUMNS of batch_rows of the dictionaries in rows,
+    @prefix is 'measurement' or 'sample', the model with the depth, geom, and instantpoint of the rows
+    '''
+    def arrays(chunk):
+        points = [row[f'{prefix}__geom'] for row in chunk]
+        return {'time': np.array([row[f'{prefix}__instantpoint__timevalue'] for row in chunk], dtype='datetime64[ms]'),
+                'depth': np.array([row[f'{prefix}__depth'] for row in chunk], dtype=np.float64),
+                'longitude': np.array([p.x if p else np.nan for p in points], dtype=np.float64),
+                'latitude': np.array([p.y if p else np.nan for p in points], dtype=np.float64),
+                'parameter': [row['parameter__name'] for row in chunk],
+                'datavalue': np.array([row['datavalue'] for row in chunk], dtype=np.float64)}
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= batch_rows:
+            yield arrays(chunk)
+            chunk = []
+    if chunk:
+        yield arrays(chunk)
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([('time', pa.timestamp('ms')), ('depth', pa.float64()), ('longitude', pa.float64()),
+                      ('latitude', pa.float64()), ('parameter', pa.string()), ('datavalue', pa.float64())])
+
+
+def _record_batch(batch, schema):
+    import pyarrow as pa
+
+    return pa.RecordBatch.from_arrays([pa.array(batch[c], type=schema.field(c).type) for c in COLUMNS], schema=schema)
+
+
+def stream_parquet(rows, prefix):
+    '''
+    Generate the bytes of a Parquet file of rows, one row group per batch
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for batch in batches(rows, prefix):
+            writer.write_table(pa.Table.from_batches([_record_batch(batch, schema)]))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_arrow(rows, prefix):
+    '''
+    Generate the bytes of an Arrow IPC stream of rows, one record batch per batch
+    '''
+    import pyarrow as pa
+
+    schema = _arrow_schema()
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches(rows, prefix):
+            writer.write_batch(_record_batch(batch, schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def write_netcdf(rows, prefix, title=''):
+    '''
+    Write rows to a temporary netCDF4 file and return it opened for reading, the file is deleted when closed
+    '''
+    from netCDF4 import Dataset
+
+    fd, path = tempfile.mkstemp(prefix='stoqs_', suffix='.nc')
+    os.close(fd)
+    try:
+        with Dataset(path, 'w', format='NETCDF4') as nc:
+            nc.title = title
+            nc.createDimension('obs', None)
+            time = nc.createVariable('time', 'f8', ('obs',))
+            time.units = 'milliseconds since 1970-01-01 00:00:00'
+            time.standard_name = 'time'
+            depth = nc.createVariable('depth', 'f8', ('obs',), fill_value=np.nan)
+            depth.units = 'm'
+            depth.standard_name = 'depth'
+            depth.positive = 'down'
+            longitude = nc.createVariable('longitude', 'f8', ('obs',), fill_value=np.nan)
+            longitude.units = 'degrees_east'
+            longitude.standard_name = 'longitude'
+            latitude = nc.createVariable('latitude', 'f8', ('obs',), fill_value=np.nan)
+            latitude.units = 'degrees_north'
+            latitude.standard_name = 'latitude'
+            parameter = nc.createVariable('parameter', str, ('obs',))
+            parameter.long_name = 'Name of the Parameter of datavalue'
+            datavalue = nc.createVariable('datavalue', 'f8', ('obs',), fill_value=np.nan)
+            datavalue.coordinates = 'time depth latitude longitude'
+
+            start = 0
+            for batch in batches(rows, prefix):
+                end = start + len(batch['parameter'])
+                time[start:end] = batch['time'].astype(np.float64)
+                depth[start:end] = batch['depth']
+                longitude[start:end] = batch['longitude']
+                latitude[start:end] = batch['latitude']
+                parameter[start:end] = np.array(batch['parameter'], dtype=object)
+                datavalue[start:end] = batch['datavalue']
+                start = end
+
+        logger.debug('Wrote %d rows to %s', start, path)
+        fh = open(path, 'rb')
+    finally:
+        # Removing the name doesn't affect the opened file
+        os.remove(path)
+
+    return fh
@@ -0,0 +1,115 @@
+'''
+Reduce the number of MeasuredParameter rows delivered to plots, REST responses and KML.
+
+Two methods select a subset of the rows of each Activity and Parameter, keeping the rows as they are:
+LTTB, Largest-Triangle-Three-Buckets (Steinarsson 2013, "Downsampling Time Series for
+Visual Representation"), keeps the points that preserve the visual shape of a time series
+of datavalues, and GRID keeps the point with the datavalue closest to the mean of each
+cell of a time-depth grid, which suits section (contour) plots of profiling platforms.
+Used via MPQuerySet.downsample().
+'''
+
+import itertools
+
+import numpy as np
+
+LTTB = 'lttb'
+GRID = 'grid'
+METHODS = (LTTB, GRID)
+
+
+def lttb(x, y, threshold):
+    '''Return indices of threshold points of the series y(x), x ascending, selected with the
+    Largest-Triangle-Three-Buckets algorithm.  The first and last points are always kept.
+
+    >>> lttb(np.arange(10.0), np.array([0., 0., 0., 5., 0., 0., 0., 0., 0., 0.]), 4).tolist()
+    [0, 3, 5, 9]
+    '''
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    # Edges of the threshold - 2 buckets between the first and last points
+    edges = np.floor(1 + np.arange(threshold - 1) * (count - 2) / (threshold - 2)).astype(np.int64)
+    edges[-1] = count - 1
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x, edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y, edges[:-1]) / sizes
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = a = 0
+    keep[-1] = count - 1
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 1 < threshold - 2:
+            next_x, next_y = mean_x[bucket + 1], mean_y[bucket + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Twice the area of the triangles made with the last kept point and the mean of the next bucket
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + np.argmax(np.where(np.isnan(areas), -1.0, areas))
+        keep[bucket + 1] = a
+
+    return keep
+
+
+def grid(x, y, z, npoints):
+    '''Return sorted indices of the points with the value z closest to the mean of z in each
+    cell of an approximately sqrt(npoints) by sqrt(npoints) grid over x and y
+
+    >>> x = np.array([0., 0.1, 0.2, 3., 3.1, 3.2])
+    >>> grid(x, np.array([0., 0., 0., 10., 10., 10.]), np.array([1., 2., 4., 5., 6., 9.]), 4).tolist()
+    [1, 4]
+    '''
+    if len(x) <= npoints:
+        return np.arange(len(x))
+
+    num = max(int(np.sqrt(npoints)), 1)
+    cells = np.zeros(len(x), dtype=np.int64)
+    for coord in (x, y):
+        span = np.ptp(coord) or 1.0
+        cells = cells * num + np.clip(((coord - coord.min()) / span * num).astype(np.int64), 0, num - 1)
+
+    order = np.argsort(cells, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(cells[order]) != 0])
+    counts = np.diff(np.r_[starts, len(order)])
+    means = np.add.reduceat(np.nan_to_num(z[order]), starts) / counts
+    deviations = np.abs(z[order] - np.repeat(means, counts))
+    deviations[np.isnan(deviations)] = np.inf
+
+    # Sort on deviation within each cell, the first of each cell is the one to keep
+    by_deviation = np.lexsort((deviations, cells[order]))
+    firsts = np.flatnonzero(np.r_[True, np.diff(cells[order][by_deviation]) != 0])
+
+    return np.sort(order[by_deviation[firsts]])
+
+
+def downsample_rows(rows, npoints, method=LTTB,
+                    group_keys=('measurement__instantpoint__activity__name', 'parameter__name'),
+                    time_key='measurement__instantpoint__timevalue', depth_key='measurement__depth',
+                    value_key='datavalue'):
+    '''Generate about npoints of the dictionaries in rows for each Activity and Parameter.  rows
+    must be ordered by group_keys, e.g. read from a query ordered by them: each group is read
+    in turn so that only its rows are in memory, and its selected rows are generated in their
+    original order.  Rows without a group key, e.g. of a single Parameter, group on the others.
+    '''
+    if method not in METHODS:
+        raise ValueError(f'Downsampling method must be one of {METHODS}, not {method}')
+
+    for _, group in itertools.groupby(rows, key=lambda row: tuple(row.get(k) for k in group_keys)):
+        group = list(group)
+        if len(group) <= npoints:
+            yield from group
+            continue
+
+        ems = np.array([row[time_key] for row in group], dtype='datetime64[ms]').astype(np.float64)
+        values = np.array([row[value_key] for row in group], dtype=np.float64)
+        if method == GRID:
+            depths = np.array([row[depth_key] for row in group], dtype=np.float64)
+            keep = grid(ems, depths, values, npoints)
+        else:
+            by_time = np.argsort(ems, kind='stable')
+            keep = np.sort(by_time[lttb(ems[by_time], values[by_time], npoints)])
+
+        for index in keep:
+            yield group[index]
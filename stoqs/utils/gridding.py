@@ -0,0 +1,133 @@
+'''
+Interpolate scattered (time, depth) data values onto the regular grids of section plots.
+
+scipy.interpolate.griddata() triangulates the points, or builds a KD-tree for the nearest
+method, on every call.  The color and contour line Parameters of a section plot, and all
+the Parameters of an Activity, are usually measured at the same points, so grid() keeps
+the CACHE_SIZE most recently used triangulations and trees, keyed by a hash of the point
+coordinates, and interpolates the values of each Parameter with them.  When no method is
+requested cubic interpolation is used for up to CUBIC_MAX_POINTS points, linear up to
+BINNED_MIN_POINTS and above that the values are averaged in the cells of the grid.
+'''
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CUBIC = 'cubic'
+LINEAR = 'linear'
+NEAREST = 'nearest'
+BINNED = 'binned'
+METHODS = (CUBIC, LINEAR, NEAREST, BINNED)
+
+CUBIC_MAX_POINTS = 20000
+BINNED_MIN_POINTS = 200000
+
+# Number of triangulations and trees kept for reuse
+CACHE_SIZE = 16
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def default_method(npoints):
+    '''Return the interpolation method for npoints points
+    '''
+    if npoints <= CUBIC_MAX_POINTS:
+        return CUBIC
+    if npoints < BINNED_MIN_POINTS:
+        return LINEAR
+    return BINNED
+
+
+def _scaling(points):
+    '''Return offset and scale that map points to the unit square, as griddata(..., rescale=True) does
+    '''
+    offset = np.nanmin(points, axis=0)
+    scale = np.nanmax(points - offset, axis=0)
+    scale[~(scale > 0)] = 1.0
+    return offset, scale
+
+
+def _structure(points, method, rescale):
+    '''Return (triangulation or tree, offset, scale) for points, from the cache if they've been used before
+    '''
+    from scipy.spatial import cKDTree, Delaunay
+
+    kind = 'tree' if method == NEAREST else 'triangulation'
+    key = (kind, rescale, points.shape, hashlib.sha1(points.tobytes()).hexdigest())
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    offset, scale = _scaling(points) if rescale else (np.zeros(2), np.ones(2))
+    scaled = (points - offset) / scale
+    structure = (cKDTree(scaled) if kind == 'tree' else Delaunay(scaled), offset, scale)
+    logger.debug('Built %s of %d points', kind, len(points))
+
+    with _lock:
+        _cache[key] = structure
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return structure
+
+
+def _binned(x, y, z, xi, yi):
+    '''Return mean of the values z in the cells around the nodes of the xi, yi grid, NaN in cells without values
+    '''
+    def cells(coord, nodes):
+        edges = (nodes[1:] + nodes[:-1]) / 2.0
+        return np.searchsorted(edges, coord)
+
+    valid = ~np.isnan(z)
+    ix = cells(x[valid], xi)
+    iy = cells(y[valid], yi)
+    inside = (x[valid] >= xi[0]) & (x[valid] <= xi[-1]) & (y[valid] >= yi[0]) & (y[valid] <= yi[-1])
+    flat = iy[inside] * len(xi) + ix[inside]
+    sums = np.bincount(flat, weights=z[valid][inside], minlength=len(xi) * len(yi))
+    counts = np.bincount(flat, minlength=len(xi) * len(yi))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zi = sums / counts
+
+    return zi.reshape(len(yi), len(xi))
+
+
+def grid(x, y, z, xi, yi, method=None, rescale=True):
+    '''Return 2-D array, shaped (len(yi), len(xi)), of the values z at points x, y interpolated to the
+    grid of the 1-D arrays xi and yi, like griddata((x, y), z, (xi[None,:], yi[:,None]), method, rescale=rescale)
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    xi = np.asarray(xi, dtype=np.float64)
+    yi = np.asarray(yi, dtype=np.float64)
+    if not len(z):
+        raise ValueError('No data values to grid')
+
+    method = method or default_method(len(z))
+    if method not in METHODS:
+        raise ValueError(f'Gridding method must be one of {METHODS}, not {method}')
+    if method == BINNED:
+        return _binned(x, y, z, xi, yi)
+
+    points = np.column_stack((x, y))
+    structure, offset, scale = _structure(points, method, rescale)
+    grid_points = (np.column_stack([c.ravel() for c in np.meshgrid(xi, yi)]) - offset) / scale
+    if method == NEAREST:
+        _, indices = structure.query(grid_points)
+        zi = z[indices]
+    elif method == LINEAR:
+        from scipy.interpolate import LinearNDInterpolator
+        zi = LinearNDInterpolator(structure, z)(grid_points)
+    else:
+        from scipy.interpolate import CloughTocher2DInterpolator
+        zi = CloughTocher2DInterpolator(structure, z)(grid_points)
+
+    return zi.reshape(len(yi), len(xi))
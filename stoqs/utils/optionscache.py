@@ -0,0 +1,143 @@
+'''
+Cache of the results of the STOQSQManager.generateOptions() functions.
+
+Each result is saved in Django's cache (Redis in production) under a key made from
+the database alias, the load generation of the database, the name of the option
+and the normalized query kwargs and request parameters - some of the functions
+read settings such as showplatforms directly from the request.  The load generation is a PostgreSQL sequence in
+the campaign database that is advanced with bump_load_generation() whenever an
+Activity is saved or deleted (see the receivers in stoqs/models.py) and by
+STOQS_Loader when it finishes writing data for an Activity, so results computed
+before a load are not served after it.  Writes that bypass both, e.g. with raw SQL,
+are picked up within TIMEOUT.  Counts of hits and misses are kept in the cache for each
+database and option, see metrics().
+'''
+
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+from django.db import IntegrityError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+GENERATION_SEQUENCE = 'stoqs_load_generation'
+
+# Seconds to keep a result in the cache, a new load generation makes it unreachable sooner
+TIMEOUT = 60 * 15
+
+# Query kwargs and request parameters that select which options are generated but don't affect their values
+IGNORED_KWARGS = ('only', 'except', 'fromTable')
+
+METRICS = ('hits', 'misses')
+
+_MISSING = object()
+
+
+def bump_load_generation(dbAlias):
+    '''Advance the load generation of database dbAlias, invalidating all of its cached options
+    '''
+    with connections[dbAlias].cursor() as cursor:
+        try:
+            with transaction.atomic(using=dbAlias):
+                cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {GENERATION_SEQUENCE}')
+        except IntegrityError:
+            # Created by another process at the same time
+            pass
+        cursor.execute('SELECT nextval(%s)', [GENERATION_SEQUENCE])
+        generation = cursor.fetchone()[0]
+
+    logger.info('Load generation of database %s is now %d', dbAlias, generation)
+
+    return generation
+
+
+def load_generation(dbAlias):
+    '''Return the load generation of database dbAlias, 0 for databases loaded before it was kept
+    '''
+    with connections[dbAlias].cursor() as cursor:
+        # Roles such as everyone may read the sequence only if granted SELECT on it, see load.py --grant_everyone_select
+        cursor.execute("SELECT CASE WHEN to_regclass(%s) IS NULL THEN NULL ELSE has_sequence_privilege(%s, 'SELECT') END",
+                       [GENERATION_SEQUENCE, GENERATION_SEQUENCE])
+        readable = cursor.fetchone()[0]
+        if readable:
+            cursor.execute(f'SELECT last_value FROM {GENERATION_SEQUENCE}')
+            return cursor.fetchone()[0]
+
+    if readable is False:
+        logger.warning('Cannot read sequence %s of database %s, grant SELECT on it so that cached options'
+                       ' are refreshed after loads', GENERATION_SEQUENCE, dbAlias)
+
+    return 0
+
+
+def _normalize(value):
+    '''Return value with empty items removed and sequences as lists so that equivalent
+    selections from the UI, e.g. [None, None] and [] for an unconstrained time, compare equal
+    '''
+    if isinstance(value, dict):
+        value = {k: _normalize(v) for k, v in value.items()}
+        return {k: v for k, v in value.items() if v not in (None, '', [], {})}
+    if isinstance(value, (list, tuple)):
+        value = [_normalize(v) for v in value]
+        if all(v in (None, '', [], {}) for v in value):
+            return []
+        return value
+
+    return value
+
+
+def cache_key(dbAlias, generation, option, kwargs, params):
+    '''Return cache key for the option of database dbAlias at its load generation for the query
+    kwargs and params, a dictionary of the request's GET parameters
+    '''
+    selection = _normalize([{k: v for k, v in kwargs.items() if k not in IGNORED_KWARGS},
+                            {k: v for k, v in params.items() if k not in IGNORED_KWARGS}])
+    digest = hashlib.sha1(json.dumps(selection, sort_keys=True, default=str).encode()).hexdigest()
+
+    return f'stoqs:options:{dbAlias}:{generation}:{option}:{digest}'
+
+
+def _count(dbAlias, option, metric):
+    key = f'stoqs:options:metrics:{dbAlias}:{option}:{metric}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Expired or evicted between add() and incr()
+            cache.set(key, 1, None)
+
+
+def lookup(dbAlias, generation, option, kwargs, params):
+    '''Return (True, result) for a cached option, (False, None) otherwise
+    '''
+    value = cache.get(cache_key(dbAlias, generation, option, kwargs, params), _MISSING)
+    if value is _MISSING:
+        _count(dbAlias, option, 'misses')
+        return False, None
+
+    _count(dbAlias, option, 'hits')
+
+    return True, value
+
+
+def store(dbAlias, generation, option, kwargs, params, result):
+    try:
+        cache.set(cache_key(dbAlias, generation, option, kwargs, params), result, TIMEOUT)
+    except Exception as e:
+        # Likely a result that can't be pickled, it'll just be generated again
+        logger.warning('Could not cache %s option: %s', option, e)
+
+
+def metrics(dbAlias, options):
+    '''Return dictionary of hits, misses and hit ratio for each of the options of database dbAlias
+    '''
+    stats = {}
+    for option in options:
+        counts = cache.get_many([f'stoqs:options:metrics:{dbAlias}:{option}:{m}' for m in METRICS])
+        hits, misses = (counts.get(f'stoqs:options:metrics:{dbAlias}:{option}:{m}', 0) for m in METRICS)
+        stats[option] = {'hits': hits, 'misses': misses,
+                         'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None}
+
+    return stats
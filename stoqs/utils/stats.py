@@ -0,0 +1,220 @@
+'''
+Descriptive statistics for the ActivityParameter and ActivityParameterHistogram tables.
+
+array_stats() computes exact statistics with numpy from values that fit in memory.
+StreamingStats computes them in one pass over chunks of values from a server-side
+cursor for Activities too big to hold in memory: count, min, max, mean, mode and the
+histogram are exact, the percentiles are approximated with a KLL-style QuantileSketch.
+Both return the same dictionary of statistics so that callers need not care which
+was used.  merge_stats() updates the statistics with values appended to an Activity
+from the saved statistics, histogram and sketch without reading the existing values.
+'''
+
+import io
+
+import numpy as np
+
+# Percentiles saved in ActivityParameter, keyed by field name
+PERCENTILES = {'median': 0.5, 'p025': 0.025, 'p975': 0.975, 'p010': 0.010, 'p990': 0.990}
+
+# Same number of bins (edges, really) as utils.utils.mode()
+MODE_NUMBINS = 100
+
+
+def _mode(counts, bin_edges):
+    '''Mode from histogram computed like utils.utils.mode()
+    '''
+    index = np.argmax(counts)
+    if index == 0:
+        return bin_edges[index]
+    else:
+        return (bin_edges[index] + bin_edges[index-1]) / 2.0
+
+
+def _span(vmin, vmax):
+    '''Return range for the histograms of values from vmin to vmax, widened by 0.5 on each side as
+    np.histogram() does when they are equal, e.g. for a Parameter with a constant value
+    '''
+    if vmin == vmax:
+        return vmin - 0.5, vmax + 0.5
+    return vmin, vmax
+
+
+def _histogram(values, numbins, vmin, vmax):
+    '''Return (counts, bins) or (None, None) if it can't be computed, e.g. for infinite values
+    '''
+    try:
+        return np.histogram(values, numbins, range=_span(vmin, vmax))
+    except (IndexError, ValueError):
+        # Likely 'autodetected range of [-inf, inf] is not finite', seen in really wild LRAUV data
+        return None, None
+
+
+def array_stats(values, numbins=100):
+    '''Return dictionary of statistics and (counts, bins) histogram with numbins for numpy array values
+    '''
+    vmin, vmax = values.min(), values.max()
+    stats = {'number': len(values), 'min': vmin, 'max': vmax, 'mean': values.mean()}
+    stats.update(zip(PERCENTILES.keys(), np.percentile(values, [100 * q for q in PERCENTILES.values()])))
+    try:
+        mode_edges = np.linspace(*_span(vmin, vmax), MODE_NUMBINS)
+        stats['mode'] = vmin if vmin == vmax else _mode(np.histogram(values, mode_edges)[0], mode_edges)
+    except (IndexError, ValueError):
+        stats['mode'] = None
+
+    return stats, _histogram(values, numbins, vmin, vmax)
+
+
+class QuantileSketch(object):
+    '''Approximate quantiles of a stream of values in O(k log(n/k)) memory, after
+    Karnin, Lang and Liberty (2016) "Optimal Quantile Approximation in Streams".
+    Items at level h of the sketch each stand for 2**h of the original values.
+    Sketches of separate streams may be combined with merge().
+    '''
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2.0 / 3.0) ** depth)), 2)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[level])
+                # An odd item out stays at this level
+                self.levels[level] = items[len(items) - len(items) % 2:]
+                items = items[:len(items) - len(items) % 2]
+                # Promote every other item with a random offset to the next level
+                self.levels[level + 1] = np.concatenate((self.levels[level + 1],
+                                                         items[self._rng.integers(2)::2]))
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.count += len(values)
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self.count += other.count
+        self._compress()
+
+    def quantiles(self, qs):
+        '''Return numpy array of approximate values at quantiles qs (fractions from 0.0 to 1.0)
+        '''
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        if not len(items):
+            return np.full(len(qs), np.nan)
+        order = np.argsort(items)
+        items = items[order]
+        weights = weights[order]
+        midpoints = (np.cumsum(weights) - weights / 2.0) / weights.sum()
+
+        return np.interp(qs, midpoints, items)
+
+    def to_bytes(self):
+        '''Return the sketch serialized, e.g. to be saved in ActivityParameter.sketch
+        '''
+        buf = io.BytesIO()
+        np.savez(buf, *self.levels, meta=np.array([self.k, self.count], dtype=np.int64))
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(bytes(data))) as saved:
+            k, count = saved['meta']
+            sketch = cls(int(k))
+            sketch.count = int(count)
+            sketch.levels = [saved[f'arr_{level}'] for level in range(len(saved.files) - 1)]
+        return sketch
+
+
+class StreamingStats(object):
+    '''Accumulate the statistics returned by array_stats() over chunks of values in one pass.
+    The range of the values, vmin and vmax, must be known beforehand (e.g. from a Min() and
+    Max() aggregate query) so that the histograms can be accumulated exactly.
+    '''
+    def __init__(self, vmin, vmax, numbins=100, k=200):
+        self.vmin = vmin
+        self.vmax = vmax
+        self.number = 0
+        self.total = 0.0
+        self.sketch = QuantileSketch(k)
+        try:
+            self.bins = np.histogram_bin_edges([], numbins, range=_span(vmin, vmax))
+            self.counts = np.zeros(numbins, dtype=np.int64)
+            self.mode_edges = np.linspace(*_span(vmin, vmax), MODE_NUMBINS)
+            self.mode_counts = np.zeros(MODE_NUMBINS - 1, dtype=np.int64)
+        except (IndexError, ValueError):
+            self.bins = self.counts = self.mode_edges = self.mode_counts = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.number += len(values)
+        self.total += values.sum()
+        self.sketch.update(values)
+        if self.counts is not None:
+            self.counts += np.histogram(values, self.bins)[0]
+            self.mode_counts += np.histogram(values, self.mode_edges)[0]
+
+    def result(self):
+        '''Return same dictionary of statistics and histogram as array_stats()
+        '''
+        stats = {'number': self.number, 'min': self.vmin, 'max': self.vmax, 'mean': self.total / self.number}
+        stats.update(zip(PERCENTILES.keys(), self.sketch.quantiles(list(PERCENTILES.values()))))
+        if self.counts is None:
+            stats['mode'] = None
+            return stats, (None, None)
+
+        stats['mode'] = self.vmin if self.vmin == self.vmax else _mode(self.mode_counts, self.mode_edges)
+
+        return stats, (self.counts, self.bins)
+
+
+def merge_stats(stats, counts, bins, sketch, values, numbins=100):
+    '''Return dictionary of statistics and (counts, bins) histogram like array_stats() for the
+    values summarized by stats, the counts, bins histogram and the QuantileSketch sketch plus
+    the numpy array values.  sketch is updated with values.  The number, min, max and mean are
+    exact, the percentiles are from the sketch.  The histogram is approximate: the counts of
+    the existing bins are added to the bins over the new range that contain their centers,
+    and the mode is taken from it.  Non-finite values are ignored; without any finite values the
+    saved statistics and histogram are returned.
+    '''
+    values = values[np.isfinite(values)]
+    if not len(values):
+        merged = dict(stats)
+        merged.update(zip(PERCENTILES.keys(), sketch.quantiles(list(PERCENTILES.values()))))
+        merged['mode'] = None if counts is None else _mode(counts, bins)
+        return merged, (counts, bins)
+
+    number = stats['number'] + len(values)
+    vmin = min(stats['min'], values.min())
+    vmax = max(stats['max'], values.max())
+    sketch.update(values)
+    merged = {'number': number, 'min': vmin, 'max': vmax,
+              'mean': (stats['mean'] * stats['number'] + values.sum()) / number}
+    merged.update(zip(PERCENTILES.keys(), sketch.quantiles(list(PERCENTILES.values()))))
+
+    new_counts, new_bins = _histogram(values, numbins, vmin, vmax)
+    if counts is None or new_counts is None:
+        merged['mode'] = None
+        return merged, (None, None)
+
+    centers = (bins[:-1] + bins[1:]) / 2.0
+    new_counts = new_counts + np.histogram(centers, new_bins, weights=counts)[0].astype(np.int64)
+    merged['mode'] = _mode(new_counts, new_bins)
+
+    return merged, (new_counts, new_bins)
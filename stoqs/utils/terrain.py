@@ -0,0 +1,146 @@
+'''
+Sample GMT .grd terrain files in process, an alternative to GMT's grdtrack(1) program.
+
+Both GMT grid formats are supported: the old format with x_range, y_range, spacing,
+dimension and flattened z variables, and the newer COARDS-compliant format with 1D
+x (lon) and y (lat) coordinate variables and a 2D z variable.  NetCDF3 files are
+memory-mapped so that only the pages of the grid that are needed are read.  Open
+grids are cached per process.
+
+Usage:
+
+    from utils.terrain import open_grid
+    bottom_elevations = open_grid('Monterey25.grd').sample(lons, lats)
+'''
+
+import logging
+import os
+
+import numpy as np
+from netCDF4 import Dataset
+from scipy.io import netcdf_file
+
+logger = logging.getLogger(__name__)
+
+_grid_cache = {}
+
+
+class TerrainGrid(object):
+    '''A regularly spaced grid of elevations read from a GMT .grd file.  Coordinates of the
+    nodes are x0 + i * dx and y0 + j * dy where dx and dy may be negative, as they are for
+    the rows of the old GMT format that start at the top (north) of the grid.
+    '''
+    def __init__(self, grd_file):
+        self.grd_file = grd_file
+        try:
+            # mmap=True keeps the grid on disk; only works for netCDF3 files
+            self.nc = netcdf_file(grd_file, mode='r', mmap=True)
+        except (TypeError, ValueError):
+            self.nc = Dataset(grd_file)
+            self.nc.set_auto_mask(False)
+
+        variables = self.nc.variables
+        if 'x_range' in variables:
+            self._init_old_format(variables)
+        else:
+            self._init_coards_format(variables)
+
+        self.fill_value = getattr(self.z, '_FillValue', None)
+        logger.debug('Opened %s: nx = %d, ny = %d, x0 = %f, dx = %f, y0 = %f, dy = %f', grd_file,
+                     self.nx, self.ny, self.x0, self.dx, self.y0, self.dy)
+
+    def _init_old_format(self, variables):
+        xmin, xmax = variables['x_range'][:]
+        ymin, ymax = variables['y_range'][:]
+        self.dx, dy = variables['spacing'][:]
+        self.nx, self.ny = (int(n) for n in variables['dimension'][:])
+        self.x0 = xmin
+        self.y0 = ymax
+        self.dy = -dy
+        if getattr(self.nc, 'node_offset', 0) == 1:
+            # Pixel registration: node values are at the centers of the cells
+            self.x0 += self.dx / 2.0
+            self.y0 += self.dy / 2.0
+        self.z = variables['z']
+
+    def _init_coards_format(self, variables):
+        for x_name, y_name in (('x', 'y'), ('lon', 'lat')):
+            if x_name in variables and y_name in variables:
+                break
+        else:
+            raise KeyError(f'No x and y (or lon and lat) coordinate variables in {self.grd_file}')
+
+        x = variables[x_name]
+        y = variables[y_name]
+        self.nx = len(x[:])
+        self.ny = len(y[:])
+        self.x0, x1 = float(x[0]), float(x[self.nx - 1])
+        self.y0, y1 = float(y[0]), float(y[self.ny - 1])
+        self.dx = (x1 - self.x0) / (self.nx - 1)
+        self.dy = (y1 - self.y0) / (self.ny - 1)
+        self.z = variables['z']
+
+    @property
+    def bounds(self):
+        '''Return (xmin, ymin, xmax, ymax) of the grid nodes
+        '''
+        x1 = self.x0 + (self.nx - 1) * self.dx
+        y1 = self.y0 + (self.ny - 1) * self.dy
+        return min(self.x0, x1), min(self.y0, y1), max(self.x0, x1), max(self.y0, y1)
+
+    def _read_window(self, j0, j1, i0, i1):
+        '''Return float array of z for rows j0:j1 and columns i0:i1 with missing values set to nan
+        '''
+        if len(self.z.shape) == 2:
+            window = np.array(self.z[j0:j1, i0:i1], dtype=np.float64)
+        else:
+            # Old GMT format stores z as a flattened 1D array
+            window = np.array(self.z[j0 * self.nx:j1 * self.nx], dtype=np.float64).reshape(j1 - j0, self.nx)[:, i0:i1]
+
+        if self.fill_value is not None:
+            window[window == self.fill_value] = np.nan
+
+        return window
+
+    def sample(self, lons, lats):
+        '''Return numpy array of bilinearly interpolated grid values at lons, lats.  Points
+        outside of the grid are returned as nan.
+        '''
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        values = np.full(lons.shape, np.nan)
+
+        fi = (lons - self.x0) / self.dx
+        fj = (lats - self.y0) / self.dy
+        inside = (fi >= 0) & (fi <= self.nx - 1) & (fj >= 0) & (fj <= self.ny - 1)
+        if not inside.any():
+            return values
+
+        fi = fi[inside]
+        fj = fj[inside]
+        i = np.clip(np.floor(fi).astype(np.int64), 0, self.nx - 2)
+        j = np.clip(np.floor(fj).astype(np.int64), 0, self.ny - 2)
+        wi = fi - i
+        wj = fj - j
+
+        # Read just the part of the grid spanned by the points
+        i0, i1 = i.min(), i.max() + 2
+        j0, j1 = j.min(), j.max() + 2
+        window = self._read_window(j0, j1, i0, i1)
+        i -= i0
+        j -= j0
+
+        values[inside] = ((1 - wj) * ((1 - wi) * window[j, i] + wi * window[j, i + 1]) +
+                               wj  * ((1 - wi) * window[j + 1, i] + wi * window[j + 1, i + 1]))
+
+        return values
+
+
+def open_grid(grd_file):
+    '''Return TerrainGrid for grd_file, opening it only once per process
+    '''
+    key = os.path.abspath(grd_file)
+    if key not in _grid_cache:
+        _grid_cache[key] = TerrainGrid(grd_file)
+
+    return _grid_cache[key]
@@ -254,6 +254,85 @@ def simplify_points (pts, tolerance):
     # Change from original code: add the index from the original line in the return
     return [(pts[i] + (i,)) for i in keep]
 
+# Longest run of points simplified as one line, bounding the number of passes over its points
+SIMPLIFY_WINDOW = 2000
+
+# Number of points of the runs simplified together, small enough for their arrays to stay in cache
+SIMPLIFY_BATCH = 2 ** 17
+
+def _segment_distances(px, py, x0, y0, x1, y1):
+    '''Distances of points px, py from the line segments (x0, y0) - (x1, y1): to the
+    nearest end point for points beyond either end
+    '''
+    dx, dy = x1 - x0, y1 - y0
+    seg_len_sq = dx * dx + dy * dy
+    ax, ay = px - x0, py - y0
+    t = numpy.clip((ax * dx + ay * dy) / numpy.where(seg_len_sq == 0.0, 1.0, seg_len_sq), 0.0, 1.0)
+
+    return numpy.hypot(ax - t * dx, ay - t * dy)
+
+def _simplify_segments(x, y, tolerance, anchors, floaters, keep):
+    '''Set keep for the points of the Douglas-Peucker simplifications of the segments of x, y
+    from anchors to floaters, splitting all the segments at their farthest points in each pass
+    '''
+    while True:
+        inner = floaters - anchors - 1
+        anchors, floaters, inner = anchors[inner > 0], floaters[inner > 0], inner[inner > 0]
+        if not len(anchors):
+            return
+
+        # Indices of the interior points of all the segments and the segment of each
+        segment = numpy.repeat(numpy.arange(len(anchors)), inner)
+        offsets = numpy.cumsum(inner) - inner
+        points = numpy.arange(len(segment)) + (anchors + 1 - offsets)[segment]
+        dist = _segment_distances(x[points], y[points], x[anchors][segment], y[anchors][segment],
+                                  x[floaters][segment], y[floaters][segment])
+
+        # First point at the greatest distance in each segment, as numpy.argmax() finds it
+        max_dist = numpy.maximum.reduceat(dist, offsets)
+        split = numpy.flatnonzero(max_dist > tolerance)
+        if not len(split):
+            return
+        at_max = numpy.flatnonzero(dist == max_dist[segment])
+        first_segments, first = numpy.unique(segment[at_max], return_index=True)
+        farthest = numpy.zeros(len(anchors), dtype=points.dtype)
+        farthest[first_segments] = points[at_max[first]]
+
+        farthest = farthest[split]
+        keep[farthest] = True
+        anchors, floaters = (numpy.concatenate((anchors[split], farthest)),
+                             numpy.concatenate((farthest, floaters[split])))
+
+def simplify_line(x, y, tolerance, window=SIMPLIFY_WINDOW):
+    '''
+    Douglas-Peucker simplification of the line through points x, y for series of tens of
+    millions of points.  The points are cut into runs of at most window points whose end
+    points are kept.  Each run is simplified by splitting at its farthest point, which on
+    a yo-yo profile is often near an end, so the work on a run grows with the square of
+    its length; the window bounds the work per point.  The distances of the points of all
+    the segments of a batch of runs are computed together in one numpy operation for each
+    level of splitting.  Returns numpy array of the indices of the points kept, in order.
+
+    >>> simplify_line([0, 1, 2, 2, 2, 1, 0, 0, 0], [0, 0, 0, 1, 2, 2, 2, 1, 0], 1.0)
+    array([0, 2, 4, 6, 8])
+    '''
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    keep = numpy.zeros(len(x), dtype=bool)
+    if len(x) < 3:
+        keep[:] = True
+        return numpy.flatnonzero(keep)
+
+    window = max(int(window), 2)
+    ends = numpy.append(numpy.arange(0, len(x) - 1, window), len(x) - 1)
+    keep[ends] = True
+    runs = max(SIMPLIFY_BATCH // window, 1)
+    for start in range(0, len(ends) - 1, runs):
+        batch = ends[start:start + runs + 1]
+        _simplify_segments(x, y, tolerance, batch[:-1], batch[1:], keep)
+
+    return numpy.flatnonzero(keep)
+
 def pearsonr(x, y):
     '''
     See http://stackoverflow.com/questions/3949226/calculating-pearson-correlation-and-significance-in-python and